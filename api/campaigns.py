@@ -0,0 +1,41 @@
+from fastapi import APIRouter, HTTPException
+from typing import List
+from api.responses import trusted_response
+from models import Campaign, CampaignCreate
+from services.database import (
+    create_campaign,
+    get_campaign,
+    get_campaigns,
+    update_campaign_status,
+)
+
+router = APIRouter()
+
+
+@router.post("")
+@trusted_response
+async def create_outbound_campaign(campaign: CampaignCreate) -> Campaign:
+    """Schedule an outbound call campaign, it starts when its call window opens"""
+    if campaign.delivery_to <= campaign.delivery_from:
+        raise HTTPException(status_code=422, detail="delivery_to must be after delivery_from")
+    if campaign.window_end <= campaign.window_start:
+        raise HTTPException(status_code=422, detail="window_end must be after window_start")
+    return get_campaign(create_campaign(campaign))
+
+
+@router.get("", response_model=List[Campaign])
+async def list_campaigns():
+    """List campaigns with attempt statistics"""
+    return get_campaigns()
+
+
+@router.post("/{campaign_id}/cancel")
+@trusted_response
+async def cancel_campaign(campaign_id: int) -> Campaign:
+    """Stop a pending or running campaign, dials already in flight still finish"""
+    campaign = get_campaign(campaign_id)
+    if campaign is None:
+        raise HTTPException(status_code=404, detail="Campaign not found")
+    if campaign.status in ("pending", "running"):
+        update_campaign_status(campaign_id, "cancelled")
+    return get_campaign(campaign_id)
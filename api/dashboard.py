@@ -1,18 +1,93 @@
-from fastapi import APIRouter
+from fastapi import APIRouter, HTTPException, Query, Request
+from datetime import datetime
 from typing import List
-from models import Package, CallLog
-from services.database import get_all_packages, get_all_call_logs
+import database
+from api.responses import rows_json, rows_json_response, snapshot_response, trusted_response
+from models import (
+    Package,
+    CallLog,
+    CallLogSearchPage,
+    RescheduleCount,
+    ScheduleAsOf,
+    ScheduleChange,
+)
+from services.database import (
+    get_all_package_rows,
+    get_all_call_log_rows,
+    get_reschedule_count_rows,
+    get_schedule_as_of,
+    get_schedule_history_rows,
+    search_call_logs,
+)
+from services.sharding import package_store_paths
+from services.snapshots import SnapshotCache
 
 router = APIRouter()
 
+# The dashboard polls both lists every second, they are only re-queried after a commit
+packages_snapshot = SnapshotCache(lambda: rows_json(*get_all_package_rows()), package_store_paths)
+call_logs_snapshot = SnapshotCache(
+    lambda: rows_json(*get_all_call_log_rows()), lambda: [database.default_path()]
+)
+
 
 @router.get("/packages", response_model=List[Package])
-async def get_packages():
-    """Get all packages for dashboard"""
-    return get_all_packages()
+async def get_packages(request: Request):
+    """Get all packages for dashboard, 304 for If-None-Match / If-Modified-Since if unchanged"""
+    # response_model only documents the schema, rows are serialized without models
+    return snapshot_response(request, packages_snapshot.get())
+
+
+@router.get("/packages/reschedules", response_model=List[RescheduleCount])
+async def get_reschedule_counts(
+    min_count: int = Query(1, ge=1),
+    limit: int = Query(100, ge=1, le=1000),
+):
+    """Packages that were rescheduled most often"""
+    return rows_json_response(*get_reschedule_count_rows(min_count, limit))
+
+
+@router.get(
+    "/packages/{tracking_number}/schedule_history", response_model=List[ScheduleChange]
+)
+async def get_package_schedule_history(tracking_number: str):
+    """Every change of a package's delivery time, oldest first"""
+    return rows_json_response(*get_schedule_history_rows(tracking_number=tracking_number))
+
+
+@router.get("/packages/{tracking_number}/schedule", response_model=ScheduleAsOf)
+@trusted_response
+async def get_package_schedule_as_of(
+    tracking_number: str,
+    as_of: datetime = Query(description="Point in time to look up the delivery time at"),
+) -> ScheduleAsOf:
+    """Delivery time a package had at a point in time"""
+    scheduled_at = get_schedule_as_of(tracking_number, as_of)
+    if scheduled_at is None:
+        raise HTTPException(status_code=404, detail="Package not found")
+    return ScheduleAsOf(tracking_number=tracking_number, as_of=as_of, scheduled_at=scheduled_at)
 
 
 @router.get("/call_logs", response_model=List[CallLog])
-async def get_call_logs():
-    """Get all call logs for dashboard"""
-    return get_all_call_logs()
+async def get_call_logs(request: Request):
+    """Get all call logs for dashboard, 304 for If-None-Match / If-Modified-Since if unchanged"""
+    return snapshot_response(request, call_logs_snapshot.get())
+
+
+@router.get("/call_logs/search", response_model=CallLogSearchPage)
+@trusted_response
+async def search_call_log_transcripts(
+    q: str = Query(min_length=1, description='Words or "quoted phrases" to find'),
+    limit: int = Query(20, ge=1, le=100),
+    offset: int = Query(0, ge=0),
+):
+    """Full-text search over call transcripts, ranked by relevance"""
+    return search_call_logs(q, limit=limit, offset=offset)
+
+
+@router.get(
+    "/call_logs/{retell_call_id}/schedule_changes", response_model=List[ScheduleChange]
+)
+async def get_call_schedule_changes(retell_call_id: str):
+    """Delivery time changes made during a call"""
+    return rows_json_response(*get_schedule_history_rows(retell_call_id=retell_call_id))
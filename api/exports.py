@@ -0,0 +1,103 @@
+import csv
+import io
+from datetime import datetime
+from typing import Iterator, List, Literal, Optional, Sequence
+
+import orjson
+from fastapi import APIRouter, Query
+from fastapi.responses import StreamingResponse
+
+from models import CALL_LOG_COLUMNS, PACKAGE_COLUMNS
+from services.database import (
+    get_call_log_export_watermark,
+    get_max_package_id,
+    iter_call_log_export_chunks,
+    iter_package_export_chunks,
+)
+
+router = APIRouter()
+
+ExportFormat = Literal["ndjson", "csv"]
+MEDIA_TYPES = {"ndjson": "application/x-ndjson", "csv": "text/csv"}
+
+# Exports read and write one fetchmany chunk at a time, so memory use stays
+# constant no matter how large the table is.
+# Incremental exports: every response carries X-Export-Watermark, the highest id it
+# covers. Rows added while the export runs are left for the next run, which passes
+# the stored watermark back as since_id. Call logs stop below the oldest call still
+# in progress, whose transcript and completion are yet to be written.
+
+
+def encode_ndjson(columns: Sequence[str], chunks: Iterator[List[tuple]]) -> Iterator[bytes]:
+    for rows in chunks:
+        yield b"".join(orjson.dumps(dict(zip(columns, row))) + b"\n" for row in rows)
+
+
+def encode_csv(columns: Sequence[str], chunks: Iterator[List[tuple]]) -> Iterator[str]:
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(columns)
+    for rows in chunks:
+        writer.writerows(
+            [
+                value.isoformat() if isinstance(value, datetime) else value
+                for value in row
+            ]
+            for row in rows
+        )
+        yield buffer.getvalue()
+        buffer.seek(0)
+        buffer.truncate()
+    if buffer.tell():
+        yield buffer.getvalue()
+
+
+def export_response(
+    name: str,
+    columns: Sequence[str],
+    chunks: Iterator[List[tuple]],
+    format: ExportFormat,
+    watermark: int,
+) -> StreamingResponse:
+    encode = encode_ndjson if format == "ndjson" else encode_csv
+    return StreamingResponse(
+        encode(columns, chunks),
+        media_type=MEDIA_TYPES[format],
+        headers={
+            "X-Export-Watermark": str(watermark),
+            "Content-Disposition": f'attachment; filename="{name}.{format}"',
+        },
+    )
+
+
+@router.get("/packages")
+async def export_packages(
+    format: ExportFormat = "ndjson",
+    since_id: int = Query(0, ge=0, description="Only rows with a higher id"),
+):
+    """Stream packages as NDJSON or CSV"""
+    watermark = get_max_package_id()
+    return export_response(
+        "packages",
+        PACKAGE_COLUMNS,
+        iter_package_export_chunks(since_id, watermark),
+        format,
+        watermark,
+    )
+
+
+@router.get("/call_logs")
+async def export_call_logs(
+    format: ExportFormat = "ndjson",
+    since_id: int = Query(0, ge=0, description="Only rows with a higher id"),
+    since: Optional[datetime] = Query(None, description="Only calls created at or after"),
+):
+    """Stream call logs as NDJSON or CSV"""
+    watermark = get_call_log_export_watermark()
+    return export_response(
+        "call_logs",
+        CALL_LOG_COLUMNS,
+        iter_call_log_export_chunks(since_id, watermark, since),
+        format,
+        watermark,
+    )
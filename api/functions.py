@@ -1,7 +1,9 @@
 from fastapi import APIRouter, Request
-from pydantic import BaseModel
+from pydantic import BaseModel, model_validator
 from datetime import datetime
-from typing import Literal, Union
+from functools import partial
+from typing import Literal, Optional, Union
+import asyncio
 import logging
 from services.database import (
     get_package_by_tracking_and_postal,
@@ -11,7 +13,14 @@ from services.database import (
     get_call_transcript_by_retell_call_id,
 )
 from services.email import send_reschedule_confirmation_email, send_escalation_email
-from models import EscalationReason
+from services.jobs import job_queue
+from services.latency import BudgetExceeded, LatencyBudget, track_late
+from services.rate_limit import FunctionRateLimiter, rate_limiter
+from services.sessions import CallSession, session_store
+from services.tenants import serving_tenant
+from services.time_resolution import UnresolvableTime, resolve_delivery_time
+from api.responses import trusted_response
+from models import EscalationReason, PackageRecord
 
 router = APIRouter()
 logger = logging.getLogger(__name__)
@@ -38,7 +47,18 @@ class VerifyPackageResponse(BaseModel):
 class RescheduleArgs(BaseModel):
     tracking_number: str
     postal_code: str
-    target_time: datetime
+    # Either an exact time, or the customer's own words ("tomorrow morning") which are
+    # resolved to a delivery slot here. time_expression wins if both are sent.
+    target_time: Optional[datetime] = None
+    time_expression: Optional[str] = None
+    # Customer's IANA timezone for time_expression, DEFAULT_CUSTOMER_TIMEZONE if not given
+    timezone: Optional[str] = None
+
+    @model_validator(mode="after")
+    def require_time(self) -> "RescheduleArgs":
+        if self.target_time is None and not self.time_expression:
+            raise ValueError("Either target_time or time_expression is required")
+        return self
 
 
 class RetellRescheduleRequest(BaseModel):
@@ -51,6 +71,8 @@ class RescheduleResponse(BaseModel):
     message: str
     tracking_number: str
     new_schedule: datetime
+    # Slot the time_expression resolved to, for the agent to read back
+    delivery_window: Optional[str] = None
 
 
 class EscalateArgs(BaseModel):
@@ -91,15 +113,193 @@ class EmailError(BaseModel):
     message: str
 
 
+class RateLimitedError(BaseModel):
+    error_type: Literal["rate_limited"]
+    message: str
+
+
+class VerificationLockedError(BaseModel):
+    error_type: Literal["verification_locked"]
+    message: str
+
+
+class InvalidDeliveryTimeError(BaseModel):
+    error_type: Literal["invalid_delivery_time"]
+    message: str
+
+
+class ServiceDegradedError(BaseModel):
+    error_type: Literal["service_degraded"]
+    message: str
+
+
+SERVICE_DEGRADED = ServiceDegradedError(
+    error_type="service_degraded",
+    message="Our system is responding slowly right now, please try again in a moment",
+)
+
+
+def tenant_rate_limiter() -> FunctionRateLimiter:
+    """The serving tenant's limits and buckets, the default tenant uses the global limiter"""
+    return serving_tenant().rate_limiter or rate_limiter
+
+
+def check_rate_limit(
+    call: dict, tracking_number: str
+) -> Optional[Union[RateLimitedError, VerificationLockedError]]:
+    """Reject throttled or locked out callers before touching the database"""
+    limiter = tenant_rate_limiter()
+    locked_scope = limiter.locked_scope(call, tracking_number)
+    if locked_scope == "call":
+        return VerificationLockedError(
+            error_type="verification_locked",
+            message="Too many failed verification attempts, the case has been handed to our support team",
+        )
+    if locked_scope:
+        # Locked by failures of other calls too, this one isn't escalated for it
+        subject = " for this package" if locked_scope == "tracking" else ""
+        return VerificationLockedError(
+            error_type="verification_locked",
+            message=f"Too many failed verification attempts{subject}, please try again later",
+        )
+
+    exhausted_scope = limiter.check(call, tracking_number)
+    if exhausted_scope:
+        logger.warning(
+            "Rate limited tool call: scope=%s call_id=%s",
+            exhausted_scope,
+            call.get("call_id", "unknown"),
+        )
+        return RateLimitedError(
+            error_type="rate_limited",
+            message="Too many requests, please try again in a moment",
+        )
+    return None
+
+
+def record_failed_verification(
+    call: dict, tracking_number: str, session: Optional[CallSession] = None
+) -> Optional[VerificationLockedError]:
+    """Count a failed lookup and escalate the call once its own failures lock it out"""
+    if session:
+        session.failed_verifications += 1
+    if not tenant_rate_limiter().record_failed_verification(call, tracking_number):
+        return None
+
+    retell_call_id = call.get("call_id")
+    logger.warning("Verification lockout: call_id=%s", retell_call_id or "unknown")
+    if retell_call_id:
+        # Picked up by the call_ended webhook, which sends the escalation email
+        update_call_log_escalated_by_retell_call_id(
+            retell_call_id, "verification_failed"
+        )
+        if session:
+            session.pending["escalation"] = "verification_failed"
+    return VerificationLockedError(
+        error_type="verification_locked",
+        message="Too many failed verification attempts, the case has been handed to our support team",
+    )
+
+
+async def find_package(
+    budget: LatencyBudget,
+    session: Optional[CallSession],
+    tracking_number: str,
+    postal_code: str,
+) -> Optional[PackageRecord]:
+    """The package verified earlier in this call, else a database lookup.
+
+    Only a match on both identifiers is reused, so the session never verifies
+    anything the database wouldn't. Its status may be stale, the reschedule
+    write checks it again.
+    """
+    package = session.verified(tracking_number, postal_code) if session else None
+    if session:
+        session_store.record_lookup(package is not None)
+    if package is None:
+        package = await budget.run(
+            "database", get_package_by_tracking_and_postal, tracking_number, postal_code
+        )
+        if package and session:
+            session.package = package
+    return package
+
+
+def settle_reschedule(write: asyncio.Future, session: CallSession, new_time: datetime):
+    """Keep the session's package in step with a schedule update that finished late"""
+    session.pending.pop("reschedule", None)
+    if not write.cancelled() and write.exception() is None and write.result():
+        if session.package:
+            session.package.scheduled_at = new_time
+
+
+def send_confirmation(
+    customer_email: str, customer_name: str, tracking_number: str, new_time: str
+) -> bool:
+    """Job handler: confirmation email, new_time as ISO 8601"""
+    return send_reschedule_confirmation_email(
+        customer_email=customer_email,
+        customer_name=customer_name,
+        tracking_number=tracking_number,
+        new_time=datetime.fromisoformat(new_time),
+    )
+
+
+job_queue.register("confirmation_email", send_confirmation)
+
+
+def confirm_when_written(write: asyncio.Future, email: dict):
+    """Send the confirmation for a schedule update that finished after its response"""
+    if not write.cancelled() and write.exception() is None and write.result():
+        track_late(
+            job_queue.submit("confirmation_email", **{**email, "new_time": email["new_time"].isoformat()})
+        )
+
+
 @router.post("/verify_package")
+@trusted_response
 async def verify_package(
     request: RetellVerifyPackageRequest,
-) -> Union[VerifyPackageResponse, PackageNotFoundError, PackageAlreadyDeliveredError]:
-    package = get_package_by_tracking_and_postal(
-        request.args.tracking_number, request.args.postal_code
-    )
+) -> Union[
+    VerifyPackageResponse,
+    PackageNotFoundError,
+    PackageAlreadyDeliveredError,
+    RateLimitedError,
+    VerificationLockedError,
+    ServiceDegradedError,
+]:
+    budget = LatencyBudget("verify_package")
+    try:
+        rate_limit_error = await budget.run(
+            "rate_limit", check_rate_limit, request.call, request.args.tracking_number
+        )
+    except BudgetExceeded:
+        return SERVICE_DEGRADED
+    if rate_limit_error:
+        return rate_limit_error
+
+    session = session_store.get(request.call.get("call_id"))
+    try:
+        package = await find_package(
+            budget, session, request.args.tracking_number, request.args.postal_code
+        )
+    except BudgetExceeded:
+        return SERVICE_DEGRADED
 
     if not package:
+        try:
+            lockout_error = await budget.run(
+                "rate_limit",
+                record_failed_verification,
+                request.call,
+                request.args.tracking_number,
+                session,
+            )
+        except BudgetExceeded:
+            # Still counted once it lands, a lockout applies from the next tool call
+            lockout_error = None
+        if lockout_error:
+            return lockout_error
         return PackageNotFoundError(
             error_type="package_not_found",
             message="Package not found with the provided tracking number and postal code",
@@ -109,8 +309,19 @@ async def verify_package(
     retell_call_id = request.call.get("call_id")
     if not retell_call_id:
         logger.warning("Missing call_id in verify_package request")
-    else:
-        update_call_log_tracking_number(retell_call_id, request.args.tracking_number)
+    elif not session or session.logged_tracking_number != package.tracking_number:
+        try:
+            await budget.run(
+                "call_log",
+                update_call_log_tracking_number,
+                retell_call_id,
+                request.args.tracking_number,
+            )
+            if session:
+                session.logged_tracking_number = package.tracking_number
+        except BudgetExceeded:
+            # Bookkeeping only, the caller doesn't need to wait for it
+            pass
 
     # Business logic: only scheduled or out_for_delivery packages can be managed
     if package.status not in ["scheduled", "out_for_delivery"]:
@@ -129,6 +340,7 @@ async def verify_package(
 
 
 @router.post("/reschedule")
+@trusted_response
 async def reschedule_package(
     request: RetellRescheduleRequest,
 ) -> Union[
@@ -137,16 +349,54 @@ async def reschedule_package(
     PackageAlreadyDeliveredError,
     DatabaseError,
     EmailError,
+    RateLimitedError,
+    VerificationLockedError,
+    ServiceDegradedError,
+    InvalidDeliveryTimeError,
 ]:
-    # TODO: Improve time handling for natural language inputs
-    # Currently the LLM converts "tomorrow morning" -> "2025-08-10T09:00:00"
-    # Issues: ambiguous times, no validation, timezone handling
-    # Should add: predefined time slots, input validation, timezone awareness
-    package = get_package_by_tracking_and_postal(
-        request.args.tracking_number, request.args.postal_code
-    )
+    budget = LatencyBudget("reschedule")
+    try:
+        rate_limit_error = await budget.run(
+            "rate_limit", check_rate_limit, request.call, request.args.tracking_number
+        )
+    except BudgetExceeded:
+        return SERVICE_DEGRADED
+    if rate_limit_error:
+        return rate_limit_error
+
+    # Spoken times are resolved to a delivery slot here rather than by the LLM
+    new_time, delivery_window = request.args.target_time, None
+    if request.args.time_expression:
+        try:
+            window = resolve_delivery_time(request.args.time_expression, request.args.timezone)
+        except UnresolvableTime as error:
+            return InvalidDeliveryTimeError(error_type="invalid_delivery_time", message=error.message)
+        new_time, delivery_window = window.scheduled_at(), window.describe()
+
+    session = session_store.get(request.call.get("call_id"))
+    try:
+        package = await find_package(
+            budget, session, request.args.tracking_number, request.args.postal_code
+        )
+    except BudgetExceeded:
+        return SERVICE_DEGRADED
 
     if not package:
+        # Reschedule takes the same tracking number / postal code pair, so it
+        # must not be usable to bypass the verification lockout
+        try:
+            lockout_error = await budget.run(
+                "rate_limit",
+                record_failed_verification,
+                request.call,
+                request.args.tracking_number,
+                session,
+            )
+        except BudgetExceeded:
+            # Still counted once it lands, a lockout applies from the next tool call
+            lockout_error = None
+        if lockout_error:
+            return lockout_error
         return PackageNotFoundError(
             error_type="package_not_found",
             message="Package not found with the provided tracking number and postal code",
@@ -159,22 +409,74 @@ async def reschedule_package(
             current_status=package.status,
         )
 
-    success = update_package_schedule(
-        request.args.tracking_number, request.args.target_time
+    email = dict(
+        customer_email=package.email,
+        customer_name=package.customer_name,
+        tracking_number=package.tracking_number,
+        new_time=new_time,
     )
 
+    try:
+        success = await budget.run(
+            "database",
+            update_package_schedule,
+            request.args.tracking_number,
+            new_time,
+            request.call.get("call_id"),
+            package.postal_code,
+        )
+    except BudgetExceeded as exceeded:
+        # The write is still running, confirm by email once it lands
+        exceeded.pending.add_done_callback(partial(confirm_when_written, email=email))
+        if session:
+            session.pending["reschedule"] = new_time
+            exceeded.pending.add_done_callback(
+                partial(settle_reschedule, session=session, new_time=new_time)
+            )
+        return RescheduleResponse(
+            message="Reschedule is being processed, a confirmation email will follow",
+            tracking_number=request.args.tracking_number,
+            new_schedule=new_time,
+            delivery_window=delivery_window,
+        )
+
     if not success:
+        # The status may have changed since the package was looked up
+        try:
+            current = await budget.run(
+                "database",
+                get_package_by_tracking_and_postal,
+                request.args.tracking_number,
+                request.args.postal_code,
+            )
+        except BudgetExceeded:
+            return SERVICE_DEGRADED
+        if current and current.status not in ["scheduled", "out_for_delivery"]:
+            if session:
+                session.package = current
+            return PackageAlreadyDeliveredError(
+                error_type="package_already_delivered",
+                message="Package cannot be rescheduled because it has already been delivered",
+                current_status=current.status,
+            )
         return DatabaseError(
             error_type="database_error",
             message="Failed to update package schedule in database",
         )
+    if session and session.package:
+        session.package.scheduled_at = new_time
 
-    email_success = send_reschedule_confirmation_email(
-        customer_email=package.email,
-        customer_name=package.customer_name,
-        tracking_number=package.tracking_number,
-        new_time=request.args.target_time,
-    )
+    try:
+        email_success = await budget.run(
+            "email", send_reschedule_confirmation_email, **email
+        )
+    except BudgetExceeded:
+        return RescheduleResponse(
+            message="Package rescheduled successfully, the confirmation email will follow",
+            tracking_number=request.args.tracking_number,
+            new_schedule=new_time,
+            delivery_window=delivery_window,
+        )
     if not email_success:
         return EmailError(
             error_type="email_error",
@@ -184,15 +486,19 @@ async def reschedule_package(
     return RescheduleResponse(
         message="Package rescheduled successfully",
         tracking_number=request.args.tracking_number,
-        new_schedule=request.args.target_time,
+        new_schedule=new_time,
+        delivery_window=delivery_window,
     )
 
 
 @router.post("/escalate")
+@trusted_response
 async def escalate_package(
     request: RetellEscalateRequest,
 ) -> Union[EscalateResponse, EmailError]:
+    # Not rate limited: escalation is where throttled and locked out callers end up.
     # Mark call log for escalation - email will be sent after call ends with full transcript
+    budget = LatencyBudget("escalate")
     retell_call_id = request.call.get("call_id")
     if not retell_call_id:
         logger.error("Missing call_id in escalate request")
@@ -201,9 +507,34 @@ async def escalate_package(
             message="Cannot escalate - missing call identification",
         )
 
-    update_call_log_escalated_by_retell_call_id(retell_call_id)
+    session = session_store.get(retell_call_id)
+    package = session.package if session else None
+    # The escalation email names the call log's package, make sure the verified one made it there
+    if package and session.logged_tracking_number != package.tracking_number:
+        try:
+            await budget.run(
+                "call_log",
+                update_call_log_tracking_number,
+                retell_call_id,
+                package.tracking_number,
+            )
+            session.logged_tracking_number = package.tracking_number
+        except BudgetExceeded:
+            pass
+
+    # Already flagged in this call (repeated escalate, verification lockout), the first reason stays anyway
+    if not session or "escalation" not in session.pending:
+        try:
+            await budget.run(
+                "database", update_call_log_escalated_by_retell_call_id, retell_call_id
+            )
+        except BudgetExceeded:
+            # The flag still lands before the call ends, which is when it's read
+            pass
+        if session:
+            session.pending["escalation"] = "agent_escalation"
 
     return EscalateResponse(
         message="Escalation queued - email will be sent after call completion",
-        tracking_number=request.args.tracking_number,
+        tracking_number=package.tracking_number if package else request.args.tracking_number,
     )
@@ -1,4 +1,9 @@
 from fastapi import APIRouter
+from services.database import SLOW_QUERY_MS, get_job_counts, get_notification_counts, slow_query_log
+from services.latency import DEFAULT_BUDGETS, latency_stats
+from services.notifications import notification_dispatcher
+from services.sessions import session_store
+from services.tenants import tenant_registry
 
 router = APIRouter()
 
@@ -8,6 +13,42 @@ async def health_check():
     return {"status": "ok"}
 
 
+@router.get("/health/latency")
+async def latency_overruns():
+    """Tool call latency budgets and how often they were exceeded, per worker process"""
+    return latency_stats.snapshot(DEFAULT_BUDGETS)
+
+
+@router.get("/health/slow_queries")
+async def slow_queries():
+    """Most recent statements over SLOW_QUERY_MS with their query plans, per worker process"""
+    return {"threshold_ms": SLOW_QUERY_MS, "queries": slow_query_log.snapshot()}
+
+
+@router.get("/health/sessions")
+async def call_sessions():
+    """Open call sessions, lookups they answered and time spent in the store, per worker process"""
+    return session_store.snapshot()
+
+
+@router.get("/health/jobs")
+async def job_counts():
+    """Persisted background jobs (escalation / confirmation emails) by status, all processes"""
+    return get_job_counts()
+
+
+@router.get("/health/notifications")
+async def notifications():
+    """Outbox notifications by status for all processes, channel pool and rate counters per process"""
+    return {"outbox": get_notification_counts(), "channels": notification_dispatcher.snapshot()}
+
+
+@router.get("/health/tenants")
+async def tenants():
+    """Tenants with their agents and request slots (in flight, queued, rejected), per worker process"""
+    return tenant_registry.snapshot()
+
+
 @router.get("/")
 async def root():
     return {"message": "Delivery Rescheduling API"}
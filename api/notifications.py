@@ -0,0 +1,40 @@
+import asyncio
+
+from fastapi import APIRouter, HTTPException
+from models import NotificationPreferences, PackageStatusUpdate
+from services.database import (
+    get_notification_preferences,
+    set_notification_preferences,
+    update_package_statuses,
+)
+
+router = APIRouter()
+
+
+@router.post("/packages/status")
+async def update_statuses(update: PackageStatusUpdate):
+    """Set the status of many packages, e.g. the carrier's morning dispatch list.
+
+    Packages turning out_for_delivery get their notifications queued in the same
+    transaction, the background worker sends them per channel.
+    """
+    changed = await asyncio.to_thread(update_package_statuses, update.tracking_numbers, update.status)
+    return {"changed": changed}
+
+
+@router.get("/packages/{tracking_number}/notifications", response_model=NotificationPreferences)
+async def get_preferences(tracking_number: str):
+    """Channels the customer is notified on"""
+    preferences = get_notification_preferences(tracking_number)
+    if preferences is None:
+        raise HTTPException(status_code=404, detail="Package not found")
+    email, sms = preferences
+    return NotificationPreferences(email=email, sms=sms)
+
+
+@router.put("/packages/{tracking_number}/notifications", response_model=NotificationPreferences)
+async def set_preferences(tracking_number: str, preferences: NotificationPreferences):
+    """Choose the channels the customer is notified on"""
+    if not set_notification_preferences(tracking_number, preferences.email, preferences.sms):
+        raise HTTPException(status_code=404, detail="Package not found")
+    return preferences
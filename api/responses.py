@@ -0,0 +1,72 @@
+import functools
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Any, Awaitable, Callable, Iterable, Sequence
+
+import orjson
+from fastapi import Request, Response
+from pydantic import BaseModel
+
+from services.snapshots import Snapshot
+
+
+def rows_json(columns: Sequence[str], rows: Iterable[Sequence]) -> bytes:
+    """Serialize database row tuples straight to a JSON array of objects.
+
+    Only for rows from our own tables, whose column types already match the response
+    model, so building and re-validating a Pydantic model per row would be wasted work.
+    """
+    return orjson.dumps([dict(zip(columns, row)) for row in rows])
+
+
+def rows_json_response(columns: Sequence[str], rows: Iterable[Sequence]) -> Response:
+    """rows_json as a JSON response"""
+    return Response(rows_json(columns, rows), media_type="application/json")
+
+
+def not_modified(request: Request, snapshot: Snapshot) -> bool:
+    """Whether the client's conditional request headers already match the snapshot"""
+    if_none_match = request.headers.get("if-none-match")
+    if if_none_match is not None:
+        # If-None-Match wins over If-Modified-Since, its ETag is exact
+        tags = [tag.strip().removeprefix("W/") for tag in if_none_match.split(",")]
+        return "*" in tags or snapshot.etag in tags
+    if_modified_since = request.headers.get("if-modified-since")
+    if if_modified_since is not None:
+        try:
+            return snapshot.last_modified <= parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+    return False
+
+
+def snapshot_response(request: Request, snapshot: Snapshot) -> Response:
+    """Cached JSON body with validators, or an empty 304 if the client has it already"""
+    headers = {
+        "ETag": snapshot.etag,
+        "Last-Modified": format_datetime(snapshot.last_modified, usegmt=True),
+        # Clients may keep the body but have to revalidate before every use
+        "Cache-Control": "no-cache",
+    }
+    if not_modified(request, snapshot):
+        return Response(status_code=304, headers=headers)
+    return Response(snapshot.body, media_type="application/json", headers=headers)
+
+
+def trusted_response(
+    endpoint: Callable[..., Awaitable[Any]],
+) -> Callable[..., Awaitable[Any]]:
+    """Serialize returned Pydantic models to JSON bytes directly.
+
+    Our handlers only return models they constructed themselves, so FastAPI's
+    response_model validation would re-validate every field a second time.
+    The return annotation still documents the response in the OpenAPI schema.
+    """
+
+    @functools.wraps(endpoint)
+    async def wrapper(*args, **kwargs):
+        result = await endpoint(*args, **kwargs)
+        if isinstance(result, BaseModel):
+            return Response(result.model_dump_json(), media_type="application/json")
+        return result
+
+    return wrapper
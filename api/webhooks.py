@@ -1,3 +1,4 @@
+import asyncio
 import json
 import logging
 import os
@@ -8,11 +9,13 @@ from models import RetellWebhookPayload
 from services.database import (
     create_call_log,
     update_call_log_completed_by_retell_call_id,
+    get_call_transcript_by_retell_call_id,
     get_escalation_info_by_retell_call_id,
     get_package_by_tracking_number,
 )
 from services.email import send_escalation_email
-from models import EscalationReason
+from services.jobs import job_queue
+from services.sessions import session_store
 
 retell = Retell(api_key=os.environ["RETELL_API_KEY"])
 
@@ -20,6 +23,37 @@ router = APIRouter()
 logger = logging.getLogger(__name__)
 
 
+def complete_call(retell_call_id: str, transcript: str) -> bool:
+    """Store the transcript, return whether the call was escalated"""
+    update_call_log_completed_by_retell_call_id(retell_call_id, transcript)
+    return get_escalation_info_by_retell_call_id(retell_call_id) is not None
+
+
+def send_call_escalation_email(retell_call_id: str) -> bool:
+    """Job handler: escalation email with the full transcript of an escalated call"""
+    escalation_info = get_escalation_info_by_retell_call_id(retell_call_id)
+    if escalation_info is None:
+        return True
+    package = get_package_by_tracking_number(escalation_info.tracking_number)
+
+    sent = send_escalation_email(
+        tracking_number=escalation_info.tracking_number,
+        escalation_reason=escalation_info.escalation_reason,
+        transcript=get_call_transcript_by_retell_call_id(retell_call_id) or "",
+        customer_email=package.email if package else None,
+        customer_name=package.customer_name if package else None,
+    )
+    if sent:
+        logger.info(
+            "Escalation email sent for tracking %s",
+            escalation_info.tracking_number,
+        )
+    return sent
+
+
+job_queue.register("escalation_email", send_call_escalation_email)
+
+
 @router.post("/events")
 async def handle_retell_webhook(request: Request):
     """Handle RetellAI webhook events, see https://docs.retellai.com/features/secure-webhook"""
@@ -50,7 +84,11 @@ async def handle_retell_webhook(request: Request):
                     return JSONResponse(
                         status_code=400, content={"message": "Missing call_id"}
                     )
-                create_call_log(retell_call_id=payload.call.call_id)
+                await asyncio.to_thread(
+                    create_call_log, retell_call_id=payload.call.call_id
+                )
+                # Tool calls of this call reuse what it verified, if they reach this process
+                session_store.open(payload.call.call_id)
                 return Response(status_code=204)
 
             case "call_ended":
@@ -61,34 +99,17 @@ async def handle_retell_webhook(request: Request):
                         status_code=400, content={"message": "Missing call_id"}
                     )
 
+                session_store.close(payload.call.call_id)
                 # TODO: does the RetellAI API guarantee the transcript is present here?
                 transcript = payload.call.transcript or ""
-                update_call_log_completed_by_retell_call_id(
-                    payload.call.call_id, transcript
+                # Database writes block, keep them off the event loop
+                escalated = await asyncio.to_thread(
+                    complete_call, payload.call.call_id, transcript
                 )
-
-                # Check if this call was escalated and send escalation email with full transcript
-                escalation_info = get_escalation_info_by_retell_call_id(
-                    payload.call.call_id
-                )
-                if escalation_info:
-                    package = get_package_by_tracking_number(
-                        escalation_info.tracking_number
-                    )
-
-                    escalation_reason: EscalationReason = "agent_escalation"
-
-                    send_escalation_email(
-                        tracking_number=escalation_info.tracking_number,
-                        escalation_reason=escalation_reason,
-                        transcript=transcript,
-                        customer_email=package.email if package else None,
-                        customer_name=package.customer_name if package else None,
-                    )
-
-                    logger.info(
-                        "Escalation email sent for tracking %s",
-                        escalation_info.tracking_number,
+                if escalated:
+                    # Persisted before we answer, so a restart can't lose the email
+                    await job_queue.submit(
+                        "escalation_email", retell_call_id=payload.call.call_id
                     )
 
                 return Response(status_code=204)
@@ -0,0 +1,92 @@
+"""Dial throughput of the campaign runner against the fake dialer.
+
+Runs a campaign over growing numbers of packages on a virtual clock (no pacing
+waits), once with an instant dialer and once with 50ms of dial latency.
+
+Usage: python -m benchmarks.bench_campaigns [packages ...]   (default 10000 100000)
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from models import CampaignCreate
+from services.campaigns import CampaignRunner
+from services.database import create_campaign, get_campaign, update_campaign_status
+from services.dialer import FakeDialer
+
+DELIVERY_DAY = datetime(2025, 8, 2)
+NOW = datetime(2025, 8, 1, 9, 0)
+
+
+def fill_scheduled_packages(count: int):
+    conn = database.get_db_connection()
+    conn.execute("DELETE FROM packages")
+    conn.executemany(
+        """
+        INSERT INTO packages
+        (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'scheduled', ?)
+    """,
+        (
+            (
+                f"BENCH{i:07d}",
+                f"Customer {i}",
+                f"+4915{i:08d}",
+                f"customer{i}@example.com",
+                "12345",
+                "Main St",
+                str(i % 300),
+                (DELIVERY_DAY + timedelta(seconds=i % 36000)).isoformat(),
+            )
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def run_campaign(dialer: FakeDialer, max_concurrent_dials: int) -> float:
+    campaign_id = create_campaign(
+        CampaignCreate(
+            name="bench",
+            delivery_from=DELIVERY_DAY,
+            delivery_to=DELIVERY_DAY + timedelta(days=1),
+            window_start=NOW,
+            window_end=NOW + timedelta(hours=8),
+            max_concurrent_dials=max_concurrent_dials,
+        )
+    )
+    update_campaign_status(campaign_id, "running")
+    virtual_time = [0.0]
+
+    async def skip(seconds: float):
+        virtual_time[0] += seconds
+
+    runner = CampaignRunner(dialer, clock=lambda: virtual_time[0], sleep=skip, now=lambda: NOW)
+    started = time.perf_counter()
+    asyncio.run(runner.run(get_campaign(campaign_id)))
+    return time.perf_counter() - started
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for packages in sizes:
+        for latency, concurrency in [(0.0, 100), (0.05, 500)]:
+            with tempfile.TemporaryDirectory() as tmp:
+                database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+                database.init_database()
+                fill_scheduled_packages(packages)
+                elapsed = run_campaign(FakeDialer(latency_seconds=latency), concurrency)
+            print(
+                f"{packages:>7} packages, {latency * 1000:3.0f}ms dials, {concurrency} concurrent: "
+                f"{elapsed:6.2f}s  {packages / elapsed:8.0f} dials/s"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Peak memory and throughput of the streaming exports at growing table sizes.
+
+Usage: python -m benchmarks.bench_exports [rows ...]   (default 10000 100000 500000)
+"""
+
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import database
+from api.exports import encode_csv, encode_ndjson
+from fixtures.generator import fill_packages
+from models import PACKAGE_COLUMNS
+from services.database import get_max_package_id, iter_package_export_chunks
+
+
+def consume(encode) -> int:
+    size = 0
+    chunks = iter_package_export_chunks(0, get_max_package_id())
+    for part in encode(PACKAGE_COLUMNS, chunks):
+        size += len(part)
+    return size
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000, 500_000]
+    for rows in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+            database.init_database()
+            fill_packages(rows)
+
+            for name, encode in (("ndjson", encode_ndjson), ("csv", encode_csv)):
+                tracemalloc.start()
+                t0 = time.perf_counter()
+                size = consume(encode)
+                elapsed = time.perf_counter() - t0
+                _, peak = tracemalloc.get_traced_memory()
+                tracemalloc.stop()
+                print(
+                    f"{rows:>8} rows {name:>6}: {size / 1e6:7.1f} MB out in {elapsed:5.2f}s, "
+                    f"peak Python memory {peak / 1e6:5.2f} MB"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,64 @@
+"""Compare dashboard list serialization: Pydantic models + response_model vs row tuples + orjson.
+
+Usage: python -m benchmarks.bench_json_responses [rows ...]   (default 10000 100000)
+"""
+
+import gzip
+import json
+import os
+import sys
+import tempfile
+import time
+from typing import List
+
+from fastapi.encoders import jsonable_encoder
+from pydantic import TypeAdapter
+
+import database
+from api.responses import rows_json_response
+from fixtures.generator import fill_packages
+from models import Package
+from services.database import get_all_package_rows, get_all_packages
+
+
+def timed(fn, repeat: int = 3) -> float:
+    best = float("inf")
+    for _ in range(repeat):
+        t0 = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - t0)
+    return best * 1000
+
+
+def legacy() -> bytes:
+    # What FastAPI did before: build models, re-validate against response_model, encode
+    packages = get_all_packages()
+    validated = TypeAdapter(List[Package]).validate_python(packages, from_attributes=True)
+    return json.dumps(jsonable_encoder(validated)).encode()
+
+
+def fast() -> bytes:
+    return rows_json_response(*get_all_package_rows()).body
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 100_000]
+    for size in sizes:
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+            database.init_database()
+            fill_packages(size)
+
+            body = fast()
+            compressed = gzip.compress(body, compresslevel=5)
+            print(f"--- {size} rows ---")
+            print(f"legacy models + jsonable_encoder: {timed(legacy):8.1f} ms")
+            print(f"row tuples + orjson:              {timed(fast):8.1f} ms")
+            print(f"gzip level 5:                     {timed(lambda body=body: gzip.compress(body, 5)):8.1f} ms")
+            print(
+                f"payload {len(body) / 1e6:.1f} MB, gzipped {len(compressed) / 1e6:.1f} MB"
+            )
+
+
+if __name__ == "__main__":
+    main()
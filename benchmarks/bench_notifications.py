@@ -0,0 +1,80 @@
+"""Bulk out-for-delivery notifications: status flip and dispatch against fake transports.
+
+Flips growing numbers of scheduled packages to out_for_delivery in one update (the
+trigger fills the outbox), then drains the outbox with unthrottled channels, once
+with instant transports and once with 10ms per send. Half the customers want SMS.
+
+Usage: python -m benchmarks.bench_notifications [packages ...]   (default 10000 50000)
+"""
+
+import asyncio
+import os
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from services.database import update_package_statuses
+from services.notifications import Channel, FakeTransport, NotificationDispatcher
+
+DELIVERY_DAY = datetime(2025, 8, 2)
+
+
+def fill_scheduled_packages(count: int):
+    conn = database.get_db_connection()
+    conn.executemany(
+        """
+        INSERT INTO packages
+        (tracking_number, customer_name, phone, email, postal_code, street, street_number, status,
+         scheduled_at, notify_sms)
+        VALUES (?, ?, ?, ?, ?, ?, ?, 'scheduled', ?, ?)
+    """,
+        (
+            (
+                f"BENCH{i:07d}",
+                f"Customer {i}",
+                f"+4915{i:08d}",
+                f"customer{i}@example.com",
+                "12345",
+                "Main St",
+                str(i % 300),
+                (DELIVERY_DAY + timedelta(seconds=i % 36000)).isoformat(),
+                i % 2,
+            )
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    sizes = [int(arg) for arg in sys.argv[1:]] or [10_000, 50_000]
+    for packages in sizes:
+        for latency in (0.0, 0.01):
+            with tempfile.TemporaryDirectory() as tmp:
+                database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+                database.init_database()
+                fill_scheduled_packages(packages)
+
+                started = time.perf_counter()
+                update_package_statuses([f"BENCH{i:07d}" for i in range(packages)], "out_for_delivery")
+                flipped = time.perf_counter() - started
+
+                channels = {
+                    "email": Channel("email", FakeTransport(latency), workers=16, per_second=1e9, burst=1e9),
+                    "sms": Channel("sms", FakeTransport(latency), workers=16, per_second=1e9, burst=1e9),
+                }
+                started = time.perf_counter()
+                sent = asyncio.run(NotificationDispatcher(channels).dispatch())
+                dispatched = time.perf_counter() - started
+            print(
+                f"{packages:>7} packages: status flip {flipped:5.2f}s, "
+                f"{sent} notifications with {latency * 1000:2.0f}ms sends in {dispatched:6.2f}s "
+                f"({sent / dispatched:6.0f}/s)"
+            )
+
+
+if __name__ == "__main__":
+    main()
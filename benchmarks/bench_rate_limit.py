@@ -0,0 +1,51 @@
+"""Measure the per-request overhead of the function endpoint rate limiter.
+
+Usage: python -m benchmarks.bench_rate_limit [iterations]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+from services.rate_limit import (
+    FunctionRateLimiter,
+    InMemoryRateLimitBackend,
+    SQLiteRateLimitBackend,
+)
+
+# Large enough that nothing is throttled, we only want the bookkeeping cost
+UNLIMITED = {scope: (1e12, 1e12) for scope in ("call", "caller", "tracking")}
+
+
+def bench(name: str, limiter: FunctionRateLimiter, iterations: int):
+    calls = [
+        {"call_id": f"call-{i % 1000}", "from_number": f"+4915{i % 5000:07d}"}
+        for i in range(iterations)
+    ]
+    tracking_numbers = [f"PKG{i % 20000:06d}" for i in range(iterations)]
+
+    start = time.perf_counter()
+    for call, tracking_number in zip(calls, tracking_numbers):
+        limiter.is_locked_out(call)
+        limiter.check(call, tracking_number)
+    elapsed = time.perf_counter() - start
+
+    print(
+        f"{name:>8}: {iterations} checks in {elapsed:.3f}s, "
+        f"{elapsed / iterations * 1e6:.2f} us/check"
+    )
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    bench("memory", FunctionRateLimiter(InMemoryRateLimitBackend(), UNLIMITED), iterations)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        backend = SQLiteRateLimitBackend(os.path.join(tmp, "rate_limits.db"))
+        bench("sqlite", FunctionRateLimiter(backend, UNLIMITED), iterations // 10)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,95 @@
+"""Cost of the schedule history on the reschedule write, and point-in-time reads.
+
+Times update_package_schedule with and without its history insert, then the
+"as of" lookup and the reschedule counts over a history of growing size.
+
+Usage: python -m benchmarks.bench_schedule_history [history_rows]   (default 200000)
+"""
+
+import os
+import random
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+
+import database
+from fixtures.generator import fill_packages
+from services.database import (
+    get_reschedule_count_rows,
+    get_schedule_as_of,
+    update_package_schedule,
+)
+
+PACKAGES = 10_000
+WRITES = 2_000
+
+
+def update_without_history(tracking_number: str, new_time: datetime) -> bool:
+    with database.write_connection() as conn:
+        cursor = conn.execute(
+            "UPDATE packages SET scheduled_at = ? WHERE tracking_number = ?",
+            (new_time.isoformat(), tracking_number),
+        )
+        return cursor.rowcount > 0
+
+
+def time_writes(update) -> float:
+    rng = random.Random(0)
+    started = time.perf_counter()
+    for i in range(WRITES):
+        update(f"BENCH{rng.randrange(PACKAGES):07d}", datetime(2025, 9, 1) + timedelta(minutes=i))
+    return (time.perf_counter() - started) / WRITES
+
+
+def fill_history(rows: int):
+    conn = database.get_db_connection()
+    start = datetime(2025, 1, 1)
+    conn.executemany(
+        """
+        INSERT INTO package_schedule_history
+        (tracking_number, previous_scheduled_at, scheduled_at, changed_at, retell_call_id)
+        VALUES (?, ?, ?, ?, ?)
+    """,
+        (
+            (
+                f"BENCH{i % PACKAGES:07d}",
+                (start + timedelta(hours=i)).isoformat(),
+                (start + timedelta(hours=i + 1)).isoformat(),
+                (start + timedelta(minutes=i)).isoformat(),
+                f"call-{i}",
+            )
+            for i in range(rows)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def main():
+    history_rows = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        database.init_database()
+        fill_packages(PACKAGES)
+
+        print(f"reschedule write without history: {time_writes(update_without_history) * 1e6:7.1f}µs")
+        print(f"reschedule write with history:    {time_writes(update_package_schedule) * 1e6:7.1f}µs")
+
+        fill_history(history_rows)
+        rng = random.Random(1)
+        started = time.perf_counter()
+        for _ in range(WRITES):
+            get_schedule_as_of(
+                f"BENCH{rng.randrange(PACKAGES):07d}",
+                datetime(2025, 1, 1) + timedelta(minutes=rng.randrange(history_rows)),
+            )
+        print(f"schedule as of T, {history_rows} history rows: {(time.perf_counter() - started) / WRITES * 1e6:7.1f}µs")
+
+        started = time.perf_counter()
+        get_reschedule_count_rows(limit=100)
+        print(f"reschedule counts, {history_rows} history rows: {(time.perf_counter() - started) * 1000:7.1f}ms")
+
+
+if __name__ == "__main__":
+    main()
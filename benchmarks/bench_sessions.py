@@ -0,0 +1,50 @@
+"""Compare a call session lookup with the package lookup it replaces.
+
+Usage: python -m benchmarks.bench_sessions [iterations]
+"""
+
+import os
+import sys
+import tempfile
+import time
+
+import database
+from services.database import get_package_by_tracking_and_postal
+from services.sessions import SessionStore
+
+OPEN_CALLS = 1000
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200_000
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        database.init_database()
+        package = get_package_by_tracking_and_postal("001", "12345")
+
+        store = SessionStore()
+        for i in range(OPEN_CALLS):
+            store.open(f"call-{i}").package = package
+        call_ids = [f"call-{i % OPEN_CALLS}" for i in range(iterations)]
+
+        start = time.perf_counter()
+        for call_id in call_ids:
+            store.get(call_id).verified("001", "12345")
+        elapsed = time.perf_counter() - start
+        print(
+            f"session: {iterations} lookups in {elapsed:.3f}s, "
+            f"{elapsed / iterations * 1e6:.2f} us/lookup "
+            f"({store.snapshot()['overhead_us_per_operation']} us in the store)"
+        )
+
+        queries = iterations // 20
+        start = time.perf_counter()
+        for _ in range(queries):
+            get_package_by_tracking_and_postal("001", "12345")
+        elapsed = time.perf_counter() - start
+        print(f"database: {queries} lookups in {elapsed:.3f}s, {elapsed / queries * 1e6:.2f} us/lookup")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Write throughput of one package file vs the package store split into shards.
+
+Several writer processes (MULTI_PROCESS mode, like uvicorn --workers) reschedule
+random packages of all regions as fast as they can, then a nightly-style bulk
+load goes through load_packages. Run once unsharded and once per shard count.
+
+Usage: python -m benchmarks.bench_shards [writers] [writes_per_writer]   (default 4 2000)
+"""
+
+import json
+import multiprocessing
+import os
+import random
+import sys
+import tempfile
+import time
+from collections import Counter
+from datetime import datetime, timedelta
+from typing import List, Optional, Tuple
+
+import database
+from fixtures.generator import fill_packages
+from services import sharding
+from services.database import iter_package_store_rows, load_packages, update_package_schedule
+
+PACKAGES = 20_000
+LOAD_PACKAGES = 50_000
+SHARD_COUNTS = [2, 4, 8]
+
+
+def write_shard_map(tmp: str, shards: int) -> str:
+    """Route postal codes by their first digit, round robin over the shards"""
+    path = os.path.join(tmp, "shards.json")
+    with open(path, "w") as f:
+        json.dump(
+            {
+                "shards": {f"shard{i}": f"shard{i}.db" for i in range(shards)},
+                "routes": {str(digit): f"shard{digit % shards}" for digit in range(10)},
+                "default": "shard0",
+            },
+            f,
+        )
+    return path
+
+
+def configure(database_path: str, map_path: Optional[str]):
+    database.DATABASE_PATH = database_path
+    database.MULTI_PROCESS = True
+    sharding.shard_map = sharding.ShardMap.load(map_path) if map_path else None
+
+
+def writer(database_path: str, map_path: Optional[str], packages: List[Tuple[str, str]], seed: int) -> float:
+    configure(database_path, map_path)
+    rng = random.Random(seed)
+    started = time.perf_counter()
+    for tracking_number, postal_code in packages:
+        update_package_schedule(
+            tracking_number, datetime(2025, 9, 1) + timedelta(minutes=rng.randrange(10_000)), None, postal_code
+        )
+    return time.perf_counter() - started
+
+
+def run(tmp: str, shards: int, writers: int, writes: int) -> str:
+    database_path = os.path.join(tmp, "bench.db")
+    map_path = write_shard_map(tmp, shards) if shards > 1 else None
+    configure(database_path, map_path)
+    database.init_database()
+    fill_packages(PACKAGES)
+    if sharding.shard_map is not None:
+        sharding.rebalance(sharding.shard_map)
+
+    packages = list(iter_package_store_rows("SELECT tracking_number, postal_code FROM packages"))
+
+    rng = random.Random(0)
+    batches = [[rng.choice(packages) for _ in range(writes)] for _ in range(writers)]
+    per_shard = Counter(sharding.package_store_path(postal) for batch in batches for _, postal in batch)
+    with multiprocessing.Pool(writers) as pool:
+        started = time.perf_counter()
+        pool.starmap(writer, [(database_path, map_path, batch, i) for i, batch in enumerate(batches)])
+        elapsed = time.perf_counter() - started
+
+    start = datetime(2025, 9, 1, 8, 0)
+    load = [
+        (
+            f"LOAD{i:07d}",
+            f"Customer {i}",
+            f"+4916{i:08d}",
+            f"load{i}@example.com",
+            f"{10000 + i % 89999}",
+            "Main St",
+            str(i % 300),
+            "scheduled",
+            (start + timedelta(minutes=i)).isoformat(),
+        )
+        for i in range(LOAD_PACKAGES)
+    ]
+    load_started = time.perf_counter()
+    load_packages(load)
+    load_elapsed = time.perf_counter() - load_started
+
+    total = writers * writes
+    busiest = max(per_shard.values())
+    return (
+        f"{shards if shards > 1 else 'unsharded':>9} {total / elapsed:>12,.0f} "
+        f"{busiest / elapsed:>16,.0f} {LOAD_PACKAGES / load_elapsed:>14,.0f}"
+    )
+
+
+def main():
+    writers = int(sys.argv[1]) if len(sys.argv) > 1 else 4
+    writes = int(sys.argv[2]) if len(sys.argv) > 2 else 2000
+    print(f"{writers} writer processes x {writes} reschedules, {PACKAGES} packages")
+    print(f"{'shards':>9} {'writes/s':>12} {'busiest shard/s':>16} {'bulk load/s':>14}")
+    for shards in [1] + SHARD_COUNTS:
+        with tempfile.TemporaryDirectory() as tmp:
+            print(run(tmp, shards, writers, writes))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,130 @@
+"""Mixed-tenant load: does a flood of one tenant's tool calls slow down another tenant?
+
+Two tenants with their own database of 2000 packages each. The quiet tenant makes
+verify_package calls from a few concurrent callers, first alone, then while the
+noisy tenant floods the app from many concurrent callers. Runs once with the noisy
+tenant's request slots unbounded and once with the default
+TENANT_MAX_CONCURRENT_REQUESTS, in process through httpx ASGITransport.
+
+Usage: python -m benchmarks.bench_tenants [seconds] [noisy callers]   (default 5 200)
+"""
+
+import asyncio
+import json
+import os
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime, timedelta
+from itertools import count
+
+import httpx
+
+os.environ.setdefault("RETELL_API_KEY", "benchmark")
+# Statements wait for the CPU under the flood, that is not what is measured here
+os.environ.setdefault("SLOW_QUERY_MS", "10000")
+
+import database
+from main import app
+from services.tenants import TENANT_MAX_CONCURRENT_REQUESTS, TenantMiddleware, TenantRegistry
+
+PACKAGES = 2000
+QUIET_CALLERS = 4
+
+
+def fill_packages(path: str):
+    conn = database.get_db_connection(path=path)
+    conn.executemany(
+        """
+        INSERT INTO packages
+        (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+        VALUES (?, ?, ?, ?, ?, 'Main St', '1', 'scheduled', ?)
+    """,
+        (
+            (
+                f"T{i:06d}",
+                f"Customer {i}",
+                f"+4915{i:08d}",
+                f"customer{i}@example.com",
+                f"{10000 + i % 500}",
+                (datetime.now() + timedelta(days=2, seconds=i)).isoformat(),
+            )
+            for i in range(PACKAGES)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def create_registry(tmp: str, noisy_slots: int) -> TenantRegistry:
+    path = os.path.join(tmp, "tenants.json")
+    tenants = {
+        "noisy": {"agent_ids": ["agent_noisy"], "database": "noisy.db", "max_concurrent_requests": noisy_slots},
+        "quiet": {"agent_ids": ["agent_quiet"], "database": "quiet.db"},
+    }
+    with open(path, "w") as f:
+        json.dump({"tenants": tenants}, f)
+    registry = TenantRegistry(path, reload_seconds=3600, queue_seconds=30)
+    for tenant in registry.tenants.values():
+        fill_packages(tenant.database_path)
+    return registry
+
+
+async def caller(client: httpx.AsyncClient, agent_id: str, ids, deadline: float, latencies: list, statuses: dict):
+    while time.perf_counter() < deadline:
+        i = next(ids)
+        body = {
+            "call": {"call_id": f"{agent_id}-{i}", "agent_id": agent_id},
+            "name": "verify_package",
+            "args": {"tracking_number": f"T{i % PACKAGES:06d}", "postal_code": f"{10000 + i % PACKAGES % 500}"},
+        }
+        started = time.perf_counter()
+        response = await client.post("/api/functions/verify_package", json=body)
+        latencies.append(time.perf_counter() - started)
+        statuses[response.status_code] = statuses.get(response.status_code, 0) + 1
+
+
+def percentile(latencies: list, q: float) -> float:
+    return statistics.quantiles(latencies, n=100)[q - 1] * 1000 if len(latencies) > 1 else float("nan")
+
+
+async def run(registry: TenantRegistry, seconds: float, noisy_callers: int) -> dict:
+    transport = httpx.ASGITransport(app=TenantMiddleware(app, registry))
+    results = {}
+    async with httpx.AsyncClient(transport=transport, base_url="http://bench", timeout=60) as client:
+        for phase, flood in (("alone", 0), ("flooded", noisy_callers)):
+            quiet, noisy = [], []
+            quiet_statuses, noisy_statuses = {}, {}
+            deadline = time.perf_counter() + seconds
+            ids = count()
+            await asyncio.gather(
+                *(caller(client, "agent_quiet", ids, deadline, quiet, quiet_statuses) for _ in range(QUIET_CALLERS)),
+                *(caller(client, "agent_noisy", ids, deadline, noisy, noisy_statuses) for _ in range(flood)),
+            )
+            results[phase] = (quiet, quiet_statuses, noisy, noisy_statuses)
+    return results
+
+
+def main():
+    seconds = float(sys.argv[1]) if len(sys.argv) > 1 else 5.0
+    noisy_callers = int(sys.argv[2]) if len(sys.argv) > 2 else 200
+    print(f"{QUIET_CALLERS} quiet callers, {noisy_callers} noisy callers, {seconds:.0f}s per phase")
+    for label, slots in (("unbounded", 1_000_000), (f"{TENANT_MAX_CONCURRENT_REQUESTS} slots", TENANT_MAX_CONCURRENT_REQUESTS)):
+        with tempfile.TemporaryDirectory() as tmp:
+            database.DATABASE_PATH = os.path.join(tmp, "default.db")
+            database.init_database()
+            results = asyncio.run(run(create_registry(tmp, slots), seconds, noisy_callers))
+        print(f"noisy tenant {label}:")
+        for phase, (quiet, quiet_statuses, noisy, noisy_statuses) in results.items():
+            line = (
+                f"  {phase:8} quiet {len(quiet) / seconds:6.0f} calls/s  p50 {percentile(quiet, 50):6.1f}ms"
+                f"  p95 {percentile(quiet, 95):6.1f}ms  {quiet_statuses}"
+            )
+            if noisy:
+                line += f"  | noisy {len(noisy) / seconds:6.0f} calls/s {noisy_statuses}"
+            print(line)
+
+
+if __name__ == "__main__":
+    main()
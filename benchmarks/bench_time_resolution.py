@@ -0,0 +1,62 @@
+"""Cost of resolving spoken delivery times, cold (parsing) and cached.
+
+Usage: python -m benchmarks.bench_time_resolution [iterations]   (default 100000)
+"""
+
+import sys
+import time
+from datetime import datetime, timezone
+
+from services.time_resolution import parse_time_expression, resolve_delivery_time
+
+EXPRESSIONS = [
+    "tomorrow morning",
+    "tomorrow at 3pm",
+    "friday after 3",
+    "next week in the morning",
+    "monday next week between 2 and 4 pm",
+    "the day after tomorrow in the evening",
+    "August 12th at 9:30",
+    "12.08. at 9.30",
+    "in 2 hours",
+    "as soon as possible",
+    "Tomorrow, around 2 p.m., please!",
+    "not tomorrow",
+]
+NOW = datetime(2025, 8, 6, 10, 15, tzinfo=timezone.utc)
+
+
+def per_call_us(fn, iterations: int) -> float:
+    started = time.perf_counter()
+    for i in range(iterations):
+        fn(i)
+    return (time.perf_counter() - started) / iterations * 1e6
+
+
+def resolve(expression: str):
+    try:
+        resolve_delivery_time(expression, "Europe/Berlin", NOW)
+    except ValueError:
+        pass
+
+
+def main():
+    iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+
+    def cold(i: int):
+        parse_time_expression.cache_clear()
+        parse_time_expression(EXPRESSIONS[i % len(EXPRESSIONS)])
+
+    def cached(i: int):
+        parse_time_expression(EXPRESSIONS[i % len(EXPRESSIONS)])
+
+    def resolved(i: int):
+        resolve(EXPRESSIONS[i % len(EXPRESSIONS)])
+
+    print(f"parse, uncached:        {per_call_us(cold, iterations // 10):7.2f}µs")
+    print(f"parse, cached:          {per_call_us(cached, iterations):7.2f}µs")
+    print(f"resolve (parse cached): {per_call_us(resolved, iterations):7.2f}µs")
+
+
+if __name__ == "__main__":
+    main()
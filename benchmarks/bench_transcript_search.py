@@ -0,0 +1,91 @@
+"""Query latency of the call transcript full-text search.
+
+Usage: python -m benchmarks.bench_transcript_search [transcripts]   (default 1,000,000)
+"""
+
+import os
+import random
+import statistics
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+from services.database import search_call_logs
+
+PHRASES = [
+    "the parcel was left at neighbor",
+    "the box arrived damaged",
+    "can you deliver tomorrow morning",
+    "I will not be home on Saturday",
+    "please leave it at the back door",
+    "my tracking number is not working",
+    "the driver never rang the bell",
+    "I want to speak to a human",
+    "could you move it to the afternoon",
+    "thanks that works for me",
+]
+FILLER = "agent user hello yes no okay package delivery time address postal code thank you".split()
+QUERIES = ['"left at neighbor"', "damaged", "saturday afternoon", "human", "zzzz"]
+
+
+def make_transcript(rng: random.Random) -> str:
+    parts = []
+    for _ in range(rng.randint(6, 14)):
+        if rng.random() < 0.3:
+            parts.append(rng.choice(PHRASES))
+        else:
+            parts.append(" ".join(rng.choices(FILLER, k=rng.randint(4, 12))))
+    return ". ".join(parts)
+
+
+def main():
+    count = int(sys.argv[1]) if len(sys.argv) > 1 else 1_000_000
+    rng = random.Random(42)
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        database.init_database()
+
+        conn = database.get_db_connection()
+        now = datetime.now().isoformat()
+        start = time.perf_counter()
+        # Bulk load without the per-row trigger, then index everything in one pass
+        conn.execute("DROP TRIGGER call_logs_fts_insert")
+        batch_size = 50_000
+        for batch_start in range(0, count, batch_size):
+            conn.executemany(
+                "INSERT INTO call_logs (retell_call_id, transcript, completed, created_at) VALUES (?, ?, ?, ?)",
+                (
+                    (f"bench-{i}", make_transcript(rng), now, now)
+                    for i in range(batch_start, min(batch_start + batch_size, count))
+                ),
+            )
+        conn.commit()
+        loaded = time.perf_counter()
+        database.rebuild_search_index(conn)
+        indexed = time.perf_counter()
+        conn.close()
+        database.init_database()  # restore the trigger
+
+        print(f"loaded {count} transcripts in {loaded - start:.1f}s")
+        print(f"rebuild-search-index took {indexed - loaded:.1f}s")
+
+        for query in QUERIES:
+            for offset in (0, 100):
+                timings = []
+                for _ in range(20):
+                    t0 = time.perf_counter()
+                    page = search_call_logs(query, limit=20, offset=offset)
+                    timings.append((time.perf_counter() - t0) * 1000)
+                timings.sort()
+                print(
+                    f"{query!r:>22} offset={offset:<4} total={page.total:<8} "
+                    f"p50={statistics.median(timings):7.2f}ms "
+                    f"p95={timings[int(len(timings) * 0.95) - 1]:7.2f}ms"
+                )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,120 @@
+"""Throughput of uvicorn with 1 to 8 worker processes in MULTI_PROCESS mode.
+
+Starts a real server per worker count on a scratch database and drives a mix of
+verify_package reads (90%) and reschedule writes (10%) over HTTP.
+
+Usage: python -m benchmarks.bench_workers [seconds_per_run] [concurrency]
+"""
+
+import asyncio
+import os
+import random
+import subprocess
+import sys
+import tempfile
+import time
+
+import httpx
+
+import database
+
+PORT = 8765
+WORKER_COUNTS = [1, 2, 4, 8]
+
+
+async def wait_until_up(client: httpx.AsyncClient):
+    for _ in range(300):
+        try:
+            if (await client.get("/api/health")).status_code == 200:
+                return
+        except httpx.TransportError:
+            pass
+        await asyncio.sleep(0.1)
+    raise RuntimeError("server did not start")
+
+
+async def drive(duration: float, concurrency: int) -> int:
+    completed = 0
+
+    async with httpx.AsyncClient(
+        base_url=f"http://127.0.0.1:{PORT}", trust_env=False, timeout=30
+    ) as client:
+        await wait_until_up(client)
+        deadline = time.perf_counter() + duration
+
+        async def caller(n: int):
+            nonlocal completed
+            rng = random.Random(n)
+            i = 0
+            while time.perf_counter() < deadline:
+                i += 1
+                call = {"call_id": f"bench-{n}-{i}"}
+                if rng.random() < 0.9:
+                    await client.post(
+                        "/api/functions/verify_package",
+                        json={
+                            "call": call,
+                            "name": "verify_package",
+                            "args": {"tracking_number": "001", "postal_code": "12345"},
+                        },
+                    )
+                else:
+                    await client.post(
+                        "/api/functions/reschedule",
+                        json={
+                            "call": call,
+                            "name": "reschedule",
+                            "args": {
+                                "tracking_number": "002",
+                                "postal_code": "67890",
+                                "target_time": "2025-08-10T14:00:00",
+                            },
+                        },
+                    )
+                completed += 1
+
+        await asyncio.gather(*(caller(n) for n in range(concurrency)))
+    return completed
+
+
+def main():
+    duration = float(sys.argv[1]) if len(sys.argv) > 1 else 10.0
+    concurrency = int(sys.argv[2]) if len(sys.argv) > 2 else 64
+    repo_root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    print(f"{os.cpu_count()} CPUs available")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        db_path = os.path.join(tmp, "bench.db")
+        database.DATABASE_PATH = db_path
+        database.init_database()
+
+        env = {
+            **os.environ,
+            "DATABASE_PATH": db_path,
+            "MULTI_PROCESS": "1",
+            "RATE_LIMIT_DB_PATH": os.path.join(tmp, "rate_limits.db"),
+            "RETELL_API_KEY": os.environ.get("RETELL_API_KEY", "bench"),
+            # Measure the backend, not the limiter rejecting our synthetic load
+            "RATE_LIMIT_TRACKING_BURST": "1000000000",
+            "RATE_LIMIT_TRACKING_PER_MINUTE": "1000000000",
+            "RESEND_API_KEY": "",
+        }
+        for workers in WORKER_COUNTS:
+            server = subprocess.Popen(
+                [
+                    sys.executable, "-m", "uvicorn", "main:app",
+                    "--port", str(PORT), "--workers", str(workers), "--log-level", "warning",
+                ],
+                cwd=repo_root,
+                env=env,
+            )
+            try:
+                completed = asyncio.run(drive(duration, concurrency))
+            finally:
+                server.terminate()
+                server.wait()
+            print(f"{workers} workers: {completed / duration:8.0f} req/s")
+
+
+if __name__ == "__main__":
+    main()
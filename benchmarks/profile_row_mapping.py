@@ -0,0 +1,82 @@
+"""Profile package scans: per-row Pydantic validation vs the shared row mapping layer.
+
+Usage: python -m benchmarks.profile_row_mapping [rows]   (default 100000)
+"""
+
+import cProfile
+import os
+import pstats
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+import database
+from fixtures.generator import fill_packages
+from models import Package
+from services.database import get_all_packages, iter_packages
+
+
+def legacy_get_all_packages():
+    # The mapping services/database.py used before: sqlite3.Row, fromisoformat and
+    # full model validation for every row
+    conn = sqlite3.connect(database.DATABASE_PATH)
+    conn.row_factory = sqlite3.Row
+    try:
+        cursor = conn.execute("""
+            SELECT id, tracking_number, customer_name, phone, email, postal_code,
+                   street, street_number, status, scheduled_at
+            FROM packages
+            ORDER BY scheduled_at DESC
+        """)
+        return [
+            Package(
+                id=row["id"],
+                tracking_number=row["tracking_number"],
+                customer_name=row["customer_name"],
+                phone=row["phone"],
+                email=row["email"],
+                postal_code=row["postal_code"],
+                street=row["street"],
+                street_number=row["street_number"],
+                status=row["status"],
+                scheduled_at=datetime.fromisoformat(row["scheduled_at"]),
+            )
+            for row in cursor.fetchall()
+        ]
+    finally:
+        conn.close()
+
+
+def stream_packages():
+    # Constant memory: consume the generator without keeping the models around
+    for _ in iter_packages():
+        pass
+
+
+def profile(name: str, fn):
+    t0 = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - t0
+    print(f"=== {name}: {elapsed * 1000:.0f} ms ===")
+
+    profiler = cProfile.Profile()
+    profiler.runcall(fn)
+    pstats.Stats(profiler).sort_stats("tottime").print_stats(6)
+
+
+def main():
+    rows = int(sys.argv[1]) if len(sys.argv) > 1 else 100_000
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "bench.db")
+        database.init_database()
+        fill_packages(rows)
+
+        profile("legacy Row + fromisoformat + Package(...)", legacy_get_all_packages)
+        profile("tuple rows + DATETIME converter + slotted records", get_all_packages)
+        profile("streamed through iter_packages", stream_packages)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,54 @@
+from datetime import datetime, timedelta
+
+import pytest
+
+import database
+
+DELIVERY_DAY = datetime(2025, 8, 2)
+
+
+@pytest.fixture
+def db(tmp_path, monkeypatch):
+    """Fresh seeded database per test"""
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    database.init_database()
+
+
+@pytest.fixture
+def fill_packages(db):
+    """Adds count packages delivered through DELIVERY_DAY, every sms_every-th one wants SMS
+
+    Returns their tracking numbers, which are unique per status.
+    """
+
+    def fill(count: int, status: str = "scheduled", sms_every: int = 1) -> list:
+        rows = [
+            (
+                f"{status[:3].upper()}{i:07d}",
+                f"Customer {i}",
+                f"+4915{i:08d}",
+                f"customer{i}@example.com",
+                "12345",
+                "Main St",
+                str(i),
+                status,
+                (DELIVERY_DAY + timedelta(seconds=i % 36000)).isoformat(),
+                int(i % sms_every == 0),
+            )
+            for i in range(count)
+        ]
+        conn = database.get_db_connection()
+        conn.executemany(
+            """
+            INSERT INTO packages
+            (tracking_number, customer_name, phone, email, postal_code, street, street_number, status,
+             scheduled_at, notify_sms)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            rows,
+        )
+        conn.commit()
+        conn.close()
+        return [row[0] for row in rows]
+
+    return fill
@@ -1,35 +1,271 @@
+import argparse
+import fcntl
+import os
 import sqlite3
+import threading
+from contextlib import contextmanager
+from contextvars import ContextVar
 from datetime import datetime, timedelta
+from typing import Dict, Optional
 
-DATABASE_PATH = "delivery_service.db"
+DATABASE_PATH = os.getenv("DATABASE_PATH", "delivery_service.db")
+# Database of the tenant a request or task serves, see services/tenants.py.
+# None for the default tenant, which uses DATABASE_PATH.
+tenant_database: ContextVar[Optional[str]] = ContextVar("tenant_database", default=None)
 
+# Set MULTI_PROCESS=1 when running several worker processes (uvicorn --workers N)
+# against the same database file, see services/coordination.py
+MULTI_PROCESS = os.getenv("MULTI_PROCESS") == "1"
+BUSY_TIMEOUT_SECONDS = 10
 
-def get_db_connection():
-    """Get database connection with row factory for easier access"""
-    conn = sqlite3.connect(DATABASE_PATH)
+
+def convert_datetime(value: bytes) -> datetime:
+    """Parse DATETIME columns (stored as ISO 8601 text) once, at the sqlite3 level"""
+    return datetime.fromisoformat(value.decode())
+
+
+sqlite3.register_converter("DATETIME", convert_datetime)
+
+# Connection class of every connection, the app swaps in one that logs slow queries on startup
+# (services.database.install_slow_query_logging)
+connection_factory = sqlite3.Connection
+
+
+def default_path() -> str:
+    """Main database of the tenant being served"""
+    return tenant_database.get() or DATABASE_PATH
+
+
+def get_db_connection(check_same_thread: bool = True, path: Optional[str] = None):
+    """Get database connection with row factory for easier access.
+
+    Columns declared DATETIME are returned as datetime objects. Pass
+    check_same_thread=False for connections handed between threads one at a time,
+    e.g. by a streaming response iterating a generator in the threadpool.
+    path selects a package shard instead of the main database, see services/sharding.py.
+    """
+    conn = sqlite3.connect(
+        path or default_path(),
+        timeout=BUSY_TIMEOUT_SECONDS,
+        detect_types=sqlite3.PARSE_DECLTYPES,
+        check_same_thread=check_same_thread,
+        factory=connection_factory,
+    )
     conn.row_factory = sqlite3.Row
+    # In WAL mode NORMAL only syncs at checkpoints instead of on every commit. The
+    # database stays consistent after a power loss, only the last commits may be lost.
+    conn.execute("PRAGMA synchronous=NORMAL")
     return conn
 
 
-def init_database():
-    """Initialize database with schema and seed data"""
-    conn = get_db_connection()
+# One writer per database file, writers of different shards don't wait for each other
+_thread_write_locks: Dict[str, threading.Lock] = {}
+_thread_write_locks_guard = threading.Lock()
+_process_lock_files = {}
+
+
+@contextmanager
+def write_lock(path: Optional[str] = None):
+    """Serialize writers: across threads always, across processes in MULTI_PROCESS mode.
+
+    SQLite allows a single writer anyway, but contended writers otherwise spin on
+    busy timeouts or fail with "database is locked" when upgrading a read transaction.
+    """
+    path = path or default_path()
+    with _thread_write_locks_guard:
+        thread_lock = _thread_write_locks.setdefault(path, threading.Lock())
+    with thread_lock:
+        if not MULTI_PROCESS:
+            yield
+            return
+
+        lock_file = _process_lock_files.get(path)
+        if lock_file is None:
+            lock_file = open(path + ".write-lock", "a")
+            _process_lock_files[path] = lock_file
+        fcntl.flock(lock_file, fcntl.LOCK_EX)
+        try:
+            yield
+        finally:
+            fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+
+@contextmanager
+def write_connection(path: Optional[str] = None):
+    """Connection for a single write transaction, committed on success, rolled back on error"""
+    with write_lock(path):
+        conn = get_db_connection(path=path)
+        try:
+            conn.execute("BEGIN IMMEDIATE")
+            yield conn
+            conn.commit()
+        except BaseException:
+            conn.rollback()
+            raise
+        finally:
+            conn.close()
+
+
+def checkpoint(path: Optional[str] = None):
+    """Copy the WAL into the database file and truncate it, e.g. before a restart"""
+    conn = get_db_connection(path=path)
+    try:
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+
+
+def ensure_column(conn, table: str, column: str, declaration: str):
+    """Add a column to an existing table, CREATE TABLE IF NOT EXISTS won't do that for us"""
+    columns = {row["name"] for row in conn.execute(f"PRAGMA table_info({table})")}
+    if column not in columns:
+        conn.execute(f"ALTER TABLE {table} ADD COLUMN {column} {declaration}")
+
+
+def rebuild_search_index(conn=None):
+    """Rebuild the transcript full-text index from call_logs, e.g. for rows written before it existed"""
+    own_conn = conn is None
+    if own_conn:
+        conn = get_db_connection()
+    try:
+        conn.execute("INSERT INTO call_logs_fts(call_logs_fts) VALUES ('rebuild')")
+        conn.commit()
+    finally:
+        if own_conn:
+            conn.close()
+
+
+# Tables that live in every package shard (and in the main database when unsharded).
+# A schedule change is written together with its history row, so both stay in one file.
+PACKAGE_STORE_SCHEMA = """
+    CREATE TABLE IF NOT EXISTS packages (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tracking_number TEXT UNIQUE NOT NULL,
+        customer_name TEXT NOT NULL,
+        phone TEXT NOT NULL,
+        email TEXT NOT NULL,
+        postal_code TEXT NOT NULL,
+        street TEXT NOT NULL,
+        street_number TEXT NOT NULL,
+        status TEXT NOT NULL CHECK (status IN ('scheduled', 'out_for_delivery', 'delivered')),
+        scheduled_at DATETIME NOT NULL,
+        notify_email INTEGER NOT NULL DEFAULT 1,
+        notify_sms INTEGER NOT NULL DEFAULT 1
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_package_lookup ON packages (tracking_number, postal_code);
+    CREATE INDEX IF NOT EXISTS idx_packages_status_scheduled ON packages (status, scheduled_at);
+
+    -- Append-only log of scheduled_at changes, written in the same transaction as
+    -- the update. Both indexes carry every column their queries read, so "schedule
+    -- as of T" and "reschedules per package" never touch the table itself.
+    CREATE TABLE IF NOT EXISTS package_schedule_history (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tracking_number TEXT NOT NULL,
+        previous_scheduled_at DATETIME,
+        scheduled_at DATETIME NOT NULL,
+        changed_at DATETIME NOT NULL,
+        retell_call_id TEXT
+    );
+
+    CREATE INDEX IF NOT EXISTS idx_schedule_history_as_of ON package_schedule_history
+        (tracking_number, changed_at, scheduled_at, previous_scheduled_at);
+    CREATE INDEX IF NOT EXISTS idx_schedule_history_call ON package_schedule_history
+        (retell_call_id) WHERE retell_call_id IS NOT NULL;
+
+    CREATE TRIGGER IF NOT EXISTS package_schedule_history_no_update
+    BEFORE UPDATE ON package_schedule_history
+    BEGIN
+        SELECT RAISE(ABORT, 'package_schedule_history is append-only');
+    END;
+
+    -- Customer notifications to send, see services/notifications.py
+    CREATE TABLE IF NOT EXISTS notification_outbox (
+        id INTEGER PRIMARY KEY AUTOINCREMENT,
+        tracking_number TEXT NOT NULL,
+        kind TEXT NOT NULL,
+        channel TEXT NOT NULL CHECK (channel IN ('email', 'sms')),
+        status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'sending', 'sent', 'failed')),
+        attempts INTEGER NOT NULL DEFAULT 0,
+        claimed_at DATETIME,
+        sent_at DATETIME,
+        last_error TEXT,
+        created_at DATETIME NOT NULL
+    );
+    CREATE INDEX IF NOT EXISTS idx_notification_outbox_pending ON notification_outbox (channel, status);
+"""
+
+# Queues an out-for-delivery notification per channel the customer wants, in the
+# transaction that changes the status, so a bulk update of thousands of packages
+# fills the outbox in one go. Created after the preference columns exist.
+OUT_FOR_DELIVERY_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS packages_out_for_delivery_notify
+    AFTER UPDATE OF status ON packages
+    WHEN new.status = 'out_for_delivery' AND old.status != 'out_for_delivery'
+    BEGIN
+        INSERT INTO notification_outbox (tracking_number, kind, channel, created_at)
+        SELECT new.tracking_number, 'out_for_delivery', channel, strftime('%Y-%m-%dT%H:%M:%f', 'now', 'localtime')
+        FROM (SELECT 'email' AS channel WHERE new.notify_email UNION ALL SELECT 'sms' WHERE new.notify_sms);
+    END;
+"""
+
+# Kept separate so shard rebalancing can lift it while it moves history rows
+HISTORY_NO_DELETE_TRIGGER = """
+    CREATE TRIGGER IF NOT EXISTS package_schedule_history_no_delete
+    BEFORE DELETE ON package_schedule_history
+    BEGIN
+        SELECT RAISE(ABORT, 'package_schedule_history is append-only');
+    END;
+"""
+
+
+def migrate_package_store(conn):
+    """Columns and triggers added to the package tables after the initial schema"""
+    ensure_column(conn, "packages", "notify_email", "INTEGER NOT NULL DEFAULT 1")
+    ensure_column(conn, "packages", "notify_sms", "INTEGER NOT NULL DEFAULT 1")
+    conn.executescript(OUT_FOR_DELIVERY_TRIGGER)
+
+
+def init_package_store(path: str, id_offset: int = 0):
+    """Create the package tables in a shard file.
+
+    Package ids start above id_offset, which gives every shard its own id range so
+    ids stay unique across shards and a scan in shard order is a scan in id order.
+    """
+    conn = get_db_connection(path=path)
+    try:
+        conn.execute("PRAGMA journal_mode=WAL")
+        conn.executescript(PACKAGE_STORE_SCHEMA + HISTORY_NO_DELETE_TRIGGER)
+        migrate_package_store(conn)
+        conn.execute(
+            """
+            INSERT INTO sqlite_sequence (name, seq)
+            SELECT 'packages', ? WHERE NOT EXISTS (
+                SELECT 1 FROM sqlite_sequence WHERE name = 'packages'
+            )
+        """,
+            (id_offset,),
+        )
+        conn.commit()
+    finally:
+        conn.close()
+
+
+def init_database(path: Optional[str] = None, seed: bool = True):
+    """Initialize database with schema and seed data, the current tenant's unless path is given"""
+    conn = get_db_connection(path=path)
+
+    # WAL lets readers (dashboard polls, lookups) run while a write is in progress,
+    # also across worker processes. The mode is persistent in the database file.
+    conn.execute("PRAGMA journal_mode=WAL")
+
+    search_index_exists = conn.execute(
+        "SELECT 1 FROM sqlite_master WHERE type = 'table' AND name = 'call_logs_fts'"
+    ).fetchone()
 
     # Create tables
+    conn.executescript(PACKAGE_STORE_SCHEMA + HISTORY_NO_DELETE_TRIGGER)
     conn.executescript("""
-        CREATE TABLE IF NOT EXISTS packages (
-            id INTEGER PRIMARY KEY AUTOINCREMENT,
-            tracking_number TEXT UNIQUE NOT NULL,
-            customer_name TEXT NOT NULL,
-            phone TEXT NOT NULL,
-            email TEXT NOT NULL,
-            postal_code TEXT NOT NULL,
-            street TEXT NOT NULL,
-            street_number TEXT NOT NULL,
-            status TEXT NOT NULL CHECK (status IN ('scheduled', 'out_for_delivery', 'delivered')),
-            scheduled_at DATETIME NOT NULL
-        );
-        
         CREATE TABLE IF NOT EXISTS call_logs (
             id INTEGER PRIMARY KEY AUTOINCREMENT,
             retell_call_id TEXT NOT NULL UNIQUE,
@@ -37,14 +273,103 @@ def init_database():
             transcript TEXT,
             completed DATETIME,
             escalated DATETIME,
+            escalation_reason TEXT,
+            direction TEXT NOT NULL DEFAULT 'inbound' CHECK (direction IN ('inbound', 'outbound')),
+            campaign_id INTEGER REFERENCES campaigns (id),
+            outcome TEXT,
             created_at DATETIME NOT NULL DEFAULT CURRENT_TIMESTAMP
         );
+
+        CREATE TABLE IF NOT EXISTS campaigns (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            name TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'completed', 'cancelled')),
+            delivery_from DATETIME NOT NULL,
+            delivery_to DATETIME NOT NULL,
+            window_start DATETIME NOT NULL,
+            window_end DATETIME NOT NULL,
+            max_concurrent_dials INTEGER NOT NULL,
+            max_attempts INTEGER NOT NULL,
+            created_at DATETIME NOT NULL
+        );
+
+        -- Work that must survive a restart, see services/jobs.py. payload is JSON.
+        CREATE TABLE IF NOT EXISTS jobs (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            kind TEXT NOT NULL,
+            payload TEXT NOT NULL,
+            status TEXT NOT NULL DEFAULT 'pending' CHECK (status IN ('pending', 'running', 'done', 'failed')),
+            attempts INTEGER NOT NULL DEFAULT 0,
+            run_after DATETIME NOT NULL,
+            claimed_at DATETIME,
+            finished_at DATETIME,
+            last_error TEXT,
+            created_at DATETIME NOT NULL
+        );
+        CREATE INDEX IF NOT EXISTS idx_jobs_due ON jobs (status, run_after);
         
-        CREATE INDEX IF NOT EXISTS idx_package_lookup ON packages (tracking_number, postal_code);
         CREATE INDEX IF NOT EXISTS idx_call_logs_retell_call_id ON call_logs (retell_call_id);
+
+        -- Full-text index over transcripts. External content table: the text lives only
+        -- in call_logs, the triggers keep the index in sync within the writing transaction.
+        CREATE VIRTUAL TABLE IF NOT EXISTS call_logs_fts USING fts5(
+            transcript,
+            content = 'call_logs',
+            content_rowid = 'id',
+            tokenize = 'porter unicode61'
+        );
+
+        CREATE TRIGGER IF NOT EXISTS call_logs_fts_insert AFTER INSERT ON call_logs
+        WHEN new.transcript IS NOT NULL
+        BEGIN
+            INSERT INTO call_logs_fts (rowid, transcript) VALUES (new.id, new.transcript);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS call_logs_fts_delete AFTER DELETE ON call_logs
+        WHEN old.transcript IS NOT NULL
+        BEGIN
+            INSERT INTO call_logs_fts (call_logs_fts, rowid, transcript)
+            VALUES ('delete', old.id, old.transcript);
+        END;
+
+        CREATE TRIGGER IF NOT EXISTS call_logs_fts_update AFTER UPDATE OF transcript ON call_logs
+        BEGIN
+            INSERT INTO call_logs_fts (call_logs_fts, rowid, transcript)
+            SELECT 'delete', old.id, old.transcript WHERE old.transcript IS NOT NULL;
+            INSERT INTO call_logs_fts (rowid, transcript)
+            SELECT new.id, new.transcript WHERE new.transcript IS NOT NULL;
+        END;
     """)
 
-    # Add seed data if not already present
+    if not search_index_exists:
+        # Index transcripts that were stored before the search index was added
+        rebuild_search_index(conn)
+
+    # Columns added after the initial schema, for databases created before them
+    migrate_package_store(conn)
+    ensure_column(conn, "call_logs", "escalation_reason", "TEXT")
+    ensure_column(
+        conn,
+        "call_logs",
+        "direction",
+        "TEXT NOT NULL DEFAULT 'inbound' CHECK (direction IN ('inbound', 'outbound'))",
+    )
+    ensure_column(conn, "call_logs", "campaign_id", "INTEGER REFERENCES campaigns (id)")
+    ensure_column(conn, "call_logs", "outcome", "TEXT")
+    conn.execute(
+        "CREATE INDEX IF NOT EXISTS idx_call_logs_campaign ON call_logs (campaign_id, tracking_number)"
+    )
+    # Calls in progress, they hold back the call log export watermark
+    conn.execute("CREATE INDEX IF NOT EXISTS idx_call_logs_open ON call_logs (id) WHERE completed IS NULL")
+
+    if not seed:
+        conn.commit()
+        conn.close()
+        return
+
+    # Add seed data if not already present.
+    # Timestamps are stored as ISO 8601 strings like every write in services/database.py,
+    # the dashboard endpoints serve them as-is.
 
     tomorrow = datetime.now() + timedelta(days=1)
     seed_packages = [
@@ -57,7 +382,7 @@ def init_database():
             "Main St",
             "123",
             "out_for_delivery",
-            tomorrow,
+            tomorrow.isoformat(),
         ),
         (
             "002",
@@ -68,7 +393,7 @@ def init_database():
             "Oak Ave",
             "456",
             "scheduled",
-            tomorrow + timedelta(hours=2),
+            (tomorrow + timedelta(hours=2)).isoformat(),
         ),
         (
             "003",
@@ -79,7 +404,7 @@ def init_database():
             "Pine Rd",
             "789",
             "delivered",
-            datetime.now(),
+            datetime.now().isoformat(),
         ),
     ]
 
@@ -94,8 +419,46 @@ def init_database():
 
     conn.commit()
     conn.close()
-    print(f"Database initialized at {DATABASE_PATH}")
+    print(f"Database initialized at {path or default_path()}")
 
 
 if __name__ == "__main__":
-    init_database()
+    parser = argparse.ArgumentParser(description="Manage the delivery service database")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        default="init",
+        choices=["init", "rebuild-search-index", "rebalance-shards", "check-query-plans"],
+        help="init: create schema and seed data (default), "
+        "rebuild-search-index: re-index all call transcripts, "
+        "rebalance-shards: move packages to the shards SHARD_MAP_PATH routes them to, "
+        "check-query-plans: fail if a hot query would scan a table instead of using an index",
+    )
+    args = parser.parse_args()
+
+    if args.command == "rebuild-search-index":
+        rebuild_search_index()
+        print(f"Transcript search index rebuilt at {DATABASE_PATH}")
+    elif args.command == "rebalance-shards":
+        from services import sharding
+
+        if sharding.shard_map is None:
+            parser.error("rebalance-shards needs SHARD_MAP_PATH")
+        moved = sharding.rebalance(sharding.shard_map)
+        print(f"Moved {sum(moved.values())} packages")
+    elif args.command == "check-query-plans":
+        from services.database import HOT_QUERIES, check_query_plans
+
+        problems = check_query_plans()
+        for problem in problems:
+            print(f"Table scan: {problem}")
+        if problems:
+            raise SystemExit(1)
+        print(f"All {len(HOT_QUERIES)} hot queries use indexes")
+    else:
+        init_database()
+        from services import sharding
+
+        if sharding.shard_map is not None:
+            sharding.shard_map.init_shards()
+            print(f"Initialized {len(sharding.shard_map.shards)} package shards")
@@ -0,0 +1,58 @@
+"""Generate realistic synthetic packages and call logs, as reusable snapshot files.
+
+Usage: python -m fixtures generate SNAPSHOT [--packages 1000000] [--calls 200000] [--seed 0]
+                                            [--anchor 2025-08-01]
+       python -m fixtures load SNAPSHOT [--database delivery_service.db]
+
+generate writes a self-contained SQLite file plus SNAPSHOT.json describing it, the same
+parameters always give the same generated rows. load copies a snapshot over --database
+(DATABASE_PATH by default) and applies schema changes made since, in about the time the
+file copy takes.
+"""
+
+import argparse
+import json
+import time
+from datetime import datetime
+
+import database
+from fixtures.generator import create_snapshot, load_snapshot, manifest_path, summary
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    generate = commands.add_parser("generate", help="Write a snapshot file")
+    generate.add_argument("snapshot")
+    generate.add_argument("--packages", type=int, default=1_000_000)
+    generate.add_argument("--calls", type=int, default=200_000)
+    generate.add_argument("--seed", type=int, default=0)
+    generate.add_argument(
+        "--anchor",
+        type=datetime.fromisoformat,
+        help="Day delivery and call times are relative to, today by default",
+    )
+
+    load = commands.add_parser("load", help="Replace a database with a snapshot")
+    load.add_argument("snapshot")
+    load.add_argument("--database", help="Target database, DATABASE_PATH by default")
+    return parser.parse_args()
+
+
+def main():
+    args = parse_args()
+    if args.command == "generate":
+        manifest = create_snapshot(args.snapshot, args.packages, args.calls, args.seed, args.anchor)
+        print("\n".join(summary(manifest)))
+    else:
+        started = time.perf_counter()
+        path = load_snapshot(args.snapshot, args.database or database.DATABASE_PATH)
+        with open(manifest_path(args.snapshot)) as f:
+            manifest = json.load(f)
+        print(f"Loaded {args.snapshot} into {path} in {time.perf_counter() - started:.1f}s")
+        print("\n".join(summary(manifest)))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,352 @@
+import json
+import os
+import random
+import shutil
+import sqlite3
+import time
+from datetime import datetime, timedelta
+from typing import Iterator, List, Optional
+
+import database
+
+# Bump when the generated rows change, cached snapshots of older versions are rebuilt
+GENERATOR_VERSION = 1
+SNAPSHOT_DIR = os.getenv("SNAPSHOT_DIR", "snapshots")
+BATCH_SIZE = 50_000
+
+STATUSES = ("scheduled", "out_for_delivery", "delivered")
+# Share of packages per status: most are still to be delivered, some are on the truck today
+STATUS_WEIGHTS = (0.55, 0.15, 0.30)
+# Share of deliveries per leading postal code digit, the metro regions get more parcels
+POSTAL_REGION_WEIGHTS = (0.07, 0.12, 0.11, 0.08, 0.13, 0.11, 0.10, 0.10, 0.10, 0.08)
+# Delivery slots start at these hours, see services/time_resolution.py
+SLOT_HOURS = (8, 10, 12, 14, 16, 18)
+# Days of calls before the anchor, spread evenly so ids follow created_at like in production
+CALL_DAYS = 30
+
+# Calls whose caller never got verified (wrong details, hung up early)
+UNVERIFIED_CALL_RATE = 0.08
+# Chance a call about a delivered package is kept, most calls are about upcoming deliveries
+DELIVERED_CALL_ACCEPT = 0.25
+# Calls still running, no call_ended yet: no transcript, not completed
+OPEN_CALL_RATE = 0.01
+ESCALATION_RATE = 0.12
+ESCALATION_REASONS = ("agent_escalation", "verification_failed", "user_declined", "reschedule_failed")
+ESCALATION_REASON_WEIGHTS = (0.50, 0.25, 0.15, 0.10)
+
+FIRST_NAMES = (
+    "Anna Ben Clara David Emma Felix Greta Hannah Jonas Julia Karl Lena Lukas Maria Max Mia "
+    "Noah Paul Sara Sophie Tim Tom Yusuf Zoe Ali Elena Finn Ida Leon Mats Nina Ole"
+).split()
+LAST_NAMES = (
+    "Müller Schmidt Schneider Fischer Weber Meyer Wagner Becker Schulz Hoffmann Koch Richter "
+    "Klein Wolf Schröder Neumann Schwarz Braun Zimmermann Krüger Hartmann Lange Werner Krause"
+).split()
+STREETS = (
+    "Hauptstraße Schulstraße Gartenstraße Bahnhofstraße Dorfstraße Bergstraße Birkenweg "
+    "Lindenstraße Kirchstraße Waldstraße Ringstraße Schillerstraße Goethestraße Amselweg"
+).split()
+
+AGENT_LINES = (
+    "Hi, this is the delivery service. How can I help you today?",
+    "Could you give me your tracking number and postal code, please?",
+    "Thank you, let me look that up for you.",
+    "I found your package, it is currently scheduled for {day}.",
+    "When would suit you better?",
+    "I can move the delivery to {day} between {hour} and {hour2}. Does that work for you?",
+    "Done, you will receive a confirmation email shortly.",
+    "I'm sorry, I couldn't find a package with those details. Could you repeat them?",
+    "I understand. I'll hand this over to a colleague who will get back to you.",
+    "Is there anything else I can help you with?",
+)
+USER_LINES = (
+    "Hi, I won't be home when my parcel arrives.",
+    "Sure, it's {tracking} and my postal code is {postal}.",
+    "Can you deliver it {day} instead?",
+    "Sometime in the afternoon would be great.",
+    "Yes, that works for me.",
+    "No, that doesn't work, I'm at work all day.",
+    "The last parcel was left at my neighbor's, I don't want that again.",
+    "Can I talk to a human please?",
+    "No, that's all. Thank you!",
+    "Hmm, let me check my calendar.",
+)
+DAYS = ("Monday", "Tuesday", "Wednesday", "Thursday", "Friday", "Saturday", "tomorrow")
+
+# Dropped during the bulk load and created again by init_database(), inserting
+# into an index costs more per row than building it once from the full table
+BULK_LOAD_DROPS = (
+    "DROP INDEX IF EXISTS idx_package_lookup",
+    "DROP INDEX IF EXISTS idx_packages_status_scheduled",
+    "DROP INDEX IF EXISTS idx_call_logs_retell_call_id",
+    "DROP INDEX IF EXISTS idx_call_logs_campaign",
+    "DROP TRIGGER IF EXISTS call_logs_fts_insert",
+)
+
+
+def tracking_number(index: int) -> str:
+    # Generated in order, so the UNIQUE index is appended to instead of split up
+    return f"TN{index:010d}"
+
+
+def postal_code(rng: random.Random) -> str:
+    region = rng.choices(range(10), POSTAL_REGION_WEIGHTS)[0]
+    return f"{region}{rng.randrange(1000, 10000):04d}"
+
+
+def scheduled_at(rng: random.Random, status: str, anchor: datetime) -> datetime:
+    if status == "delivered":
+        day = anchor - timedelta(days=rng.randrange(1, 31))
+    elif status == "out_for_delivery":
+        day = anchor
+    else:
+        day = anchor + timedelta(days=rng.randrange(1, 15))
+    return day.replace(hour=rng.choice(SLOT_HOURS), minute=0, second=0, microsecond=0)
+
+
+def package_rows(count: int, seed: int, anchor: datetime, statuses: Optional[bytearray] = None) -> Iterator[tuple]:
+    """Rows for load_packages(), statuses collects each package's status index for call generation"""
+    rng = random.Random(f"{seed}-packages")
+    for index in range(count):
+        first, last = rng.choice(FIRST_NAMES), rng.choice(LAST_NAMES)
+        status = rng.choices(range(3), STATUS_WEIGHTS)[0]
+        if statuses is not None:
+            statuses.append(status)
+        yield (
+            tracking_number(index),
+            f"{first} {last}",
+            f"+4915{rng.randrange(10**8, 10**9)}",
+            f"{first.lower()}.{index}@example.com",
+            postal_code(rng),
+            rng.choice(STREETS),
+            str(rng.randrange(1, 200)) + rng.choice(("", "", "", "", "a", "b")),
+            STATUSES[status],
+            scheduled_at(rng, STATUSES[status], anchor).isoformat(),
+        )
+
+
+def fill_packages(count: int):
+    """Adds count uniform packages BENCH0000000... to DATABASE_PATH, for benchmarks and the simulator.
+
+    Statuses rotate through STATUSES, delivery times are a minute apart from 2025-08-01 08:00.
+    """
+    conn = database.get_db_connection()
+    start = datetime(2025, 8, 1, 8, 0)
+    conn.executemany(
+        """
+        INSERT INTO packages
+        (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+        VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+    """,
+        (
+            (
+                f"BENCH{i:07d}",
+                f"Customer {i}",
+                f"+4915{i:08d}",
+                f"customer{i}@example.com",
+                f"{10000 + i % 89999}",
+                "Main St",
+                str(i % 300),
+                STATUSES[i % 3],
+                (start + timedelta(minutes=i)).isoformat(),
+            )
+            for i in range(count)
+        ),
+    )
+    conn.commit()
+    conn.close()
+
+
+def make_transcript(rng: random.Random, tracking: str, postal: str) -> str:
+    """Alternating agent / user turns, 6 to 24 of them, about 0.5 to 2.5 KB like real calls"""
+    day = rng.choice(DAYS)
+    hour = rng.choice(SLOT_HOURS)
+    values = {"day": day, "hour": f"{hour}:00", "hour2": f"{hour + 2}:00", "tracking": tracking, "postal": postal}
+    lines = []
+    for turn in range(rng.randrange(6, 25)):
+        speaker, pool = ("Agent", AGENT_LINES) if turn % 2 == 0 else ("User", USER_LINES)
+        lines.append(f"{speaker}: {rng.choice(pool).format(**values)}")
+    return "\n".join(lines)
+
+
+def call_log_rows(count: int, statuses: bytearray, seed: int, anchor: datetime) -> Iterator[tuple]:
+    """call_logs rows in created_at order, about packages of the first len(statuses) tracking numbers"""
+    rng = random.Random(f"{seed}-calls")
+    start = anchor - timedelta(days=CALL_DAYS)
+    step = CALL_DAYS * 86400 / max(count, 1)
+    for index in range(count):
+        created = start + timedelta(seconds=index * step + rng.random() * step)
+        tracking = None
+        if statuses and rng.random() >= UNVERIFIED_CALL_RATE:
+            for _ in range(3):
+                package = rng.randrange(len(statuses))
+                if STATUSES[statuses[package]] != "delivered" or rng.random() < DELIVERED_CALL_ACCEPT:
+                    break
+            tracking = tracking_number(package)
+        transcript = completed = escalated = reason = None
+        if rng.random() >= OPEN_CALL_RATE:
+            transcript = make_transcript(rng, tracking or f"TN{rng.randrange(10**10):010d}", postal_code(rng))
+            completed = (created + timedelta(seconds=rng.randrange(40, 360))).isoformat()
+            if rng.random() < ESCALATION_RATE:
+                reason = rng.choices(ESCALATION_REASONS, ESCALATION_REASON_WEIGHTS)[0]
+                escalated = (created + timedelta(seconds=rng.randrange(20, 300))).isoformat()
+        yield (
+            f"call_{rng.getrandbits(96):024x}",
+            tracking,
+            transcript,
+            completed,
+            escalated,
+            reason,
+            created.isoformat(),
+        )
+
+
+def insert_batches(conn: sqlite3.Connection, sql: str, rows: Iterator[tuple]) -> int:
+    inserted = 0
+    while True:
+        batch = [row for _, row in zip(range(BATCH_SIZE), rows)]
+        if not batch:
+            return inserted
+        conn.executemany(sql, batch)
+        inserted += len(batch)
+
+
+def generate(path: str, packages: int, calls: int, seed: int = 0, anchor: Optional[datetime] = None) -> dict:
+    """Create a database at path with the seed data plus generated packages and call logs.
+
+    The same parameters always give the same generated rows (the seed packages
+    001 to 003 are relative to today). Returns the manifest describing them.
+    """
+    anchor = (anchor or datetime.now()).replace(hour=0, minute=0, second=0, microsecond=0)
+    started = time.perf_counter()
+    database.init_database(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        # A file nobody else has open yet: no journal, no syncs
+        conn.execute("PRAGMA journal_mode=OFF")
+        conn.execute("PRAGMA synchronous=OFF")
+        for statement in BULK_LOAD_DROPS:
+            conn.execute(statement)
+        statuses = bytearray()
+        conn.execute("BEGIN")
+        insert_batches(
+            conn,
+            """
+            INSERT INTO packages
+            (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+        """,
+            package_rows(packages, seed, anchor, statuses),
+        )
+        insert_batches(
+            conn,
+            """
+            INSERT INTO call_logs
+            (retell_call_id, tracking_number, transcript, completed, escalated, escalation_reason, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?)
+        """,
+            call_log_rows(calls, statuses, seed, anchor),
+        )
+        conn.commit()
+        database.rebuild_search_index(conn)
+    finally:
+        conn.close()
+    # Indexes and the search trigger dropped above
+    database.init_database(path)
+
+    conn = sqlite3.connect(path)
+    try:
+        conn.execute("ANALYZE")
+        # One self-contained file to copy around
+        conn.execute("PRAGMA journal_mode=DELETE")
+        counts = dict(conn.execute("SELECT status, COUNT(*) FROM packages GROUP BY status").fetchall())
+        escalated = conn.execute("SELECT COUNT(*) FROM call_logs WHERE escalated IS NOT NULL").fetchone()[0]
+    finally:
+        conn.close()
+    return {
+        "generator_version": GENERATOR_VERSION,
+        "seed": seed,
+        "packages": packages,
+        "calls": calls,
+        "anchor": anchor.date().isoformat(),
+        "status_counts": counts,
+        "escalated_calls": escalated,
+        "seconds": round(time.perf_counter() - started, 1),
+    }
+
+
+def manifest_path(snapshot: str) -> str:
+    return snapshot + ".json"
+
+
+def create_snapshot(
+    snapshot: str, packages: int, calls: int, seed: int = 0, anchor: Optional[datetime] = None
+) -> dict:
+    """Generate a snapshot file and its manifest, replacing an existing one only once complete"""
+    os.makedirs(os.path.dirname(snapshot) or ".", exist_ok=True)
+    partial = snapshot + ".partial"
+    if os.path.exists(partial):
+        os.remove(partial)
+    manifest = generate(partial, packages, calls, seed, anchor)
+    os.replace(partial, snapshot)
+    with open(manifest_path(snapshot), "w") as f:
+        json.dump(manifest, f, indent=2)
+    return manifest
+
+
+def load_snapshot(snapshot: str, path: Optional[str] = None) -> str:
+    """Copy a snapshot to path (DATABASE_PATH by default) and bring its schema up to date.
+
+    A file copy, so a million packages load in about as long as the disk takes to
+    write the file.
+    """
+    path = path or database.DATABASE_PATH
+    for leftover in (path + "-wal", path + "-shm"):
+        if os.path.exists(leftover):
+            os.remove(leftover)
+    shutil.copyfile(snapshot, path)
+    # Migrations added since the snapshot was made, and WAL mode
+    database.init_database(path)
+    return path
+
+
+def snapshot_name(packages: int, calls: int, seed: int, anchor: Optional[datetime]) -> str:
+    day = f"-{anchor:%Y%m%d}" if anchor else ""
+    return f"v{GENERATOR_VERSION}-p{packages}-c{calls}-s{seed}{day}.db"
+
+
+def cached_snapshot(
+    packages: int,
+    calls: int,
+    seed: int = 0,
+    anchor: Optional[datetime] = None,
+    directory: Optional[str] = None,
+) -> str:
+    """Path of a snapshot with these parameters, generated on first use.
+
+    Without an anchor the snapshot is regenerated once a day, its delivery
+    times are relative to the day it was made.
+    """
+    directory = directory or SNAPSHOT_DIR
+    snapshot = os.path.join(directory, snapshot_name(packages, calls, seed, anchor))
+    expected_anchor = (anchor or datetime.now()).date().isoformat()
+    try:
+        with open(manifest_path(snapshot)) as f:
+            manifest = json.load(f)
+        if manifest["anchor"] == expected_anchor and os.path.exists(snapshot):
+            return snapshot
+    except (OSError, ValueError, KeyError):
+        pass
+    create_snapshot(snapshot, packages, calls, seed, anchor)
+    return snapshot
+
+
+def summary(manifest: dict) -> List[str]:
+    lines = [
+        f"{manifest['packages']} packages, {manifest['calls']} call logs (seed {manifest['seed']}, "
+        f"anchor {manifest['anchor']}), generated in {manifest['seconds']}s"
+    ]
+    lines += [f"  {status}: {count}" for status, count in sorted(manifest["status_counts"].items())]
+    lines.append(f"  escalated calls: {manifest['escalated_calls']}")
+    return lines
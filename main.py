@@ -1,4 +1,6 @@
+from contextlib import asynccontextmanager
 from fastapi import FastAPI
+from fastapi.middleware.gzip import GZipMiddleware
 from fastapi.staticfiles import StaticFiles
 from dotenv import load_dotenv
 
@@ -8,17 +10,77 @@ from dotenv import load_dotenv
 # but then we wouldn't get an instant error if a env var is missing.
 load_dotenv()
 
-from api import functions, webhooks, dashboard, health
+from api import functions, webhooks, dashboard, health, exports, campaigns, notifications
+from services.background import BackgroundWorker
+from services.campaigns import CampaignDispatcher, CampaignRunner
+from services.coordination import LeaderElection, default_leader_lock_path
+from services.database import check_query_plans, install_slow_query_logging
+from services.dialer import create_dialer
+from services.jobs import job_queue, prune_finished_jobs
+from services.notifications import notification_dispatcher
+from services.profiling import PROFILING, ProfilingMiddleware
+from services.rate_limit import rate_limiter
+from services.recording import RECORD_REQUESTS, RecordingMiddleware, RequestRecorder
+from services.shutdown import DrainMiddleware, graceful_shutdown
+from services.tenants import TENANTS_PATH, TenantMiddleware, for_each_tenant
+
+# With uvicorn --workers N every process builds its own app, the leader election
+# makes sure periodic jobs run in only one of them
+background_worker = BackgroundWorker(LeaderElection(default_leader_lock_path()))
+background_worker.register("prune_rate_limits", 300, rate_limiter.prune)
+campaign_dispatcher = CampaignDispatcher(CampaignRunner(create_dialer()))
+# Each tenant's campaigns, jobs and outbox live in its own database
+background_worker.register("dispatch_campaigns", 30, for_each_tenant(campaign_dispatcher.dispatch))
+# Retries, and jobs of workers that died without releasing them
+background_worker.register("run_due_jobs", 15, for_each_tenant(job_queue.run_due))
+background_worker.register("prune_jobs", 3600, for_each_tenant(prune_finished_jobs))
+# Out-for-delivery notifications queued by package status changes
+background_worker.register("dispatch_notifications", 5, for_each_tenant(notification_dispatcher.dispatch))
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    install_slow_query_logging()
+    # A dropped or renamed index turns a tool call lookup into a table scan, warn right away
+    await for_each_tenant(check_query_plans)()
+    background_worker.start()
+    # Jobs left over from the last shutdown or crash
+    await for_each_tenant(job_queue.start)()
+    yield
+    # No new periodic work or campaign dials, then let what's in flight finish
+    await background_worker.stop()
+    await campaign_dispatcher.stop()
+    await notification_dispatcher.stop()
+    await graceful_shutdown(job_queue)
+
 
 app = FastAPI(
     title="Delivery Rescheduling API",
     description="API for handling package rescheduling via RetellAI voice agents",
     version="1.0.0",
+    lifespan=lifespan,
 )
 
+# Large list responses (dashboard packages / call logs) compress very well,
+# small tool call responses stay below the threshold and skip compression
+app.add_middleware(GZipMiddleware, minimum_size=4096, compresslevel=5)
+if PROFILING != "off":
+    app.add_middleware(ProfilingMiddleware, mode=PROFILING)
+if RECORD_REQUESTS:
+    # Webhooks and tool calls, for replay as a regression benchmark (python -m replay)
+    app.add_middleware(RecordingMiddleware, recorder=RequestRecorder(RECORD_REQUESTS))
+if TENANTS_PATH:
+    # Inside the recorder, which records what the client sent, tenant routing included
+    app.add_middleware(TenantMiddleware)
+# Outermost, so requests turned away during shutdown skip all other middleware
+app.add_middleware(DrainMiddleware)
+
 app.include_router(health.router, prefix="/api")
 app.include_router(functions.router, prefix="/api/functions")
 app.include_router(webhooks.router, prefix="/api/webhooks")
 app.include_router(dashboard.router, prefix="/api")
+app.include_router(exports.router, prefix="/api/export")
+app.include_router(campaigns.router, prefix="/api/campaigns")
+app.include_router(notifications.router, prefix="/api")
 
 app.mount("/static", StaticFiles(directory="static"), name="static")
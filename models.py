@@ -1,6 +1,9 @@
-from pydantic import BaseModel
+from dataclasses import dataclass, fields
+from pydantic import BaseModel, Field, field_validator
 from datetime import datetime
-from typing import Optional, Literal
+from typing import List, Optional, Literal
+
+from services.time_resolution import to_service_time
 
 # Type definitions
 EscalationReason = Literal[
@@ -68,6 +71,138 @@ class CallLog(BaseModel):
     created_at: datetime
 
 
+class ScheduleChange(BaseModel):
+    id: int
+    tracking_number: str
+    previous_scheduled_at: Optional[datetime] = None
+    scheduled_at: datetime
+    changed_at: datetime
+    retell_call_id: Optional[str] = None
+
+
+class ScheduleAsOf(BaseModel):
+    tracking_number: str
+    as_of: datetime
+    scheduled_at: datetime
+
+
+class RescheduleCount(BaseModel):
+    tracking_number: str
+    reschedules: int
+    last_changed_at: datetime
+
+
+CampaignStatus = Literal["pending", "running", "completed", "cancelled"]
+
+
+class CampaignCreate(BaseModel):
+    name: str
+    # Packages with status "scheduled" and scheduled_at in [delivery_from, delivery_to)
+    delivery_from: datetime
+    delivery_to: datetime
+    # Calls are spread evenly over [window_start, window_end)
+    window_start: datetime
+    window_end: datetime
+    max_concurrent_dials: int = Field(10, ge=1)
+    max_attempts: int = Field(1, ge=1)
+
+    @field_validator("delivery_from", "delivery_to", "window_start", "window_end")
+    @classmethod
+    def in_service_time(cls, value: datetime) -> datetime:
+        """Stored and compared as naive SERVICE_TIMEZONE times, like package delivery times"""
+        return to_service_time(value)
+
+
+class Campaign(CampaignCreate):
+    id: int
+    status: CampaignStatus
+    created_at: datetime
+    attempts: int = 0
+    dial_failures: int = 0
+    completed_calls: int = 0
+
+
+# Rows read by services/database.py. Slotted dataclasses are about ten times cheaper to
+# build than Pydantic models, which dominates full table scans. Field order matches the
+# SELECT column order so rows map positionally; the Pydantic models above stay the API schema.
+@dataclass(slots=True)
+class PackageRecord:
+    id: int
+    tracking_number: str
+    customer_name: str
+    phone: str
+    email: str
+    postal_code: str
+    street: str
+    street_number: str
+    status: Literal["scheduled", "out_for_delivery", "delivered"]
+    scheduled_at: datetime
+
+
+@dataclass(slots=True)
+class CallLogRecord:
+    id: int
+    retell_call_id: str
+    tracking_number: Optional[str]
+    transcript: Optional[str]
+    completed: Optional[datetime]
+    escalated: Optional[datetime]
+    created_at: datetime
+
+
+@dataclass(slots=True)
+class JobRecord:
+    id: int
+    kind: str
+    payload: dict  # keyword arguments of the job's handler
+    attempts: int  # including the current one
+
+
+@dataclass(slots=True)
+class OutboxNotification:
+    id: int
+    tracking_number: str
+    kind: str
+    channel: Literal["email", "sms"]
+    attempts: int  # including the current one
+    package: Optional[PackageRecord]  # None if the package is gone
+
+
+PACKAGE_COLUMNS = tuple(field.name for field in fields(PackageRecord))
+CALL_LOG_COLUMNS = tuple(field.name for field in fields(CallLogRecord))
+SCHEDULE_CHANGE_COLUMNS = tuple(ScheduleChange.model_fields)
+
+
+class PackageStatusUpdate(BaseModel):
+    tracking_numbers: List[str] = Field(min_length=1, max_length=100_000)
+    status: Literal["scheduled", "out_for_delivery", "delivered"]
+
+
+class NotificationPreferences(BaseModel):
+    email: bool = True
+    sms: bool = True
+
+
+class CallLogSearchResult(BaseModel):
+    id: int
+    retell_call_id: str
+    tracking_number: Optional[str] = None
+    created_at: datetime
+    completed: Optional[datetime] = None
+    escalated: Optional[datetime] = None
+    snippet: str  # HTML-escaped transcript excerpt with matches wrapped in <mark></mark>
+    rank: float  # bm25 score, lower is more relevant
+
+
+class CallLogSearchPage(BaseModel):
+    query: str
+    total: int
+    limit: int
+    offset: int
+    results: List[CallLogSearchResult]
+
+
 class EscalationInfo(BaseModel):
     tracking_number: str
-    escalated: str  # ISO datetime string from database
+    escalated: datetime
+    escalation_reason: EscalationReason = "agent_escalation"
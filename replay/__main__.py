@@ -0,0 +1,163 @@
+"""Replay a recording of webhook and tool call requests against the backend, in-process.
+
+Usage: python -m replay run RECORDING [--speed 1] [--concurrency 100] [--packages 1000]
+                           [--database DB] [--email-latency 0.05] [--output results.json]
+       python -m replay compare BASELINE.json CANDIDATE.json [--threshold 20]
+
+Record with RECORD_REQUESTS=recording.ndjson. run replays on a copy of --database, or on a
+scratch database seeded with --packages packages, and writes latencies per webhook event and
+tool to --output. Run it on two builds and compare the outputs: compare exits with 1 if a p95
+got worse by more than --threshold percent.
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sqlite3
+import subprocess
+import sys
+import tempfile
+
+import httpx
+
+import database
+from fixtures.generator import fill_packages
+from replay.player import PackageMapper, Replayer, compare
+from services.recording import read_recording
+from simulator.runner import offline_emails
+
+RATE_LIMIT_BURSTS = ("RATE_LIMIT_CALL_BURST", "RATE_LIMIT_CALLER_BURST", "RATE_LIMIT_TRACKING_BURST")
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="Replay a recording")
+    run.add_argument("recording")
+    run.add_argument("--speed", type=float, default=1.0, help="Time compression, 0 for as fast as possible")
+    run.add_argument("--concurrency", type=int, default=100)
+    run.add_argument("--packages", type=int, default=1000)
+    run.add_argument("--database", help="Database to replay on a copy of instead of a scratch one")
+    run.add_argument("--email-latency", type=float, default=0.05)
+    run.add_argument("--rate-limits", action="store_true", help="Keep the configured rate limits")
+    run.add_argument("--label", help="Build name for the output, the git commit by default")
+    run.add_argument("--output", help="Write the results as JSON for compare")
+
+    diff = commands.add_parser("compare", help="Latency differences between two runs")
+    diff.add_argument("baseline")
+    diff.add_argument("candidate")
+    diff.add_argument("--threshold", type=float, default=20.0, help="p95 regression in percent that fails")
+    return parser.parse_args()
+
+
+def git_revision() -> str:
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return "unknown"
+
+
+def copy_database(source: str, target: str):
+    """Consistent copy, even of a database in WAL mode that is being written"""
+    src, dst = sqlite3.connect(source), sqlite3.connect(target)
+    try:
+        src.backup(dst)
+    finally:
+        src.close()
+        dst.close()
+
+
+def replay_packages() -> list:
+    conn = database.get_db_connection()
+    packages = conn.execute("SELECT tracking_number, postal_code, status FROM packages").fetchall()
+    conn.close()
+    return [tuple(p) for p in packages]
+
+
+async def replay(args: argparse.Namespace, entries: list) -> dict:
+    # Imported late so the app sees the database path and environment set up in main()
+    from main import app
+    from services.jobs import job_queue
+
+    mapper = PackageMapper(replay_packages())
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://replay", limits=limits
+    ) as client:
+        replayer = Replayer(client, os.environ["RETELL_API_KEY"], mapper, args.speed, args.concurrency)
+        with offline_emails(args.email_latency):
+            result = await replayer.run(entries)
+            await job_queue.wait(timeout=30)
+    return result.to_dict()
+
+
+def print_run(results: dict):
+    print(f"{results['label']}: {results['requests']} requests in {results['elapsed']:.1f}s")
+    print(f"\n{'request':<20} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in results["latency"]:
+        print(
+            f"{row['name']:<20} {row['count']:>7} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+            f"{row['p99']:>8.1f} {row['max']:>8.1f}"
+        )
+    if results["diverged"]:
+        print("\nAnswered differently than recorded:")
+        for change, count in results["diverged"].items():
+            print(f"{count:>7}  {change}")
+
+
+def run(args: argparse.Namespace):
+    os.environ.setdefault("RETELL_API_KEY", "replay")
+    if not args.rate_limits:
+        # A compressed day would exhaust buckets a real one doesn't
+        for name in RATE_LIMIT_BURSTS:
+            os.environ.setdefault(name, "1000000000")
+    entries = list(read_recording(args.recording))
+
+    with tempfile.TemporaryDirectory() as tmp:
+        database.DATABASE_PATH = os.path.join(tmp, "replay.db")
+        if args.database:
+            copy_database(args.database, database.DATABASE_PATH)
+        else:
+            database.init_database()
+            fill_packages(args.packages)
+        results = asyncio.run(replay(args, entries))
+
+    results = {"label": args.label or git_revision(), "recording": args.recording, "speed": args.speed, **results}
+    print_run(results)
+    if args.output:
+        with open(args.output, "w") as f:
+            json.dump(results, f, indent=2)
+
+
+def compare_runs(args: argparse.Namespace) -> int:
+    with open(args.baseline) as f:
+        baseline = json.load(f)
+    with open(args.candidate) as f:
+        candidate = json.load(f)
+    rows, regressions = compare(baseline, candidate, args.threshold)
+
+    print(f"{baseline['label']} -> {candidate['label']}")
+    print(f"\n{'request':<20} {'count':>7} {'p50 ms':>17} {'p95 ms':>17} {'p99 ms':>17} {'p95':>8}")
+    for row in rows:
+        stats = " ".join(f"{old:>8.1f}>{new:<8.1f}" for old, new in (row["p50"], row["p95"], row["p99"]))
+        print(f"{row['name']:<20} {row['count']:>7} {stats} {row['change']:>+7.1f}%")
+    if regressions:
+        print(f"\np95 regressed by more than {args.threshold:.0f}%: {', '.join(regressions)}")
+        return 1
+    return 0
+
+
+def main():
+    args = parse_args()
+    if args.command == "run":
+        run(args)
+    else:
+        sys.exit(compare_runs(args))
+
+
+if __name__ == "__main__":
+    main()
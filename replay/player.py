@@ -0,0 +1,178 @@
+import asyncio
+import json
+import time
+from collections import Counter
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional, Sequence, Set, Tuple
+
+import httpx
+from retell.lib.webhook_auth import symmetric
+
+from services.recording import restore
+from simulator.runner import LatencyRecorder
+
+# Outcomes telling that the recorded tracking number / postal code pair matched a package
+FOUND_OUTCOMES = frozenset({"ok", "package_already_delivered", "invalid_delivery_time", "email_error", "database_error"})
+# Postal code no package has, for pairs that weren't found when recorded
+MISSING_POSTAL_CODE = "00000"
+
+
+class PackageMapper:
+    """Maps pseudonymized identifiers of a recording onto packages of the replay database.
+
+    Each tracking number token gets its own package on first appearance, a
+    delivered one if any of its lookups said so, so repeated lookups stay repeats.
+    Postal code tokens that didn't match when recorded get a postal code no
+    package has, so found and not found lookups keep their mix. The mapping
+    only depends on the order of the recording and the packages.
+    """
+
+    def __init__(self, packages: Sequence[Tuple[str, str, str]]):
+        ordered = sorted(packages)
+        self.active = [p for p in ordered if p[2] != "delivered"] or ordered
+        self.delivered = [p for p in ordered if p[2] == "delivered"] or ordered
+        self.next_active = self.next_delivered = 0
+        self.tracking: Dict[str, Tuple[str, str, str]] = {}
+        self.postal: Dict[Tuple[str, str], str] = {}
+        self.delivered_tokens: Set[str] = set()
+
+    def learn(self, entries: Sequence[dict]):
+        """Note the tracking numbers found delivered, lookups with a wrong postal code may come first"""
+        for entry in entries:
+            args = (entry.get("b") or {}).get("args")
+            if entry.get("o") == "package_already_delivered" and isinstance(args, dict):
+                self.delivered_tokens.add(args.get("tracking_number"))
+
+    def package(self, tracking_token: str) -> Tuple[str, str, str]:
+        package = self.tracking.get(tracking_token)
+        if package is None:
+            if tracking_token in self.delivered_tokens:
+                package = self.delivered[self.next_delivered % len(self.delivered)]
+                self.next_delivered += 1
+            else:
+                package = self.active[self.next_active % len(self.active)]
+                self.next_active += 1
+            self.tracking[tracking_token] = package
+        return package
+
+    def map_args(self, args: dict, outcome: Optional[str]) -> dict:
+        tracking_token = args.get("tracking_number")
+        if not tracking_token:
+            return args
+        package = self.package(tracking_token)
+        pair = (tracking_token, args.get("postal_code", ""))
+        if pair not in self.postal:
+            self.postal[pair] = package[1] if outcome in FOUND_OUTCOMES else MISSING_POSTAL_CODE
+        return {**args, "tracking_number": package[0], "postal_code": self.postal[pair]}
+
+
+@dataclass(slots=True)
+class ReplayResult:
+    requests: int = 0
+    elapsed: float = 0.0
+    # Requests answered differently than when recorded, by name and "recorded -> replayed"
+    diverged: Counter = field(default_factory=Counter)
+    recorder: LatencyRecorder = field(default_factory=LatencyRecorder)
+
+    def to_dict(self) -> dict:
+        return {
+            "requests": self.requests,
+            "elapsed": round(self.elapsed, 3),
+            "latency": self.recorder.summary(),
+            "diverged": {f"{name}: {change}": count for (name, change), count in self.diverged.items()},
+        }
+
+
+def request_name(entry: dict) -> str:
+    """Webhook event or tool name, what latencies are reported by"""
+    body = entry.get("b") or {}
+    if entry["p"].startswith("/api/webhooks/"):
+        return body.get("event", "webhook")
+    return body.get("name") or entry["p"].rsplit("/", 1)[-1]
+
+
+class Replayer:
+    """Sends recorded requests to the app again, keeping their relative timing.
+
+    speed divides the gaps between requests (2 replays a day in 12 hours),
+    0 sends them as fast as concurrency allows. Webhooks are signed again with
+    api_key, the recording has no signatures.
+    """
+
+    def __init__(
+        self,
+        client: httpx.AsyncClient,
+        api_key: str,
+        mapper: PackageMapper,
+        speed: float = 1.0,
+        concurrency: int = 100,
+    ):
+        self.client = client
+        self.api_key = api_key
+        self.mapper = mapper
+        self.speed = speed
+        self.concurrency = concurrency
+
+    def prepare(self, entry: dict) -> Tuple[str, dict, bytes]:
+        """Request body and headers to send for a recorded request"""
+        body = restore(entry.get("b"))
+        if isinstance(body, dict) and isinstance(body.get("args"), dict):
+            body = {**body, "args": self.mapper.map_args(body["args"], entry.get("o"))}
+        content = json.dumps(body, separators=(",", ":"), ensure_ascii=False)
+        headers = {**entry.get("h", {}), "content-type": "application/json"}
+        if entry["p"].startswith("/api/webhooks/"):
+            headers["x-retell-signature"] = symmetric["sign"](content, self.api_key)
+        return entry["p"], headers, content.encode()
+
+    async def send(self, entry: dict, prepared: Tuple[str, dict, bytes], result: ReplayResult):
+        path, headers, content = prepared
+        name = request_name(entry)
+        started = time.perf_counter()
+        response = await self.client.request(entry.get("m", "POST"), path, content=content, headers=headers)
+        result.recorder.record(name, time.perf_counter() - started)
+        recorded, replayed = entry.get("s"), response.status_code
+        if recorded == replayed and entry.get("o") is not None:
+            recorded, replayed = entry["o"], response.json().get("error_type", "ok")
+        if recorded != replayed:
+            result.diverged[(name, f"{recorded} -> {replayed}")] += 1
+
+    async def run(self, entries: List[dict]) -> ReplayResult:
+        entries = sorted(entries, key=lambda entry: entry["t"])
+        result = ReplayResult(requests=len(entries))
+        if not entries:
+            return result
+        # Mapped up front in recording order, so concurrency can't change the mapping
+        self.mapper.learn(entries)
+        prepared = [self.prepare(entry) for entry in entries]
+        semaphore = asyncio.Semaphore(self.concurrency)
+        first = entries[0]["t"]
+        started = time.perf_counter()
+
+        async def replay(entry: dict, request: Tuple[str, dict, bytes]):
+            if self.speed:
+                delay = (entry["t"] - first) / self.speed - (time.perf_counter() - started)
+                if delay > 0:
+                    await asyncio.sleep(delay)
+            async with semaphore:
+                await self.send(entry, request, result)
+
+        await asyncio.gather(*(replay(entry, request) for entry, request in zip(entries, prepared)))
+        result.elapsed = time.perf_counter() - started
+        return result
+
+
+def compare(baseline: dict, candidate: dict, threshold: float) -> Tuple[List[dict], List[str]]:
+    """Latency rows of both runs side by side, and the names whose p95 got worse by over threshold percent"""
+    before = {row["name"]: row for row in baseline["latency"]}
+    after = {row["name"]: row for row in candidate["latency"]}
+    rows, regressions = [], []
+    for name in sorted(before.keys() & after.keys()):
+        row = {"name": name, "count": after[name]["count"]}
+        for stat in ("p50", "p95", "p99"):
+            row[stat] = (before[name][stat], after[name][stat])
+        old, new = row["p95"]
+        row["change"] = (new - old) / old * 100 if old else 0.0
+        if row["change"] > threshold:
+            regressions.append(name)
+        rows.append(row)
+    return rows, regressions
@@ -0,0 +1,78 @@
+import asyncio
+import inspect
+import logging
+import os
+import time
+from typing import Callable, List, Optional
+
+from services.coordination import LeaderElection
+
+logger = logging.getLogger(__name__)
+
+# How often followers check whether the leader went away
+LEADER_RETRY_SECONDS = 5.0
+
+
+class PeriodicTask:
+    def __init__(self, name: str, interval_seconds: float, fn: Callable[[], object]):
+        self.name = name
+        self.interval_seconds = interval_seconds
+        self.fn = fn
+        self.next_run = 0.0
+
+
+class BackgroundWorker:
+    """Runs periodic maintenance jobs in exactly one process.
+
+    Every worker process starts one, but only the elected leader executes tasks,
+    the others wait to take over if the leader exits. Plain blocking functions run
+    in a thread so they don't stall request handling, coroutine functions run on
+    the event loop and must not block.
+    """
+
+    def __init__(self, election: LeaderElection, tick_seconds: float = 1.0):
+        self.election = election
+        self.tick_seconds = tick_seconds
+        self.tasks: List[PeriodicTask] = []
+        self._runner: Optional[asyncio.Task] = None
+
+    def register(self, name: str, interval_seconds: float, fn: Callable[[], object]):
+        self.tasks.append(PeriodicTask(name, interval_seconds, fn))
+
+    async def run_due_tasks(self):
+        now = time.monotonic()
+        for task in self.tasks:
+            if now < task.next_run:
+                continue
+            task.next_run = now + task.interval_seconds
+            try:
+                if inspect.iscoroutinefunction(task.fn):
+                    await task.fn()
+                else:
+                    await asyncio.to_thread(task.fn)
+            except Exception as err:
+                logger.error("Background task %s failed: %s", task.name, err, exc_info=True)
+
+    async def run(self):
+        while True:
+            if self.election.try_acquire():
+                await self.run_due_tasks()
+                await asyncio.sleep(self.tick_seconds)
+            else:
+                await asyncio.sleep(LEADER_RETRY_SECONDS)
+
+    def start(self):
+        if self.election.try_acquire():
+            logger.info("Elected background worker leader (pid %s)", os.getpid())
+        self._runner = asyncio.create_task(self.run())
+
+    async def stop(self):
+        if self._runner is not None:
+            self._runner.cancel()
+            try:
+                await self._runner
+            except asyncio.CancelledError:
+                pass
+            self._runner = None
+        self.election.release()
+
@@ -0,0 +1,184 @@
+import asyncio
+import logging
+import time
+import uuid
+from datetime import datetime
+from typing import Awaitable, Callable, Dict, List, Optional, Set, Tuple
+
+import database
+from models import Campaign
+from services.database import (
+    count_campaign_targets,
+    get_campaign_status,
+    get_campaign_targets,
+    get_campaigns,
+    record_campaign_attempts,
+    start_due_campaigns,
+    update_campaign_status,
+)
+from services.dialer import Dialer, DialError
+
+logger = logging.getLogger(__name__)
+
+TARGET_PAGE_SIZE = 1000
+
+
+class CampaignRunner:
+    """Calls every eligible package of a campaign within its call window.
+
+    Dials are spread evenly over what is left of the call window and never more
+    than max_concurrent_dials are in flight; nothing is dialed once the window
+    has closed. Each attempt is logged in call_logs (direction outbound, with
+    campaign_id and outcome) as soon as it is dialed, so a campaign that is
+    interrupted resumes with the packages it hasn't called yet.
+    """
+
+    def __init__(
+        self,
+        dialer: Dialer,
+        clock: Callable[[], float] = time.monotonic,
+        sleep: Callable[[float], Awaitable[None]] = asyncio.sleep,
+        now: Callable[[], datetime] = datetime.now,
+    ):
+        self.dialer = dialer
+        self.clock = clock
+        self.sleep = sleep
+        self.now = now
+
+    async def run(self, campaign: Campaign) -> int:
+        """Run the campaign until it is done, cancelled or its window closes, return the number of dials"""
+        now = self.now()
+        if now >= campaign.window_end:
+            logger.warning("Campaign %s: call window closed at %s, nothing dialed", campaign.id, campaign.window_end)
+            await asyncio.to_thread(update_campaign_status, campaign.id, "completed", "running")
+            return 0
+
+        total = await asyncio.to_thread(count_campaign_targets, campaign)
+        remaining_window = (campaign.window_end - max(now, campaign.window_start)).total_seconds()
+        spacing = remaining_window / total if total else 0
+        logger.info(
+            "Campaign %s: %s packages to call, one dial every %.2fs",
+            campaign.id,
+            total,
+            spacing,
+        )
+
+        semaphore = asyncio.Semaphore(campaign.max_concurrent_dials)
+        in_flight: Set[asyncio.Task] = set()
+        attempts: List[Tuple[str, str, str]] = []
+        recording: Optional[asyncio.Task] = None
+        dialed = 0
+
+        async def flush():
+            # Attempts dialed while a batch is being written go into the next one
+            while attempts:
+                batch = attempts[:]
+                attempts.clear()
+                try:
+                    await asyncio.to_thread(record_campaign_attempts, campaign.id, batch)
+                except BaseException:
+                    attempts[:0] = batch
+                    raise
+
+        def record(call_id: str, tracking_number: str, outcome: str):
+            nonlocal recording
+            attempts.append((call_id, tracking_number, outcome))
+            if recording is None or recording.done():
+                recording = asyncio.create_task(flush())
+
+        async def dial(tracking_number: str, phone: str):
+            try:
+                call_id = await self.dialer.dial(
+                    phone,
+                    {"tracking_number": tracking_number, "campaign_id": str(campaign.id)},
+                )
+                record(call_id, tracking_number, "dialed")
+            except DialError as err:
+                logger.warning("Campaign %s dial failed: %s", campaign.id, err)
+                record(f"dial-failed-{uuid.uuid4().hex}", tracking_number, "dial_failed")
+            finally:
+                semaphore.release()
+
+        def settled(task: asyncio.Task):
+            in_flight.discard(task)
+            if not task.cancelled() and task.exception() is not None:
+                logger.error("Campaign %s dial crashed", campaign.id, exc_info=task.exception())
+
+        started = self.clock()
+        window_closes = started + (campaign.window_end - now).total_seconds()
+        cursor = None
+        cancelled = closed = False
+        try:
+            while not (cancelled or closed):
+                page = await asyncio.to_thread(
+                    get_campaign_targets, campaign, cursor, TARGET_PAGE_SIZE
+                )
+                if not page:
+                    break
+                for _, tracking_number, phone, _ in page:
+                    delay = started + dialed * spacing - self.clock()
+                    if delay > 0:
+                        await self.sleep(delay)
+                    await semaphore.acquire()
+                    # Dials held back by max_concurrent_dials may have run into the window's end
+                    if self.clock() >= window_closes:
+                        semaphore.release()
+                        closed = True
+                        break
+                    task = asyncio.create_task(dial(tracking_number, phone))
+                    in_flight.add(task)
+                    task.add_done_callback(settled)
+                    dialed += 1
+                cursor = (page[-1][3], page[-1][0])
+
+                status = await asyncio.to_thread(get_campaign_status, campaign.id)
+                cancelled = status in (None, "cancelled")
+        finally:
+            # Also when stopped: calls placed must be logged, or the next start places them again
+            await asyncio.gather(*in_flight, return_exceptions=True)
+            if recording is not None:
+                await asyncio.gather(recording, return_exceptions=True)
+            await flush()
+
+        if closed:
+            logger.warning(
+                "Campaign %s: call window closed after %s of %s dials", campaign.id, dialed, total
+            )
+        if not cancelled:
+            await asyncio.to_thread(
+                update_campaign_status, campaign.id, "completed", "running"
+            )
+        logger.info("Campaign %s finished after %s dials", campaign.id, dialed)
+        return dialed
+
+
+class CampaignDispatcher:
+    """Starts campaigns whose call window has opened, run by the elected background worker.
+
+    Campaigns left "running" by a previous leader are picked up again as well.
+    """
+
+    def __init__(self, runner: CampaignRunner):
+        self.runner = runner
+        # By database and campaign id, every tenant database numbers its campaigns from 1
+        self.active: Dict[Tuple[str, int], asyncio.Task] = {}
+
+    async def dispatch(self):
+        await asyncio.to_thread(start_due_campaigns, self.runner.now())
+        for campaign in await asyncio.to_thread(get_campaigns, "running"):
+            key = (database.default_path(), campaign.id)
+            if key in self.active:
+                continue
+            task = asyncio.create_task(self.runner.run(campaign))
+            self.active[key] = task
+            task.add_done_callback(lambda _, key=key: self.active.pop(key, None))
+
+    async def stop(self):
+        """Stop the running campaigns, they stay running and resume on the next start.
+
+        Runners wait for their dials in flight and log every attempt before they stop.
+        """
+        tasks = list(self.active.values())
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
@@ -0,0 +1,73 @@
+import fcntl
+import os
+import sqlite3
+import threading
+from typing import Optional
+
+import database
+
+
+class LeaderElection:
+    """Elects exactly one process to run background work, via an exclusive file lock.
+
+    The OS drops the lock when the leader exits (even on a crash), so a follower
+    retrying try_acquire() takes over.
+    """
+
+    def __init__(self, lock_path: str):
+        self.lock_path = lock_path
+        self._lock_file = None
+
+    @property
+    def is_leader(self) -> bool:
+        return self._lock_file is not None
+
+    def try_acquire(self) -> bool:
+        """Become leader if nobody else is, without blocking"""
+        if self._lock_file is not None:
+            return True
+        lock_file = open(self.lock_path, "a")
+        try:
+            fcntl.flock(lock_file, fcntl.LOCK_EX | fcntl.LOCK_NB)
+        except BlockingIOError:
+            lock_file.close()
+            return False
+        self._lock_file = lock_file
+        return True
+
+    def release(self):
+        if self._lock_file is not None:
+            fcntl.flock(self._lock_file, fcntl.LOCK_UN)
+            self._lock_file.close()
+            self._lock_file = None
+
+
+class ChangeMonitor:
+    """Cheap cross-process "has the database changed?" check for in-process caches.
+
+    PRAGMA data_version on a dedicated connection changes whenever any other
+    connection commits, in this process or any other worker, without reading a table.
+    """
+
+    def __init__(self, path: Optional[str] = None):
+        self.path = path
+        self._conn: Optional[sqlite3.Connection] = None
+        self._conn_path: Optional[str] = None
+        self._lock = threading.Lock()
+
+    def version(self) -> int:
+        with self._lock:
+            path = self.path or database.DATABASE_PATH
+            if self._conn is None or self._conn_path != path:
+                if self._conn is not None:
+                    self._conn.close()
+                self._conn = sqlite3.connect(path, check_same_thread=False)
+                self._conn_path = path
+            return self._conn.execute("PRAGMA data_version").fetchone()[0]
+
+
+def default_leader_lock_path() -> str:
+    return os.getenv("LEADER_LOCK_PATH", database.DATABASE_PATH + ".leader-lock")
+
+
+change_monitor = ChangeMonitor()
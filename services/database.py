@@ -1,106 +1,388 @@
-from datetime import datetime
-from typing import Optional, List
-from database import get_db_connection
-from models import Package, CallLog, EscalationInfo
+import heapq
+import html
+import itertools
+import json
+import logging
+import operator
+import os
+import re
+import sqlite3
+import threading
+import time
+from collections import deque
+from datetime import datetime, timedelta
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
 
+import database
+from database import get_db_connection, write_connection
+from models import (
+    CALL_LOG_COLUMNS,
+    PACKAGE_COLUMNS,
+    SCHEDULE_CHANGE_COLUMNS,
+    CallLogRecord,
+    CallLogSearchPage,
+    CallLogSearchResult,
+    Campaign,
+    CampaignCreate,
+    CampaignStatus,
+    EscalationInfo,
+    EscalationReason,
+    JobRecord,
+    OutboxNotification,
+    PackageRecord,
+)
+from services.sharding import package_store_path, package_store_paths
+from services.time_resolution import to_service_time
 
-def get_package_by_tracking_and_postal(
-    tracking_number: str, postal_code: str
-) -> Optional[Package]:
-    """Get package by tracking number and postal code"""
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute(
-            """
-            SELECT id, tracking_number, customer_name, phone, email, postal_code, 
-                   street, street_number, status, scheduled_at
-            FROM packages 
-            WHERE tracking_number = ? AND postal_code = ?
-        """,
-            (tracking_number, postal_code),
+logger = logging.getLogger(__name__)
+
+# "quoted phrases" or single words
+FTS_TERM_PATTERN = re.compile(r'"([^"]*)"|(\S+)')
+
+# Rows are read as plain tuples in PACKAGE_COLUMNS / CALL_LOG_COLUMNS order and mapped
+# positionally onto the record dataclasses. Timestamp columns already come back as
+# datetime from the DATETIME converter registered in database.py.
+SELECT_PACKAGES = f"SELECT {', '.join(PACKAGE_COLUMNS)} FROM packages"
+SCHEDULED_AT_COLUMN = PACKAGE_COLUMNS.index("scheduled_at")
+SELECT_CALL_LOGS = f"SELECT {', '.join(CALL_LOG_COLUMNS)} FROM call_logs"
+SCAN_CHUNK_SIZE = 1000
+
+# Statements of every tool call, webhook and campaign page, see HOT_QUERIES
+PACKAGE_BY_TRACKING_AND_POSTAL = f"{SELECT_PACKAGES} WHERE tracking_number = ? AND postal_code = ?"
+PACKAGE_BY_TRACKING_NUMBER = f"{SELECT_PACKAGES} WHERE tracking_number = ?"
+PACKAGE_EXISTS = "SELECT 1 FROM packages WHERE tracking_number = ?"
+# Callers check the status too, but a bulk status change or another worker may have delivered
+# the package since, so the write only applies to packages that can still be rescheduled
+RESCHEDULABLE = "status IN ('scheduled', 'out_for_delivery')"
+RECORD_SCHEDULE_CHANGE = f"""
+    INSERT INTO package_schedule_history
+    (tracking_number, previous_scheduled_at, scheduled_at, changed_at, retell_call_id)
+    SELECT tracking_number, scheduled_at, ?, ?, ?
+    FROM packages WHERE tracking_number = ? AND {RESCHEDULABLE}
+"""
+UPDATE_PACKAGE_SCHEDULE = f"UPDATE packages SET scheduled_at = ? WHERE tracking_number = ? AND {RESCHEDULABLE}"
+SCHEDULE_AT_LAST_CHANGE = """
+    SELECT scheduled_at FROM package_schedule_history
+    WHERE tracking_number = ? AND changed_at <= ?
+    ORDER BY changed_at DESC LIMIT 1
+"""
+SCHEDULE_BEFORE_FIRST_CHANGE = """
+    SELECT previous_scheduled_at FROM package_schedule_history
+    WHERE tracking_number = ? AND changed_at > ?
+    ORDER BY changed_at LIMIT 1
+"""
+CURRENT_SCHEDULE = "SELECT scheduled_at FROM packages WHERE tracking_number = ?"
+CALL_LOG_ID_BY_RETELL_CALL_ID = "SELECT id FROM call_logs WHERE retell_call_id = ?"
+COMPLETE_CALL_LOG = "UPDATE call_logs SET transcript = ?, completed = ? WHERE retell_call_id = ?"
+SET_CALL_LOG_TRACKING_NUMBER = "UPDATE call_logs SET tracking_number = ? WHERE retell_call_id = ?"
+ESCALATE_CALL_LOG = """
+    UPDATE call_logs
+    SET escalated = ?, escalation_reason = COALESCE(escalation_reason, ?)
+    WHERE retell_call_id = ?
+"""
+CALL_TRANSCRIPT = "SELECT transcript FROM call_logs WHERE retell_call_id = ?"
+ESCALATION_INFO = """
+    SELECT tracking_number, escalated, escalation_reason FROM call_logs
+    WHERE retell_call_id = ? AND escalated IS NOT NULL
+"""
+
+# Statements taking longer are logged with their query plan, 0 turns the log off
+SLOW_QUERY_MS = float(os.getenv("SLOW_QUERY_MS", "100"))
+SLOW_QUERY_LOG_SIZE = 100
+EXPLAINABLE_STATEMENTS = ("SELECT", "INSERT", "UPDATE", "DELETE", "WITH")
+NAMED_PARAMETER_PATTERN = re.compile(r"(?<!:):(\w+)")
+
+
+def parameter_shape(parameters):
+    """Types of the bound parameters, never their values (phone numbers, transcripts, ...)"""
+    if isinstance(parameters, dict):
+        return {name: type(value).__name__ for name, value in parameters.items()}
+    return [type(value).__name__ for value in parameters]
+
+
+def null_parameters(sql: str):
+    """NULL for every placeholder of a statement, enough to EXPLAIN it"""
+    names = NAMED_PARAMETER_PATTERN.findall(sql)
+    if names:
+        return dict.fromkeys(names)
+    return (None,) * sql.count("?")
+
+
+def explain(conn: sqlite3.Connection, sql: str, parameters=None) -> List[str]:
+    """EXPLAIN QUERY PLAN steps of a statement, bound to parameters or NULLs"""
+    if parameters is None:
+        parameters = null_parameters(sql)
+    rows = sqlite3.Connection.execute(conn, f"EXPLAIN QUERY PLAN {sql}", parameters).fetchall()
+    return [row[3] for row in rows]
+
+
+class SlowQueryLog:
+    """Most recent slow statements of this process, newest first"""
+
+    def __init__(self, size: int = SLOW_QUERY_LOG_SIZE):
+        self._lock = threading.Lock()
+        self.entries: deque = deque(maxlen=size)
+
+    def record(self, entry: dict):
+        with self._lock:
+            self.entries.append(entry)
+
+    def snapshot(self) -> List[dict]:
+        with self._lock:
+            return list(reversed(self.entries))
+
+    def reset(self):
+        with self._lock:
+            self.entries.clear()
+
+
+slow_query_log = SlowQueryLog()
+
+
+class SlowQueryLoggingConnection(sqlite3.Connection):
+    """Times every statement and logs the ones over SLOW_QUERY_MS.
+
+    The time covers running the statement up to its first row, rows fetched
+    later (long streaming scans) aren't included. Their plan shows the scan anyway.
+    """
+
+    def execute(self, sql: str, parameters=()):
+        started = time.perf_counter()
+        cursor = super().execute(sql, parameters)
+        self.check_duration(started, sql, parameters)
+        return cursor
+
+    def executemany(self, sql: str, seq_of_parameters):
+        started = time.perf_counter()
+        cursor = super().executemany(sql, seq_of_parameters)
+        self.check_duration(started, sql, None)
+        return cursor
+
+    def check_duration(self, started: float, sql: str, parameters):
+        duration_ms = (time.perf_counter() - started) * 1000
+        if SLOW_QUERY_MS > 0 and duration_ms >= SLOW_QUERY_MS:
+            self.log_slow_query(sql, parameters, duration_ms)
+
+    def log_slow_query(self, sql: str, parameters, duration_ms: float):
+        statement = " ".join(sql.split())
+        plan = None
+        if statement.upper().startswith(EXPLAINABLE_STATEMENTS):
+            try:
+                plan = explain(self, statement, parameters)
+            except sqlite3.Error:
+                pass
+        entry = {
+            "sql": statement,
+            # executemany: one shape per row would be noise, the statement says enough
+            "parameters": None if parameters is None else parameter_shape(parameters),
+            "duration_ms": round(duration_ms, 3),
+            "plan": plan,
+            "database": sqlite3.Connection.execute(self, "PRAGMA database_list").fetchone()[2],
+            "logged_at": datetime.now().isoformat(),
+        }
+        slow_query_log.record(entry)
+        logger.warning(
+            "Slow query (%.1fms): %s parameters=%s plan=%s",
+            duration_ms,
+            statement,
+            entry["parameters"],
+            plan,
         )
 
-        row = cursor.fetchone()
-        if row:
-            return Package(
-                id=row["id"],
-                tracking_number=row["tracking_number"],
-                customer_name=row["customer_name"],
-                phone=row["phone"],
-                email=row["email"],
-                postal_code=row["postal_code"],
-                street=row["street"],
-                street_number=row["street_number"],
-                status=row["status"],
-                scheduled_at=datetime.fromisoformat(row["scheduled_at"]),
-            )
-        return None
+
+def install_slow_query_logging():
+    """Open every connection from now on as a SlowQueryLoggingConnection, unless SLOW_QUERY_MS is 0"""
+    if SLOW_QUERY_MS > 0:
+        database.connection_factory = SlowQueryLoggingConnection
+
+
+def package_from_row(row: tuple) -> PackageRecord:
+    """Map a row in PACKAGE_COLUMNS order"""
+    return PackageRecord(*row)
+
+
+def call_log_from_row(row: tuple) -> CallLogRecord:
+    """Map a row in CALL_LOG_COLUMNS order"""
+    return CallLogRecord(*row)
+
+
+def fetch_one(sql: str, params: tuple = (), path: Optional[str] = None) -> Optional[tuple]:
+    """Run a query and return its first row as a tuple"""
+    conn = get_db_connection(path=path)
+    conn.row_factory = None
+    try:
+        return conn.execute(sql, params).fetchone()
     finally:
         conn.close()
 
 
-def update_package_schedule(tracking_number: str, new_time: datetime) -> bool:
-    """Update package scheduled_at time"""
-    conn = get_db_connection()
+def iter_row_chunks(
+    sql: str,
+    params: tuple = (),
+    chunk_size: int = SCAN_CHUNK_SIZE,
+    path: Optional[str] = None,
+) -> Iterator[List[tuple]]:
+    """Stream query results as lists of at most chunk_size tuples"""
+    # The generator may be resumed from different threadpool threads (never concurrently)
+    conn = get_db_connection(check_same_thread=False, path=path)
+    conn.row_factory = None
     try:
-        cursor = conn.execute(
-            """
-            UPDATE packages 
-            SET scheduled_at = ?
-            WHERE tracking_number = ?
-        """,
-            (new_time.isoformat(), tracking_number),
-        )
-
-        conn.commit()
-        return cursor.rowcount > 0
+        cursor = conn.execute(sql, params)
+        while True:
+            rows = cursor.fetchmany(chunk_size)
+            if not rows:
+                break
+            yield rows
     finally:
         conn.close()
 
 
+def iter_rows(
+    sql: str,
+    params: tuple = (),
+    chunk_size: int = SCAN_CHUNK_SIZE,
+    path: Optional[str] = None,
+) -> Iterator[tuple]:
+    """Stream query results as tuples, holding at most chunk_size rows in memory"""
+    for rows in iter_row_chunks(sql, params, chunk_size, path):
+        yield from rows
+
+
+def iter_package_store_rows(
+    sql: str, params: tuple = (), order_by: Optional[int] = None, reverse: bool = False
+) -> Iterator[tuple]:
+    """Run a package query on every package store and combine the rows.
+
+    Each store's rows must already be sorted by column index order_by (ascending, or
+    descending with reverse), the combined stream then is too. Without order_by rows
+    come in store order, which is package id order.
+    """
+    paths = package_store_paths()
+    if len(paths) == 1:
+        return iter_rows(sql, params, path=paths[0])
+    streams = [iter_rows(sql, params, path=path) for path in paths]
+    if order_by is None:
+        return itertools.chain.from_iterable(streams)
+    return heapq.merge(*streams, key=operator.itemgetter(order_by), reverse=reverse)
+
+
+def package_store_connection(path: str) -> sqlite3.Connection:
+    """Connection to a package store that can also read call_logs and campaigns.
+
+    Shards attach the main database, unqualified table names resolve to it.
+    """
+    conn = get_db_connection(path=path)
+    conn.row_factory = None
+    if path != database.default_path():
+        conn.execute("ATTACH DATABASE ? AS central", (database.default_path(),))
+    return conn
+
+
+def locate_package(tracking_number: str) -> Optional[str]:
+    """Database file holding a package, when its postal code isn't known"""
+    paths = package_store_paths()
+    if len(paths) == 1:
+        return paths[0]
+    for path in paths:
+        if fetch_one(PACKAGE_EXISTS, (tracking_number,), path):
+            return path
+    return None
+
+
+def get_package_by_tracking_and_postal(
+    tracking_number: str, postal_code: str
+) -> Optional[PackageRecord]:
+    """Get package by tracking number and postal code"""
+    row = fetch_one(
+        PACKAGE_BY_TRACKING_AND_POSTAL,
+        (tracking_number, postal_code),
+        package_store_path(postal_code),
+    )
+    return package_from_row(row) if row else None
+
+
+def update_package_schedule(
+    tracking_number: str,
+    new_time: datetime,
+    retell_call_id: Optional[str] = None,
+    postal_code: Optional[str] = None,
+) -> bool:
+    """Update package scheduled_at time and record the change in package_schedule_history.
+
+    Pass the postal code when known, it saves looking for the package's shard.
+    Returns False if the package doesn't exist or can't be rescheduled anymore.
+    """
+    path = package_store_path(postal_code) if postal_code else locate_package(tracking_number)
+    if path is None:
+        return False
+    with write_connection(path) as conn:
+        # Read the previous time inside the write transaction so no change is missed
+        conn.execute(
+            RECORD_SCHEDULE_CHANGE,
+            (new_time.isoformat(), datetime.now().isoformat(), retell_call_id, tracking_number),
+        )
+        cursor = conn.execute(UPDATE_PACKAGE_SCHEDULE, (new_time.isoformat(), tracking_number))
+        return cursor.rowcount > 0
+
+
+def load_packages(packages: Iterable[tuple]) -> int:
+    """Bulk insert packages, skipping tracking numbers that already exist.
+
+    Rows are (tracking_number, customer_name, phone, email, postal_code, street,
+    street_number, status, scheduled_at). Each shard is written in one transaction.
+    Returns the number of packages inserted.
+    """
+    by_path: Dict[str, List[tuple]] = {}
+    for package in packages:
+        by_path.setdefault(package_store_path(package[4]), []).append(package)
+    inserted = 0
+    for path, batch in by_path.items():
+        with write_connection(path) as conn:
+            before = conn.total_changes
+            conn.executemany(
+                """
+                INSERT OR IGNORE INTO packages
+                (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                batch,
+            )
+            inserted += conn.total_changes - before
+    return inserted
+
+
 def create_call_log(retell_call_id: str, tracking_number: Optional[str] = None) -> int:
     """Create new call log entry, return ID"""
-    conn = get_db_connection()
-    try:
+    with write_connection() as conn:
         cursor = conn.execute(
             """
             INSERT INTO call_logs (retell_call_id, tracking_number, created_at)
             VALUES (?, ?, ?)
+            ON CONFLICT (retell_call_id) DO NOTHING
         """,
             (retell_call_id, tracking_number, datetime.now().isoformat()),
         )
-
-        conn.commit()
+        if cursor.rowcount == 0:
+            # Outbound campaign calls are logged when dialed, before call_started arrives
+            return conn.execute(CALL_LOG_ID_BY_RETELL_CALL_ID, (retell_call_id,)).fetchone()["id"]
         return cursor.lastrowid
-    finally:
-        conn.close()
 
 
 def update_call_log_completed_by_retell_call_id(
     retell_call_id: str, transcript: str
 ) -> bool:
     """Update call log with transcript and completion time by retell_call_id"""
-    conn = get_db_connection()
-    try:
+    # The call_logs_fts_update trigger re-indexes the transcript in the same transaction
+    with write_connection() as conn:
         cursor = conn.execute(
-            """
-            UPDATE call_logs 
-            SET transcript = ?, completed = ?
-            WHERE retell_call_id = ?
-        """,
-            (transcript, datetime.now().isoformat(), retell_call_id),
+            COMPLETE_CALL_LOG, (transcript, datetime.now().isoformat(), retell_call_id)
         )
-
-        conn.commit()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 
 def update_call_log_escalated(log_id: int) -> bool:
     """Mark call log as escalated"""
-    conn = get_db_connection()
-    try:
+    with write_connection() as conn:
         cursor = conn.execute(
             """
             UPDATE call_logs 
@@ -109,21 +391,14 @@ def update_call_log_escalated(log_id: int) -> bool:
         """,
             (datetime.now().isoformat(), log_id),
         )
-
-        conn.commit()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 
 def find_call_log_by_retell_call_id(retell_call_id: str) -> Optional[int]:
     """Find call log ID by retell_call_id"""
     conn = get_db_connection()
     try:
-        cursor = conn.execute(
-            "SELECT id FROM call_logs WHERE retell_call_id = ?",
-            (retell_call_id,),
-        )
+        cursor = conn.execute(CALL_LOG_ID_BY_RETELL_CALL_ID, (retell_call_id,))
         row = cursor.fetchone()
         return row["id"] if row else None
     finally:
@@ -132,50 +407,27 @@ def find_call_log_by_retell_call_id(retell_call_id: str) -> Optional[int]:
 
 def update_call_log_tracking_number(retell_call_id: str, tracking_number: str) -> bool:
     """Update call log tracking number by retell_call_id"""
-    conn = get_db_connection()
-    try:
-        cursor = conn.execute(
-            """
-            UPDATE call_logs 
-            SET tracking_number = ?
-            WHERE retell_call_id = ?
-        """,
-            (tracking_number, retell_call_id),
-        )
-
-        conn.commit()
+    with write_connection() as conn:
+        cursor = conn.execute(SET_CALL_LOG_TRACKING_NUMBER, (tracking_number, retell_call_id))
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 
-def update_call_log_escalated_by_retell_call_id(retell_call_id: str) -> bool:
-    """Mark call log as escalated by retell_call_id"""
-    conn = get_db_connection()
-    try:
+def update_call_log_escalated_by_retell_call_id(
+    retell_call_id: str, reason: EscalationReason = "agent_escalation"
+) -> bool:
+    """Mark call log as escalated by retell_call_id, keeping the first escalation reason"""
+    with write_connection() as conn:
         cursor = conn.execute(
-            """
-            UPDATE call_logs 
-            SET escalated = ?
-            WHERE retell_call_id = ?
-        """,
-            (datetime.now().isoformat(), retell_call_id),
+            ESCALATE_CALL_LOG, (datetime.now().isoformat(), reason, retell_call_id)
         )
-
-        conn.commit()
         return cursor.rowcount > 0
-    finally:
-        conn.close()
 
 
 def get_call_transcript_by_retell_call_id(retell_call_id: str) -> Optional[str]:
     """Get call transcript by retell_call_id"""
     conn = get_db_connection()
     try:
-        cursor = conn.execute(
-            "SELECT transcript FROM call_logs WHERE retell_call_id = ?",
-            (retell_call_id,),
-        )
+        cursor = conn.execute(CALL_TRANSCRIPT, (retell_call_id,))
         row = cursor.fetchone()
         return row["transcript"] if row else None
     finally:
@@ -188,113 +440,724 @@ def get_escalation_info_by_retell_call_id(
     """Get escalation info (tracking_number, escalated timestamp) by retell_call_id if escalated"""
     conn = get_db_connection()
     try:
-        cursor = conn.execute(
-            "SELECT tracking_number, escalated FROM call_logs WHERE retell_call_id = ? AND escalated IS NOT NULL",
-            (retell_call_id,),
-        )
+        cursor = conn.execute(ESCALATION_INFO, (retell_call_id,))
         row = cursor.fetchone()
         if row:
             return EscalationInfo(
                 tracking_number=row["tracking_number"] or "unknown",
                 escalated=row["escalated"],
+                escalation_reason=row["escalation_reason"] or "agent_escalation",
             )
         return None
     finally:
         conn.close()
 
 
-def get_package_by_tracking_number(tracking_number: str) -> Optional[Package]:
+def get_package_by_tracking_number(tracking_number: str) -> Optional[PackageRecord]:
     """Get package by tracking number only (assumes tracking numbers are unique)"""
+    for path in package_store_paths():
+        row = fetch_one(PACKAGE_BY_TRACKING_NUMBER, (tracking_number,), path)
+        if row:
+            return package_from_row(row)
+    return None
+
+
+def iter_packages() -> Iterator[PackageRecord]:
+    """Stream all packages, latest scheduled first"""
+    for row in iter_package_store_rows(
+        f"{SELECT_PACKAGES} ORDER BY scheduled_at DESC", order_by=SCHEDULED_AT_COLUMN, reverse=True
+    ):
+        yield package_from_row(row)
+
+
+def get_all_packages() -> List[PackageRecord]:
+    """Get all packages"""
+    return list(iter_packages())
+
+
+def get_schedule_history_rows(
+    tracking_number: Optional[str] = None, retell_call_id: Optional[str] = None
+) -> Tuple[List[str], List[tuple]]:
+    """Schedule changes of a package or made by a call, oldest first, as (column names, row tuples)"""
+    columns = list(SCHEDULE_CHANGE_COLUMNS)
+    select = f"SELECT {', '.join(SCHEDULE_CHANGE_COLUMNS)} FROM package_schedule_history"
+    if tracking_number is not None:
+        path = locate_package(tracking_number)
+        if path is None:
+            return columns, []
+        rows = iter_rows(
+            f"{select} WHERE tracking_number = ? ORDER BY changed_at, id", (tracking_number,), path=path
+        )
+        return columns, list(rows)
+    # A call may have rescheduled packages in several shards
+    rows = iter_package_store_rows(
+        f"{select} WHERE retell_call_id = ? ORDER BY changed_at, id",
+        (retell_call_id,),
+        order_by=columns.index("changed_at"),
+    )
+    return columns, list(rows)
+
+
+def get_schedule_as_of(tracking_number: str, as_of: datetime) -> Optional[datetime]:
+    """Delivery time a package had at as_of, answered from idx_schedule_history_as_of"""
+    path = locate_package(tracking_number)
+    if path is None:
+        return None
+    as_of = to_service_time(as_of)
+    row = fetch_one(SCHEDULE_AT_LAST_CHANGE, (tracking_number, as_of.isoformat()), path)
+    if row:
+        return row[0]
+    # Before its first change the package had that change's previous time
+    row = fetch_one(SCHEDULE_BEFORE_FIRST_CHANGE, (tracking_number, as_of.isoformat()), path)
+    if row:
+        return row[0]
+    # Never changed since as_of
+    row = fetch_one(CURRENT_SCHEDULE, (tracking_number,), path)
+    return row[0] if row else None
+
+
+def get_reschedule_count_rows(
+    min_count: int = 1, limit: int = 100
+) -> Tuple[List[str], List[tuple]]:
+    """Packages by number of reschedules, most first, as (column names, row tuples)"""
+    # A package's history lives in one shard, so the overall top is among the shards' tops
+    rows = list(
+        iter_package_store_rows(
+            """
+            SELECT tracking_number, COUNT(*) AS reschedules, MAX(changed_at) AS last_changed_at
+            FROM package_schedule_history
+            GROUP BY tracking_number
+            HAVING COUNT(*) >= ?
+            ORDER BY reschedules DESC, tracking_number
+            LIMIT ?
+        """,
+            (min_count, limit),
+        )
+    )
+    if len(package_store_paths()) > 1:
+        rows = sorted(rows, key=lambda row: (-row[1], row[0]))[:limit]
+    return ["tracking_number", "reschedules", "last_changed_at"], rows
+
+
+def get_all_package_rows() -> Tuple[List[str], List[tuple]]:
+    """Get all packages as (column names, row tuples), for serializing without models"""
+    rows = list(
+        iter_package_store_rows(
+            f"{SELECT_PACKAGES} ORDER BY scheduled_at DESC", order_by=SCHEDULED_AT_COLUMN, reverse=True
+        )
+    )
+    return list(PACKAGE_COLUMNS), rows
+
+
+def iter_call_logs() -> Iterator[CallLogRecord]:
+    """Stream all call logs, newest first"""
+    for row in iter_rows(f"{SELECT_CALL_LOGS} ORDER BY created_at DESC"):
+        yield call_log_from_row(row)
+
+
+def get_all_call_logs() -> List[CallLogRecord]:
+    """Get all call logs"""
+    return list(iter_call_logs())
+
+
+def get_all_call_log_rows() -> Tuple[List[str], List[tuple]]:
+    """Get all call logs as (column names, row tuples), for serializing without models"""
+    rows = list(iter_rows(f"{SELECT_CALL_LOGS} ORDER BY created_at DESC"))
+    return list(CALL_LOG_COLUMNS), rows
+
+
+def get_max_package_id() -> int:
+    """Highest package id, the upper bound of an export"""
+    return max(
+        fetch_one("SELECT COALESCE(MAX(id), 0) FROM packages", path=path)[0]
+        for path in package_store_paths()
+    )
+
+
+# Calls open for longer than this lost their call_ended webhook, they stop holding back exports
+OPEN_CALL_MAX_AGE = timedelta(hours=6)
+OLDEST_OPEN_CALL_LOG = """
+    SELECT MIN(id) FROM call_logs
+    WHERE completed IS NULL AND created_at >= ? AND outcome IS NOT 'dial_failed'
+"""
+
+
+def get_call_log_export_watermark(now: Optional[datetime] = None) -> int:
+    """Upper bound of a call log export: the highest id below the oldest call still in progress.
+
+    Transcript, completion and escalation of a call are written after its log is
+    created, so a call is exported once it has ended. Calls never dialed through
+    and calls open for longer than OPEN_CALL_MAX_AGE don't hold the watermark back.
+    """
+    open_since = (now or datetime.now()) - OPEN_CALL_MAX_AGE
     conn = get_db_connection()
     try:
+        max_id = conn.execute("SELECT COALESCE(MAX(id), 0) FROM call_logs").fetchone()[0]
+        oldest_open = conn.execute(OLDEST_OPEN_CALL_LOG, (open_since.isoformat(),)).fetchone()[0]
+    finally:
+        conn.close()
+    return max_id if oldest_open is None else min(max_id, oldest_open - 1)
+
+
+def iter_package_export_chunks(
+    after_id: int, up_to_id: int, chunk_size: int = SCAN_CHUNK_SIZE
+) -> Iterator[List[tuple]]:
+    """Packages with after_id < id <= up_to_id in id order, chunk by chunk"""
+    # Shards hand out ids from ascending ranges, so chaining them keeps id order
+    return itertools.chain.from_iterable(
+        iter_row_chunks(
+            f"{SELECT_PACKAGES} WHERE id > ? AND id <= ? ORDER BY id",
+            (after_id, up_to_id),
+            chunk_size,
+            path,
+        )
+        for path in package_store_paths()
+    )
+
+
+def iter_call_log_export_chunks(
+    after_id: int,
+    up_to_id: int,
+    created_since: Optional[datetime] = None,
+    chunk_size: int = SCAN_CHUNK_SIZE,
+) -> Iterator[List[tuple]]:
+    """Call logs with after_id < id <= up_to_id (and created_at >= created_since) in id order"""
+    if created_since is None:
+        return iter_row_chunks(
+            f"{SELECT_CALL_LOGS} WHERE id > ? AND id <= ? ORDER BY id",
+            (after_id, up_to_id),
+            chunk_size,
+        )
+    return iter_row_chunks(
+        f"{SELECT_CALL_LOGS} WHERE id > ? AND id <= ? AND created_at >= ? ORDER BY id",
+        (after_id, up_to_id, to_service_time(created_since).isoformat()),
+        chunk_size,
+    )
+
+
+SELECT_CAMPAIGNS = """
+    SELECT c.id, c.name, c.status, c.delivery_from, c.delivery_to, c.window_start, c.window_end,
+           c.max_concurrent_dials, c.max_attempts, c.created_at,
+           COUNT(l.id) AS attempts,
+           COUNT(CASE WHEN l.outcome = 'dial_failed' THEN 1 END) AS dial_failures,
+           COUNT(l.completed) AS completed_calls
+    FROM campaigns c
+    LEFT JOIN call_logs l ON l.campaign_id = c.id
+"""
+
+# Eligible packages of a campaign: scheduled, delivery inside the campaign's range and
+# not yet called max_attempts times. Walks idx_packages_status_scheduled in
+# (scheduled_at, id) order so pages can be fetched with a keyset cursor.
+CAMPAIGN_TARGETS_WHERE = """
+    WHERE p.status = 'scheduled'
+      AND p.scheduled_at >= :delivery_from AND p.scheduled_at < :delivery_to
+      AND (
+          SELECT COUNT(*) FROM call_logs l
+          WHERE l.campaign_id = :campaign_id AND l.tracking_number = p.tracking_number
+      ) < :max_attempts
+"""
+COUNT_CAMPAIGN_TARGETS = f"SELECT COUNT(*) FROM packages p {CAMPAIGN_TARGETS_WHERE}"
+CAMPAIGN_TARGETS_KEYSET = (
+    "AND p.scheduled_at >= :after_time AND (p.scheduled_at, p.id) > (:after_time, :after_id)"
+)
+
+
+def campaign_targets_page_sql(keyset: bool) -> str:
+    """First page of campaign targets, or the page after a (:after_time, :after_id) cursor"""
+    return f"""
+        SELECT p.id, p.tracking_number, p.phone, p.scheduled_at
+        FROM packages p
+        {CAMPAIGN_TARGETS_WHERE} {CAMPAIGN_TARGETS_KEYSET if keyset else ""}
+        ORDER BY p.scheduled_at, p.id
+        LIMIT :limit
+    """
+
+
+def create_campaign(campaign: CampaignCreate) -> int:
+    """Store a new pending campaign, return ID"""
+    with write_connection() as conn:
         cursor = conn.execute(
             """
-            SELECT id, tracking_number, customer_name, phone, email, postal_code, 
-                   street, street_number, status, scheduled_at
-            FROM packages 
-            WHERE tracking_number = ?
+            INSERT INTO campaigns
+            (name, delivery_from, delivery_to, window_start, window_end,
+             max_concurrent_dials, max_attempts, created_at)
+            VALUES (?, ?, ?, ?, ?, ?, ?, ?)
         """,
-            (tracking_number,),
+            (
+                campaign.name,
+                campaign.delivery_from.isoformat(),
+                campaign.delivery_to.isoformat(),
+                campaign.window_start.isoformat(),
+                campaign.window_end.isoformat(),
+                campaign.max_concurrent_dials,
+                campaign.max_attempts,
+                datetime.now().isoformat(),
+            ),
         )
+        return cursor.lastrowid
 
-        row = cursor.fetchone()
-        if row:
-            return Package(
-                id=row["id"],
-                tracking_number=row["tracking_number"],
-                customer_name=row["customer_name"],
-                phone=row["phone"],
-                email=row["email"],
-                postal_code=row["postal_code"],
-                street=row["street"],
-                street_number=row["street_number"],
-                status=row["status"],
-                scheduled_at=datetime.fromisoformat(row["scheduled_at"]),
-            )
-        return None
+
+def get_campaign(campaign_id: int) -> Optional[Campaign]:
+    """Get campaign with attempt statistics"""
+    conn = get_db_connection()
+    try:
+        row = conn.execute(
+            f"{SELECT_CAMPAIGNS} WHERE c.id = ? GROUP BY c.id", (campaign_id,)
+        ).fetchone()
+        return Campaign(**row) if row else None
     finally:
         conn.close()
 
 
-def get_all_packages() -> List[Package]:
-    """Get all packages"""
+def get_campaigns(status: Optional[CampaignStatus] = None) -> List[Campaign]:
+    """Get all campaigns (optionally by status) with attempt statistics, newest first"""
     conn = get_db_connection()
     try:
-        cursor = conn.execute("""
-            SELECT id, tracking_number, customer_name, phone, email, postal_code, 
-                   street, street_number, status, scheduled_at
-            FROM packages 
-            ORDER BY scheduled_at DESC
-        """)
-
-        packages = []
-        for row in cursor.fetchall():
-            packages.append(
-                Package(
-                    id=row["id"],
-                    tracking_number=row["tracking_number"],
-                    customer_name=row["customer_name"],
-                    phone=row["phone"],
-                    email=row["email"],
-                    postal_code=row["postal_code"],
-                    street=row["street"],
-                    street_number=row["street_number"],
-                    status=row["status"],
-                    scheduled_at=datetime.fromisoformat(row["scheduled_at"]),
-                )
+        if status is None:
+            cursor = conn.execute(f"{SELECT_CAMPAIGNS} GROUP BY c.id ORDER BY c.id DESC")
+        else:
+            cursor = conn.execute(
+                f"{SELECT_CAMPAIGNS} WHERE c.status = ? GROUP BY c.id ORDER BY c.id DESC",
+                (status,),
             )
-        return packages
+        return [Campaign(**row) for row in cursor.fetchall()]
     finally:
         conn.close()
 
 
-def get_all_call_logs() -> List[CallLog]:
-    """Get all call logs"""
+def start_due_campaigns(now: datetime) -> int:
+    """Move pending campaigns whose call window is open to running.
+
+    Pending campaigns whose window closed before they could start are completed
+    without dialing.
+    """
+    with write_connection() as conn:
+        conn.execute(
+            "UPDATE campaigns SET status = 'completed' WHERE status = 'pending' AND window_end <= ?",
+            (now.isoformat(),),
+        )
+        cursor = conn.execute(
+            "UPDATE campaigns SET status = 'running' WHERE status = 'pending' AND window_start <= ?",
+            (now.isoformat(),),
+        )
+        return cursor.rowcount
+
+
+def get_campaign_status(campaign_id: int) -> Optional[CampaignStatus]:
+    """Current status without the attempt statistics, cheap enough to poll"""
+    row = fetch_one("SELECT status FROM campaigns WHERE id = ?", (campaign_id,))
+    return row[0] if row else None
+
+
+def update_campaign_status(
+    campaign_id: int, status: CampaignStatus, only_if: Optional[CampaignStatus] = None
+) -> bool:
+    """Set campaign status, optionally only when it currently has status only_if"""
+    with write_connection() as conn:
+        if only_if is None:
+            cursor = conn.execute(
+                "UPDATE campaigns SET status = ? WHERE id = ?", (status, campaign_id)
+            )
+        else:
+            cursor = conn.execute(
+                "UPDATE campaigns SET status = ? WHERE id = ? AND status = ?",
+                (status, campaign_id, only_if),
+            )
+        return cursor.rowcount > 0
+
+
+def campaign_target_params(campaign: Campaign) -> dict:
+    """Named parameters for CAMPAIGN_TARGETS_WHERE"""
+    return {
+        "campaign_id": campaign.id,
+        "delivery_from": campaign.delivery_from.isoformat(),
+        "delivery_to": campaign.delivery_to.isoformat(),
+        "max_attempts": campaign.max_attempts,
+    }
+
+
+def count_campaign_targets(campaign: Campaign) -> int:
+    """Number of packages the campaign still has to call"""
+    total = 0
+    for path in package_store_paths():
+        conn = package_store_connection(path)
+        try:
+            total += conn.execute(COUNT_CAMPAIGN_TARGETS, campaign_target_params(campaign)).fetchone()[0]
+        finally:
+            conn.close()
+    return total
+
+
+def get_campaign_targets(
+    campaign: Campaign, after: Optional[Tuple[datetime, int]] = None, limit: int = 1000
+) -> List[Tuple[int, str, str, datetime]]:
+    """Next page of (id, tracking_number, phone, scheduled_at) to call, after a (scheduled_at, id) cursor"""
+    params = campaign_target_params(campaign)
+    params["limit"] = limit
+    if after is not None:
+        params["after_time"] = after[0].isoformat()
+        params["after_id"] = after[1]
+    sql = campaign_targets_page_sql(keyset=after is not None)
+    pages = []
+    for path in package_store_paths():
+        conn = package_store_connection(path)
+        try:
+            pages.append(conn.execute(sql, params).fetchall())
+        finally:
+            conn.close()
+    if len(pages) == 1:
+        return pages[0]
+    return list(itertools.islice(heapq.merge(*pages, key=operator.itemgetter(3, 0)), limit))
+
+
+def record_campaign_attempts(
+    campaign_id: int, attempts: List[Tuple[str, str, str]]
+) -> None:
+    """Log a batch of outbound (retell_call_id, tracking_number, outcome) dial attempts"""
+    now = datetime.now().isoformat()
+    with write_connection() as conn:
+        # The call_started webhook of a dialed call may have created its log already
+        conn.executemany(
+            """
+            INSERT INTO call_logs
+            (retell_call_id, tracking_number, direction, campaign_id, outcome, created_at)
+            VALUES (?, ?, 'outbound', ?, ?, ?)
+            ON CONFLICT (retell_call_id) DO UPDATE SET
+                direction = 'outbound',
+                campaign_id = excluded.campaign_id,
+                outcome = excluded.outcome,
+                tracking_number = COALESCE(call_logs.tracking_number, excluded.tracking_number)
+        """,
+            [
+                (call_id, tracking_number, campaign_id, outcome, now)
+                for call_id, tracking_number, outcome in attempts
+            ],
+        )
+
+
+CLAIM_DUE_JOBS = """
+    UPDATE jobs SET status = 'running', claimed_at = :now, attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM jobs WHERE status = 'pending' AND run_after <= :now
+        UNION ALL
+        SELECT id FROM jobs WHERE status = 'running' AND claimed_at < :stale_before
+        LIMIT :limit
+    )
+    RETURNING id, kind, payload, attempts
+"""
+
+
+def job_from_row(row: tuple) -> JobRecord:
+    return JobRecord(row[0], row[1], json.loads(row[2]), row[3])
+
+
+def enqueue_job(kind: str, payload: dict) -> int:
+    """Store a job for services/jobs.py, due right away, return ID"""
+    now = datetime.now().isoformat()
+    with write_connection() as conn:
+        cursor = conn.execute(
+            "INSERT INTO jobs (kind, payload, run_after, created_at) VALUES (?, ?, ?, ?)",
+            (kind, json.dumps(payload), now, now),
+        )
+        return cursor.lastrowid
+
+
+def claim_job(job_id: int) -> Optional[JobRecord]:
+    """Mark a pending job running, None if another worker claimed it first"""
+    with write_connection() as conn:
+        conn.row_factory = None
+        row = conn.execute(
+            """
+            UPDATE jobs SET status = 'running', claimed_at = ?, attempts = attempts + 1
+            WHERE id = ? AND status = 'pending'
+            RETURNING id, kind, payload, attempts
+        """,
+            (datetime.now().isoformat(), job_id),
+        ).fetchone()
+        return job_from_row(row) if row else None
+
+
+def claim_due_jobs(now: datetime, stale_before: datetime, limit: int = 100) -> List[JobRecord]:
+    """Claim due pending jobs, and running ones claimed before stale_before by a worker that went away"""
+    with write_connection() as conn:
+        conn.row_factory = None
+        rows = conn.execute(
+            CLAIM_DUE_JOBS,
+            {"now": now.isoformat(), "stale_before": stale_before.isoformat(), "limit": limit},
+        ).fetchall()
+        return [job_from_row(row) for row in rows]
+
+
+def finish_job(job_id: int, status: str = "done", error: Optional[str] = None) -> None:
+    """Mark a job done, or failed for good"""
+    with write_connection() as conn:
+        conn.execute(
+            "UPDATE jobs SET status = ?, finished_at = ?, last_error = ? WHERE id = ?",
+            (status, datetime.now().isoformat(), error, job_id),
+        )
+
+
+def release_job(
+    job_id: int, run_after: datetime, error: Optional[str] = None, count_attempt: bool = True
+) -> None:
+    """Put a claimed job back to pending, to be retried from run_after on"""
+    with write_connection() as conn:
+        conn.execute(
+            """
+            UPDATE jobs SET status = 'pending', claimed_at = NULL, run_after = ?,
+                last_error = COALESCE(?, last_error), attempts = attempts - ?
+            WHERE id = ?
+        """,
+            (run_after.isoformat(), error, 0 if count_attempt else 1, job_id),
+        )
+
+
+def get_job_counts() -> Dict[str, int]:
+    """Number of jobs per status"""
+    rows = iter_rows("SELECT status, COUNT(*) FROM jobs GROUP BY status")
+    return dict(rows)
+
+
+def prune_jobs(finished_before: datetime) -> int:
+    """Delete done jobs finished before finished_before, failed ones stay for inspection"""
+    with write_connection() as conn:
+        cursor = conn.execute(
+            "DELETE FROM jobs WHERE status = 'done' AND finished_at < ?",
+            (finished_before.isoformat(),),
+        )
+        return cursor.rowcount
+
+
+UPDATE_PACKAGE_STATUSES = """
+    UPDATE packages SET status = :status
+    WHERE tracking_number IN (SELECT value FROM json_each(:tracking_numbers)) AND status != :status
+"""
+CLAIM_NOTIFICATIONS = """
+    UPDATE notification_outbox SET status = 'sending', claimed_at = :now, attempts = attempts + 1
+    WHERE id IN (
+        SELECT id FROM notification_outbox WHERE channel = :channel AND status = 'pending'
+        UNION ALL
+        SELECT id FROM notification_outbox
+        WHERE channel = :channel AND status = 'sending' AND claimed_at < :stale_before
+        LIMIT :limit
+    )
+    RETURNING id, tracking_number, kind, channel, attempts
+"""
+PACKAGES_BY_TRACKING_NUMBERS = f"{SELECT_PACKAGES} WHERE tracking_number IN (SELECT value FROM json_each(?))"
+
+
+def update_package_statuses(tracking_numbers: List[str], status: str) -> int:
+    """Set the status of many packages at once, e.g. from a carrier's dispatch list.
+
+    One statement and transaction per package store, the out_for_delivery trigger
+    queues the customer notifications within it. Returns the number of packages
+    whose status changed.
+    """
+    params = {"status": status, "tracking_numbers": json.dumps(tracking_numbers)}
+    changed = 0
+    for path in package_store_paths():
+        with write_connection(path) as conn:
+            changed += conn.execute(UPDATE_PACKAGE_STATUSES, params).rowcount
+    return changed
+
+
+def get_notification_preferences(tracking_number: str) -> Optional[Tuple[bool, bool]]:
+    """(email, sms) notifications wanted for a package, None if there is no such package"""
+    path = locate_package(tracking_number)
+    if path is None:
+        return None
+    row = fetch_one(
+        "SELECT notify_email, notify_sms FROM packages WHERE tracking_number = ?", (tracking_number,), path
+    )
+    return (bool(row[0]), bool(row[1])) if row else None
+
+
+def set_notification_preferences(tracking_number: str, email: bool, sms: bool) -> bool:
+    """Choose the channels a package's notifications go out on"""
+    path = locate_package(tracking_number)
+    if path is None:
+        return False
+    with write_connection(path) as conn:
+        cursor = conn.execute(
+            "UPDATE packages SET notify_email = ?, notify_sms = ? WHERE tracking_number = ?",
+            (email, sms, tracking_number),
+        )
+        return cursor.rowcount > 0
+
+
+def claim_notifications(
+    path: str, channel: str, now: datetime, stale_before: datetime, limit: int
+) -> List[OutboxNotification]:
+    """Claim pending notifications of one channel in a package store, with their packages.
+
+    Also reclaims ones claimed before stale_before by a process that went away.
+    """
+    with write_connection(path) as conn:
+        conn.row_factory = None
+        rows = conn.execute(
+            CLAIM_NOTIFICATIONS,
+            {
+                "channel": channel,
+                "now": now.isoformat(),
+                "stale_before": stale_before.isoformat(),
+                "limit": limit,
+            },
+        ).fetchall()
+        tracking_numbers = json.dumps(sorted({row[1] for row in rows}))
+        packages = {
+            package.tracking_number: package
+            for package in map(package_from_row, conn.execute(PACKAGES_BY_TRACKING_NUMBERS, (tracking_numbers,)))
+        }
+    notifications = []
+    for row in rows:
+        # Rebalancing moves packages to another shard, their pending notifications stay
+        package = packages.get(row[1]) or get_package_by_tracking_number(row[1])
+        notifications.append(OutboxNotification(*row, package))
+    return notifications
+
+
+def finish_notifications(path: str, results: List[Tuple[int, Optional[str]]], max_attempts: int) -> None:
+    """Record (id, error) send results, failed ones go back to pending until max_attempts"""
+    now = datetime.now().isoformat()
+    with write_connection(path) as conn:
+        conn.executemany(
+            "UPDATE notification_outbox SET status = 'sent', sent_at = ?, last_error = NULL WHERE id = ?",
+            [(now, notification_id) for notification_id, error in results if error is None],
+        )
+        conn.executemany(
+            """
+            UPDATE notification_outbox
+            SET status = CASE WHEN attempts >= ? THEN 'failed' ELSE 'pending' END,
+                claimed_at = NULL, last_error = ?
+            WHERE id = ?
+        """,
+            [(max_attempts, error, notification_id) for notification_id, error in results if error is not None],
+        )
+
+
+def get_notification_counts() -> Dict[str, Dict[str, int]]:
+    """Number of outbox notifications per channel and status, all package stores"""
+    counts: Dict[str, Dict[str, int]] = {}
+    rows = iter_package_store_rows(
+        "SELECT channel, status, COUNT(*) FROM notification_outbox GROUP BY channel, status"
+    )
+    for channel, status, count in rows:
+        by_status = counts.setdefault(channel, {})
+        by_status[status] = by_status.get(status, 0) + count
+    return counts
+
+
+# Statements run on every tool call, webhook or campaign page, by the store they run on.
+# check_query_plans() verifies at startup that each of them is answered from an index.
+HOT_QUERIES: Dict[str, Tuple[str, str]] = {
+    "package_by_tracking_and_postal": ("packages", PACKAGE_BY_TRACKING_AND_POSTAL),
+    "package_by_tracking_number": ("packages", PACKAGE_BY_TRACKING_NUMBER),
+    "package_exists": ("packages", PACKAGE_EXISTS),
+    "record_schedule_change": ("packages", RECORD_SCHEDULE_CHANGE),
+    "update_package_schedule": ("packages", UPDATE_PACKAGE_SCHEDULE),
+    "schedule_at_last_change": ("packages", SCHEDULE_AT_LAST_CHANGE),
+    "schedule_before_first_change": ("packages", SCHEDULE_BEFORE_FIRST_CHANGE),
+    "current_schedule": ("packages", CURRENT_SCHEDULE),
+    "count_campaign_targets": ("packages", COUNT_CAMPAIGN_TARGETS),
+    "campaign_targets_first_page": ("packages", campaign_targets_page_sql(keyset=False)),
+    "campaign_targets_next_page": ("packages", campaign_targets_page_sql(keyset=True)),
+    "call_log_id_by_retell_call_id": ("main", CALL_LOG_ID_BY_RETELL_CALL_ID),
+    "complete_call_log": ("main", COMPLETE_CALL_LOG),
+    "set_call_log_tracking_number": ("main", SET_CALL_LOG_TRACKING_NUMBER),
+    "escalate_call_log": ("main", ESCALATE_CALL_LOG),
+    "call_transcript": ("main", CALL_TRANSCRIPT),
+    "escalation_info": ("main", ESCALATION_INFO),
+    "claim_due_jobs": ("main", CLAIM_DUE_JOBS),
+    "claim_notifications": ("packages", CLAIM_NOTIFICATIONS),
+}
+
+
+def is_table_scan(plan_step: str) -> bool:
+    """A plan step reading a whole table, or building a throwaway index for lack of one"""
+    if "AUTOMATIC" in plan_step:
+        return True
+    return plan_step.startswith("SCAN ") and " USING " not in plan_step and plan_step != "SCAN CONSTANT ROW"
+
+
+def check_query_plans() -> List[str]:
+    """Check that every HOT_QUERIES statement uses an index on every store, log and return the scans"""
+    problems = []
+    for name, (store, sql) in HOT_QUERIES.items():
+        paths = package_store_paths() if store == "packages" else [database.default_path()]
+        for path in paths:
+            conn = package_store_connection(path)
+            try:
+                plan = explain(conn, sql)
+            finally:
+                conn.close()
+            problems.extend(f"{name} on {path}: {step}" for step in plan if is_table_scan(step))
+    for problem in problems:
+        logger.warning("Hot query without index: %s", problem)
+    return problems
+
+
+# snippet() marks matches with control characters, the transcript text is escaped before
+# they become the only HTML tags of the snippet
+SNIPPET_MATCH_START, SNIPPET_MATCH_END = "\x02", "\x03"
+
+
+def highlight_snippet(snippet: str) -> str:
+    """HTML-escaped snippet with its matches wrapped in <mark></mark>"""
+    return (
+        html.escape(snippet)
+        .replace(SNIPPET_MATCH_START, "<mark>")
+        .replace(SNIPPET_MATCH_END, "</mark>")
+    )
+
+
+def build_fts_query(text: str) -> str:
+    """Turn free text into an FTS5 query: "quoted phrases" stay phrases, all terms must match.
+
+    Every term is quoted so user input can never hit FTS5 operator syntax.
+    """
+    terms = []
+    for phrase, word in FTS_TERM_PATTERN.findall(text):
+        term = (phrase or word).strip()
+        if term:
+            terms.append('"' + term.replace('"', '""') + '"')
+    return " ".join(terms)
+
+
+def search_call_logs(query: str, limit: int = 20, offset: int = 0) -> CallLogSearchPage:
+    """Full-text search over call transcripts, best matches first"""
+    fts_query = build_fts_query(query)
+    if not fts_query:
+        return CallLogSearchPage(
+            query=query, total=0, limit=limit, offset=offset, results=[]
+        )
+
     conn = get_db_connection()
     try:
-        cursor = conn.execute("""
-            SELECT id, retell_call_id, tracking_number, transcript, completed, escalated, created_at
-            FROM call_logs 
-            ORDER BY created_at DESC
-        """)
-
-        call_logs = []
-        for row in cursor.fetchall():
-            call_logs.append(
-                CallLog(
-                    id=row["id"],
-                    retell_call_id=row["retell_call_id"],
-                    tracking_number=row["tracking_number"],
-                    transcript=row["transcript"],
-                    completed=datetime.fromisoformat(row["completed"])
-                    if row["completed"]
-                    else None,
-                    escalated=datetime.fromisoformat(row["escalated"])
-                    if row["escalated"]
-                    else None,
-                    created_at=datetime.fromisoformat(row["created_at"]),
-                )
-            )
-        return call_logs
+        total = conn.execute(
+            "SELECT count(*) FROM call_logs_fts WHERE call_logs_fts MATCH ?",
+            (fts_query,),
+        ).fetchone()[0]
+
+        cursor = conn.execute(
+            """
+            SELECT c.id, c.retell_call_id, c.tracking_number, c.created_at, c.completed, c.escalated,
+                   snippet(call_logs_fts, 0, char(2), char(3), '...', 24) AS snippet,
+                   call_logs_fts.rank AS rank
+            FROM call_logs_fts
+            JOIN call_logs c ON c.id = call_logs_fts.rowid
+            WHERE call_logs_fts MATCH ?
+            ORDER BY call_logs_fts.rank
+            LIMIT ? OFFSET ?
+        """,
+            (fts_query, limit, offset),
+        )
+
+        results = [
+            CallLogSearchResult(**{**row, "snippet": highlight_snippet(row["snippet"])})
+            for row in cursor.fetchall()
+        ]
+        return CallLogSearchPage(
+            query=query, total=total, limit=limit, offset=offset, results=results
+        )
     finally:
         conn.close()
@@ -0,0 +1,81 @@
+import asyncio
+import os
+import random
+import uuid
+from typing import Dict, List, Optional, Protocol
+
+from retell import Retell, RetellError
+
+
+class DialError(Exception):
+    """Raised when an outbound call could not be placed"""
+
+
+class Dialer(Protocol):
+    """Places outbound calls, returns the call_id later webhooks will refer to"""
+
+    async def dial(self, to_number: str, metadata: Dict[str, str]) -> str: ...
+
+
+class FakeDialer:
+    """Local stand-in for the Retell API, for tests, benchmarks and dry runs"""
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.dialed: List[Dict[str, str]] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def dial(self, to_number: str, metadata: Dict[str, str]) -> str:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency_seconds:
+                await asyncio.sleep(self.latency_seconds)
+            if self.random.random() < self.failure_rate:
+                raise DialError(f"Fake dial to {to_number} failed")
+            self.dialed.append({"to_number": to_number, **metadata})
+            return f"fake-{uuid.uuid4().hex}"
+        finally:
+            self.in_flight -= 1
+
+
+class RetellDialer:
+    """Places calls through the Retell API from a Retell phone number"""
+
+    def __init__(self, from_number: str, agent_id: Optional[str] = None):
+        self.client = Retell(api_key=os.environ["RETELL_API_KEY"])
+        self.from_number = from_number
+        self.agent_id = agent_id
+
+    async def dial(self, to_number: str, metadata: Dict[str, str]) -> str:
+        kwargs = {"override_agent_id": self.agent_id} if self.agent_id else {}
+        try:
+            # The SDK client is synchronous, keep it off the event loop
+            call = await asyncio.to_thread(
+                self.client.call.create_phone_call,
+                from_number=self.from_number,
+                to_number=to_number,
+                metadata=metadata,
+                retell_llm_dynamic_variables=metadata,
+                **kwargs,
+            )
+        except RetellError as err:
+            raise DialError(str(err)) from err
+        return call.call_id
+
+
+def create_dialer() -> Dialer:
+    """Dialer configured by DIALER: "fake" (default) or "retell" """
+    match os.getenv("DIALER", "fake"):
+        case "retell":
+            return RetellDialer(
+                from_number=os.environ["RETELL_OUTBOUND_NUMBER"],
+                agent_id=os.getenv("RETELL_OUTBOUND_AGENT_ID"),
+            )
+        case "fake":
+            return FakeDialer()
+        case other:
+            raise ValueError(f"Unknown DIALER: {other}")
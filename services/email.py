@@ -1,12 +1,10 @@
-import os
-import resend
 from datetime import datetime
 from typing import Optional
-from models import EscalationReason
 
+from models import EscalationReason
+from services.notifications import Message, notification_channels
+from services.tenants import serving_tenant
 
-resend.api_key = os.getenv("RESEND_API_KEY")
-source_email = "onboarding@resend.dev"
 escalation_target_email = "escalation@example.com"
 
 
@@ -15,17 +13,15 @@ def send_reschedule_confirmation_email(
 ) -> bool:
     """Send confirmation email after successful package reschedule"""
 
-    if not resend.api_key:
-        print("Warning: RESEND_API_KEY not configured")
-        return False
-
     formatted_time = new_time.strftime("%A, %B %d, %Y at %I:%M %p")
 
-    params: resend.Emails.SendParams = {
-        "from": f"Delivery Service <{source_email}>",
-        "to": [customer_email],
-        "subject": f"Delivery Rescheduled - Package {tracking_number}",
-        "html": f"""
+    message = Message(
+        channel="email",
+        to=customer_email,
+        subject=f"Delivery Rescheduled - Package {tracking_number}",
+        tracking_number=tracking_number,
+        sender=serving_tenant().source_email,
+        body=f"""
         <html>
         <body>
             <h2>Delivery Rescheduled Successfully</h2>
@@ -38,7 +34,7 @@ def send_reschedule_confirmation_email(
                 <li><strong>New Delivery Time:</strong> {formatted_time}</li>
             </ul>
             
-            <p>You will receive an SMS notification when your package is out for delivery.</p>
+            <p>We will let you know when your package is out for delivery.</p>
             
             <p>Thank you for choosing our delivery service!</p>
             
@@ -47,14 +43,8 @@ def send_reschedule_confirmation_email(
         </body>
         </html>
         """,
-    }
-
-    try:
-        email = resend.Emails.send(params)
-        return email is not None
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
+    )
+    return notification_channels["email"].send(message)
 
 
 def send_escalation_email(
@@ -66,15 +56,13 @@ def send_escalation_email(
 ) -> bool:
     """Send escalation notification to support team when issue needs human intervention"""
 
-    if not resend.api_key:
-        print("Warning: RESEND_API_KEY not configured")
-        return False
-
-    params: resend.Emails.SendParams = {
-        "from": f"Delivery Service <{source_email}>",
-        "to": [escalation_target_email],
-        "subject": f"ESCALATION REQUIRED - Package {tracking_number}",
-        "html": f"""
+    message = Message(
+        channel="email",
+        to=serving_tenant().escalation_email or escalation_target_email,
+        subject=f"ESCALATION REQUIRED - Package {tracking_number}",
+        tracking_number=tracking_number,
+        sender=serving_tenant().source_email,
+        body=f"""
         <html>
         <body>
             <h2>Customer Support Escalation</h2>
@@ -82,6 +70,7 @@ def send_escalation_email(
             <h3>Details:</h3>
             <ul>
                 <li><strong>Tracking Number:</strong> {tracking_number}</li>
+                <li><strong>Reason:</strong> {escalation_reason}</li>
                 <li><strong>Escalated At:</strong> {datetime.now().strftime("%Y-%m-%d %H:%M:%S UTC")}</li>
                 {f"<li><strong>Customer Name:</strong> {customer_name}</li>" if customer_name else ""}
                 {f"<li><strong>Customer Email:</strong> {customer_email}</li>" if customer_email else ""}
@@ -92,11 +81,5 @@ def send_escalation_email(
         </body>
         </html>
         """,
-    }
-
-    try:
-        email = resend.Emails.send(params)
-        return email is not None
-    except Exception as e:
-        print(f"Email sending failed: {e}")
-        return False
+    )
+    return notification_channels["email"].send(message)
@@ -0,0 +1,146 @@
+import asyncio
+import logging
+import os
+import time
+from datetime import datetime, timedelta
+from typing import Callable, Dict, Optional, Set
+
+from models import JobRecord
+from services.database import (
+    claim_due_jobs,
+    claim_job,
+    enqueue_job,
+    finish_job,
+    prune_jobs,
+    release_job,
+)
+
+logger = logging.getLogger(__name__)
+
+MAX_JOB_ATTEMPTS = int(os.getenv("MAX_JOB_ATTEMPTS", "5"))
+# Retries wait RETRY_BACKOFF_SECONDS, then twice that, four times, ...
+RETRY_BACKOFF_SECONDS = 30.0
+# A job running this long was claimed by a process that died, it is run again
+STALE_JOB_SECONDS = 600.0
+# Done jobs are deleted after this long, failed ones are kept
+JOB_RETENTION_DAYS = 7
+
+
+class JobQueue:
+    """Background work that must survive a restart, like escalation emails.
+
+    Jobs are stored before they run and a job runs right away in the process that
+    submitted it. Jobs not finished at shutdown, lost in a crash or waiting for a
+    retry are picked up by run_due(): on startup and periodically in the leader
+    process. Claims are atomic, so a job runs in one process at a time. Delivery
+    is at least once: a job interrupted after its side effect ran will run again.
+
+    Handlers are blocking functions taking the job payload as keyword arguments
+    and returning True when done. Failures are retried with exponential backoff
+    up to MAX_JOB_ATTEMPTS attempts.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, Callable[..., bool]] = {}
+        self.running: Set[asyncio.Task] = set()
+        self.accepting = True
+
+    def register(self, kind: str, handler: Callable[..., bool]):
+        self.handlers[kind] = handler
+
+    async def submit(self, kind: str, **payload) -> int:
+        """Persist a job and start it, return its ID.
+
+        After drain() began the job is only persisted, the next start runs it.
+        """
+        if kind not in self.handlers:
+            raise ValueError(f"No handler registered for job kind {kind}")
+        job_id = await asyncio.to_thread(enqueue_job, kind, payload)
+        if self.accepting:
+            self._spawn(self._claim_and_execute(job_id))
+        return job_id
+
+    async def run_due(self) -> int:
+        """Run due jobs of all processes and jobs of processes that went away, return how many"""
+        if not self.accepting:
+            return 0
+        now = datetime.now()
+        jobs = await asyncio.to_thread(claim_due_jobs, now, now - timedelta(seconds=STALE_JOB_SECONDS))
+        for job in jobs:
+            self._spawn(self.execute(job))
+        return len(jobs)
+
+    def _spawn(self, coroutine) -> asyncio.Task:
+        task = asyncio.ensure_future(coroutine)
+        self.running.add(task)
+        task.add_done_callback(self.running.discard)
+        return task
+
+    async def _claim_and_execute(self, job_id: int):
+        job = await asyncio.to_thread(claim_job, job_id)
+        if job is not None:
+            await self.execute(job)
+
+    async def execute(self, job: JobRecord):
+        error: Optional[str] = None
+        try:
+            handler = self.handlers[job.kind]
+            done = await asyncio.to_thread(handler, **job.payload)
+        except asyncio.CancelledError:
+            # Shutdown deadline: the next start runs the job again
+            release_job(job.id, datetime.now(), "interrupted by shutdown", count_attempt=False)
+            raise
+        except Exception as err:
+            logger.error("Job %s (%s) failed: %s", job.id, job.kind, err, exc_info=True)
+            done, error = False, repr(err)
+
+        if done:
+            await asyncio.to_thread(finish_job, job.id)
+        elif job.attempts >= MAX_JOB_ATTEMPTS:
+            logger.error("Job %s (%s) failed %s times, giving up", job.id, job.kind, job.attempts)
+            await asyncio.to_thread(finish_job, job.id, "failed", error or "handler returned False")
+        else:
+            delay = RETRY_BACKOFF_SECONDS * 2 ** (job.attempts - 1)
+            await asyncio.to_thread(
+                release_job, job.id, datetime.now() + timedelta(seconds=delay), error or "handler returned False"
+            )
+
+    async def wait(self, timeout: float) -> bool:
+        """Wait up to timeout for the jobs running in this process, True if all finished"""
+        deadline = time.monotonic() + timeout
+        # Tasks of event loops that are gone (e.g. per-request test loops) never finish
+        self.running.difference_update([task for task in self.running if task.get_loop().is_closed()])
+        # Jobs submitted meanwhile are waited for too
+        while self.running and (remaining := deadline - time.monotonic()) > 0:
+            await asyncio.wait(set(self.running), timeout=remaining)
+        return not self.running
+
+    async def drain(self, timeout: float) -> int:
+        """Stop starting jobs and wait up to timeout for the running ones.
+
+        Jobs still running then are cancelled and released for the next start.
+        Returns the number of cancelled jobs.
+        """
+        self.accepting = False
+        await self.wait(timeout)
+        pending = set(self.running)
+        for task in pending:
+            task.cancel()
+        if pending:
+            await asyncio.wait(pending)
+        return len(pending)
+
+    async def start(self) -> int:
+        """Accept jobs (again) and resume the persisted unfinished ones, return how many"""
+        self.accepting = True
+        resumed = await self.run_due()
+        if resumed:
+            logger.info("Resumed %s unfinished jobs", resumed)
+        return resumed
+
+
+job_queue = JobQueue()
+
+
+def prune_finished_jobs() -> int:
+    return prune_jobs(datetime.now() - timedelta(days=JOB_RETENTION_DAYS))
@@ -0,0 +1,130 @@
+import asyncio
+import logging
+import os
+import threading
+import time
+from collections import Counter
+from typing import Callable, Dict, Optional, Set, TypeVar
+
+logger = logging.getLogger(__name__)
+
+T = TypeVar("T")
+
+# Seconds a tool call may take before the voice agent gets a degraded answer.
+# The agent sits in silence while we work, so these stay well below Retell's
+# tool call timeout.
+DEFAULT_BUDGETS: Dict[str, float] = {
+    "verify_package": float(os.getenv("LATENCY_BUDGET_VERIFY_PACKAGE", "1.0")),
+    "reschedule": float(os.getenv("LATENCY_BUDGET_RESCHEDULE", "2.0")),
+    "escalate": float(os.getenv("LATENCY_BUDGET_ESCALATE", "1.0")),
+}
+
+
+class BudgetExceeded(Exception):
+    """A dependency did not answer within the remaining budget.
+
+    The work itself keeps running in its thread, `pending` resolves once it is done.
+    """
+
+    def __init__(self, endpoint: str, stage: str, pending: asyncio.Future):
+        super().__init__(f"{endpoint}: {stage} exceeded the latency budget")
+        self.endpoint = endpoint
+        self.stage = stage
+        self.pending = pending
+
+
+class LatencyStats:
+    """Per-process request and budget overrun counters"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests: Counter = Counter()
+        self.overruns: Counter = Counter()
+
+    def record_request(self, endpoint: str):
+        with self._lock:
+            self.requests[endpoint] += 1
+
+    def record_overrun(self, endpoint: str, stage: str):
+        with self._lock:
+            self.overruns[(endpoint, stage)] += 1
+
+    def snapshot(self, budgets: Dict[str, float]) -> dict:
+        with self._lock:
+            overruns: Dict[str, Dict[str, int]] = {}
+            for (endpoint, stage), count in self.overruns.items():
+                overruns.setdefault(endpoint, {})[stage] = count
+            return {
+                "budgets": dict(budgets),
+                "requests": dict(self.requests),
+                "overruns": overruns,
+            }
+
+    def reset(self):
+        with self._lock:
+            self.requests.clear()
+            self.overruns.clear()
+
+
+latency_stats = LatencyStats()
+
+
+class LatencyBudget:
+    """Deadline for one tool call, shared by all of its blocking steps.
+
+    Each step runs in a thread and is awaited for at most the time left, so a
+    slow database or email provider can't hold the response past the deadline.
+    """
+
+    def __init__(
+        self,
+        endpoint: str,
+        seconds: Optional[float] = None,
+        stats: LatencyStats = latency_stats,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.endpoint = endpoint
+        self.seconds = DEFAULT_BUDGETS[endpoint] if seconds is None else seconds
+        self.stats = stats
+        self.clock = clock
+        self.deadline = clock() + self.seconds
+        stats.record_request(endpoint)
+
+    def remaining(self) -> float:
+        return max(self.deadline - self.clock(), 0.0)
+
+    async def run(self, stage: str, fn: Callable[..., T], *args, **kwargs) -> T:
+        """Run a blocking call in a thread, raise BudgetExceeded if it outlives the budget"""
+        pending = asyncio.ensure_future(asyncio.to_thread(fn, *args, **kwargs))
+        try:
+            # shield: on timeout the thread can't be stopped anyway, keep its result reachable
+            return await asyncio.wait_for(asyncio.shield(pending), self.remaining())
+        except asyncio.TimeoutError:
+            self.stats.record_overrun(self.endpoint, stage)
+            logger.warning(
+                "Latency budget of %.2fs exceeded: endpoint=%s stage=%s",
+                self.seconds,
+                self.endpoint,
+                stage,
+            )
+            track_late(pending)
+            raise BudgetExceeded(self.endpoint, stage, pending) from None
+
+
+def log_late_failure(future: asyncio.Future):
+    """Surface errors of work that finished after its response was sent"""
+    if not future.cancelled() and future.exception() is not None:
+        logger.error("Late dependency call failed: %s", future.exception())
+
+
+# Strong references to work that outlives its request, the event loop only keeps weak ones
+late_work: Set[asyncio.Task] = set()
+
+
+def track_late(awaitable) -> asyncio.Future:
+    """Keep work that outlives its request referenced, and drained on shutdown, until it's done"""
+    task = asyncio.ensure_future(awaitable)
+    late_work.add(task)
+    task.add_done_callback(late_work.discard)
+    task.add_done_callback(log_late_failure)
+    return task
@@ -0,0 +1,405 @@
+import asyncio
+import logging
+import os
+import random
+import threading
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from datetime import datetime, timedelta
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+import httpx
+import resend
+
+from models import OutboxNotification
+from services.database import claim_notifications, finish_notifications
+from services.rate_limit import InMemoryRateLimitBackend
+from services.sharding import package_store_paths
+from services.tenants import serving_tenant
+
+logger = logging.getLogger(__name__)
+
+resend.api_key = os.getenv("RESEND_API_KEY")
+source_email = "onboarding@resend.dev"
+
+# Per channel: worker tasks sending bulk notifications and their token bucket, then the
+# bucket of single messages sent right away (confirmations, escalations), so a bulk run
+# never holds up a caller. Resend allows 2 requests per second by default, split in two.
+CHANNEL_LIMITS: Dict[str, Tuple[int, float, float, float, float]] = {
+    "email": (
+        int(os.getenv("NOTIFY_EMAIL_WORKERS", "2")),
+        float(os.getenv("NOTIFY_EMAIL_PER_SECOND", "1")),
+        float(os.getenv("NOTIFY_EMAIL_BURST", "1")),
+        float(os.getenv("NOTIFY_EMAIL_DIRECT_PER_SECOND", "1")),
+        float(os.getenv("NOTIFY_EMAIL_DIRECT_BURST", "1")),
+    ),
+    "sms": (
+        int(os.getenv("NOTIFY_SMS_WORKERS", "4")),
+        float(os.getenv("NOTIFY_SMS_PER_SECOND", "8")),
+        float(os.getenv("NOTIFY_SMS_BURST", "8")),
+        float(os.getenv("NOTIFY_SMS_DIRECT_PER_SECOND", "2")),
+        float(os.getenv("NOTIFY_SMS_DIRECT_BURST", "2")),
+    ),
+}
+# Queued bulk messages per channel before the dispatcher waits for the workers
+NOTIFY_QUEUE_SIZE = int(os.getenv("NOTIFY_QUEUE_SIZE", "1000"))
+NOTIFY_BATCH_SIZE = int(os.getenv("NOTIFY_BATCH_SIZE", "500"))
+NOTIFY_MAX_ATTEMPTS = int(os.getenv("NOTIFY_MAX_ATTEMPTS", "3"))
+# Claimed notifications not finished after this long are sent again (at least once delivery)
+NOTIFY_STALE_SECONDS = float(os.getenv("NOTIFY_STALE_SECONDS", "600"))
+
+
+@dataclass(slots=True)
+class Message:
+    channel: str
+    to: str
+    subject: str  # email only
+    body: str  # HTML for email, plain text for SMS
+    tracking_number: Optional[str] = None
+    sender: Optional[str] = None  # email only, source_email by default
+
+
+class Transport(Protocol):
+    """Hands a message to a provider, returns whether it was accepted. Blocking."""
+
+    def send(self, message: Message) -> bool: ...
+
+
+class FakeTransport:
+    """Local stand-in for an email or SMS provider, for tests, benchmarks and dry runs"""
+
+    def __init__(self, latency_seconds: float = 0.0, failure_rate: float = 0.0, seed: int = 0):
+        self.latency_seconds = latency_seconds
+        self.failure_rate = failure_rate
+        self.random = random.Random(seed)
+        self.sent: List[Message] = []
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self._lock = threading.Lock()
+
+    def send(self, message: Message) -> bool:
+        with self._lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.latency_seconds:
+                time.sleep(self.latency_seconds)
+            with self._lock:
+                if self.random.random() < self.failure_rate:
+                    return False
+                self.sent.append(message)
+            return True
+        finally:
+            with self._lock:
+                self.in_flight -= 1
+
+
+class ResendTransport:
+    """Email through the Resend API"""
+
+    def send(self, message: Message) -> bool:
+        if not resend.api_key:
+            logger.warning("RESEND_API_KEY not configured, email to %s not sent", message.to)
+            return False
+
+        params: resend.Emails.SendParams = {
+            "from": f"Delivery Service <{message.sender or source_email}>",
+            "to": [message.to],
+            "subject": message.subject,
+            "html": message.body,
+        }
+        try:
+            email = resend.Emails.send(params)
+            return email is not None
+        except resend.exceptions.ResendError as err:
+            logger.warning("Email to %s failed: %s", message.to, err)
+            return False
+
+
+class TwilioTransport:
+    """SMS through the Twilio REST API"""
+
+    def __init__(self, account_sid: str, auth_token: str, from_number: str):
+        self.url = f"https://api.twilio.com/2010-04-01/Accounts/{account_sid}/Messages.json"
+        self.client = httpx.Client(auth=(account_sid, auth_token), timeout=10.0)
+        self.from_number = from_number
+
+    def send(self, message: Message) -> bool:
+        try:
+            response = self.client.post(
+                self.url, data={"From": self.from_number, "To": message.to, "Body": message.body}
+            )
+        except httpx.HTTPError as err:
+            logger.warning("SMS to %s failed: %s", message.to, err)
+            return False
+        if response.status_code >= 400:
+            logger.warning("SMS to %s rejected: %s %s", message.to, response.status_code, response.text)
+            return False
+        return True
+
+
+def create_transport(channel: str) -> Transport:
+    """Transport configured by NOTIFY_EMAIL_TRANSPORT ("resend" default, or "fake")
+    and NOTIFY_SMS_TRANSPORT ("fake" default, or "twilio")"""
+    match channel, os.getenv(f"NOTIFY_{channel.upper()}_TRANSPORT", "resend" if channel == "email" else "fake"):
+        case "email", "resend":
+            return ResendTransport()
+        case "sms", "twilio":
+            return TwilioTransport(
+                account_sid=os.environ["TWILIO_ACCOUNT_SID"],
+                auth_token=os.environ["TWILIO_AUTH_TOKEN"],
+                from_number=os.environ["TWILIO_FROM_NUMBER"],
+            )
+        case _, "fake":
+            return FakeTransport()
+        case _, other:
+            raise ValueError(f"Unknown NOTIFY_{channel.upper()}_TRANSPORT: {other}")
+
+
+class Channel:
+    """One way of reaching customers, with its own worker pool and rate limit.
+
+    Bulk messages are queued with submit() and sent by `workers` tasks on the
+    channel's own threads, the bounded queue makes whoever fills it wait. Single messages (confirmations, escalations)
+    go out right away with send() from the calling thread. Each kind has its own
+    token bucket (direct_* for single messages, the bulk rate by default), together
+    they stay within the provider's limit. The buckets are per process.
+    """
+
+    def __init__(
+        self,
+        name: str,
+        transport: Transport,
+        workers: int,
+        per_second: float,
+        burst: float,
+        direct_per_second: Optional[float] = None,
+        direct_burst: Optional[float] = None,
+        queue_size: int = NOTIFY_QUEUE_SIZE,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.name = name
+        self.transport = transport
+        self.workers = workers
+        self.per_second = per_second
+        self.burst = burst
+        self.direct_per_second = direct_per_second or per_second
+        self.direct_burst = direct_burst or burst
+        self.queue_size = queue_size
+        self.clock = clock
+        # Keys "bulk" and "direct"
+        self.bucket = InMemoryRateLimitBackend(max_keys=2)
+        # Not the default executor, a slow provider must not take threads from the other channels
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix=f"notify-{name}")
+        self.counts: Counter = Counter()
+        self._counts_lock = threading.Lock()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._queue: Optional[asyncio.Queue] = None
+        self._tasks: List[asyncio.Task] = []
+
+    def count(self, key: str):
+        with self._counts_lock:
+            self.counts[key] += 1
+
+    def wait_seconds(self, direct: bool = False) -> float:
+        """0 after taking a token, otherwise how long to wait before trying again"""
+        if direct:
+            key, burst, per_second = "direct", self.direct_burst, self.direct_per_second
+        else:
+            key, burst, per_second = "bulk", self.burst, self.per_second
+        if self.bucket.consume(key, burst, per_second, self.clock()):
+            return 0.0
+        self.count("throttled")
+        return 1 / per_second
+
+    def deliver(self, message: Message) -> bool:
+        try:
+            sent = self.transport.send(message)
+        except Exception:
+            # Transports report failed sends by returning False, this is a bug in one.
+            # Caught so it doesn't take down the channel's worker.
+            logger.exception("%s to %s crashed", self.name, message.to)
+            sent = False
+        self.count("sent" if sent else "failed")
+        return sent
+
+    def send(self, message: Message) -> bool:
+        """Send one message now, blocking while single messages are over their rate"""
+        while delay := self.wait_seconds(direct=True):
+            time.sleep(delay)
+        return self.deliver(message)
+
+    async def submit(self, message: Message) -> asyncio.Future:
+        """Queue a message for the worker pool, the future resolves to whether it was sent"""
+        self.ensure_workers()
+        future = self._loop.create_future()
+        await self._queue.put((message, future))
+        return future
+
+    def ensure_workers(self):
+        loop = asyncio.get_running_loop()
+        if self._loop is loop:
+            return
+        # First use, or a new event loop (tests), queues belong to one loop
+        self._loop = loop
+        self._queue = asyncio.Queue(self.queue_size)
+        self._tasks = [loop.create_task(self.work()) for _ in range(self.workers)]
+
+    async def work(self):
+        while True:
+            message, future = await self._queue.get()
+            try:
+                while delay := self.wait_seconds():
+                    await asyncio.sleep(delay)
+                sent = await self._loop.run_in_executor(self.executor, self.deliver, message)
+                if not future.done():
+                    future.set_result(sent)
+            except asyncio.CancelledError:
+                future.cancel()
+                raise
+            finally:
+                self._queue.task_done()
+
+    async def stop(self):
+        """Stop the workers, queued messages stay claimed and are sent again later"""
+        for task in self._tasks:
+            task.cancel()
+        await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._tasks = []
+        self._loop = self._queue = None
+
+    def snapshot(self) -> dict:
+        with self._counts_lock:
+            counts = dict(self.counts)
+        return {
+            "workers": self.workers,
+            "per_second": self.per_second,
+            "direct_per_second": self.direct_per_second,
+            "queued": self._queue.qsize() if self._queue else 0,
+            "sent": counts.get("sent", 0),
+            "failed": counts.get("failed", 0),
+            "throttled": counts.get("throttled", 0),
+        }
+
+
+def create_channels() -> Dict[str, Channel]:
+    return {
+        name: Channel(name, create_transport(name), *limits)
+        for name, limits in CHANNEL_LIMITS.items()
+    }
+
+
+def out_for_delivery_message(notification: OutboxNotification) -> Optional[Message]:
+    package = notification.package
+    if package is None:
+        return None
+    slot = package.scheduled_at.strftime("%I:%M %p")
+    if notification.channel == "sms":
+        return Message(
+            channel="sms",
+            to=package.phone,
+            subject="",
+            body=f"Delivery Service: your package {package.tracking_number} is out for delivery "
+            f"and arrives today around {slot}.",
+            tracking_number=package.tracking_number,
+        )
+    return Message(
+        channel="email",
+        to=package.email,
+        subject=f"Out for Delivery - Package {package.tracking_number}",
+        body=f"""
+        <html>
+        <body>
+            <h2>Your Package Is Out for Delivery</h2>
+            <p>Hello {package.customer_name},</p>
+
+            <p>Your package {package.tracking_number} is on its way and arrives today around {slot}
+            at {package.street} {package.street_number}.</p>
+
+            <p>Best regards,<br>
+            Delivery Service Team</p>
+        </body>
+        </html>
+        """,
+        tracking_number=package.tracking_number,
+        sender=serving_tenant().source_email,
+    )
+
+
+# Message builders by outbox kind
+TEMPLATES: Dict[str, Callable[[OutboxNotification], Optional[Message]]] = {
+    "out_for_delivery": out_for_delivery_message,
+}
+
+
+class NotificationDispatcher:
+    """Sends what the status triggers put into the outbox of every package store.
+
+    Channels drain their own part of the outbox side by side, so a slow or rate
+    limited channel doesn't hold back the others.
+    """
+
+    def __init__(
+        self,
+        channels: Dict[str, Channel],
+        batch_size: int = NOTIFY_BATCH_SIZE,
+        max_attempts: int = NOTIFY_MAX_ATTEMPTS,
+        stale_seconds: float = NOTIFY_STALE_SECONDS,
+    ):
+        self.channels = channels
+        self.batch_size = batch_size
+        self.max_attempts = max_attempts
+        self.stale_seconds = stale_seconds
+
+    async def dispatch(self) -> int:
+        """Send all pending notifications, return how many were handled"""
+        handled = await asyncio.gather(*(self.dispatch_channel(channel) for channel in self.channels.values()))
+        return sum(handled)
+
+    async def dispatch_channel(self, channel: Channel) -> int:
+        handled = 0
+        for path in package_store_paths():
+            while True:
+                now = datetime.now()
+                batch = await asyncio.to_thread(
+                    claim_notifications,
+                    path,
+                    channel.name,
+                    now,
+                    now - timedelta(seconds=self.stale_seconds),
+                    self.batch_size,
+                )
+                if not batch:
+                    break
+                await self.send_batch(path, channel, batch)
+                handled += len(batch)
+                # Failed ones are pending again, they get their next attempt on the next run
+                if len(batch) < self.batch_size:
+                    break
+        return handled
+
+    async def send_batch(self, path: str, channel: Channel, batch: List[OutboxNotification]):
+        results: List[Tuple[int, Optional[str]]] = []
+        queued: List[Tuple[int, asyncio.Future]] = []
+        for notification in batch:
+            template = TEMPLATES.get(notification.kind)
+            message = template(notification) if template else None
+            if message is None:
+                results.append((notification.id, f"Nothing to send for {notification.kind}"))
+            else:
+                queued.append((notification.id, await channel.submit(message)))
+        for notification_id, future in queued:
+            results.append((notification_id, None if await future else f"{channel.name} send failed"))
+        await asyncio.to_thread(finish_notifications, path, results, self.max_attempts)
+
+    async def stop(self):
+        await asyncio.gather(*(channel.stop() for channel in self.channels.values()))
+
+    def snapshot(self) -> dict:
+        return {name: channel.snapshot() for name, channel in self.channels.items()}
+
+
+notification_channels = create_channels()
+notification_dispatcher = NotificationDispatcher(notification_channels)
@@ -0,0 +1,134 @@
+import logging
+import os
+import sys
+import threading
+import time
+import uuid
+from collections import Counter
+from typing import Optional
+
+logger = logging.getLogger(__name__)
+
+# off: no profiling middleware at all, header: profile requests sent with an
+# "X-Profile: 1" header, all: profile every request
+PROFILING = os.getenv("PROFILING", "off")
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+SAMPLE_INTERVAL_SECONDS = float(os.getenv("PROFILE_SAMPLE_INTERVAL_MS", "1")) / 1000
+PROFILE_HEADER = b"x-profile"
+
+# Innermost frames of threads that are waiting, not working. Idle threadpool
+# workers and the event loop polling for IO would otherwise fill every profile.
+IDLE_FRAMES = {
+    ("threading.py", "wait"),
+    ("selectors.py", "select"),
+    ("queue.py", "get"),
+    ("thread.py", "_worker"),
+}
+
+
+def frame_label(frame) -> str:
+    code = frame.f_code
+    return f"{code.co_qualname} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})"
+
+
+def is_idle(frame) -> bool:
+    code = frame.f_code
+    return (os.path.basename(code.co_filename), code.co_name) in IDLE_FRAMES
+
+
+class StackSampler:
+    """Samples the stacks of all other threads every interval seconds.
+
+    Stacks are aggregated in the folded format ("thread;outer;...;inner count"
+    per line) that flamegraph.pl, speedscope and inferno read. Sampling runs in
+    its own daemon thread and needs no tracing hooks, so the profiled code runs
+    at full speed apart from the GIL hand-offs.
+    """
+
+    def __init__(self, interval: float = SAMPLE_INTERVAL_SECONDS):
+        self.interval = interval
+        self.stacks: Counter = Counter()
+        self.samples = 0
+        self._stop = threading.Event()
+        self._thread: Optional[threading.Thread] = None
+
+    def start(self):
+        self._thread = threading.Thread(target=self._run, name="stack-sampler", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            self.sample(own)
+
+    def sample(self, skip_thread: Optional[int] = None):
+        names = {thread.ident: thread.name for thread in threading.enumerate()}
+        self.samples += 1
+        for ident, frame in sys._current_frames().items():
+            if ident == skip_thread or is_idle(frame):
+                continue
+            stack = []
+            while frame is not None:
+                stack.append(frame_label(frame))
+                frame = frame.f_back
+            stack.append(names.get(ident, str(ident)))
+            self.stacks[";".join(reversed(stack))] += 1
+
+    def folded(self) -> str:
+        return "".join(f"{stack} {count}\n" for stack, count in sorted(self.stacks.items()))
+
+
+def profile_file_name(method: str, path: str) -> str:
+    endpoint = path.strip("/").replace("/", "_") or "root"
+    return f"{time.strftime('%Y%m%d-%H%M%S')}-{method.lower()}-{endpoint}-{uuid.uuid4().hex[:8]}.folded"
+
+
+def write_profile(sampler: StackSampler, name: str):
+    os.makedirs(PROFILE_DIR, exist_ok=True)
+    with open(os.path.join(PROFILE_DIR, name), "w") as f:
+        f.write(sampler.folded())
+
+
+class ProfilingMiddleware:
+    """Samples stacks while a request is handled and writes them as a flamegraph input file.
+
+    Pure ASGI, so streaming responses are profiled until their last chunk. The
+    sampler sees every thread of the process: threadpool work of the request
+    shows up, and so does that of requests running at the same time. The response
+    names the file in PROFILE_DIR in its X-Profile header.
+    """
+
+    def __init__(self, app, mode: str = PROFILING):
+        self.app = app
+        self.mode = mode
+
+    def wants_profile(self, scope) -> bool:
+        if self.mode == "all":
+            return True
+        return any(name == PROFILE_HEADER and value not in (b"", b"0") for name, value in scope["headers"])
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not self.wants_profile(scope):
+            await self.app(scope, receive, send)
+            return
+
+        name = profile_file_name(scope["method"], scope["path"])
+
+        async def send_with_profile_header(message):
+            if message["type"] == "http.response.start":
+                message["headers"] = [*message.get("headers", []), (PROFILE_HEADER, name.encode())]
+            await send(message)
+
+        sampler = StackSampler()
+        sampler.start()
+        try:
+            await self.app(scope, receive, send_with_profile_header)
+        finally:
+            sampler.stop()
+            write_profile(sampler, name)
+            logger.info("Profiled %s %s: %s samples in %s", scope["method"], scope["path"], sampler.samples, name)
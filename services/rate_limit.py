@@ -0,0 +1,396 @@
+import os
+import sqlite3
+import threading
+import time
+from itertools import islice
+from typing import Callable, Dict, List, Optional, Protocol, Tuple
+
+import database
+
+
+# Token buckets per scope: (capacity, refill tokens per second).
+# Defaults are generous for a real conversation (a handful of tool calls per call)
+# but stop scripted brute forcing of tracking number / postal code pairs.
+DEFAULT_LIMITS: Dict[str, Tuple[float, float]] = {
+    "call": (
+        float(os.getenv("RATE_LIMIT_CALL_BURST", "10")),
+        float(os.getenv("RATE_LIMIT_CALL_PER_MINUTE", "20")) / 60,
+    ),
+    "caller": (
+        float(os.getenv("RATE_LIMIT_CALLER_BURST", "20")),
+        float(os.getenv("RATE_LIMIT_CALLER_PER_MINUTE", "30")) / 60,
+    ),
+    "tracking": (
+        float(os.getenv("RATE_LIMIT_TRACKING_BURST", "10")),
+        float(os.getenv("RATE_LIMIT_TRACKING_PER_MINUTE", "10")) / 60,
+    ),
+    # One bucket shared by all requests without call_id and caller number, Retell always sends a call_id
+    "anonymous": (
+        float(os.getenv("RATE_LIMIT_ANONYMOUS_BURST", "10")),
+        float(os.getenv("RATE_LIMIT_ANONYMOUS_PER_MINUTE", "10")) / 60,
+    ),
+}
+MAX_FAILED_VERIFICATIONS = int(os.getenv("RATE_LIMIT_MAX_FAILED_VERIFICATIONS", "3"))
+# Failed lookups of one tracking number over all calls, call_id and caller number are
+# chosen by whoever sends the request, the tracking number being guessed at is not
+MAX_FAILED_TRACKING_VERIFICATIONS = int(os.getenv("RATE_LIMIT_MAX_FAILED_TRACKING_VERIFICATIONS", "10"))
+FAILURE_WINDOW_SECONDS = float(os.getenv("RATE_LIMIT_FAILURE_WINDOW_SECONDS", "900"))
+LOCKOUT_SECONDS = float(os.getenv("RATE_LIMIT_LOCKOUT_SECONDS", "900"))
+
+
+class RateLimitBackend(Protocol):
+    """Storage for bucket, failure and lockout state.
+
+    The in-memory backend is enough for a single process. Multi-node deployments
+    plug in a shared implementation of the same four methods (e.g. backed by Redis).
+    """
+
+    def consume(
+        self, key: str, capacity: float, refill_per_second: float, now: float
+    ) -> bool: ...
+
+    def add_failure(self, key: str, window_seconds: float, now: float) -> int: ...
+
+    def lock(self, key: str, until: float) -> None: ...
+
+    def locked_until(self, key: str, now: float) -> Optional[float]: ...
+
+
+class InMemoryRateLimitBackend:
+    """Process-local backend, a dict lookup and a few float ops per check"""
+
+    def __init__(self, max_keys: int = 100_000):
+        self._lock = threading.Lock()
+        # key -> [tokens, last_refill]
+        self._buckets: Dict[str, List[float]] = {}
+        # key -> [failure_count, window_start]
+        self._failures: Dict[str, List[float]] = {}
+        self._lockouts: Dict[str, float] = {}
+        self._max_keys = max_keys
+
+    def consume(
+        self, key: str, capacity: float, refill_per_second: float, now: float
+    ) -> bool:
+        with self._lock:
+            bucket = self._buckets.get(key)
+            if bucket is None:
+                self._make_room_locked(self._buckets, now)
+                self._buckets[key] = [capacity - 1, now]
+                return True
+
+            tokens = bucket[0] + (now - bucket[1]) * refill_per_second
+            if tokens > capacity:
+                tokens = capacity
+            bucket[1] = now
+            if tokens >= 1:
+                bucket[0] = tokens - 1
+                return True
+            bucket[0] = tokens
+            return False
+
+    def add_failure(self, key: str, window_seconds: float, now: float) -> int:
+        with self._lock:
+            entry = self._failures.get(key)
+            if entry is None:
+                self._make_room_locked(self._failures, now)
+            if entry is None or now - entry[1] > window_seconds:
+                self._failures[key] = [1, now]
+                return 1
+            entry[0] += 1
+            return int(entry[0])
+
+    def lock(self, key: str, until: float) -> None:
+        with self._lock:
+            if key not in self._lockouts:
+                # Lockouts share one duration, the oldest one expires first
+                self._make_room_locked(self._lockouts, None)
+            self._lockouts[key] = until
+
+    def locked_until(self, key: str, now: float) -> Optional[float]:
+        until = self._lockouts.get(key)
+        if until is None:
+            return None
+        if until <= now:
+            with self._lock:
+                self._lockouts.pop(key, None)
+            return None
+        return until
+
+    def prune(self, now: float, idle_seconds: float = 3600) -> int:
+        """Drop state that has been idle long enough to be back at its defaults"""
+        with self._lock:
+            return self._prune_locked(now, idle_seconds)
+
+    def _make_room_locked(self, entries: dict, now: Optional[float]) -> None:
+        """Keep entries below max_keys: idle state goes first if now is given, then the oldest keys.
+
+        Many distinct call_ids within the idle window would otherwise grow it without
+        bound. An evicted key starts over at its defaults.
+        """
+        if len(entries) < self._max_keys:
+            return
+        if now is not None:
+            self._prune_locked(now)
+            if len(entries) < self._max_keys:
+                return
+        # Evict a tenth at once so a full map isn't scanned on every new key
+        excess = len(entries) - self._max_keys + max(1, self._max_keys // 10)
+        for key in list(islice(entries, excess)):
+            del entries[key]
+
+    def _prune_locked(self, now: float, idle_seconds: float = 3600) -> int:
+        stale_buckets = [
+            k for k, (_, last) in self._buckets.items() if now - last > idle_seconds
+        ]
+        for k in stale_buckets:
+            del self._buckets[k]
+        stale_failures = [
+            k for k, (_, start) in self._failures.items() if now - start > idle_seconds
+        ]
+        for k in stale_failures:
+            del self._failures[k]
+        expired = [k for k, until in self._lockouts.items() if until <= now]
+        for k in expired:
+            del self._lockouts[k]
+        return len(stale_buckets) + len(stale_failures) + len(expired)
+
+
+class SQLiteRateLimitBackend:
+    """Shared backend for several worker processes on one host (or a shared volume).
+
+    Every operation is a single atomic statement, so concurrent workers never
+    lose updates to each other.
+    """
+
+    def __init__(self, path: str):
+        self.path = path
+        self._local = threading.local()
+        conn = self._connection()
+        conn.executescript("""
+            CREATE TABLE IF NOT EXISTS rate_limit_buckets (
+                key TEXT PRIMARY KEY,
+                tokens REAL NOT NULL,
+                updated_at REAL NOT NULL,
+                allowed INTEGER NOT NULL
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS rate_limit_failures (
+                key TEXT PRIMARY KEY,
+                failures INTEGER NOT NULL,
+                window_start REAL NOT NULL
+            ) WITHOUT ROWID;
+
+            CREATE TABLE IF NOT EXISTS rate_limit_lockouts (
+                key TEXT PRIMARY KEY,
+                locked_until REAL NOT NULL
+            ) WITHOUT ROWID;
+        """)
+
+    def _connection(self) -> sqlite3.Connection:
+        # One connection per thread, reused across checks to keep them cheap
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=5, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def consume(
+        self, key: str, capacity: float, refill_per_second: float, now: float
+    ) -> bool:
+        row = (
+            self._connection()
+            .execute(
+                """
+            INSERT INTO rate_limit_buckets (key, tokens, updated_at, allowed)
+            VALUES (:key, :capacity - 1, :now, 1)
+            ON CONFLICT(key) DO UPDATE SET
+                tokens = CASE
+                    WHEN MIN(:capacity, tokens + (:now - updated_at) * :rate) >= 1
+                    THEN MIN(:capacity, tokens + (:now - updated_at) * :rate) - 1
+                    ELSE MIN(:capacity, tokens + (:now - updated_at) * :rate)
+                END,
+                allowed = MIN(:capacity, tokens + (:now - updated_at) * :rate) >= 1,
+                updated_at = :now
+            RETURNING allowed
+        """,
+                {
+                    "key": key,
+                    "capacity": capacity,
+                    "rate": refill_per_second,
+                    "now": now,
+                },
+            )
+            .fetchone()
+        )
+        return bool(row[0])
+
+    def add_failure(self, key: str, window_seconds: float, now: float) -> int:
+        row = (
+            self._connection()
+            .execute(
+                """
+            INSERT INTO rate_limit_failures (key, failures, window_start)
+            VALUES (:key, 1, :now)
+            ON CONFLICT(key) DO UPDATE SET
+                failures = CASE WHEN :now - window_start > :window THEN 1 ELSE failures + 1 END,
+                window_start = CASE WHEN :now - window_start > :window THEN :now ELSE window_start END
+            RETURNING failures
+        """,
+                {"key": key, "now": now, "window": window_seconds},
+            )
+            .fetchone()
+        )
+        return int(row[0])
+
+    def lock(self, key: str, until: float) -> None:
+        self._connection().execute(
+            """
+            INSERT INTO rate_limit_lockouts (key, locked_until) VALUES (?, ?)
+            ON CONFLICT(key) DO UPDATE SET locked_until = excluded.locked_until
+        """,
+            (key, until),
+        )
+
+    def locked_until(self, key: str, now: float) -> Optional[float]:
+        row = (
+            self._connection()
+            .execute(
+                "SELECT locked_until FROM rate_limit_lockouts WHERE key = ? AND locked_until > ?",
+                (key, now),
+            )
+            .fetchone()
+        )
+        return row[0] if row else None
+
+    def prune(self, now: float, idle_seconds: float = 3600) -> int:
+        """Drop state that has been idle long enough to be back at its defaults"""
+        conn = self._connection()
+        removed = 0
+        removed += conn.execute(
+            "DELETE FROM rate_limit_buckets WHERE updated_at < ?", (now - idle_seconds,)
+        ).rowcount
+        removed += conn.execute(
+            "DELETE FROM rate_limit_failures WHERE window_start < ?",
+            (now - idle_seconds,),
+        ).rowcount
+        removed += conn.execute(
+            "DELETE FROM rate_limit_lockouts WHERE locked_until <= ?", (now,)
+        ).rowcount
+        return removed
+
+
+class FunctionRateLimiter:
+    """Throttles tool calls per call_id, caller number and tracking number, and locks
+    callers and tracking numbers out after repeated failed verifications.
+
+    Requests carrying neither call_id nor caller number share one anonymous identity.
+    """
+
+    def __init__(
+        self,
+        backend: RateLimitBackend,
+        limits: Dict[str, Tuple[float, float]] = DEFAULT_LIMITS,
+        max_failed_verifications: int = MAX_FAILED_VERIFICATIONS,
+        max_failed_tracking_verifications: int = MAX_FAILED_TRACKING_VERIFICATIONS,
+        failure_window_seconds: float = FAILURE_WINDOW_SECONDS,
+        lockout_seconds: float = LOCKOUT_SECONDS,
+        clock: Callable[[], float] = time.time,
+        namespace: str = "",
+    ):
+        self.backend = backend
+        self.limits = limits
+        self.max_failed_verifications = max_failed_verifications
+        self.max_failed_tracking_verifications = max_failed_tracking_verifications
+        self.failure_window_seconds = failure_window_seconds
+        self.lockout_seconds = lockout_seconds
+        self.clock = clock
+        # Prefix of every key, limiters of different tenants can share one backend
+        self.namespace = namespace
+
+    def _identity_keys(self, call: dict) -> List[Tuple[str, str]]:
+        keys = []
+        call_id = call.get("call_id")
+        if call_id:
+            keys.append(("call", f"{self.namespace}call:{call_id}"))
+        caller = call.get("from_number")
+        if caller:
+            keys.append(("caller", f"{self.namespace}caller:{caller}"))
+        if not keys:
+            keys.append(("anonymous", f"{self.namespace}anonymous"))
+        return keys
+
+    def _keys(self, call: dict, tracking_number: Optional[str]) -> List[Tuple[str, str]]:
+        keys = self._identity_keys(call)
+        if tracking_number:
+            keys.append(("tracking", f"{self.namespace}tracking:{tracking_number}"))
+        return keys
+
+    def check(self, call: dict, tracking_number: Optional[str] = None) -> Optional[str]:
+        """Consume one token from every applicable bucket.
+
+        Returns the scope that is exhausted, or None if the request may proceed.
+        """
+        now = self.clock()
+        keys = self._keys(call, tracking_number)
+
+        for scope, key in keys:
+            capacity, refill = self.limits[scope]
+            if not self.backend.consume(key, capacity, refill, now):
+                return scope
+        return None
+
+    def locked_scope(self, call: dict, tracking_number: Optional[str] = None) -> Optional[str]:
+        """The scope locked out of verification (call, caller, anonymous or tracking), if any"""
+        now = self.clock()
+        for scope, key in self._keys(call, tracking_number):
+            if self.backend.locked_until(key, now) is not None:
+                return scope
+        return None
+
+    def is_locked_out(self, call: dict, tracking_number: Optional[str] = None) -> bool:
+        """Check whether the call, caller or tracking number is locked out of verification"""
+        return self.locked_scope(call, tracking_number) is not None
+
+    def record_failed_verification(self, call: dict, tracking_number: Optional[str] = None) -> bool:
+        """Count a failed verification, return True if this call's own failures locked it out.
+
+        Caller, anonymous and tracking number lockouts may come from failures of other
+        calls, they refuse verification without blaming this call.
+        """
+        now = self.clock()
+        locked = False
+        for scope, key in self._keys(call, tracking_number):
+            failures = self.backend.add_failure(key, self.failure_window_seconds, now)
+            limit = (
+                self.max_failed_tracking_verifications if scope == "tracking" else self.max_failed_verifications
+            )
+            if failures >= limit:
+                self.backend.lock(key, now + self.lockout_seconds)
+                locked = locked or scope == "call"
+        return locked
+
+    def prune(self) -> int:
+        """Drop idle state from the backend if it supports pruning"""
+        prune = getattr(self.backend, "prune", None)
+        return prune(self.clock()) if prune else 0
+
+
+def create_rate_limiter() -> FunctionRateLimiter:
+    """Build the limiter configured by RATE_LIMIT_BACKEND (memory or sqlite)"""
+    # Worker processes must share limiter state, or each one grants its own budget
+    default_backend = "sqlite" if database.MULTI_PROCESS else "memory"
+    backend_name = os.getenv("RATE_LIMIT_BACKEND", default_backend)
+    if backend_name == "sqlite":
+        backend: RateLimitBackend = SQLiteRateLimitBackend(
+            os.getenv("RATE_LIMIT_DB_PATH", "rate_limits.db")
+        )
+    elif backend_name == "memory":
+        backend = InMemoryRateLimitBackend()
+    else:
+        raise ValueError(f"Unknown RATE_LIMIT_BACKEND: {backend_name}")
+    return FunctionRateLimiter(backend)
+
+
+rate_limiter = create_rate_limiter()
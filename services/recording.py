@@ -0,0 +1,228 @@
+import hashlib
+import hmac
+import logging
+import os
+import re
+import secrets
+import time
+from typing import Any, Iterator, Optional
+
+import orjson
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# File that webhook and tool call requests are appended to, recording is off when empty
+RECORD_REQUESTS = os.getenv("RECORD_REQUESTS", "")
+# Key of the pseudonyms, shared by all worker processes writing one recording
+RECORDING_KEY = os.getenv("RECORDING_KEY", "")
+RECORDED_PATHS = ("/api/webhooks/", "/api/functions/")
+# Tool call answers are small, only their error_type is kept
+MAX_RECORDED_RESPONSE_BYTES = 64 * 1024
+
+# Identifiers replaced by keyed hashes: a value always gets the same token,
+# so a caller's repeated lookups stay repeats of one package in the recording
+PSEUDONYMIZED_FIELDS = {
+    "tracking_number": "tn",
+    "postal_code": "pc",
+    "from_number": "ph",
+    "to_number": "ph",
+}
+# Free text and personal details, only their length is kept
+REDACTED_FIELDS = frozenset(
+    {
+        "transcript",
+        "transcript_object",
+        "transcript_with_tool_calls",
+        "call_analysis",
+        "metadata",
+        "retell_llm_dynamic_variables",
+        "recording_url",
+        "public_log_url",
+        "customer_name",
+        "email",
+        "customer_email",
+        "phone",
+        "street",
+        "street_number",
+    }
+)
+# Secrets, client addresses, and what replay sets itself
+DROPPED_HEADERS = frozenset(
+    {
+        "authorization",
+        "cookie",
+        "x-retell-signature",
+        "x-forwarded-for",
+        "x-real-ip",
+        "forwarded",
+        "host",
+        "content-length",
+    }
+)
+REDACTED_MARKER = re.compile(r"<redacted:(\d+)>")
+
+
+class Redactor:
+    """Strips personal data from request bodies, keeping their shape and size"""
+
+    def __init__(self, key: bytes):
+        self.key = key
+
+    def token(self, prefix: str, value: str) -> str:
+        digest = hmac.new(self.key, value.encode(), hashlib.sha256).hexdigest()
+        return f"{prefix}_{digest[:16]}"
+
+    def redact(self, value: Any) -> Any:
+        if isinstance(value, dict):
+            return {name: self.field(name, item) for name, item in value.items()}
+        if isinstance(value, list):
+            return [self.redact(item) for item in value]
+        return value
+
+    def field(self, name: str, value: Any) -> Any:
+        if name in PSEUDONYMIZED_FIELDS and isinstance(value, str):
+            return self.token(PSEUDONYMIZED_FIELDS[name], value)
+        if name in REDACTED_FIELDS and value is not None:
+            return f"<redacted:{len(value)}>" if isinstance(value, str) else "<redacted:0>"
+        return self.redact(value)
+
+
+def restore(value: Any) -> Any:
+    """Replace redaction markers by filler text of the original length, for replay"""
+    if isinstance(value, dict):
+        return {name: restore(item) for name, item in value.items()}
+    if isinstance(value, list):
+        return [restore(item) for item in value]
+    if isinstance(value, str):
+        marker = REDACTED_MARKER.fullmatch(value)
+        if marker:
+            length = int(marker.group(1))
+            return ("redacted " * (length // 9 + 1))[:length]
+    return value
+
+
+def response_outcome(status: int, body: bytes) -> Optional[str]:
+    """error_type of a tool call answer, "ok" without one, None if it isn't JSON"""
+    if status >= 400 or not body:
+        return None
+    try:
+        payload = orjson.loads(body)
+    except orjson.JSONDecodeError:
+        return None
+    return payload.get("error_type", "ok") if isinstance(payload, dict) else "ok"
+
+
+class RequestRecorder:
+    """Appends one compact JSON line per request to a recording file.
+
+    Keys: t request start (epoch seconds), m method, p path, h headers,
+    b redacted JSON body, s status, d duration in ms, o outcome (error_type
+    or "ok"). Lines are written with a single O_APPEND write, so several
+    worker processes can record into the same file.
+    """
+
+    def __init__(self, path: str, key: Optional[bytes] = None):
+        if key is None:
+            key = RECORDING_KEY.encode() or secrets.token_bytes(32)
+            if not RECORDING_KEY and database.MULTI_PROCESS:
+                logger.warning("RECORDING_KEY not set, each worker pseudonymizes identifiers differently")
+        self.path = path
+        self.redactor = Redactor(key)
+        self._fd = os.open(path, os.O_WRONLY | os.O_APPEND | os.O_CREAT, 0o600)
+        self.recorded = 0
+
+    def record(
+        self,
+        scope,
+        body: bytes,
+        status: int,
+        response: bytes,
+        started_at: float,
+        seconds: float,
+    ):
+        headers = {}
+        for name, value in scope["headers"]:
+            name = name.decode("latin-1").lower()
+            if name not in DROPPED_HEADERS:
+                headers[name] = value.decode("latin-1")
+        try:
+            payload = self.redactor.redact(orjson.loads(body)) if body else None
+        except orjson.JSONDecodeError:
+            # Can't be redacted field by field, so it isn't kept
+            payload = None
+        entry = {
+            "t": round(started_at, 3),
+            "m": scope["method"],
+            "p": scope["path"],
+            "h": headers,
+            "b": payload,
+            "s": status,
+            "d": round(seconds * 1000, 2),
+            "o": response_outcome(status, response),
+        }
+        os.write(self._fd, orjson.dumps(entry) + b"\n")
+        self.recorded += 1
+
+    def close(self):
+        os.close(self._fd)
+
+
+class RecordingMiddleware:
+    """Records webhook and tool call requests with their timing and outcome.
+
+    Pure ASGI: the request body is copied as the app reads it and the answer as
+    it is sent, nothing is buffered ahead of the app.
+    """
+
+    def __init__(self, app, recorder: RequestRecorder):
+        self.app = app
+        self.recorder = recorder
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http" or not scope["path"].startswith(RECORDED_PATHS):
+            await self.app(scope, receive, send)
+            return
+
+        body = bytearray()
+        response = bytearray()
+        status = 0
+
+        async def receive_recorded():
+            message = await receive()
+            if message["type"] == "http.request":
+                body.extend(message.get("body", b""))
+            return message
+
+        async def send_recorded(message):
+            nonlocal status
+            if message["type"] == "http.response.start":
+                status = message["status"]
+            elif message["type"] == "http.response.body" and len(response) < MAX_RECORDED_RESPONSE_BYTES:
+                response.extend(message.get("body", b""))
+            await send(message)
+
+        started_at, started = time.time(), time.perf_counter()
+        try:
+            await self.app(scope, receive_recorded, send_recorded)
+        finally:
+            try:
+                self.recorder.record(
+                    scope, bytes(body), status or 500, bytes(response), started_at, time.perf_counter() - started
+                )
+            except (OSError, orjson.JSONEncodeError) as err:
+                # A full disk or an odd payload must not fail the request that was just served
+                logger.error("Recording %s failed: %s", scope["path"], err)
+
+
+def read_recording(path: str) -> Iterator[dict]:
+    """Recorded requests in file order, skipping a line cut off by a crash"""
+    with open(path, "rb") as f:
+        for number, line in enumerate(f, 1):
+            if not line.strip():
+                continue
+            try:
+                yield orjson.loads(line)
+            except orjson.JSONDecodeError:
+                logger.warning("Skipping unreadable line %s of %s", number, path)
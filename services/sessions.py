@@ -0,0 +1,167 @@
+import os
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field
+from typing import Any, Callable, Dict, Optional
+
+from models import PackageRecord
+
+# Sessions unused this long belong to calls whose call_ended never reached this process
+SESSION_TTL_SECONDS = float(os.getenv("SESSION_TTL_SECONDS", "900"))
+MAX_SESSIONS = int(os.getenv("MAX_SESSIONS", "10000"))
+
+
+@dataclass(slots=True)
+class CallSession:
+    """What one conversation has established so far, for its later tool calls"""
+
+    call_id: str
+    opened_at: float
+    last_used: float
+    # Package verified with tracking number and postal code in this call
+    package: Optional[PackageRecord] = None
+    # Tracking number already written to the call log
+    logged_tracking_number: Optional[str] = None
+    tool_calls: int = 0
+    failed_verifications: int = 0
+    # Actions started but not confirmed yet, e.g. "escalation" -> reason,
+    # "reschedule" -> new time of a write that outlived its response
+    pending: Dict[str, Any] = field(default_factory=dict)
+
+    def verified(self, tracking_number: str, postal_code: str) -> Optional[PackageRecord]:
+        """The verified package if it matches both identifiers, else None"""
+        package = self.package
+        if package and package.tracking_number == tracking_number and package.postal_code == postal_code:
+            return package
+        return None
+
+
+class SessionStore:
+    """Per-process call sessions keyed by Retell call_id.
+
+    Opened by the call_started webhook and closed by call_ended. Tool calls of
+    calls without a session (call_started went to another worker, or the
+    process restarted) just read the database, so the store is a cache and
+    never the only copy of anything. Tool calls don't open sessions, a flood
+    of made-up call_ids can't grow the store.
+
+    Sessions are kept in least recently used order, so evicting those idle for
+    longer than ttl only looks at the oldest ones. Time spent in the store is
+    counted, snapshot() reports it next to the hits it bought.
+    """
+
+    def __init__(
+        self,
+        ttl: float = SESSION_TTL_SECONDS,
+        max_sessions: int = MAX_SESSIONS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.ttl = ttl
+        self.max_sessions = max_sessions
+        self.clock = clock
+        self._sessions: "OrderedDict[str, CallSession]" = OrderedDict()
+        self._lock = threading.Lock()
+        self.opened = self.closed = self.evicted = 0
+        self.hits = self.misses = 0
+        self.operations = 0
+        self.overhead_ns = 0
+
+    def open(self, call_id: str) -> CallSession:
+        """Start a session, an existing one (repeated webhook) is kept"""
+        started = time.perf_counter_ns()
+        with self._lock:
+            now = self.clock()
+            self._evict_locked(now)
+            session = self._sessions.get(call_id)
+            if session is None:
+                if len(self._sessions) >= self.max_sessions:
+                    self._sessions.popitem(last=False)
+                    self.evicted += 1
+                session = self._sessions[call_id] = CallSession(call_id, now, now)
+                self.opened += 1
+            self._count_locked(started)
+            return session
+
+    def get(self, call_id: Optional[str]) -> Optional[CallSession]:
+        """The open session of a call, counted as a tool call of it"""
+        if not call_id:
+            return None
+        started = time.perf_counter_ns()
+        with self._lock:
+            now = self.clock()
+            self._evict_locked(now)
+            session = self._sessions.get(call_id)
+            if session is not None:
+                session.last_used = now
+                session.tool_calls += 1
+                self._sessions.move_to_end(call_id)
+            self._count_locked(started)
+            return session
+
+    def close(self, call_id: str) -> Optional[CallSession]:
+        started = time.perf_counter_ns()
+        with self._lock:
+            session = self._sessions.pop(call_id, None)
+            if session is not None:
+                self.closed += 1
+            self._count_locked(started)
+            return session
+
+    def record_lookup(self, hit: bool):
+        """Count whether a session answered a lookup that would have read the database"""
+        with self._lock:
+            if hit:
+                self.hits += 1
+            else:
+                self.misses += 1
+
+    def prune(self) -> int:
+        with self._lock:
+            return self._evict_locked(self.clock())
+
+    def _evict_locked(self, now: float) -> int:
+        evicted = 0
+        while self._sessions:
+            session = next(iter(self._sessions.values()))
+            if now - session.last_used <= self.ttl:
+                break
+            self._sessions.popitem(last=False)
+            evicted += 1
+        self.evicted += evicted
+        return evicted
+
+    def _count_locked(self, started: int):
+        self.operations += 1
+        self.overhead_ns += time.perf_counter_ns() - started
+
+    def __len__(self) -> int:
+        return len(self._sessions)
+
+    def snapshot(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "active": len(self._sessions),
+                "opened": self.opened,
+                "closed": self.closed,
+                "evicted": self.evicted,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": round(self.hits / lookups, 3) if lookups else None,
+                "operations": self.operations,
+                "overhead_us_per_operation": (
+                    round(self.overhead_ns / self.operations / 1000, 2) if self.operations else None
+                ),
+            }
+
+    def reset(self):
+        with self._lock:
+            self._sessions.clear()
+            self.opened = self.closed = self.evicted = 0
+            self.hits = self.misses = 0
+            self.operations = 0
+            self.overhead_ns = 0
+
+
+session_store = SessionStore()
@@ -0,0 +1,204 @@
+import json
+import logging
+import os
+from collections import Counter
+from dataclasses import dataclass
+from datetime import datetime
+from typing import Dict, List, Optional
+
+import database
+
+logger = logging.getLogger(__name__)
+
+# Set to a shard map file to keep packages in per-region database files.
+# Call logs, campaigns and rate limits stay in the main database either way.
+SHARD_MAP_PATH = os.getenv("SHARD_MAP_PATH")
+
+# Size of each shard's package id range, shard i hands out ids above (i + 1) * SHARD_ID_SPAN.
+# The main database keeps the ids below the first range.
+SHARD_ID_SPAN = 10**12
+
+REBALANCE_BATCH_SIZE = 1000
+
+
+@dataclass(slots=True)
+class Shard:
+    name: str
+    path: str
+    id_offset: int
+
+
+class ShardMap:
+    """Routes postal codes to package shards by longest matching prefix.
+
+    The map file looks like
+        {"shards": {"north": "shards/north.db", "south": "shards/south.db"},
+         "routes": {"1": "north", "2": "north", "54": "south"},
+         "default": "north"}
+    Shard paths are relative to the map file. Append new shards at the end, a
+    shard's position determines its package id range.
+    """
+
+    def __init__(self, shards: Dict[str, str], routes: Dict[str, str], default: str):
+        self.shards = [
+            Shard(name, path, (position + 1) * SHARD_ID_SPAN)
+            for position, (name, path) in enumerate(shards.items())
+        ]
+        by_name = {shard.name: shard for shard in self.shards}
+        unknown = {name for name in [*routes.values(), default] if name not in by_name}
+        if unknown:
+            raise ValueError(f"Shard map routes to unknown shards: {sorted(unknown)}")
+        self.routes = {prefix: by_name[name] for prefix, name in routes.items()}
+        self.default = by_name[default]
+        self._prefix_lengths = sorted({len(prefix) for prefix in routes}, reverse=True)
+
+    @classmethod
+    def load(cls, path: str) -> "ShardMap":
+        with open(path) as f:
+            spec = json.load(f)
+        base = os.path.dirname(os.path.abspath(path))
+        shards = {name: os.path.join(base, shard_path) for name, shard_path in spec["shards"].items()}
+        return cls(shards, spec.get("routes", {}), spec["default"])
+
+    def shard_for(self, postal_code: str) -> Shard:
+        for length in self._prefix_lengths:
+            shard = self.routes.get(postal_code[:length])
+            if shard is not None:
+                return shard
+        return self.default
+
+    def init_shards(self):
+        for shard in self.shards:
+            database.init_package_store(shard.path, shard.id_offset)
+
+
+shard_map: Optional[ShardMap] = ShardMap.load(SHARD_MAP_PATH) if SHARD_MAP_PATH else None
+
+
+def package_store_paths() -> List[str]:
+    """Every database file holding packages, in package id order"""
+    # Tenants with their own database keep their packages in it, shards are the default tenant's
+    tenant_path = database.tenant_database.get()
+    if tenant_path:
+        return [tenant_path]
+    if shard_map is None:
+        return [database.DATABASE_PATH]
+    return [shard.path for shard in shard_map.shards]
+
+
+def package_store_path(postal_code: str) -> str:
+    """Database file holding the packages of a postal code"""
+    tenant_path = database.tenant_database.get()
+    if tenant_path:
+        return tenant_path
+    if shard_map is None:
+        return database.DATABASE_PATH
+    return shard_map.shard_for(postal_code).path
+
+
+def rebalance(target_map: ShardMap, batch_size: int = REBALANCE_BATCH_SIZE) -> Counter:
+    """Move packages, with their schedule history, to the shards target_map routes them to.
+
+    Sources are the main database (packages from before sharding was enabled) and
+    every shard of target_map. Each batch is first written to its new shard and then
+    deleted from the old one. Interrupted runs can simply be repeated: packages that
+    already arrived are skipped, and their history only ever moves with them.
+    Moved packages get new ids from their new shard's range.
+
+    Returns the number of moved packages per (source, target) shard name.
+    """
+    target_map.init_shards()
+    names = {shard.path: shard.name for shard in target_map.shards}
+    sources = [database.DATABASE_PATH] + [shard.path for shard in target_map.shards]
+    moved: Counter = Counter()
+
+    for source in sources:
+        after_id = 0
+        while True:
+            conn = database.get_db_connection(path=source)
+            conn.row_factory = None
+            try:
+                rows = conn.execute(
+                    """
+                    SELECT id, tracking_number, customer_name, phone, email, postal_code,
+                           street, street_number, status, scheduled_at, notify_email, notify_sms
+                    FROM packages WHERE id > ? ORDER BY id LIMIT ?
+                """,
+                    (after_id, batch_size),
+                ).fetchall()
+            finally:
+                conn.close()
+            if not rows:
+                break
+            after_id = rows[-1][0]
+
+            by_target: Dict[str, List[tuple]] = {}
+            for row in rows:
+                target = target_map.shard_for(row[5]).path
+                if target != source:
+                    by_target.setdefault(target, []).append(row)
+
+            for target, batch in by_target.items():
+                move_packages(source, target, batch)
+                moved[(names.get(source, "main"), names[target])] += len(batch)
+
+    for (source, target), count in sorted(moved.items()):
+        logger.info("Moved %s packages from %s to %s", count, source, target)
+    return moved
+
+
+def to_sql(value):
+    """Store datetimes read back through the DATETIME converter as ISO 8601 again"""
+    return value.isoformat() if isinstance(value, datetime) else value
+
+
+def move_packages(source: str, target: str, rows: List[tuple]):
+    tracking_numbers = [row[1] for row in rows]
+    placeholders = ", ".join("?" * len(tracking_numbers))
+
+    conn = database.get_db_connection(path=source)
+    conn.row_factory = None
+    try:
+        history = conn.execute(
+            f"""
+            SELECT tracking_number, previous_scheduled_at, scheduled_at, changed_at, retell_call_id
+            FROM package_schedule_history WHERE tracking_number IN ({placeholders})
+            ORDER BY id
+        """,
+            tracking_numbers,
+        ).fetchall()
+    finally:
+        conn.close()
+
+    with database.write_connection(target) as conn:
+        arrived = set()
+        for row in rows:
+            cursor = conn.execute(
+                """
+                INSERT OR IGNORE INTO packages
+                (tracking_number, customer_name, phone, email, postal_code, street, street_number, status,
+                 scheduled_at, notify_email, notify_sms)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [to_sql(value) for value in row[1:]],
+            )
+            if cursor.rowcount:
+                arrived.add(row[1])
+        conn.executemany(
+            """
+            INSERT INTO package_schedule_history
+            (tracking_number, previous_scheduled_at, scheduled_at, changed_at, retell_call_id)
+            VALUES (?, ?, ?, ?, ?)
+        """,
+            [[to_sql(value) for value in entry] for entry in history if entry[0] in arrived],
+        )
+
+    with database.write_connection(source) as conn:
+        # The only place history rows are ever deleted, the trigger is back before commit
+        conn.execute("DROP TRIGGER package_schedule_history_no_delete")
+        conn.execute(
+            f"DELETE FROM package_schedule_history WHERE tracking_number IN ({placeholders})",
+            tracking_numbers,
+        )
+        conn.execute(database.HISTORY_NO_DELETE_TRIGGER)
+        conn.execute(f"DELETE FROM packages WHERE tracking_number IN ({placeholders})", tracking_numbers)
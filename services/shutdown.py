@@ -0,0 +1,118 @@
+import asyncio
+import logging
+import os
+import sqlite3
+import time
+
+import database
+from services.jobs import JobQueue
+from services.latency import DEFAULT_BUDGETS, late_work, latency_stats
+from services.tenants import tenant_registry
+
+logger = logging.getLogger(__name__)
+
+# Time shutdown may take in total, keep it below the orchestrator's kill timeout
+# (30s terminationGracePeriodSeconds in Kubernetes) and uvicorn --timeout-graceful-shutdown
+SHUTDOWN_TIMEOUT_SECONDS = float(os.getenv("SHUTDOWN_TIMEOUT_SECONDS", "20"))
+DRAIN_POLL_SECONDS = 0.05
+
+
+class RequestTracker:
+    """Counts in-flight HTTP requests, new ones are turned away once draining"""
+
+    def __init__(self):
+        self.in_flight = 0
+        self.draining = False
+
+    async def wait_idle(self, timeout: float) -> bool:
+        """Wait until no request is in flight, False if some still are after timeout"""
+        deadline = time.monotonic() + timeout
+        while self.in_flight and time.monotonic() < deadline:
+            await asyncio.sleep(DRAIN_POLL_SECONDS)
+        return self.in_flight == 0
+
+
+request_tracker = RequestTracker()
+
+
+class DrainMiddleware:
+    """Tracks in-flight requests and answers 503 to requests arriving during shutdown.
+
+    Load balancers and Retell retry a 503, so a request that reaches a worker
+    on its way down lands on another one instead of being cut off.
+    """
+
+    def __init__(self, app, tracker: RequestTracker = request_tracker):
+        self.app = app
+        self.tracker = tracker
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.tracker.draining:
+            await send(
+                {
+                    "type": "http.response.start",
+                    "status": 503,
+                    "headers": [(b"retry-after", b"1"), (b"connection", b"close"), (b"content-length", b"0")],
+                }
+            )
+            await send({"type": "http.response.body", "body": b""})
+            return
+        self.tracker.in_flight += 1
+        try:
+            await self.app(scope, receive, send)
+        finally:
+            self.tracker.in_flight -= 1
+
+
+async def wait_for_late_work(timeout: float) -> int:
+    """Wait for work that outlived its request (slow writes, late emails), return how many are left"""
+    loop = asyncio.get_running_loop()
+    deadline = time.monotonic() + timeout
+    # Finishing work can start more, e.g. a slow write submitting its confirmation email
+    while (tasks := {task for task in late_work if task.get_loop() is loop}) and (
+        remaining := deadline - time.monotonic()
+    ) > 0:
+        await asyncio.wait(tasks, timeout=remaining)
+    return len(tasks)
+
+
+def flush():
+    """Checkpoint every database file of every tenant and log this process's final metrics"""
+    for path in tenant_registry.database_paths():
+        try:
+            database.checkpoint(path)
+        except sqlite3.Error as err:
+            logger.warning("Checkpoint of %s failed: %s", path, err)
+    logger.info("Latency stats at shutdown: %s", latency_stats.snapshot(DEFAULT_BUDGETS))
+
+
+async def graceful_shutdown(
+    jobs: JobQueue,
+    timeout: float = SHUTDOWN_TIMEOUT_SECONDS,
+    tracker: RequestTracker = request_tracker,
+):
+    """Stop taking new work, then drain requests, late work and jobs within timeout.
+
+    Order matters: requests still running may submit jobs or late work, and late
+    work may submit jobs (confirmation emails of slow writes). Jobs that don't
+    finish in time stay persisted and are resumed by the next start.
+    """
+    deadline = time.monotonic() + timeout
+    tracker.draining = True
+
+    if not await tracker.wait_idle(max(deadline - time.monotonic(), 0)):
+        logger.warning("Shutdown deadline: %s requests still in flight", tracker.in_flight)
+    left = await wait_for_late_work(max(deadline - time.monotonic(), 0))
+    if left:
+        logger.warning("Shutdown deadline: %s late tasks still running", left)
+    interrupted = await jobs.drain(max(deadline - time.monotonic(), 0))
+    if interrupted:
+        logger.warning("Shutdown deadline: %s jobs interrupted, they resume on the next start", interrupted)
+
+    await asyncio.to_thread(flush)
+    # The server closes its sockets from here on. The same process may start the app again
+    # (tests, reloads), the next lifespan startup resumes jobs.
+    tracker.draining = False
@@ -0,0 +1,78 @@
+import hashlib
+import threading
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Callable, Dict, List, Tuple
+
+import database
+from services.coordination import ChangeMonitor, change_monitor
+
+_shard_monitors: Dict[str, ChangeMonitor] = {}
+_shard_monitors_guard = threading.Lock()
+
+
+def monitor_for(path: str) -> ChangeMonitor:
+    if path == database.DATABASE_PATH:
+        return change_monitor
+    with _shard_monitors_guard:
+        monitor = _shard_monitors.get(path)
+        if monitor is None:
+            monitor = _shard_monitors[path] = ChangeMonitor(path)
+        return monitor
+
+
+def data_versions(paths: List[str]) -> Tuple[Tuple[str, int], ...]:
+    """PRAGMA data_version of each database file, moves with every commit of any process"""
+    return tuple((path, monitor_for(path).version()) for path in paths)
+
+
+@dataclass(frozen=True, slots=True)
+class Snapshot:
+    body: bytes
+    etag: str
+    last_modified: datetime
+    versions: Tuple[Tuple[str, int], ...]
+
+
+class SnapshotCache:
+    """A pre-serialized response body, rebuilt only after its database files changed.
+
+    Checking for changes costs one PRAGMA data_version per file and reads no table.
+    data_version moves with every commit to a file, so e.g. a new call log also
+    rebuilds the package list in an unsharded database. The ETag is a hash of the
+    body, so such a rebuild keeps the ETag and Last-Modified of identical content
+    and clients still get 304s. One snapshot is kept per set of files, i.e. per tenant.
+    """
+
+    def __init__(self, build: Callable[[], bytes], paths: Callable[[], List[str]]):
+        self.build = build
+        self.paths = paths
+        self._snapshots: Dict[Tuple[str, ...], Snapshot] = {}
+        self._lock = threading.Lock()
+
+    def get(self) -> Snapshot:
+        paths = self.paths()
+        versions = data_versions(paths)
+        snapshot = self._snapshots.get(tuple(paths))
+        if snapshot is not None and snapshot.versions == versions:
+            return snapshot
+        # One rebuild at a time, pollers arriving meanwhile get its result
+        with self._lock:
+            snapshot = self._snapshots.get(tuple(paths))
+            if snapshot is not None and snapshot.versions == versions:
+                return snapshot
+            # Commits after reading versions may already be in body, that only
+            # causes one rebuild too many on the next get
+            body = self.build()
+            etag = f'"{hashlib.blake2b(body, digest_size=16).hexdigest()}"'
+            if snapshot is not None and snapshot.etag == etag:
+                last_modified = snapshot.last_modified
+            else:
+                # HTTP dates have whole seconds, If-Modified-Since compares against this
+                last_modified = datetime.now(timezone.utc).replace(microsecond=0)
+            snapshot = self._snapshots[tuple(paths)] = Snapshot(body, etag, last_modified, versions)
+            return snapshot
+
+    def clear(self):
+        with self._lock:
+            self._snapshots.clear()
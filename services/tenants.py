@@ -0,0 +1,381 @@
+import asyncio
+import inspect
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from contextvars import ContextVar
+from dataclasses import dataclass, field
+from typing import Callable, Deque, Dict, Iterator, List, Optional, Tuple
+
+import orjson
+
+import database
+from services.rate_limit import DEFAULT_LIMITS, FunctionRateLimiter, rate_limiter
+from services.sharding import package_store_paths
+
+logger = logging.getLogger(__name__)
+
+TENANTS_PATH = os.getenv("TENANTS_PATH")
+# How often each process checks the tenants file for changes
+TENANT_RELOAD_SECONDS = float(os.getenv("TENANT_RELOAD_SECONDS", "5"))
+# Requests of one tenant handled at once per process, and how long further ones wait for a slot
+TENANT_MAX_CONCURRENT_REQUESTS = int(os.getenv("TENANT_MAX_CONCURRENT_REQUESTS", "16"))
+TENANT_QUEUE_SECONDS = float(os.getenv("TENANT_QUEUE_SECONDS", "2"))
+DEFAULT_TENANT = "default"
+# Requests naming their agent in call.agent_id, others pick a tenant with X-Tenant
+AGENT_ROUTED_PATHS = ("/api/functions/", "/api/webhooks/")
+
+
+class Bulkhead:
+    """At most `limit` requests at once, further ones wait up to `timeout` in arrival order.
+
+    A freed slot is handed straight to the next waiter. Not thread-safe, it is
+    used from the event loop only.
+    """
+
+    def __init__(self, limit: int, timeout: float):
+        self.limit = limit
+        self.timeout = timeout
+        self.in_flight = 0
+        self.waiters: Deque[asyncio.Future] = deque()
+        self.waited = 0
+        self.rejected = 0
+
+    async def acquire(self) -> bool:
+        if self.in_flight < self.limit and not self.waiters:
+            self.in_flight += 1
+            return True
+        self.waited += 1
+        waiter = asyncio.get_running_loop().create_future()
+        self.waiters.append(waiter)
+        try:
+            return await asyncio.wait_for(asyncio.shield(waiter), self.timeout)
+        except asyncio.TimeoutError:
+            if waiter.done():
+                return True  # Handed a slot just as the wait ran out
+            waiter.cancel()
+            self.waiters.remove(waiter)
+            self.rejected += 1
+            return False
+        except asyncio.CancelledError:
+            if waiter.done():
+                self.release()
+            else:
+                waiter.cancel()
+                self.waiters.remove(waiter)
+            raise
+
+    def release(self):
+        while self.waiters:
+            waiter = self.waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(True)
+                return
+        self.in_flight -= 1
+
+    def snapshot(self) -> dict:
+        return {
+            "limit": self.limit,
+            "in_flight": self.in_flight,
+            "waiting": len(self.waiters),
+            "waited": self.waited,
+            "rejected": self.rejected,
+        }
+
+
+@dataclass(slots=True)
+class Tenant:
+    """A carrier served by this deployment: its agents, database, email settings and limits.
+
+    The default tenant serves agents no other tenant lists, from DATABASE_PATH (and
+    its shards) with the global settings; its database_path is None.
+    """
+
+    id: str
+    agent_ids: Tuple[str, ...] = ()
+    database_path: Optional[str] = None
+    source_email: Optional[str] = None
+    escalation_email: Optional[str] = None
+    # Tool call limits by scope as (burst, per minute), over DEFAULT_LIMITS
+    rate_limits: Dict[str, Tuple[float, float]] = field(default_factory=dict)
+    max_concurrent_requests: int = TENANT_MAX_CONCURRENT_REQUESTS
+    # Runtime state, kept by reloads that don't change the tenant
+    rate_limiter: Optional[FunctionRateLimiter] = field(default=None, compare=False, repr=False)
+    bulkhead: Optional[Bulkhead] = field(default=None, compare=False, repr=False)
+
+    def start(self, queue_seconds: float):
+        self.bulkhead = Bulkhead(self.max_concurrent_requests, queue_seconds)
+        if self.database_path is None:
+            return
+        limits = dict(DEFAULT_LIMITS)
+        for scope, (burst, per_minute) in self.rate_limits.items():
+            limits[scope] = (float(burst), float(per_minute) / 60)
+        # Same backend as the default limiter, separate buckets
+        self.rate_limiter = FunctionRateLimiter(rate_limiter.backend, limits=limits, namespace=f"{self.id}:")
+
+
+def parse_tenants(path: str) -> Dict[str, Tenant]:
+    """Tenants of a tenants file, database paths are relative to the file.
+
+    Raises OSError if it can't be read and ValueError if it isn't a valid tenants file.
+    """
+    with open(path) as f:
+        spec = json.load(f)
+    base = os.path.dirname(os.path.abspath(path))
+    tenants = {}
+    try:
+        for tenant_id, settings in spec["tenants"].items():
+            if tenant_id == DEFAULT_TENANT:
+                raise ValueError(f"Tenant id {DEFAULT_TENANT!r} is reserved")
+            tenants[tenant_id] = Tenant(
+                id=tenant_id,
+                agent_ids=tuple(settings.get("agent_ids", ())),
+                database_path=os.path.join(base, settings["database"]),
+                source_email=settings.get("source_email"),
+                escalation_email=settings.get("escalation_email"),
+                rate_limits={scope: tuple(limit) for scope, limit in settings.get("rate_limits", {}).items()},
+                max_concurrent_requests=settings.get("max_concurrent_requests", TENANT_MAX_CONCURRENT_REQUESTS),
+            )
+    except (KeyError, TypeError, AttributeError) as err:
+        raise ValueError(f"Malformed tenants file: {err!r}") from err
+    claimed: Dict[str, str] = {}
+    for tenant in tenants.values():
+        for agent_id in tenant.agent_ids:
+            if agent_id in claimed:
+                raise ValueError(f"Agent {agent_id} is listed by tenants {claimed[agent_id]} and {tenant.id}")
+            claimed[agent_id] = tenant.id
+    return tenants
+
+
+class TenantRegistry:
+    """Tenants by id and agent_id, loaded from a tenants file and reloaded when it changes.
+
+    The file looks like
+        {"tenants": {"acme": {"agent_ids": ["agent_3f2a"], "database": "tenants/acme.db",
+                              "source_email": "deliveries@acme.example",
+                              "escalation_email": "support@acme.example",
+                              "rate_limits": {"tracking": [5, 5]},
+                              "max_concurrent_requests": 32}}}
+    Databases of new tenants are created on load. Each process checks the file's
+    modification time at most every reload_seconds; a file that fails to load
+    keeps the tenants loaded before.
+    """
+
+    def __init__(
+        self,
+        path: Optional[str] = None,
+        reload_seconds: float = TENANT_RELOAD_SECONDS,
+        queue_seconds: float = TENANT_QUEUE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.path = path
+        self.reload_seconds = reload_seconds
+        self.queue_seconds = queue_seconds
+        self.clock = clock
+        self.default = Tenant(DEFAULT_TENANT)
+        self.default.start(queue_seconds)
+        self.tenants: Dict[str, Tenant] = {}
+        self.by_agent: Dict[str, Tenant] = {}
+        self._mtime: Optional[float] = None
+        self._next_check = 0.0
+        self._lock = threading.Lock()
+        if path:
+            self.load()
+
+    def load(self):
+        mtime = os.stat(self.path).st_mtime
+        loaded = parse_tenants(self.path)
+        tenants = {}
+        for tenant_id, tenant in loaded.items():
+            previous = self.tenants.get(tenant_id)
+            if previous == tenant:
+                tenants[tenant_id] = previous
+                continue
+            database.init_database(tenant.database_path, seed=False)
+            tenant.start(self.queue_seconds)
+            tenants[tenant_id] = tenant
+        # Swapped whole, requests never see half a reload
+        self.by_agent = {agent_id: tenant for tenant in tenants.values() for agent_id in tenant.agent_ids}
+        self.tenants = tenants
+        self._mtime = mtime
+        logger.info("Loaded %s tenants from %s", len(tenants), self.path)
+
+    def reload_due(self) -> bool:
+        return self.path is not None and self.clock() >= self._next_check
+
+    def reload_if_changed(self) -> bool:
+        """Reload the tenants file if it was modified since the last load, blocking"""
+        with self._lock:
+            if not self.reload_due():
+                return False
+            self._next_check = self.clock() + self.reload_seconds
+            try:
+                if os.stat(self.path).st_mtime == self._mtime:
+                    return False
+                self.load()
+                return True
+            except (OSError, ValueError, sqlite3.Error) as err:
+                logger.error("Keeping previous tenants, %s failed to load: %s", self.path, err)
+                return False
+
+    def for_agent(self, agent_id: Optional[str]) -> Tenant:
+        return self.by_agent.get(agent_id, self.default) if agent_id else self.default
+
+    def get(self, tenant_id: str) -> Optional[Tenant]:
+        return self.default if tenant_id == DEFAULT_TENANT else self.tenants.get(tenant_id)
+
+    def all(self) -> List[Tenant]:
+        return [self.default, *self.tenants.values()]
+
+    def database_paths(self) -> List[str]:
+        """Every database file of every tenant"""
+        paths = [database.DATABASE_PATH, *package_store_paths()]
+        paths.extend(tenant.database_path for tenant in self.tenants.values())
+        return list(dict.fromkeys(paths))
+
+    def snapshot(self) -> dict:
+        return {
+            tenant.id: {"agent_ids": list(tenant.agent_ids), "requests": tenant.bulkhead.snapshot()}
+            for tenant in self.all()
+        }
+
+
+tenant_registry = TenantRegistry(TENANTS_PATH)
+current_tenant: ContextVar[Optional[Tenant]] = ContextVar("current_tenant", default=None)
+
+
+@contextmanager
+def use_tenant(tenant: Tenant) -> Iterator[Tenant]:
+    """Serve a tenant: its database for every connection opened within, its settings"""
+    tenant_token = current_tenant.set(tenant)
+    database_token = database.tenant_database.set(tenant.database_path)
+    try:
+        yield tenant
+    finally:
+        database.tenant_database.reset(database_token)
+        current_tenant.reset(tenant_token)
+
+
+def serving_tenant() -> Tenant:
+    return current_tenant.get() or tenant_registry.default
+
+
+def for_each_tenant(fn: Callable[[], object]) -> Callable[[], object]:
+    """Wrap a periodic task to run once per tenant, on that tenant's database"""
+
+    async def run_for_each_tenant():
+        for tenant in tenant_registry.all():
+            with use_tenant(tenant):
+                try:
+                    if inspect.iscoroutinefunction(fn):
+                        await fn()
+                    else:
+                        await asyncio.to_thread(fn)
+                except Exception as err:
+                    logger.error("%s failed for tenant %s: %s", fn.__name__, tenant.id, err, exc_info=True)
+
+    run_for_each_tenant.__name__ = getattr(fn, "__name__", "task")
+    return run_for_each_tenant
+
+
+async def send_error(send, status: int, message: str, headers: Tuple[Tuple[bytes, bytes], ...] = ()):
+    body = orjson.dumps({"message": message})
+    await send(
+        {
+            "type": "http.response.start",
+            "status": status,
+            "headers": [(b"content-type", b"application/json"), (b"content-length", str(len(body)).encode()), *headers],
+        }
+    )
+    await send({"type": "http.response.body", "body": body})
+
+
+class TenantRejected(Exception):
+    """The request names no tenant it may be served as"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+class TenantMiddleware:
+    """Serves each request as its tenant, within the tenant's share of the process.
+
+    Tool calls and webhooks are routed by the call's agent_id, which means reading
+    their (small) body up front, an X-Tenant header on them must name the same
+    tenant. Other requests name a tenant in an X-Tenant header and default to the
+    default tenant. Every tenant has its own bulkhead, so a
+    tenant under load queues for its own slots instead of taking the threads and
+    database connections other tenants' calls need.
+    """
+
+    def __init__(self, app, registry: TenantRegistry = tenant_registry):
+        self.app = app
+        self.registry = registry
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        if self.registry.reload_due():
+            await asyncio.to_thread(self.registry.reload_if_changed)
+
+        try:
+            tenant, receive = await self.resolve(scope, receive)
+        except TenantRejected as rejected:
+            await send_error(send, rejected.status, rejected.message)
+            return
+        if not await tenant.bulkhead.acquire():
+            logger.warning("Tenant %s over its concurrency limit, request to %s rejected", tenant.id, scope["path"])
+            await send_error(send, 503, "Too many requests for this tenant", ((b"retry-after", b"1"),))
+            return
+        try:
+            with use_tenant(tenant):
+                await self.app(scope, receive, send)
+        finally:
+            tenant.bulkhead.release()
+
+    async def resolve(self, scope, receive) -> Tuple[Tenant, Callable]:
+        """The request's tenant and the receive to pass on, raises TenantRejected"""
+        requested = next((value.decode() for name, value in scope["headers"] if name == b"x-tenant"), None)
+        if not scope["path"].startswith(AGENT_ROUTED_PATHS):
+            if requested is None:
+                return self.registry.default, receive
+            tenant = self.registry.get(requested)
+            if tenant is None:
+                raise TenantRejected(404, "Unknown tenant")
+            return tenant, receive
+
+        chunks = []
+        while True:
+            message = await receive()
+            chunks.append(message.get("body", b""))
+            if message["type"] != "http.request" or not message.get("more_body"):
+                break
+        body = b"".join(chunks)
+        try:
+            call = orjson.loads(body).get("call") or {}
+            agent_id = call.get("agent_id") if isinstance(call, dict) else None
+        except (orjson.JSONDecodeError, AttributeError):
+            agent_id = None  # The endpoint answers malformed bodies
+
+        replayed = False
+
+        async def replay():
+            nonlocal replayed
+            if replayed:
+                return await receive()
+            replayed = True
+            return {"type": "http.request", "body": body, "more_body": False}
+
+        tenant = self.registry.for_agent(agent_id)
+        # The agent decides, a header must not move a call into another tenant's data
+        if requested is not None and requested != tenant.id:
+            raise TenantRejected(403, "X-Tenant doesn't match the call's agent")
+        return tenant, replay
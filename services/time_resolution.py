@@ -0,0 +1,495 @@
+"""Resolve spoken delivery times ("tomorrow morning", "friday after 3pm") to delivery slots.
+
+Parsing only depends on the words, so it runs once per distinct expression through
+precompiled patterns and is cached. Resolving the parsed spec against the current
+time and the customer's timezone is plain date arithmetic.
+"""
+
+import os
+import re
+from dataclasses import dataclass
+from datetime import date, datetime, time, timedelta, timezone
+from functools import lru_cache
+from typing import Callable, Dict, List, Optional, Tuple
+from zoneinfo import ZoneInfo, ZoneInfoNotFoundError
+
+# Deliveries come in SLOT_MINUTES windows between DELIVERY_START_HOUR and
+# DELIVERY_END_HOUR, Monday to Saturday
+DELIVERY_START_HOUR = 8
+DELIVERY_END_HOUR = 20
+SLOT_MINUTES = 120
+DELIVERY_WEEKDAYS = frozenset(range(6))
+# A slot must start at least this long from now to be bookable
+MIN_LEAD_MINUTES = 60
+# Packages are held this long, later days can't be booked
+BOOKING_HORIZON_DAYS = 30
+
+# Timezone of the naive datetimes stored in the database, the server's local time if unset
+SERVICE_TIMEZONE = os.getenv("SERVICE_TIMEZONE")
+# Timezone of callers that don't say otherwise, SERVICE_TIMEZONE if unset
+DEFAULT_CUSTOMER_TIMEZONE = os.getenv("DEFAULT_CUSTOMER_TIMEZONE", SERVICE_TIMEZONE)
+
+SLOTS: Tuple[Tuple[int, int], ...] = tuple(
+    (start, start + SLOT_MINUTES)
+    for start in range(DELIVERY_START_HOUR * 60, DELIVERY_END_HOUR * 60, SLOT_MINUTES)
+)
+DAY_MINUTES = 24 * 60
+
+
+class UnresolvableTime(ValueError):
+    """The expression can't be turned into a delivery slot, message is fit to read to the caller"""
+
+    def __init__(self, reason: str, message: str):
+        super().__init__(message)
+        self.reason = reason
+        self.message = message
+
+
+@dataclass(frozen=True, slots=True)
+class TimeSpec:
+    """What an expression asks for, independent of when it is said"""
+
+    # At most one way of naming the day. None of them: the soonest day with a free slot
+    days_ahead: Optional[int] = None
+    weekday: Optional[int] = None
+    # The weekday must not be today ("next friday"), or must be in next calendar week
+    skip_today: bool = False
+    next_week: bool = False
+    # "next week": any day of next calendar week
+    whole_next_week: bool = False
+    # (year or 0, month or 0, day), zeros are filled in with the next matching date
+    date: Optional[Tuple[int, int, int]] = None
+    # "in 2 hours": a point in time this many minutes from now
+    minutes_from_now: Optional[int] = None
+    # Wanted part of the day in minutes after midnight, [earliest, latest)
+    earliest: int = 0
+    latest: int = DAY_MINUTES
+
+    @property
+    def is_point(self) -> bool:
+        return self.latest - self.earliest == 1
+
+
+@dataclass(frozen=True, slots=True)
+class DeliveryWindow:
+    # Timezone aware, in the customer's timezone
+    start: datetime
+    end: datetime
+
+    def scheduled_at(self) -> datetime:
+        """Window start as a naive datetime in SERVICE_TIMEZONE, the way packages store it"""
+        return to_service_time(self.start)
+
+    def describe(self) -> str:
+        return f"{self.start:%A, %B} {self.start.day} between {self.start:%H:%M} and {self.end:%H:%M}"
+
+
+def service_zone() -> Optional[ZoneInfo]:
+    return ZoneInfo(SERVICE_TIMEZONE) if SERVICE_TIMEZONE else None
+
+
+def to_service_time(value: datetime) -> datetime:
+    """Naive datetime in SERVICE_TIMEZONE, comparable with the stored times.
+
+    Naive values are taken to be in SERVICE_TIMEZONE already.
+    """
+    if value.tzinfo is None:
+        return value
+    return value.astimezone(service_zone()).replace(tzinfo=None)
+
+
+# --- Parsing -----------------------------------------------------------------
+
+NUMBER_WORDS = {
+    "a": 1, "an": 1, "one": 1, "two": 2, "three": 3, "four": 4, "five": 5, "six": 6,
+    "seven": 7, "eight": 8, "nine": 9, "ten": 10, "eleven": 11, "twelve": 12,
+}
+NUMBER = r"(\d{1,2}|" + "|".join(sorted(NUMBER_WORDS, key=len, reverse=True)) + ")"
+# Like NUMBER without "a" / "an", which would read "a good time" as 1 o'clock
+HOUR = r"(\d{1,2}|" + "|".join(sorted(set(NUMBER_WORDS) - {"a", "an"}, key=len, reverse=True)) + ")"
+
+WEEKDAYS = {
+    "monday": 0, "mon": 0, "tuesday": 1, "tue": 1, "tues": 1, "wednesday": 2, "wed": 2,
+    "thursday": 3, "thu": 3, "thur": 3, "thurs": 3, "friday": 4, "fri": 4,
+    "saturday": 5, "sat": 5, "sunday": 6, "sun": 6,
+}
+WEEKDAY = r"(" + "|".join(sorted(WEEKDAYS, key=len, reverse=True)) + r")"
+
+MONTHS = {
+    "january": 1, "jan": 1, "february": 2, "feb": 2, "march": 3, "mar": 3, "april": 4,
+    "apr": 4, "may": 5, "june": 6, "jun": 6, "july": 7, "jul": 7, "august": 8, "aug": 8,
+    "september": 9, "sep": 9, "sept": 9, "october": 10, "oct": 10, "november": 11,
+    "nov": 11, "december": 12, "dec": 12,
+}
+MONTH = r"(" + "|".join(sorted(MONTHS, key=len, reverse=True)) + r")"
+ORDINAL = r"(\d{1,2})(?:st|nd|rd|th)?"
+
+# "3", "3pm", "3:30 pm", "15:00", "three o'clock", "noon"
+CLOCK = rf"(?:{HOUR}(?::(\d{{2}}))?\s*(am|pm|o'?clock)?|(noon|midday|midnight))"
+
+# (earliest, latest, meridiem for bare hours: True pm, False am, None guess)
+PARTS_OF_DAY: Dict[str, Tuple[int, int, Optional[bool]]] = {
+    "early morning": (8 * 60, 10 * 60, False),
+    "late morning": (10 * 60, 12 * 60, False),
+    "morning": (8 * 60, 12 * 60, False),
+    "lunchtime": (12 * 60, 14 * 60, None),
+    "lunch": (12 * 60, 14 * 60, None),
+    "early afternoon": (12 * 60, 15 * 60, True),
+    "late afternoon": (15 * 60, 18 * 60, True),
+    "afternoon": (12 * 60, 17 * 60, True),
+    "early evening": (17 * 60, 19 * 60, True),
+    # Reach past the last slot so "evening at 9" still finds it
+    "evening": (17 * 60, 23 * 60, True),
+    "night": (17 * 60, 23 * 60, True),
+}
+PART_OF_DAY = r"(" + "|".join(sorted(PARTS_OF_DAY, key=len, reverse=True)) + r")"
+
+# Words that carry no meaning once the day and time are taken out
+FILLER = frozenset(
+    """a about after and any anytime around at available be best between by can could day
+    deliver delivered delivery during fine for from good great home i i'm ideally im in is it
+    its like maybe me of okay on or please possible preferably prefer rather should slot some
+    sometime that the then time to want we whenever will work works would you""".split()
+)
+
+
+def number(text: str) -> int:
+    return NUMBER_WORDS[text] if text in NUMBER_WORDS else int(text)
+
+
+def clock_minutes(m: re.Match, offset: int, pm: Optional[bool]) -> Optional[int]:
+    """Minutes after midnight of a CLOCK match whose groups start at offset"""
+    hour_text, minute_text, meridiem, named = m.group(offset, offset + 1, offset + 2, offset + 3)
+    if named:
+        return DAY_MINUTES - 1 if named == "midnight" else 12 * 60
+    hour, minute = number(hour_text), int(minute_text or 0)
+    if minute > 59:
+        return None
+    if meridiem == "am":
+        if hour > 12:
+            return None
+        hour %= 12
+    elif meridiem == "pm":
+        if hour > 12:
+            return None
+        hour = hour % 12 + 12
+    elif hour > 23:
+        return None
+    elif hour < 12 and (pm or (pm is None and 1 <= hour < DELIVERY_START_HOUR)):
+        # A bare "3" means 15:00, nobody asks for a parcel at 3 in the night
+        hour += 12
+    return hour * 60 + minute
+
+
+def meridiem_of(m: re.Match, offset: int) -> Optional[bool]:
+    meridiem = m.group(offset + 2)
+    return None if meridiem in (None, "oclock", "o'clock") else meridiem == "pm"
+
+
+DayRule = Callable[[re.Match], Optional[dict]]
+
+
+def weekday_rule(m: re.Match) -> dict:
+    qualifier, weekday, next_week = m.group(1), WEEKDAYS[m.group(2)], m.group(3)
+    if next_week:
+        return {"weekday": weekday, "next_week": True}
+    # "friday" said on a friday is today, "next friday" is a week later
+    return {"weekday": weekday, "skip_today": qualifier == "next"}
+
+
+DAY_RULES: List[Tuple[re.Pattern, DayRule]] = [
+    (re.compile(r"\b(?:the\s+)?day\s+after\s+tomorrow\b"), lambda m: {"days_ahead": 2}),
+    (re.compile(r"\btomorrow\b"), lambda m: {"days_ahead": 1}),
+    (re.compile(r"\b(?:in\s+)?a\s+week\s+from\s+today\b"), lambda m: {"days_ahead": 7}),
+    (re.compile(r"\btonight\b"), lambda m: {"days_ahead": 0, "earliest": 17 * 60, "latest": 23 * 60}),
+    (
+        re.compile(r"\btoday\b|\bthis\b(?=\s+(?:early\s+|late\s+)?(?:morning|afternoon|evening)\b)"),
+        lambda m: {"days_ahead": 0},
+    ),
+    (re.compile(rf"\bin\s+{NUMBER}\s+days?\b"), lambda m: {"days_ahead": number(m.group(1))}),
+    (re.compile(rf"\bin\s+{NUMBER}\s+weeks?\b"), lambda m: {"days_ahead": 7 * number(m.group(1))}),
+    (
+        re.compile(rf"\b(?:(next|this|on|coming|this\s+coming)\s+)?{WEEKDAY}\b(?:\s+(next\s+week))?"),
+        weekday_rule,
+    ),
+    (re.compile(r"\b(?:(?:this|the)\s+)?weekend\b"), lambda m: {"weekday": 5}),
+    (re.compile(r"\bnext\s+week\b"), lambda m: {"whole_next_week": True}),
+    (
+        re.compile(r"\b(\d{4})-(\d{1,2})-(\d{1,2})\b"),
+        lambda m: {"date": (int(m.group(1)), int(m.group(2)), int(m.group(3)))},
+    ),
+    (
+        re.compile(rf"\b(?:the\s+)?{ORDINAL}\s+(?:of\s+)?{MONTH}\b(?:\s+(\d{{4}}))?"),
+        lambda m: {"date": (int(m.group(3) or 0), MONTHS[m.group(2)], int(m.group(1)))},
+    ),
+    (
+        re.compile(rf"\b{MONTH}\s+(?:the\s+)?{ORDINAL}\b(?:\s+(\d{{4}}))?"),
+        lambda m: {"date": (int(m.group(3) or 0), MONTHS[m.group(1)], int(m.group(2)))},
+    ),
+    # European day.month., as read from the delivery notice
+    (
+        re.compile(r"\b(\d{1,2})\.(0?[1-9]|1[0-2])\.(\d{4})?"),
+        lambda m: {"date": (int(m.group(3) or 0), int(m.group(2)), int(m.group(1)))},
+    ),
+    (
+        re.compile(r"\bthe\s+(\d{1,2})(?:st|nd|rd|th)\b"),
+        lambda m: {"date": (0, 0, int(m.group(1)))},
+    ),
+]
+
+DOTTED_CLOCK = re.compile(r"\b(\d{1,2})\.(\d{2})\b")
+# "after lunch" is a clock rule
+PART_OF_DAY_RULE = re.compile(rf"(?<!after )(?<!before )\b(?:in\s+the\s+|this\s+)?{PART_OF_DAY}\b")
+ASAP_RULE = re.compile(
+    r"\b(?:asap|as\s+soon\s+as\s+possible|soonest|first\s+available|earliest(?:\s+possible)?)\b"
+)
+IN_HOURS_RULE = re.compile(rf"\bin\s+(?:{NUMBER}\s+hours?|(half)\s+an\s+hour|{NUMBER}\s+minutes?)\b")
+ANY_TIME_RULE = re.compile(r"\b(?:any\s*time|whenever|all\s+day)\b")
+
+# Clock rules, each returns (earliest, latest) given the part of day's am/pm hint
+ClockRule = Callable[[re.Match, Optional[bool]], Optional[Tuple[int, int]]]
+
+
+def range_rule(m: re.Match, pm: Optional[bool]) -> Optional[Tuple[int, int]]:
+    second_pm = meridiem_of(m, 5)
+    end = clock_minutes(m, 5, pm)
+    # "between 2 and 4 pm": the second half's am/pm also applies to the first
+    start = clock_minutes(m, 1, pm if second_pm is None else second_pm)
+    if start is None or end is None:
+        return None
+    if start >= end and second_pm is not None and meridiem_of(m, 1) is None:
+        start = clock_minutes(m, 1, pm)
+    if start is None or start >= end:
+        return None
+    return start, end
+
+
+def after_rule(m: re.Match, pm: Optional[bool]) -> Optional[Tuple[int, int]]:
+    start = clock_minutes(m, 1, pm)
+    return None if start is None else (start, DAY_MINUTES)
+
+
+def before_rule(m: re.Match, pm: Optional[bool]) -> Optional[Tuple[int, int]]:
+    end = clock_minutes(m, 1, pm)
+    return None if end is None else (0, end)
+
+
+def at_rule(m: re.Match, pm: Optional[bool]) -> Optional[Tuple[int, int]]:
+    point = clock_minutes(m, 1, pm)
+    return None if point is None else (point, point + 1)
+
+
+CLOCK_RULES: List[Tuple[re.Pattern, ClockRule]] = [
+    (re.compile(rf"\b(?:between\s+|from\s+)?{CLOCK}\s*(?:and|to|until|till|-)\s*{CLOCK}\b"), range_rule),
+    (re.compile(r"\bafter\s+lunch\b"), lambda m, pm: (13 * 60, DAY_MINUTES)),
+    (re.compile(r"\bbefore\s+lunch\b"), lambda m, pm: (0, 12 * 60)),
+    (re.compile(rf"\b(?:after|from|not\s+before|no\s+earlier\s+than)\s+{CLOCK}"), after_rule),
+    (re.compile(rf"\b(?:before|by|until|till|not\s+after|no\s+later\s+than)\s+{CLOCK}"), before_rule),
+    (re.compile(rf"(?:\b(?:at|around|about)\s+)?(?<![\d:-]){CLOCK}(?![\d:-])"), at_rule),
+]
+
+
+def take(text: str, m: re.Match) -> str:
+    return f"{text[:m.start()]} {text[m.end():]}"
+
+
+def normalize(expression: str) -> str:
+    text = expression.lower().replace("a.m.", "am").replace("p.m.", "pm")
+    return " ".join(re.sub(r"[,!?;\"()]", " ", text).split())
+
+
+@lru_cache(maxsize=4096)
+def parse_time_expression(expression: str) -> Optional[TimeSpec]:
+    """Parse an expression into a TimeSpec, None if it isn't understood.
+
+    Unknown words make the whole expression unrecognized ("not tomorrow" must not
+    become tomorrow), so callers can ask again instead of booking the wrong slot.
+    """
+    text = normalize(expression)
+    fields: dict = {}
+    matched = False
+
+    for pattern, rule in DAY_RULES:
+        m = pattern.search(text)
+        if m:
+            fields.update(rule(m))
+            text = take(text, m)
+            matched = True
+            break
+    # Dates are out, what is left of dots is a clock ("9.30") or punctuation
+    text = DOTTED_CLOCK.sub(r"\1:\2", text).replace(".", " ")
+
+    # "tonight at 8" is 20:00
+    pm: Optional[bool] = True if "earliest" in fields else None
+    m = PART_OF_DAY_RULE.search(text)
+    if m:
+        fields["earliest"], fields["latest"], pm = PARTS_OF_DAY[m.group(1)]
+        text = take(text, m)
+        matched = True
+
+    m = IN_HOURS_RULE.search(text)
+    if m and not fields:
+        hours, half, minutes = m.group(1, 2, 3)
+        fields["minutes_from_now"] = (
+            30 if half else number(minutes) if minutes else 60 * number(hours)
+        )
+        text = take(text, m)
+        matched = True
+    else:
+        for pattern, rule in CLOCK_RULES:
+            m = pattern.search(text)
+            if m:
+                window = rule(m, pm)
+                if window is None:
+                    return None
+                # A clock time narrows a named part of the day, "morning after 9" is 9 to 12
+                earliest = max(window[0], fields.get("earliest", 0))
+                latest = min(window[1], fields.get("latest", DAY_MINUTES))
+                if earliest >= latest:
+                    return None
+                fields["earliest"], fields["latest"] = earliest, latest
+                text = take(text, m)
+                matched = True
+                break
+
+    for pattern in (ASAP_RULE, ANY_TIME_RULE):
+        m = pattern.search(text)
+        if m:
+            text = take(text, m)
+            matched = True
+
+    if not matched or any(word not in FILLER for word in text.split()):
+        return None
+    return TimeSpec(**fields)
+
+
+# --- Resolution --------------------------------------------------------------
+
+
+def customer_zone(tz_name: Optional[str]) -> Optional[ZoneInfo]:
+    name = tz_name or DEFAULT_CUSTOMER_TIMEZONE
+    if not name:
+        return None
+    try:
+        return ZoneInfo(name)
+    except (ZoneInfoNotFoundError, ValueError):
+        raise UnresolvableTime("unknown_timezone", f"Unknown timezone {tz_name!r}") from None
+
+
+def candidate_days(spec: TimeSpec, today: date) -> List[date]:
+    if spec.days_ahead is not None:
+        return [today + timedelta(days=spec.days_ahead)]
+    next_monday = today + timedelta(days=7 - today.weekday())
+    if spec.whole_next_week:
+        return [next_monday + timedelta(days=i) for i in range(7)]
+    if spec.weekday is not None:
+        if spec.next_week:
+            return [next_monday + timedelta(days=spec.weekday)]
+        ahead = (spec.weekday - today.weekday()) % 7
+        if ahead == 0 and spec.skip_today:
+            ahead = 7
+        return [today + timedelta(days=ahead)]
+    if spec.date is not None:
+        return [resolve_date(spec.date, today)]
+    return [today + timedelta(days=i) for i in range(BOOKING_HORIZON_DAYS + 1)]
+
+
+def resolve_date(parts: Tuple[int, int, int], today: date) -> date:
+    year, month, day = parts
+    if month == 0:
+        # "the 12th": this month, or next month once it has passed. Months without
+        # that day ("the 31st" in April) are skipped.
+        first = today.replace(day=1)
+        for _ in range(12):
+            if day >= today.day or first.month != today.month:
+                try:
+                    return first.replace(day=day)
+                except ValueError:
+                    pass
+            first = (first + timedelta(days=32)).replace(day=1)
+        raise UnresolvableTime("unrecognized", "That date doesn't exist")
+    try:
+        if year:
+            return date(year, month, day)
+        candidate = date(today.year, month, day)
+        return candidate if candidate >= today else date(today.year + 1, month, day)
+    except ValueError:
+        raise UnresolvableTime("unrecognized", "That date doesn't exist") from None
+
+
+def pick_slot(earliest: int, latest: int, not_before: int, point: bool) -> Optional[Tuple[int, int]]:
+    """Best slot of a day for [earliest, latest), starting no sooner than not_before"""
+    open_slots = [slot for slot in SLOTS if slot[0] >= not_before]
+    if not open_slots:
+        return None
+    for slot in open_slots:
+        if earliest <= slot[0] and slot[1] <= latest:
+            return slot
+    for slot in open_slots:
+        if slot[0] < latest and earliest < slot[1]:
+            return slot
+    if point or latest <= SLOTS[0][0] or earliest >= SLOTS[-1][1]:
+        # Outside delivery hours, or its slot has passed: the nearest slot still open
+        return min(open_slots, key=lambda slot: max(slot[0] - latest, earliest - slot[1], 0))
+    return None
+
+
+def resolve_delivery_time(
+    expression: str, tz_name: Optional[str] = None, now: Optional[datetime] = None
+) -> DeliveryWindow:
+    """Delivery window for an expression like "tomorrow morning" said at now.
+
+    tz_name is the customer's IANA timezone, DEFAULT_CUSTOMER_TIMEZONE if not given.
+    Raises UnresolvableTime if the expression isn't understood or names a day
+    without a bookable slot.
+    """
+    spec = parse_time_expression(expression)
+    if spec is None:
+        raise UnresolvableTime("unrecognized", f"Couldn't understand the delivery time {expression!r}")
+    zone = customer_zone(tz_name)
+    if now is None:
+        now = datetime.now(timezone.utc)
+    elif now.tzinfo is None:
+        now = now.replace(tzinfo=service_zone()) if SERVICE_TIMEZONE else now.astimezone()
+    local_now = now.astimezone(zone)
+    today = local_now.date()
+
+    earliest, latest = spec.earliest, spec.latest
+    if spec.minutes_from_now is not None:
+        target = local_now + timedelta(minutes=spec.minutes_from_now)
+        days = [target.date()]
+        earliest = target.hour * 60 + target.minute
+        latest = earliest + 1
+    else:
+        days = candidate_days(spec, today)
+
+    if days[0] < today:
+        raise UnresolvableTime("no_delivery_slot", "That date has already passed")
+    horizon = today + timedelta(days=BOOKING_HORIZON_DAYS)
+    lead = local_now + timedelta(minutes=MIN_LEAD_MINUTES)
+    for day in days:
+        if day > horizon:
+            break
+        if day.weekday() not in DELIVERY_WEEKDAYS:
+            continue
+        not_before = 0
+        if day == lead.date():
+            not_before = lead.hour * 60 + lead.minute + (lead.second > 0 or lead.microsecond > 0)
+        elif day < lead.date():
+            continue
+        slot = pick_slot(earliest, latest, not_before, spec.is_point or spec.minutes_from_now is not None)
+        if slot is not None:
+            start = datetime.combine(day, time(slot[0] // 60, slot[0] % 60), tzinfo=zone or local_now.tzinfo)
+            return DeliveryWindow(start=start, end=start + timedelta(minutes=SLOT_MINUTES))
+
+    if days[-1] > horizon:
+        raise UnresolvableTime(
+            "no_delivery_slot", f"Deliveries can be booked at most {BOOKING_HORIZON_DAYS} days ahead"
+        )
+    if len(days) == 1 and days[0].weekday() not in DELIVERY_WEEKDAYS:
+        raise UnresolvableTime("no_delivery_slot", f"There are no deliveries on {days[0]:%A}s")
+    raise UnresolvableTime(
+        "no_delivery_slot",
+        f"No delivery slot left for that time, deliveries run from "
+        f"{DELIVERY_START_HOUR}:00 to {DELIVERY_END_HOUR}:00, Monday to Saturday",
+    )
@@ -0,0 +1,124 @@
+"""Simulate calls through the RetellAI conversation flow against the backend, in-process.
+
+Usage: python -m simulator [--calls 2000] [--concurrency 200] [--packages 1000]
+                           [--invalid-rate 0.1] [--decline-rate 0.1] [--think-time 0]
+                           [--email-latency 0.05] [--script welcome,confirm-details,...]
+
+Runs on a scratch database seeded with --packages packages unless --database is given.
+Emails are never sent, a fake provider taking --email-latency seconds stands in for Resend.
+"""
+
+import argparse
+import asyncio
+import os
+import tempfile
+import time
+from collections import Counter
+
+import httpx
+
+import database
+from fixtures.generator import fill_packages
+from simulator.flow import ConversationFlow
+from simulator.runner import CallSimulator, LatencyRecorder, offline_emails, random_callers
+
+
+def parse_args() -> argparse.Namespace:
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--flow", default="retellai-voice-agent.json")
+    parser.add_argument("--calls", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=200)
+    parser.add_argument("--packages", type=int, default=1000)
+    parser.add_argument("--database", help="Existing database to run against instead of a scratch one")
+    parser.add_argument("--invalid-rate", type=float, default=0.1, help="Share of callers giving a wrong postal code")
+    parser.add_argument("--decline-rate", type=float, default=0.1, help="Chance to decline at a confirmation node")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean seconds spent at each conversation node")
+    parser.add_argument("--email-latency", type=float, default=0.05)
+    parser.add_argument("--script", help="Comma separated node ids every caller walks")
+    parser.add_argument("--seed", type=int, default=0)
+    return parser.parse_args()
+
+
+async def simulate(args: argparse.Namespace, flow: ConversationFlow, packages: list):
+    # Imported late so the app sees the database path and environment set up in main()
+    from main import app
+    from services.jobs import job_queue
+    from services.latency import DEFAULT_BUDGETS, latency_stats
+    from services.sessions import session_store
+
+    callers = random_callers(
+        packages,
+        args.calls,
+        invalid_rate=args.invalid_rate,
+        decline_rate=args.decline_rate,
+        script=args.script.split(",") if args.script else None,
+        seed=args.seed,
+    )
+    recorder = LatencyRecorder()
+    limits = httpx.Limits(max_connections=None)
+    async with httpx.AsyncClient(
+        transport=httpx.ASGITransport(app=app), base_url="http://simulator", limits=limits
+    ) as client:
+        simulator = CallSimulator(
+            flow, client, os.environ["RETELL_API_KEY"], recorder, think_seconds=args.think_time
+        )
+        with offline_emails(args.email_latency) as emails:
+            started = time.perf_counter()
+            results = await simulator.run(callers, args.concurrency)
+            elapsed = time.perf_counter() - started
+            # Escalation emails are jobs that may still be running
+            await job_queue.wait(timeout=30)
+
+    print(f"{len(results)} calls in {elapsed:.1f}s ({len(results) / elapsed:.0f} calls/s), {len(emails)} emails")
+    print(f"\n{'node':<20} {'count':>7} {'p50 ms':>8} {'p95 ms':>8} {'p99 ms':>8} {'max ms':>8}")
+    for row in recorder.summary():
+        print(
+            f"{row['name']:<20} {row['count']:>7} {row['p50']:>8.1f} {row['p95']:>8.1f} "
+            f"{row['p99']:>8.1f} {row['max']:>8.1f}"
+        )
+
+    print("\nPaths:")
+    for path, count in Counter(" > ".join(r.path) for r in results).most_common():
+        print(f"{count:>7}  {path}")
+
+    errors = Counter(error for r in results for error in r.errors)
+    diverged = sum(r.diverged for r in results)
+    if errors or diverged:
+        print(f"\n{diverged} scripted calls diverged")
+        for error, count in errors.most_common():
+            print(f"{count:>7}  {error}")
+
+    sessions = session_store.snapshot()
+    print(
+        f"\nCall sessions: {sessions['hits']} package lookups answered, {sessions['misses']} read the database, "
+        f"{sessions['overhead_us_per_operation']} µs per store operation"
+    )
+
+    overruns = latency_stats.snapshot(DEFAULT_BUDGETS)["overruns"]
+    if overruns:
+        print(f"\nLatency budget overruns: {overruns}")
+
+
+def main():
+    args = parse_args()
+    flow = ConversationFlow.load(args.flow)
+    os.environ.setdefault("RETELL_API_KEY", "simulator")
+    # Simulated load comes from a handful of tracking numbers, don't let the limiter reject it
+    os.environ.setdefault("RATE_LIMIT_TRACKING_BURST", "1000000000")
+
+    with tempfile.TemporaryDirectory() as tmp:
+        if args.database:
+            database.DATABASE_PATH = args.database
+        else:
+            database.DATABASE_PATH = os.path.join(tmp, "simulator.db")
+            database.init_database()
+            fill_packages(args.packages)
+
+        conn = database.get_db_connection()
+        packages = conn.execute("SELECT tracking_number, postal_code FROM packages").fetchall()
+        conn.close()
+        asyncio.run(simulate(args, flow, [tuple(p) for p in packages]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,107 @@
+import json
+from dataclasses import dataclass, field
+from typing import Dict, List, Optional
+from urllib.parse import urlparse
+
+# Words in an edge's condition that mark it as the unhappy branch
+FAILURE_WORDS = ("error", "fail", "decline")
+
+
+@dataclass(slots=True)
+class Edge:
+    id: str
+    destination: str
+    condition: str
+
+    @property
+    def is_failure(self) -> bool:
+        text = self.condition.lower()
+        return any(word in text for word in FAILURE_WORDS)
+
+
+@dataclass(slots=True)
+class Tool:
+    tool_id: str
+    name: str
+    # Path part of the tool URL, the host is whatever ngrok URL was configured
+    path: str
+    parameters: List[str]
+    required: List[str]
+
+
+@dataclass(slots=True)
+class Node:
+    id: str
+    name: str
+    type: str
+    text: str = ""
+    edges: List[Edge] = field(default_factory=list)
+    tool: Optional[Tool] = None
+
+    def edge_to(self, destination: str) -> Optional[Edge]:
+        return next((e for e in self.edges if e.destination == destination), None)
+
+    def success_edge(self) -> Optional[Edge]:
+        return next((e for e in self.edges if not e.is_failure), None)
+
+    def failure_edge(self) -> Optional[Edge]:
+        return next((e for e in self.edges if e.is_failure), None)
+
+
+@dataclass(slots=True)
+class ConversationFlow:
+    agent_id: str
+    start_node_id: str
+    nodes: Dict[str, Node]
+
+    @classmethod
+    def load(cls, path: str = "retellai-voice-agent.json") -> "ConversationFlow":
+        """Read the conversation flow graph from an exported RetellAI agent"""
+        with open(path) as f:
+            agent = json.load(f)
+        flow = agent["conversationFlow"]
+
+        tools = {
+            tool["tool_id"]: Tool(
+                tool_id=tool["tool_id"],
+                name=tool["name"],
+                path=urlparse(tool["url"]).path,
+                parameters=list(tool.get("parameters", {}).get("properties", {})),
+                required=tool.get("parameters", {}).get("required", []),
+            )
+            for tool in flow.get("tools", [])
+        }
+        nodes = {}
+        for node in flow["nodes"]:
+            instruction = node.get("instruction") or {}
+            nodes[node["id"]] = Node(
+                id=node["id"],
+                name=node.get("name", node["id"]),
+                type=node["type"],
+                text=instruction.get("text", ""),
+                edges=[
+                    Edge(
+                        id=edge["id"],
+                        destination=edge["destination_node_id"],
+                        condition=edge.get("condition")
+                        or edge.get("transition_condition", {}).get("prompt", ""),
+                    )
+                    for edge in node.get("edges", [])
+                ],
+                tool=tools.get(node.get("tool_id")),
+            )
+
+        for node in nodes.values():
+            for edge in node.edges:
+                if edge.destination not in nodes:
+                    raise ValueError(
+                        f"Edge {edge.id} of node {node.id} points to unknown node {edge.destination}"
+                    )
+            if node.type == "function" and node.tool is None:
+                raise ValueError(f"Function node {node.id} has no matching tool")
+
+        return cls(
+            agent_id=agent.get("agent_id") or "simulated-agent",
+            start_node_id=flow["start_node_id"],
+            nodes=nodes,
+        )
@@ -0,0 +1,262 @@
+import asyncio
+import json
+import random
+import time
+import uuid
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from datetime import datetime, timedelta
+from typing import Dict, Iterator, List, Optional, Sequence
+
+import httpx
+from retell.lib.webhook_auth import symmetric
+
+from services.notifications import Channel, FakeTransport, Message, notification_channels
+from simulator.flow import ConversationFlow, Edge, Node
+
+# Safety net against cycles in an edited flow definition
+MAX_STEPS = 50
+
+
+@dataclass(slots=True)
+class Caller:
+    """A simulated customer: the details they give and how cooperative they are"""
+
+    tracking_number: str
+    postal_code: str
+    target_time: datetime
+    # Chance to take the unhappy branch at a conversation node that offers one
+    decline_rate: float = 0.0
+    # Node ids to walk, the caller steers conversation nodes towards them
+    script: Optional[List[str]] = None
+    rng: random.Random = field(default_factory=random.Random)
+
+    def tool_args(self) -> Dict[str, str]:
+        return {
+            "tracking_number": self.tracking_number,
+            "postal_code": self.postal_code,
+            "target_time": self.target_time.isoformat(),
+        }
+
+    def choose(self, node: Node, step: int) -> Edge:
+        if self.script is not None and step + 1 < len(self.script):
+            scripted = node.edge_to(self.script[step + 1])
+            if scripted is not None:
+                return scripted
+        failure = node.failure_edge()
+        if failure is not None and self.rng.random() < self.decline_rate:
+            return failure
+        return node.success_edge() or node.edges[0]
+
+    def says(self, edge: Edge) -> str:
+        condition = edge.condition.lower()
+        if "tracking" in condition:
+            return f"My tracking number is {self.tracking_number} and my postal code is {self.postal_code}"
+        if "time" in condition:
+            return f"{self.target_time:%A %I %p} please"
+        return "No, that's not right" if edge.is_failure else "Yes, that's right"
+
+
+@dataclass(slots=True)
+class CallResult:
+    call_id: str
+    path: List[str]
+    backend_seconds: float
+    # True if the backend sent a scripted caller down a different branch
+    diverged: bool = False
+    errors: List[str] = field(default_factory=list)
+
+
+class LatencyRecorder:
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+
+    def record(self, name: str, seconds: float):
+        self.samples.setdefault(name, []).append(seconds)
+
+    def summary(self) -> List[dict]:
+        """Count and p50/p95/p99/max in milliseconds per recorded name"""
+        rows = []
+        for name, samples in self.samples.items():
+            ordered = sorted(samples)
+            rows.append(
+                {
+                    "name": name,
+                    "count": len(ordered),
+                    **{
+                        f"p{p}": ordered[min(len(ordered) - 1, int(len(ordered) * p / 100))] * 1000
+                        for p in (50, 95, 99)
+                    },
+                    "max": ordered[-1] * 1000,
+                }
+            )
+        return rows
+
+
+class CallSimulator:
+    """Walks callers through the conversation flow against the backend.
+
+    Conversation nodes only cost think time, function nodes call the tool's
+    endpoint and follow the success or failure edge depending on the answer,
+    and the call is framed by signed call_started / call_ended webhooks.
+    """
+
+    def __init__(
+        self,
+        flow: ConversationFlow,
+        client: httpx.AsyncClient,
+        api_key: str,
+        recorder: Optional[LatencyRecorder] = None,
+        think_seconds: float = 0.0,
+    ):
+        self.flow = flow
+        self.client = client
+        self.api_key = api_key
+        self.recorder = recorder or LatencyRecorder()
+        self.think_seconds = think_seconds
+
+    async def post(self, name: str, path: str, result: CallResult, **request) -> httpx.Response:
+        """Timed POST, recorded under name and added to the call's backend time"""
+        started = time.perf_counter()
+        response = await self.client.post(path, **request)
+        elapsed = time.perf_counter() - started
+        self.recorder.record(name, elapsed)
+        result.backend_seconds += elapsed
+        if response.status_code >= 400:
+            result.errors.append(f"{name}: HTTP {response.status_code}")
+        return response
+
+    async def webhook(self, event: str, call: dict, result: CallResult):
+        body = json.dumps({"event": event, "call": call}, separators=(",", ":"), ensure_ascii=False)
+        await self.post(
+            event,
+            "/api/webhooks/events",
+            result,
+            content=body.encode(),
+            headers={
+                "Content-Type": "application/json",
+                "X-Retell-Signature": symmetric["sign"](body, self.api_key),
+            },
+        )
+
+    async def run_call(self, caller: Caller) -> CallResult:
+        call = {
+            "call_id": f"sim-{uuid.uuid4().hex}",
+            "agent_id": self.flow.agent_id,
+            "call_status": "ongoing",
+        }
+        result = CallResult(call_id=call["call_id"], path=[], backend_seconds=0.0)
+        transcript: List[str] = []
+        await self.webhook("call_started", call, result)
+
+        node = self.flow.nodes[self.flow.start_node_id]
+        for step in range(MAX_STEPS):
+            result.path.append(node.id)
+            if node.text:
+                transcript.append(f"Agent: {node.text}")
+            if node.type == "end" or not node.edges:
+                break
+
+            if node.type == "function":
+                args = caller.tool_args()
+                response = await self.post(
+                    node.id,
+                    node.tool.path,
+                    result,
+                    json={
+                        "call": call,
+                        "name": node.tool.name,
+                        "args": {name: args[name] for name in node.tool.parameters if name in args},
+                    },
+                )
+                failed = response.status_code >= 400 or "error_type" in response.json()
+                edge = (node.failure_edge() if failed else node.success_edge()) or node.edges[0]
+                script = caller.script
+                if script and step + 1 < len(script) and edge.destination != script[step + 1]:
+                    result.diverged = True
+            else:
+                if self.think_seconds:
+                    await asyncio.sleep(caller.rng.expovariate(1 / self.think_seconds))
+                edge = caller.choose(node, step)
+                if edge.condition.startswith("User"):
+                    transcript.append(f"User: {caller.says(edge)}")
+            node = self.flow.nodes[edge.destination]
+        else:
+            result.errors.append(f"no end node reached after {MAX_STEPS} steps")
+
+        call["call_status"] = "ended"
+        call["transcript"] = "\n".join(transcript)
+        await self.webhook("call_ended", call, result)
+        self.recorder.record("end_to_end", result.backend_seconds)
+        return result
+
+    async def run(self, callers: Sequence[Caller], concurrency: int) -> List[CallResult]:
+        """Simulate all callers, at most `concurrency` calls at a time"""
+        semaphore = asyncio.Semaphore(concurrency)
+
+        async def limited(caller: Caller) -> CallResult:
+            async with semaphore:
+                return await self.run_call(caller)
+
+        return await asyncio.gather(*(limited(caller) for caller in callers))
+
+
+def random_callers(
+    packages: Sequence[tuple],
+    count: int,
+    invalid_rate: float = 0.0,
+    decline_rate: float = 0.0,
+    script: Optional[List[str]] = None,
+    seed: int = 0,
+) -> List[Caller]:
+    """Callers for (tracking_number, postal_code) pairs, some giving wrong details"""
+    rng = random.Random(seed)
+    start = datetime(2025, 8, 10, 9, 0)
+    callers = []
+    for i in range(count):
+        tracking_number, postal_code = rng.choice(packages)
+        if rng.random() < invalid_rate:
+            postal_code = "00000"
+        callers.append(
+            Caller(
+                tracking_number=tracking_number,
+                postal_code=postal_code,
+                target_time=start + timedelta(hours=rng.randrange(0, 72)),
+                decline_rate=decline_rate,
+                script=script,
+                rng=random.Random(rng.random()),
+            )
+        )
+    return callers
+
+
+class RecordingTransport(FakeTransport):
+    """Fake email provider that remembers the tracking number of every message"""
+
+    def __init__(self, latency_seconds: float = 0.0):
+        super().__init__(latency_seconds)
+        self.tracking_numbers: List[str] = []
+
+    def send(self, message: Message) -> bool:
+        sent = super().send(message)
+        if sent:
+            self.tracking_numbers.append(message.tracking_number)
+        return sent
+
+
+@contextmanager
+def offline_emails(latency_seconds: float = 0.0) -> Iterator[List[str]]:
+    """Send emails through a fake provider that takes latency_seconds and succeeds.
+
+    Swaps the email channel for one without a rate limit, simulated calls send far
+    more than Resend allows. Yields the list of tracking numbers emails were "sent" for.
+    """
+    transport = RecordingTransport(latency_seconds)
+    real = notification_channels["email"]
+    notification_channels["email"] = Channel(
+        "email", transport, workers=real.workers, per_second=1e9, burst=1e9
+    )
+    try:
+        yield transport.tracking_numbers
+    finally:
+        notification_channels["email"] = real
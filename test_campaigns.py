@@ -0,0 +1,335 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from models import CampaignCreate
+from services.campaigns import CampaignDispatcher, CampaignRunner
+from services.database import (
+    create_call_log,
+    create_campaign,
+    get_campaign,
+    get_campaigns,
+    start_due_campaigns,
+    update_campaign_status,
+)
+from services import time_resolution
+from services.dialer import FakeDialer
+
+client = TestClient(app)
+
+NOW = datetime(2025, 8, 1, 9, 0)
+DELIVERY_DAY = datetime(2025, 8, 2)
+
+
+@pytest.fixture
+def db(db):
+    """Fresh database without the seed packages"""
+    conn = database.get_db_connection()
+    conn.execute("DELETE FROM packages")
+    conn.commit()
+    conn.close()
+
+
+def start_campaign(window_seconds: float, **overrides):
+    fields = {
+        "name": "Tomorrow's deliveries",
+        "delivery_from": DELIVERY_DAY,
+        "delivery_to": DELIVERY_DAY + timedelta(days=1),
+        "window_start": NOW,
+        "window_end": NOW + timedelta(seconds=window_seconds),
+        **overrides,
+    }
+    campaign_id = create_campaign(CampaignCreate(**fields))
+    update_campaign_status(campaign_id, "running")
+    return get_campaign(campaign_id)
+
+
+class FakeTime:
+    """Clock that only moves when the runner sleeps"""
+
+    def __init__(self):
+        self.now = 0.0
+        self.slept = []
+
+    def clock(self):
+        return self.now
+
+    async def sleep(self, seconds):
+        self.slept.append(seconds)
+        self.now += seconds
+
+
+def runner(dialer: FakeDialer, now: datetime = NOW) -> CampaignRunner:
+    """Runner on a virtual clock, its dials are paced without waiting"""
+    fake_time = FakeTime()
+    return CampaignRunner(dialer, clock=fake_time.clock, sleep=fake_time.sleep, now=lambda: now)
+
+
+class TestCampaignRunner:
+    def test_calls_every_scheduled_package_once(self, fill_packages):
+        """Only scheduled packages in the delivery range are dialed, each one once"""
+        fill_packages(20)
+        fill_packages(5, status="delivered")
+        campaign = start_campaign(3600)
+        dialer = FakeDialer()
+
+        dialed = asyncio.run(runner(dialer).run(campaign))
+
+        assert dialed == 20
+        assert len({d["tracking_number"] for d in dialer.dialed}) == 20
+        finished = get_campaign(campaign.id)
+        assert finished.status == "completed"
+        assert finished.attempts == 20
+        assert finished.completed_calls == 0
+
+        # Running it again finds nothing left to call
+        assert asyncio.run(runner(dialer).run(campaign)) == 0
+
+    def test_dials_are_spread_over_the_window(self, fill_packages):
+        """10 packages in a 100s window are dialed 10s apart"""
+        fill_packages(10)
+        campaign = start_campaign(100)
+        fake_time = FakeTime()
+        runner = CampaignRunner(
+            FakeDialer(), clock=fake_time.clock, sleep=fake_time.sleep, now=lambda: NOW
+        )
+
+        asyncio.run(runner.run(campaign))
+
+        assert fake_time.slept == pytest.approx([10.0] * 9)
+
+    def test_concurrent_dials_are_capped(self, fill_packages):
+        fill_packages(50)
+        campaign = start_campaign(3600, max_concurrent_dials=4)
+        dialer = FakeDialer(latency_seconds=0.01)
+
+        asyncio.run(runner(dialer).run(campaign))
+
+        assert dialer.max_in_flight == 4
+        assert len(dialer.dialed) == 50
+
+    def test_failed_dials_are_logged_and_retried(self, fill_packages):
+        """Failed dials count as attempts, a second run retries up to max_attempts"""
+        fill_packages(100)
+        campaign = start_campaign(3600, max_attempts=2)
+        dialer = FakeDialer(failure_rate=0.5, seed=1)
+
+        assert asyncio.run(runner(dialer).run(campaign)) == 100
+        failures = get_campaign(campaign.id).dial_failures
+        assert 0 < failures < 100
+
+        # Every package has one attempt left, whether its first dial failed or not
+        assert asyncio.run(runner(dialer).run(campaign)) == 100
+        assert get_campaign(campaign.id).attempts == 200
+
+    def test_crashing_dialer_is_logged(self, fill_packages, caplog):
+        """Only DialError counts as a failed dial, a dialer bug is logged with its traceback"""
+        fill_packages(3)
+        campaign = start_campaign(3600)
+
+        class BrokenDialer(FakeDialer):
+            async def dial(self, to_number, metadata):
+                if not self.dialed:
+                    self.dialed.append(metadata)
+                    raise RuntimeError("bug")
+                return await super().dial(to_number, metadata)
+
+        assert asyncio.run(runner(BrokenDialer()).run(campaign)) == 3
+        assert get_campaign(campaign.id).attempts == 2
+        [crash] = [r for r in caplog.records if r.getMessage() == f"Campaign {campaign.id} dial crashed"]
+        assert crash.exc_info[0] is RuntimeError
+
+    def test_cancelled_campaign_stops_after_current_page(self, fill_packages, monkeypatch):
+        monkeypatch.setattr("services.campaigns.TARGET_PAGE_SIZE", 10)
+        fill_packages(50)
+        # One dial at a time, so the cancelling dial runs before the page ends
+        campaign = start_campaign(3600, max_concurrent_dials=1)
+
+        class CancellingDialer(FakeDialer):
+            async def dial(self, to_number, metadata):
+                if not self.dialed:
+                    update_campaign_status(campaign.id, "cancelled")
+                return await super().dial(to_number, metadata)
+
+        dialed = asyncio.run(runner(CancellingDialer()).run(campaign))
+
+        assert dialed == 10
+        assert get_campaign(campaign.id).status == "cancelled"
+
+    def test_100k_packages_throughput(self, fill_packages):
+        """A day's worth of packages is dialed in seconds with a zero-latency dialer"""
+        fill_packages(100_000)
+        campaign = start_campaign(3600, max_concurrent_dials=100)
+        dialer = FakeDialer()
+
+        started = time.perf_counter()
+        dialed = asyncio.run(runner(dialer).run(campaign))
+        elapsed = time.perf_counter() - started
+
+        assert dialed == 100_000
+        assert get_campaign(campaign.id).attempts == 100_000
+        assert elapsed < 60
+
+    def test_call_started_before_the_attempt_is_logged(self, fill_packages):
+        """The webhook's call log of a dialed call becomes the campaign attempt"""
+        fill_packages(3)
+        campaign = start_campaign(3600)
+
+        class WebhookFirstDialer(FakeDialer):
+            async def dial(self, to_number, metadata):
+                call_id = await super().dial(to_number, metadata)
+                create_call_log(call_id)
+                return call_id
+
+        assert asyncio.run(runner(WebhookFirstDialer()).run(campaign)) == 3
+        assert get_campaign(campaign.id).attempts == 3
+        assert asyncio.run(runner(WebhookFirstDialer()).run(campaign)) == 0
+
+    def test_nothing_is_dialed_after_the_window_closed(self, fill_packages):
+        fill_packages(10)
+        campaign = start_campaign(100)
+        dialer = FakeDialer()
+
+        assert asyncio.run(runner(dialer, now=NOW + timedelta(days=1)).run(campaign)) == 0
+        assert dialer.dialed == []
+        assert get_campaign(campaign.id).status == "completed"
+
+    def test_dials_running_late_stop_at_the_window_end(self, fill_packages):
+        """Dials taking 30s one at a time fit only partly into a 100s window"""
+        fill_packages(10)
+        campaign = start_campaign(100, max_concurrent_dials=1)
+        fake_time = FakeTime()
+
+        class SlowDialer(FakeDialer):
+            async def dial(self, to_number, metadata):
+                fake_time.now += 30
+                return await super().dial(to_number, metadata)
+
+        dialer = SlowDialer()
+        runner = CampaignRunner(dialer, clock=fake_time.clock, sleep=fake_time.sleep, now=lambda: NOW)
+        dialed = asyncio.run(runner.run(campaign))
+
+        assert 0 < dialed < 10 and len(dialer.dialed) == dialed
+        assert get_campaign(campaign.id).attempts == dialed
+        assert get_campaign(campaign.id).status == "completed"
+
+
+class TestCampaignDispatcher:
+    def test_starts_due_campaigns(self, fill_packages):
+        fill_packages(3)
+        due = create_campaign(
+            CampaignCreate(
+                name="due",
+                delivery_from=DELIVERY_DAY,
+                delivery_to=DELIVERY_DAY + timedelta(days=1),
+                window_start=NOW - timedelta(minutes=1),
+                window_end=NOW + timedelta(minutes=1),
+            )
+        )
+        expired = create_campaign(
+            CampaignCreate(
+                name="expired",
+                delivery_from=DELIVERY_DAY,
+                delivery_to=DELIVERY_DAY + timedelta(days=1),
+                window_start=NOW - timedelta(hours=2),
+                window_end=NOW - timedelta(hours=1),
+            )
+        )
+        later = create_campaign(
+            CampaignCreate(
+                name="later",
+                delivery_from=DELIVERY_DAY,
+                delivery_to=DELIVERY_DAY + timedelta(days=1),
+                window_start=NOW + timedelta(hours=1),
+                window_end=NOW + timedelta(hours=2),
+            )
+        )
+        dispatcher = CampaignDispatcher(runner(FakeDialer()))
+
+        async def dispatch_and_wait():
+            await dispatcher.dispatch()
+            await asyncio.gather(*dispatcher.active.values())
+
+        asyncio.run(dispatch_and_wait())
+
+        assert get_campaign(due).status == "completed"
+        assert get_campaign(due).attempts == 3
+        assert get_campaign(later).status == "pending"
+        assert (get_campaign(expired).status, get_campaign(expired).attempts) == ("completed", 0)
+
+    def test_stop_logs_the_dialed_attempts(self, fill_packages):
+        """A stopped campaign stays running and its next run skips who was called"""
+        fill_packages(10)
+        # One dial every 10s, only the first one happens before stop
+        start_campaign(100)
+        dialer = FakeDialer(latency_seconds=0.01)
+        dispatcher = CampaignDispatcher(CampaignRunner(dialer, now=lambda: NOW))
+
+        async def dispatch_and_stop():
+            await dispatcher.dispatch()
+            await asyncio.sleep(0.005)
+            await dispatcher.stop()
+
+        asyncio.run(dispatch_and_stop())
+
+        campaign = get_campaigns()[0]
+        assert (len(dialer.dialed), campaign.attempts, campaign.status) == (1, 1, "running")
+        assert asyncio.run(runner(dialer).run(campaign)) == 9
+
+
+class TestCampaignEndpoints:
+    def test_create_list_and_cancel(self, db):
+        body = {
+            "name": "Tomorrow",
+            "delivery_from": "2025-08-02T00:00:00",
+            "delivery_to": "2025-08-03T00:00:00",
+            "window_start": "2025-08-01T09:00:00",
+            "window_end": "2025-08-01T17:00:00",
+            "max_concurrent_dials": 5,
+        }
+        response = client.post("/api/campaigns", json=body)
+        assert response.status_code == 200
+        campaign = response.json()
+        assert campaign["status"] == "pending"
+        assert campaign["attempts"] == 0
+
+        assert [c["id"] for c in client.get("/api/campaigns").json()] == [campaign["id"]]
+
+        response = client.post(f"/api/campaigns/{campaign['id']}/cancel")
+        assert response.json()["status"] == "cancelled"
+        assert client.post("/api/campaigns/999/cancel").status_code == 404
+
+    def test_rejects_empty_window(self, db):
+        response = client.post(
+            "/api/campaigns",
+            json={
+                "name": "Backwards",
+                "delivery_from": "2025-08-02T00:00:00",
+                "delivery_to": "2025-08-03T00:00:00",
+                "window_start": "2025-08-01T17:00:00",
+                "window_end": "2025-08-01T09:00:00",
+            },
+        )
+        assert response.status_code == 422
+
+    def test_utc_timestamps_are_stored_in_service_time(self, fill_packages, monkeypatch):
+        """A window given in UTC starts and is dialed like one given in SERVICE_TIMEZONE"""
+        monkeypatch.setattr(time_resolution, "SERVICE_TIMEZONE", "Europe/Berlin")
+        fill_packages(3)
+        body = {
+            "name": "From UTC",
+            "delivery_from": "2025-08-01T22:00:00Z",
+            "delivery_to": "2025-08-02T22:00:00Z",
+            "window_start": "2025-08-01T07:00:00Z",
+            "window_end": "2025-08-01T10:00:00+02:00",
+        }
+        campaign = client.post("/api/campaigns", json=body).json()
+        assert (campaign["window_start"], campaign["window_end"]) == ("2025-08-01T09:00:00", "2025-08-01T10:00:00")
+
+        assert start_due_campaigns(NOW) == 1
+        assert asyncio.run(runner(FakeDialer()).run(get_campaign(campaign["id"]))) == 3
@@ -0,0 +1,44 @@
+import pytest
+
+import database
+from services.coordination import ChangeMonitor, LeaderElection
+from services.database import create_call_log, find_call_log_by_retell_call_id
+
+
+class TestLeaderElection:
+    def test_only_one_leader(self, tmp_path):
+        """A second candidate can't take the lock until the leader releases it"""
+        lock_path = str(tmp_path / "leader-lock")
+        leader = LeaderElection(lock_path)
+        follower = LeaderElection(lock_path)
+
+        assert leader.try_acquire()
+        assert not follower.try_acquire()
+
+        leader.release()
+        assert follower.try_acquire()
+        follower.release()
+
+
+class TestWrites:
+    @pytest.mark.parametrize("multi_process", [False, True])
+    def test_write_connection_commits_and_rolls_back(self, db, monkeypatch, multi_process):
+        """Writes commit on success and leave nothing behind on error"""
+        monkeypatch.setattr(database, "MULTI_PROCESS", multi_process)
+        create_call_log(retell_call_id="committed")
+        assert find_call_log_by_retell_call_id("committed") is not None
+
+        with pytest.raises(RuntimeError):
+            with database.write_connection() as conn:
+                conn.execute("INSERT INTO call_logs (retell_call_id) VALUES ('rolled-back')")
+                raise RuntimeError("boom")
+        assert find_call_log_by_retell_call_id("rolled-back") is None
+
+    def test_change_monitor_sees_commits(self, db):
+        """data_version moves when any other connection commits"""
+        monitor = ChangeMonitor()
+        before = monitor.version()
+        assert monitor.version() == before
+
+        create_call_log(retell_call_id="new-call")
+        assert monitor.version() != before
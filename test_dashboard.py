@@ -0,0 +1,302 @@
+import csv
+import io
+import json
+import sqlite3
+import pytest
+from datetime import datetime, timedelta, timezone
+from typing import List
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+from pydantic import TypeAdapter
+
+import database
+from main import app
+from models import CallLog, Package
+from services.database import (
+    OPEN_CALL_MAX_AGE,
+    create_call_log,
+    get_all_call_logs,
+    get_all_package_rows,
+    get_all_packages,
+    get_call_log_export_watermark,
+    get_package_by_tracking_number,
+    update_call_log_completed_by_retell_call_id,
+    update_package_schedule,
+)
+
+client = TestClient(app)
+
+
+class TestCallLogSearch:
+    def test_search_ranks_and_highlights(self, db):
+        """Phrase search finds updated transcripts and highlights the match"""
+        create_call_log(retell_call_id="call-a")
+        update_call_log_completed_by_retell_call_id(
+            "call-a", "User: the parcel was left at neighbor again"
+        )
+        create_call_log(retell_call_id="call-b")
+        update_call_log_completed_by_retell_call_id("call-b", "User: it arrived damaged")
+
+        response = client.get("/api/call_logs/search", params={"q": '"left at neighbor"'})
+        assert response.status_code == 200
+        data = response.json()
+        assert data["total"] == 1
+        assert data["results"][0]["retell_call_id"] == "call-a"
+        assert "<mark>left at neighbor</mark>" in data["results"][0]["snippet"]
+
+    def test_snippet_markup_is_escaped(self, db):
+        """Only the match marks are HTML, markup spoken or injected into a transcript is text"""
+        create_call_log(retell_call_id="call-x")
+        update_call_log_completed_by_retell_call_id(
+            "call-x", 'User: my parcel <img src=x onerror="alert(1)"> & <mark>box</mark> is late'
+        )
+
+        snippet = client.get("/api/call_logs/search", params={"q": "parcel"}).json()["results"][0]["snippet"]
+
+        assert snippet.startswith("User: my <mark>parcel</mark> &lt;img src=x onerror=&quot;alert(1)&quot;&gt; &amp;")
+        assert "&lt;mark&gt;box&lt;/mark&gt;" in snippet
+
+    def test_search_pagination_and_operator_input(self, db):
+        """Paging works and FTS operator characters in the query are harmless"""
+        for i in range(3):
+            create_call_log(retell_call_id=f"call-{i}")
+            update_call_log_completed_by_retell_call_id(f"call-{i}", "box damaged")
+
+        page = client.get(
+            "/api/call_logs/search", params={"q": "damaged", "limit": 2, "offset": 2}
+        ).json()
+        assert page["total"] == 3
+        assert len(page["results"]) == 1
+
+        response = client.get("/api/call_logs/search", params={"q": 'NEAR( "damaged'})
+        assert response.status_code == 200
+
+    def test_rebuild_indexes_existing_rows(self, db):
+        """Rows written behind the index's back are found after a rebuild"""
+        conn = database.get_db_connection()
+        conn.execute("DROP TRIGGER call_logs_fts_insert")
+        conn.execute(
+            "INSERT INTO call_logs (retell_call_id, transcript) VALUES ('old-call', 'driver never rang')"
+        )
+        conn.commit()
+        conn.close()
+        assert client.get("/api/call_logs/search", params={"q": "rang"}).json()["total"] == 0
+
+        database.rebuild_search_index()
+        assert client.get("/api/call_logs/search", params={"q": "rang"}).json()["total"] == 1
+
+
+class TestListSerialization:
+    def test_fast_path_matches_model_serialization(self, db):
+        """Row serialization produces the same JSON as validating through the models"""
+        create_call_log(retell_call_id="call-a")
+        update_call_log_completed_by_retell_call_id("call-a", "hello")
+
+        packages = client.get("/api/packages").json()
+        call_logs = client.get("/api/call_logs").json()
+
+        assert packages == TypeAdapter(List[Package]).dump_python(
+            [Package.model_validate(p, from_attributes=True) for p in get_all_packages()],
+            mode="json",
+        )
+        assert call_logs == TypeAdapter(List[CallLog]).dump_python(
+            [CallLog.model_validate(c, from_attributes=True) for c in get_all_call_logs()],
+            mode="json",
+        )
+
+    def test_large_lists_are_gzipped(self, db):
+        """Big list responses are compressed when the client accepts gzip"""
+        for i in range(100):
+            create_call_log(retell_call_id=f"call-{i}")
+            update_call_log_completed_by_retell_call_id(f"call-{i}", "transcript " * 20)
+
+        response = client.get("/api/call_logs", headers={"Accept-Encoding": "gzip"})
+        assert response.headers["content-encoding"] == "gzip"
+        assert len(response.json()) == 100
+
+
+class TestSnapshotCaching:
+    def test_unchanged_list_is_not_modified(self, db):
+        first = client.get("/api/packages")
+        assert first.headers["cache-control"] == "no-cache"
+
+        by_etag = client.get("/api/packages", headers={"If-None-Match": first.headers["etag"]})
+        by_date = client.get(
+            "/api/packages", headers={"If-Modified-Since": first.headers["last-modified"]}
+        )
+
+        assert by_etag.status_code == 304
+        assert by_etag.content == b""
+        assert by_etag.headers["etag"] == first.headers["etag"]
+        assert by_date.status_code == 304
+
+    def test_polls_without_changes_dont_query(self, db):
+        with patch("api.dashboard.get_all_package_rows", wraps=get_all_package_rows) as rows:
+            for _ in range(3):
+                client.get("/api/packages")
+        assert rows.call_count == 1
+
+    def test_commit_of_another_process_invalidates(self, db):
+        etag = client.get("/api/packages").headers["etag"]
+        # A plain connection, like another worker process would commit with
+        conn = sqlite3.connect(database.DATABASE_PATH)
+        conn.execute("UPDATE packages SET status = 'delivered' WHERE tracking_number = '002'")
+        conn.commit()
+        conn.close()
+
+        response = client.get("/api/packages", headers={"If-None-Match": etag})
+
+        assert response.status_code == 200
+        assert response.headers["etag"] != etag
+        statuses = {p["tracking_number"]: p["status"] for p in response.json()}
+        assert statuses["002"] == "delivered"
+
+    def test_unrelated_commit_keeps_the_etag(self, db):
+        """A new call log rebuilds the package snapshot, but its content and ETag stay the same"""
+        packages_etag = client.get("/api/packages").headers["etag"]
+        call_logs_etag = client.get("/api/call_logs").headers["etag"]
+        create_call_log(retell_call_id="call-a")
+
+        packages = client.get("/api/packages", headers={"If-None-Match": packages_etag})
+        call_logs = client.get("/api/call_logs", headers={"If-None-Match": call_logs_etag})
+
+        assert packages.status_code == 304
+        assert call_logs.status_code == 200
+        assert [log["retell_call_id"] for log in call_logs.json()] == ["call-a"]
+
+
+class TestExports:
+    def test_ndjson_export_with_watermark(self, db):
+        """NDJSON export streams every row and an incremental run only gets new rows"""
+        create_call_log(retell_call_id="call-a")
+        update_call_log_completed_by_retell_call_id("call-a", "Hello")
+        response = client.get("/api/export/call_logs")
+        assert response.headers["content-type"] == "application/x-ndjson"
+        lines = response.text.splitlines()
+        assert [json.loads(line)["retell_call_id"] for line in lines] == ["call-a"]
+        watermark = response.headers["x-export-watermark"]
+
+        create_call_log(retell_call_id="call-b")
+        update_call_log_completed_by_retell_call_id("call-b", "Hi")
+        response = client.get("/api/export/call_logs", params={"since_id": watermark})
+        assert [json.loads(line)["retell_call_id"] for line in response.text.splitlines()] == [
+            "call-b"
+        ]
+
+    def test_calls_in_progress_are_exported_once_they_ended(self, db):
+        """An open call holds back the watermark, so its transcript isn't missed"""
+        create_call_log(retell_call_id="call-open")
+        create_call_log(retell_call_id="call-done")
+        update_call_log_completed_by_retell_call_id("call-done", "Bye")
+
+        response = client.get("/api/export/call_logs")
+        assert response.text == ""
+        watermark = response.headers["x-export-watermark"]
+
+        update_call_log_completed_by_retell_call_id("call-open", "Finally")
+        response = client.get("/api/export/call_logs", params={"since_id": watermark})
+        exported = [json.loads(line) for line in response.text.splitlines()]
+        assert [(log["retell_call_id"], log["transcript"]) for log in exported] == [
+            ("call-open", "Finally"),
+            ("call-done", "Bye"),
+        ]
+
+    def test_abandoned_calls_stop_holding_back_exports(self, db):
+        create_call_log(retell_call_id="call-lost")
+        later = datetime.now() + OPEN_CALL_MAX_AGE + timedelta(minutes=1)
+        assert get_call_log_export_watermark(later) == get_call_log_export_watermark() + 1
+
+    def test_since_with_a_utc_offset(self, db):
+        """An aware since is compared in the service timezone, not as a string"""
+        create_call_log(retell_call_id="call-a")
+        since = datetime.now().astimezone(timezone(timedelta(hours=-5)))
+        create_call_log(retell_call_id="call-b")
+        for retell_call_id in ("call-a", "call-b"):
+            update_call_log_completed_by_retell_call_id(retell_call_id, "Bye")
+
+        response = client.get("/api/export/call_logs", params={"since": since.isoformat()})
+        assert [json.loads(line)["retell_call_id"] for line in response.text.splitlines()] == ["call-b"]
+
+    def test_csv_export(self, db):
+        """CSV export has a header row and ISO timestamps"""
+        response = client.get("/api/export/packages", params={"format": "csv"})
+        rows = list(csv.reader(io.StringIO(response.text)))
+        assert rows[0][:2] == ["id", "tracking_number"]
+        assert len(rows) == 4
+        assert "T" in rows[1][-1]
+
+
+class TestScheduleHistory:
+    def reschedule(self, call_id: str, target_time: str):
+        with patch("api.functions.send_reschedule_confirmation_email", return_value=True):
+            response = client.post(
+                "/api/functions/reschedule",
+                json={
+                    "call": {"call_id": call_id},
+                    "name": "reschedule",
+                    "args": {"tracking_number": "002", "postal_code": "67890", "target_time": target_time},
+                },
+            )
+        assert response.json()["message"] == "Package rescheduled successfully"
+
+    def test_history_and_point_in_time(self, db):
+        """Every reschedule is logged with its call, and past schedules can be looked up"""
+        original = get_package_by_tracking_number("002").scheduled_at
+        before = datetime.now()
+        self.reschedule("call-1", "2025-08-10T14:00:00")
+        between = datetime.now()
+        self.reschedule("call-2", "2025-08-11T09:00:00")
+
+        history = client.get("/api/packages/002/schedule_history").json()
+        assert [(c["previous_scheduled_at"], c["scheduled_at"], c["retell_call_id"]) for c in history] == [
+            (original.isoformat(), "2025-08-10T14:00:00", "call-1"),
+            ("2025-08-10T14:00:00", "2025-08-11T09:00:00", "call-2"),
+        ]
+        assert client.get("/api/call_logs/call-2/schedule_changes").json() == history[1:]
+
+        def as_of(when: datetime):
+            response = client.get("/api/packages/002/schedule", params={"as_of": when.isoformat()})
+            return response.json()["scheduled_at"]
+
+        assert as_of(before) == original.isoformat()
+        assert as_of(between) == "2025-08-10T14:00:00"
+        assert as_of(between.astimezone(timezone(timedelta(hours=-5)))) == "2025-08-10T14:00:00"
+        assert as_of(datetime.now()) == "2025-08-11T09:00:00"
+        # Packages that were never rescheduled have their current time
+        assert as_of(before) != client.get("/api/packages/001/schedule", params={"as_of": before.isoformat()}).json()
+        assert client.get("/api/packages/nope/schedule", params={"as_of": before.isoformat()}).status_code == 404
+
+        counts = client.get("/api/packages/reschedules").json()
+        assert [(c["tracking_number"], c["reschedules"]) for c in counts] == [("002", 2)]
+        assert client.get("/api/packages/reschedules", params={"min_count": 3}).json() == []
+
+    def test_history_is_append_only(self, db):
+        update_package_schedule("002", datetime(2025, 8, 10, 14, 0))
+        conn = database.get_db_connection()
+        try:
+            with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+                conn.execute("UPDATE package_schedule_history SET scheduled_at = '2030-01-01'")
+            with pytest.raises(sqlite3.IntegrityError, match="append-only"):
+                conn.execute("DELETE FROM package_schedule_history")
+        finally:
+            conn.close()
+
+    @pytest.mark.parametrize(
+        "sql",
+        [
+            "SELECT scheduled_at FROM package_schedule_history WHERE tracking_number = '002' "
+            "AND changed_at <= '2025-08-10' ORDER BY changed_at DESC LIMIT 1",
+            "SELECT previous_scheduled_at FROM package_schedule_history WHERE tracking_number = '002' "
+            "AND changed_at > '2025-08-10' ORDER BY changed_at LIMIT 1",
+            "SELECT tracking_number, COUNT(*), MAX(changed_at) FROM package_schedule_history "
+            "GROUP BY tracking_number",
+        ],
+    )
+    def test_queries_are_answered_from_the_index(self, db, sql):
+        conn = database.get_db_connection()
+        try:
+            plan = " ".join(row[3] for row in conn.execute(f"EXPLAIN QUERY PLAN {sql}"))
+        finally:
+            conn.close()
+        assert "COVERING INDEX idx_schedule_history_as_of" in plan
+        assert "TEMP B-TREE" not in plan
@@ -0,0 +1,107 @@
+import hashlib
+import os
+from datetime import datetime
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from fixtures import generator
+from fixtures.generator import cached_snapshot, create_snapshot, load_snapshot
+from main import app
+from services.database import check_query_plans, search_call_logs
+
+ANCHOR = datetime(2025, 8, 1)
+PACKAGES = 3000
+CALLS = 1000
+
+
+@pytest.fixture(scope="module")
+def snapshot(tmp_path_factory):
+    path = str(tmp_path_factory.mktemp("snapshots") / "small.db")
+    create_snapshot(path, PACKAGES, CALLS, seed=7, anchor=ANCHOR)
+    return path
+
+
+@pytest.fixture
+def db(snapshot, tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    load_snapshot(snapshot)
+
+
+def table_digest(path: str, table: str) -> str:
+    conn = database.get_db_connection(path=path)
+    digest = hashlib.sha256()
+    # Seed packages 001 to 003 are relative to today
+    for row in conn.execute(f"SELECT * FROM {table} WHERE id > 3 ORDER BY id"):
+        digest.update(repr(tuple(row)).encode())
+    conn.close()
+    return digest.hexdigest()
+
+
+def test_same_seed_same_rows(snapshot, tmp_path):
+    again = str(tmp_path / "again.db")
+    other_seed = str(tmp_path / "other.db")
+    create_snapshot(again, PACKAGES, CALLS, seed=7, anchor=ANCHOR)
+    create_snapshot(other_seed, PACKAGES, CALLS, seed=8, anchor=ANCHOR)
+
+    for table in ("packages", "call_logs"):
+        assert table_digest(again, table) == table_digest(snapshot, table)
+        assert table_digest(other_seed, table) != table_digest(snapshot, table)
+
+
+def test_distributions_are_realistic(db):
+    conn = database.get_db_connection()
+    statuses = dict(conn.execute("SELECT status, COUNT(*) FROM packages GROUP BY status").fetchall())
+    escalated, verified, open_calls, avg_transcript = conn.execute(
+        """
+        SELECT AVG(escalated IS NOT NULL), AVG(tracking_number IS NOT NULL),
+               AVG(completed IS NULL), AVG(LENGTH(transcript))
+        FROM call_logs
+    """
+    ).fetchone()
+    upcoming = conn.execute(
+        "SELECT COUNT(*) FROM packages WHERE status = 'scheduled' AND scheduled_at > ?", (ANCHOR.isoformat(),)
+    ).fetchone()[0]
+    conn.close()
+
+    total = PACKAGES + 3  # plus the seed packages
+    assert sum(statuses.values()) == total
+    assert statuses["scheduled"] / total == pytest.approx(0.55, abs=0.05)
+    assert statuses["delivered"] / total == pytest.approx(0.30, abs=0.05)
+    assert upcoming >= statuses["scheduled"] - 1  # 002 is relative to today
+    assert escalated == pytest.approx(generator.ESCALATION_RATE, abs=0.04)
+    assert verified == pytest.approx(1 - generator.UNVERIFIED_CALL_RATE, abs=0.04)
+    assert open_calls < 0.05
+    assert 500 < avg_transcript < 2500
+
+
+def test_loaded_snapshot_is_indexed_and_searchable(db):
+    assert check_query_plans() == []
+    assert search_call_logs("neighbor", limit=5).total > 0
+
+
+def test_loaded_snapshot_serves_tool_calls(db):
+    client = TestClient(app)
+    conn = database.get_db_connection()
+    tracking_number, postal_code = conn.execute(
+        "SELECT tracking_number, postal_code FROM packages WHERE status = 'scheduled' LIMIT 1 OFFSET 100"
+    ).fetchone()
+    conn.close()
+
+    seeded = {"tracking_number": "001", "postal_code": "12345"}
+    for args in (seeded, {"tracking_number": tracking_number, "postal_code": postal_code}):
+        response = client.post(
+            "/api/functions/verify_package",
+            json={"call": {"call_id": "fixture-call"}, "name": "verify_package", "args": args},
+        )
+        assert response.json()["tracking_number"] == args["tracking_number"]
+
+
+def test_cached_snapshot_is_generated_once(tmp_path):
+    first = cached_snapshot(200, 50, anchor=ANCHOR, directory=str(tmp_path))
+    modified = os.path.getmtime(first)
+
+    assert cached_snapshot(200, 50, anchor=ANCHOR, directory=str(tmp_path)) == first
+    assert os.path.getmtime(first) == modified
+    assert cached_snapshot(200, 50, seed=1, anchor=ANCHOR, directory=str(tmp_path)) != first
@@ -0,0 +1,204 @@
+import threading
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services import latency
+from services.database import (
+    get_package_by_tracking_and_postal,
+    update_package_schedule,
+)
+from services.rate_limit import FunctionRateLimiter, InMemoryRateLimitBackend
+
+BUDGET = 0.3
+SLOW = 1.0
+# Scheduling slack on top of the budget for the test client round trip
+SLACK = 0.25
+
+RESCHEDULE = {
+    "call": {"call_id": "slow-call"},
+    "name": "reschedule",
+    "args": {
+        "tracking_number": "002",
+        "postal_code": "67890",
+        "target_time": "2025-08-10T14:00:00",
+    },
+}
+VERIFY = {
+    "call": {"call_id": "slow-call"},
+    "name": "verify_package",
+    "args": {"tracking_number": "001", "postal_code": "12345"},
+}
+ESCALATE = {
+    "call": {"call_id": "slow-call"},
+    "name": "escalate",
+    "args": {"tracking_number": "001", "postal_code": "12345"},
+}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    """Seeded database, fresh limiter and counters, small budgets"""
+    monkeypatch.setattr(
+        "api.functions.rate_limiter", FunctionRateLimiter(InMemoryRateLimitBackend())
+    )
+    for endpoint in latency.DEFAULT_BUDGETS:
+        monkeypatch.setitem(latency.DEFAULT_BUDGETS, endpoint, BUDGET)
+    latency.latency_stats.reset()
+    # Keep one event loop for the whole test so work that outlives a request can finish
+    with TestClient(app) as client:
+        yield client
+
+
+def slow(fn=None, result=None):
+    """Stand-in for a dependency that takes SLOW seconds, signals when it's done"""
+    done = threading.Event()
+
+    def call(*args, **kwargs):
+        time.sleep(SLOW)
+        value = fn(*args, **kwargs) if fn else result
+        done.set()
+        return value
+
+    call.done = done
+    return call
+
+
+def timed_post(client, path, body):
+    started = time.perf_counter()
+    response = client.post(path, json=body)
+    return response, time.perf_counter() - started
+
+
+class TestReschedule:
+    def test_slow_email_returns_degraded_success(self, client, monkeypatch):
+        email = slow(result=True)
+        monkeypatch.setattr("api.functions.send_reschedule_confirmation_email", email)
+
+        response, elapsed = timed_post(client, "/api/functions/reschedule", RESCHEDULE)
+
+        assert elapsed < BUDGET + SLACK
+        data = response.json()
+        assert data["message"] == "Package rescheduled successfully, the confirmation email will follow"
+        assert data["new_schedule"] == "2025-08-10T14:00:00"
+        # The email is still sent after the response
+        assert email.done.wait(SLOW * 2)
+        assert latency.latency_stats.overruns[("reschedule", "email")] == 1
+
+    def test_slow_write_confirms_once_it_lands(self, client, monkeypatch):
+        write = slow(update_package_schedule)
+        sent = threading.Event()
+        monkeypatch.setattr("api.functions.update_package_schedule", write)
+        monkeypatch.setattr(
+            "api.functions.send_reschedule_confirmation_email",
+            lambda **email: sent.set() or True,
+        )
+
+        response, elapsed = timed_post(client, "/api/functions/reschedule", RESCHEDULE)
+
+        assert elapsed < BUDGET + SLACK
+        assert response.json()["message"] == "Reschedule is being processed, a confirmation email will follow"
+        assert sent.wait(SLOW * 2)
+        assert get_package_by_tracking_and_postal("002", "67890").scheduled_at.isoformat() == "2025-08-10T14:00:00"
+        assert latency.latency_stats.overruns[("reschedule", "database")] == 1
+
+    def test_slow_lookup_returns_service_degraded(self, client, monkeypatch):
+        monkeypatch.setattr(
+            "api.functions.get_package_by_tracking_and_postal",
+            slow(get_package_by_tracking_and_postal),
+        )
+        email = slow(result=True)
+        monkeypatch.setattr("api.functions.send_reschedule_confirmation_email", email)
+
+        response, elapsed = timed_post(client, "/api/functions/reschedule", RESCHEDULE)
+
+        assert elapsed < BUDGET + SLACK
+        assert response.json()["error_type"] == "service_degraded"
+        assert not email.done.wait(SLOW * 1.5)
+
+
+@pytest.mark.parametrize(
+    "path, body, dependency",
+    [
+        ("/api/functions/verify_package", VERIFY, "get_package_by_tracking_and_postal"),
+        ("/api/functions/verify_package", VERIFY, "update_call_log_tracking_number"),
+        ("/api/functions/reschedule", RESCHEDULE, "get_package_by_tracking_and_postal"),
+        ("/api/functions/reschedule", RESCHEDULE, "update_package_schedule"),
+        ("/api/functions/reschedule", RESCHEDULE, "send_reschedule_confirmation_email"),
+        ("/api/functions/escalate", ESCALATE, "update_call_log_escalated_by_retell_call_id"),
+    ],
+)
+def test_response_always_within_budget(client, monkeypatch, path, body, dependency):
+    """Whatever dependency is slow, the agent gets a well-formed answer in time"""
+    import api.functions
+
+    monkeypatch.setattr(
+        f"api.functions.{dependency}", slow(getattr(api.functions, dependency))
+    )
+    if dependency != "send_reschedule_confirmation_email":
+        monkeypatch.setattr("api.functions.send_reschedule_confirmation_email", lambda **_: True)
+
+    response, elapsed = timed_post(client, path, body)
+
+    assert response.status_code == 200
+    assert elapsed < BUDGET + SLACK
+    data = response.json()
+    assert "message" in data or data["tracking_number"] == body["args"]["tracking_number"]
+    endpoint = path.rsplit("/", 1)[1]
+    assert sum(
+        count for (name, _), count in latency.latency_stats.overruns.items() if name == endpoint
+    ) == 1
+
+
+class SlowBackend(InMemoryRateLimitBackend):
+    """Limiter storage stuck behind another process's write, e.g. the SQLite backend"""
+
+    def consume(self, *args):
+        time.sleep(SLOW)
+        return super().consume(*args)
+
+    def add_failure(self, *args):
+        time.sleep(SLOW)
+        return super().add_failure(*args)
+
+
+@pytest.mark.parametrize(
+    "path, body",
+    [("/api/functions/verify_package", VERIFY), ("/api/functions/reschedule", RESCHEDULE)],
+)
+def test_slow_rate_limiter_returns_service_degraded(client, monkeypatch, path, body):
+    monkeypatch.setattr("api.functions.rate_limiter", FunctionRateLimiter(SlowBackend()))
+
+    response, elapsed = timed_post(client, path, body)
+
+    assert elapsed < BUDGET + SLACK
+    assert response.json()["error_type"] == "service_degraded"
+    endpoint = path.rsplit("/", 1)[1]
+    assert latency.latency_stats.overruns[(endpoint, "rate_limit")] == 1
+
+
+def test_slow_failure_count_still_answers_in_time(client, monkeypatch):
+    backend = InMemoryRateLimitBackend()
+    backend.add_failure = slow(backend.add_failure)
+    monkeypatch.setattr("api.functions.rate_limiter", FunctionRateLimiter(backend))
+    wrong = {**VERIFY, "args": {"tracking_number": "001", "postal_code": "00000"}}
+
+    response, elapsed = timed_post(client, "/api/functions/verify_package", wrong)
+
+    assert elapsed < BUDGET + SLACK
+    assert response.json()["error_type"] == "package_not_found"
+    assert backend.add_failure.done.wait(SLOW * 3)
+
+
+def test_overruns_are_exposed(client, monkeypatch):
+    monkeypatch.setattr("api.functions.send_reschedule_confirmation_email", slow(result=True))
+    client.post("/api/functions/reschedule", json=RESCHEDULE)
+    client.post("/api/functions/verify_package", json=VERIFY)
+
+    stats = client.get("/api/health/latency").json()
+
+    assert stats["budgets"]["reschedule"] == BUDGET
+    assert stats["requests"] == {"reschedule": 1, "verify_package": 1}
+    assert stats["overruns"] == {"reschedule": {"email": 1}}
@@ -0,0 +1,141 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from services.database import claim_notifications, get_notification_counts, update_package_statuses
+from services.email import send_reschedule_confirmation_email
+from services.notifications import Channel, FakeTransport, Message, NotificationDispatcher, notification_channels
+
+client = TestClient(app)
+
+
+def fake_channels(email: FakeTransport, sms: FakeTransport, **limits) -> dict:
+    return {
+        "email": Channel("email", email, workers=2, per_second=1e6, burst=1e6, **limits),
+        "sms": Channel("sms", sms, workers=3, per_second=1e6, burst=1e6, **limits),
+    }
+
+
+def test_bulk_status_change_queues_notifications_per_preference(fill_packages):
+    tracking_numbers = fill_packages(5000, sms_every=2)
+
+    started = time.perf_counter()
+    assert update_package_statuses(tracking_numbers, "out_for_delivery") == 5000
+    elapsed = time.perf_counter() - started
+
+    assert get_notification_counts() == {"email": {"pending": 5000}, "sms": {"pending": 2500}}
+    # Already out for delivery, nothing changes and nothing is queued twice
+    assert update_package_statuses(tracking_numbers[:10], "out_for_delivery") == 0
+    assert update_package_statuses(tracking_numbers[:10], "delivered") == 10
+    assert get_notification_counts()["email"] == {"pending": 5000}
+    assert elapsed < 2.0
+
+
+def test_dispatcher_sends_every_channel_with_bounded_workers(fill_packages):
+    tracking_numbers = fill_packages(400, sms_every=4)
+    update_package_statuses(tracking_numbers, "out_for_delivery")
+    email, sms = FakeTransport(latency_seconds=0.002), FakeTransport(latency_seconds=0.001)
+    dispatcher = NotificationDispatcher(fake_channels(email, sms), batch_size=150)
+
+    assert asyncio.run(dispatcher.dispatch()) == 500
+
+    assert get_notification_counts() == {"email": {"sent": 400}, "sms": {"sent": 100}}
+    assert {message.to for message in sms.sent} == {f"+4915{i:08d}" for i in range(0, 400, 4)}
+    assert any(message.body.startswith("Delivery Service: your package SCH0000004 is out") for message in sms.sent)
+    assert "Hello Customer 0," in next(m.body for m in email.sent if m.to == "customer0@example.com")
+    assert email.max_in_flight <= 2 and sms.max_in_flight <= 3
+    assert asyncio.run(dispatcher.dispatch()) == 0
+
+
+def test_failed_sends_are_retried_until_max_attempts(fill_packages):
+    update_package_statuses(fill_packages(20), "out_for_delivery")
+    email, sms = FakeTransport(failure_rate=1.0), FakeTransport()
+    dispatcher = NotificationDispatcher(fake_channels(email, sms), max_attempts=2)
+
+    asyncio.run(dispatcher.dispatch())
+    assert get_notification_counts() == {"email": {"pending": 20}, "sms": {"sent": 20}}
+    asyncio.run(dispatcher.dispatch())
+    assert get_notification_counts()["email"] == {"failed": 20}
+
+    update_package_statuses(["001"], "scheduled")
+    update_package_statuses(["001"], "out_for_delivery")
+    email.failure_rate = 0.0
+    asyncio.run(dispatcher.dispatch())
+    assert get_notification_counts()["email"] == {"failed": 20, "sent": 1}
+
+
+def test_stale_claims_are_sent_again(fill_packages):
+    update_package_statuses(fill_packages(3), "out_for_delivery")
+    now = datetime.now()
+    assert len(claim_notifications(database.DATABASE_PATH, "email", now, now - timedelta(minutes=10), 10)) == 3
+    assert claim_notifications(database.DATABASE_PATH, "email", now, now - timedelta(minutes=10), 10) == []
+
+    reclaimed = claim_notifications(database.DATABASE_PATH, "email", now, now + timedelta(seconds=1), 10)
+    assert [notification.attempts for notification in reclaimed] == [2, 2, 2]
+    assert reclaimed[0].package.customer_name == "Customer 0"
+
+
+def test_channel_rate_limit():
+    transport = FakeTransport()
+    channel = Channel("sms", transport, workers=4, per_second=200, burst=1)
+
+    async def send_all():
+        futures = [await channel.submit(Message("sms", f"+49{i}", "", "Hi")) for i in range(60)]
+        results = await asyncio.gather(*futures)
+        await channel.stop()
+        return results
+
+    started = time.perf_counter()
+    assert all(asyncio.run(send_all()))
+    assert time.perf_counter() - started >= 59 / 200 * 0.9
+    assert channel.snapshot()["sent"] == 60 and channel.snapshot()["throttled"] > 0
+
+
+def test_bulk_sends_dont_hold_up_single_messages():
+    """A confirmation sent while the workers use up the bulk rate doesn't wait for it"""
+    channel = Channel("email", FakeTransport(), workers=1, per_second=1, burst=1, direct_per_second=1, direct_burst=1)
+
+    async def bulk_and_single():
+        futures = [await channel.submit(Message("email", f"{i}@example.com", "", "Hi")) for i in range(3)]
+        await asyncio.sleep(0.05)
+        started = time.perf_counter()
+        sent = await asyncio.to_thread(channel.send, Message("email", "ann@example.com", "", "Confirmed"))
+        elapsed = time.perf_counter() - started
+        await channel.stop()
+        for future in futures:
+            future.cancel()
+        return sent, elapsed
+
+    sent, elapsed = asyncio.run(bulk_and_single())
+    assert sent and elapsed < 0.5
+    assert channel.snapshot()["throttled"] > 0
+
+
+def test_transactional_email_goes_through_the_email_channel(monkeypatch):
+    transport = FakeTransport()
+    monkeypatch.setattr(notification_channels["email"], "transport", transport)
+
+    assert send_reschedule_confirmation_email("a@example.com", "Ann", "001", datetime(2025, 8, 2, 14, 0))
+    assert transport.sent[0].to == "a@example.com"
+    assert "out for delivery" in transport.sent[0].body
+
+
+def test_endpoints(db):
+    assert client.get("/api/packages/001/notifications").json() == {"email": True, "sms": True}
+    assert client.put("/api/packages/001/notifications", json={"email": True, "sms": False}).status_code == 200
+    assert client.put("/api/packages/nope/notifications", json={"email": True, "sms": False}).status_code == 404
+
+    update = {"tracking_numbers": ["002", "nope"], "status": "out_for_delivery"}
+    assert client.post("/api/packages/status", json=update).json() == {"changed": 1}
+    # Preferences count when the status changes, later changes don't touch queued notifications
+    client.put("/api/packages/002/notifications", json={"email": False, "sms": False})
+    assert client.get("/api/health/notifications").json()["outbox"] == {
+        "email": {"pending": 1},
+        "sms": {"pending": 1},
+    }
+    empty = {"tracking_numbers": [], "status": "delivered"}
+    assert client.post("/api/packages/status", json=empty).status_code == 422
@@ -0,0 +1,143 @@
+import sqlite3
+import time
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from services import database as database_service
+from services import profiling
+from services.database import (
+    check_query_plans,
+    get_package_by_tracking_and_postal,
+    load_packages,
+    slow_query_log,
+)
+
+
+@pytest.fixture
+def log_every_query(monkeypatch):
+    monkeypatch.setattr(database_service, "SLOW_QUERY_MS", 1e-6)
+    monkeypatch.setattr(database, "connection_factory", database.connection_factory)
+    database_service.install_slow_query_logging()
+    slow_query_log.reset()
+    yield
+    slow_query_log.reset()
+
+
+def busy_loop(seconds: float):
+    deadline = time.perf_counter() + seconds
+    while time.perf_counter() < deadline:
+        pass
+
+
+class TestStackSampler:
+    def test_folded_stacks_name_the_busy_function(self):
+        sampler = profiling.StackSampler(interval=0.001)
+        sampler.start()
+        busy_loop(0.1)
+        sampler.stop()
+
+        lines = sampler.folded().splitlines()
+        assert sampler.samples > 0
+        assert any("busy_loop (test_profiling.py:" in line for line in lines)
+        stack, count = lines[0].rsplit(" ", 1)
+        assert int(count) > 0
+        assert stack.startswith("MainThread;")
+
+    def test_idle_threads_are_skipped(self):
+        sampler = profiling.StackSampler(interval=0.001)
+        sampler.start()
+        time.sleep(0.05)
+        sampler.stop()
+
+        # Only the main thread sleeping in this test, no idle waiters
+        assert not any("threading.py" in stack.rsplit(";", 1)[-1] for stack in sampler.stacks)
+
+
+class TestProfilingMiddleware:
+    def test_profiles_requests_with_the_header(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+        client = TestClient(profiling.ProfilingMiddleware(app, mode="header"))
+
+        profiled = client.get("/api/packages", headers={"X-Profile": "1"})
+        plain = client.get("/api/packages")
+
+        assert profiled.status_code == 200
+        assert "x-profile" not in plain.headers
+        name = profiled.headers["x-profile"]
+        assert "-get-api_packages-" in name and name.endswith(".folded")
+        assert [p.name for p in (tmp_path / "profiles").iterdir()] == [name]
+
+    def test_all_mode_profiles_every_request(self, db, tmp_path, monkeypatch):
+        monkeypatch.setattr(profiling, "PROFILE_DIR", str(tmp_path / "profiles"))
+        client = TestClient(profiling.ProfilingMiddleware(app, mode="all"))
+
+        client.get("/api/health")
+        client.get("/api/health")
+
+        assert len(list((tmp_path / "profiles").iterdir())) == 2
+
+
+class TestSlowQueryLog:
+    def test_records_plan_and_parameter_types_but_no_values(self, db, log_every_query):
+        get_package_by_tracking_and_postal("001", "12345")
+
+        entry = slow_query_log.snapshot()[0]
+        assert entry["sql"].endswith("WHERE tracking_number = ? AND postal_code = ?")
+        assert entry["parameters"] == ["str", "str"]
+        assert entry["duration_ms"] >= 0
+        assert entry["database"].endswith("test.db")
+        assert any("USING INDEX" in step for step in entry["plan"])
+        assert "12345" not in str(entry)
+
+    def test_executemany_is_logged_without_parameters(self, db, log_every_query):
+        load_packages(
+            [("X1", "Customer", "+4915", "x@example.com", "10115", "Main St", "1", "scheduled", "2025-08-02T08:00:00")]
+        )
+
+        entry = next(e for e in slow_query_log.snapshot() if "INSERT OR IGNORE INTO packages" in e["sql"])
+        assert entry["parameters"] is None
+        assert entry["plan"] is not None
+
+    def test_fast_queries_are_not_logged(self, db):
+        slow_query_log.reset()
+        get_package_by_tracking_and_postal("001", "12345")
+        assert slow_query_log.snapshot() == []
+
+    def test_off_keeps_plain_connections(self, db, monkeypatch):
+        monkeypatch.setattr(database_service, "SLOW_QUERY_MS", 0)
+        # Tests running the app's lifespan before this one have installed it already
+        monkeypatch.setattr(database, "connection_factory", sqlite3.Connection)
+        database_service.install_slow_query_logging()
+
+        conn = database.get_db_connection()
+        assert type(conn) is not database_service.SlowQueryLoggingConnection
+        conn.close()
+
+    def test_endpoint_lists_newest_first(self, db, log_every_query):
+        client = TestClient(app)
+        get_package_by_tracking_and_postal("001", "12345")
+        get_package_by_tracking_and_postal("002", "67890")
+
+        queries = client.get("/api/health/slow_queries").json()["queries"]
+
+        assert len(queries) >= 2
+        assert queries[0]["logged_at"] >= queries[1]["logged_at"]
+
+
+class TestQueryPlanCheck:
+    def test_fresh_database_uses_indexes(self, db):
+        assert check_query_plans() == []
+
+    def test_missing_index_is_reported(self, db):
+        conn = database.get_db_connection()
+        conn.execute("DROP INDEX idx_call_logs_campaign")
+        conn.execute("DROP INDEX idx_packages_status_scheduled")
+        conn.close()
+
+        problems = check_query_plans()
+
+        reported = {problem.split(" on ")[0] for problem in problems}
+        assert reported == {"count_campaign_targets", "campaign_targets_first_page", "campaign_targets_next_page"}
@@ -0,0 +1,169 @@
+import pytest
+from unittest.mock import patch
+from fastapi.testclient import TestClient
+
+from main import app
+from services.rate_limit import (
+    DEFAULT_LIMITS,
+    FunctionRateLimiter,
+    InMemoryRateLimitBackend,
+    SQLiteRateLimitBackend,
+)
+from services.database import create_call_log, get_escalation_info_by_retell_call_id
+
+client = TestClient(app)
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self):
+        return self.now
+
+
+@pytest.fixture(params=["memory", "sqlite"])
+def backend(request, tmp_path):
+    if request.param == "memory":
+        return InMemoryRateLimitBackend()
+    return SQLiteRateLimitBackend(str(tmp_path / "rate_limits.db"))
+
+
+class TestTokenBucket:
+    def test_burst_then_refill(self, backend):
+        """Bucket allows its capacity, then refills over time"""
+        clock = FakeClock()
+        limiter = FunctionRateLimiter(
+            backend, limits={"call": (3, 1.0), "caller": (100, 1.0)}, clock=clock
+        )
+        call = {"call_id": "c1"}
+
+        assert [limiter.check(call) for _ in range(4)] == [None, None, None, "call"]
+        clock.now += 1.0
+        assert limiter.check(call) is None
+        assert limiter.check(call) == "call"
+
+    def test_tracking_number_bucket_is_shared_across_calls(self, backend):
+        """Different calls hammering one tracking number share its bucket"""
+        limiter = FunctionRateLimiter(
+            backend,
+            limits={"call": (100, 1.0), "caller": (100, 1.0), "tracking": (2, 0.0)},
+            clock=FakeClock(),
+        )
+        assert limiter.check({"call_id": "a"}, "PKG1") is None
+        assert limiter.check({"call_id": "b"}, "PKG1") is None
+        assert limiter.check({"call_id": "c"}, "PKG1") == "tracking"
+        assert limiter.check({"call_id": "c"}, "PKG2") is None
+
+    def test_lockout_after_failures(self, backend):
+        """Repeated failed verifications lock the caller out until expiry"""
+        clock = FakeClock()
+        limiter = FunctionRateLimiter(
+            backend, max_failed_verifications=2, lockout_seconds=60, clock=clock
+        )
+        call = {"call_id": "c1", "from_number": "+491234"}
+
+        assert limiter.record_failed_verification(call) is False
+        assert limiter.record_failed_verification(call) is True
+        assert limiter.is_locked_out(call)
+        # A new call from the same number is locked out as well
+        assert limiter.is_locked_out({"call_id": "c2", "from_number": "+491234"})
+
+        clock.now += 61
+        assert not limiter.is_locked_out(call)
+
+    def test_tracking_number_locked_after_failures_across_calls(self, backend):
+        """A fresh call_id per guess still runs into the tracking number's lockout"""
+        limiter = FunctionRateLimiter(
+            backend, max_failed_tracking_verifications=3, lockout_seconds=60, clock=FakeClock()
+        )
+
+        locked = [limiter.record_failed_verification({"call_id": f"guess-{i}"}, "PKG1") for i in range(3)]
+
+        # No single call failed often enough to be escalated
+        assert locked == [False, False, False]
+        assert limiter.locked_scope({"call_id": "guess-4"}, "PKG1") == "tracking"
+        assert not limiter.is_locked_out({"call_id": "guess-4"}, "PKG2")
+
+    def test_memory_backend_evicts_the_oldest_keys_when_full(self):
+        """Distinct call_ids within the idle window don't grow the maps past max_keys"""
+        backend = InMemoryRateLimitBackend(max_keys=10)
+        limiter = FunctionRateLimiter(backend, max_failed_verifications=1, clock=FakeClock())
+
+        for i in range(25):
+            limiter.check({"call_id": f"call-{i}"})
+            limiter.record_failed_verification({"call_id": f"call-{i}"})
+
+        assert max(len(backend._buckets), len(backend._failures), len(backend._lockouts)) <= 10
+        assert limiter.is_locked_out({"call_id": "call-24"})
+        assert not limiter.is_locked_out({"call_id": "call-0"})
+
+    def test_requests_without_identity_share_a_bucket(self, backend):
+        limiter = FunctionRateLimiter(
+            backend,
+            limits={**DEFAULT_LIMITS, "anonymous": (2, 0.0), "tracking": (100, 1.0)},
+            max_failed_verifications=2,
+            clock=FakeClock(),
+        )
+
+        assert [limiter.check({}, f"PKG{i}") for i in range(3)] == [None, None, "anonymous"]
+        assert limiter.check({"call_id": "real-call"}, "PKG9") is None
+
+        limiter.record_failed_verification({}, "PKG1")
+        assert limiter.record_failed_verification({"call_id": ""}, "PKG2") is False
+        assert limiter.locked_scope({}) == "anonymous"
+
+
+class TestVerifyPackageLockout:
+    def test_lockout_escalates_call(self, db):
+        """Failed verifications end in a lockout that marks the call for escalation"""
+        limiter = FunctionRateLimiter(
+            InMemoryRateLimitBackend(), max_failed_verifications=2
+        )
+        create_call_log(retell_call_id="brute-force-call")
+        request = {
+            "call": {"call_id": "brute-force-call", "from_number": "+15550000"},
+            "name": "verify_package",
+            "args": {"tracking_number": "001", "postal_code": "00000"},
+        }
+
+        with patch("api.functions.rate_limiter", limiter):
+            first = client.post("/api/functions/verify_package", json=request)
+            second = client.post("/api/functions/verify_package", json=request)
+            third = client.post(
+                "/api/functions/verify_package",
+                json={**request, "args": {"tracking_number": "001", "postal_code": "12345"}},
+            )
+
+        assert first.json()["error_type"] == "package_not_found"
+        assert second.json()["error_type"] == "verification_locked"
+        # Correct details don't help once locked out
+        assert third.json()["error_type"] == "verification_locked"
+
+        escalation = get_escalation_info_by_retell_call_id("brute-force-call")
+        assert escalation is not None
+        assert escalation.escalation_reason == "verification_failed"
+
+    def test_locked_tracking_number_is_refused_to_other_calls(self, db):
+        limiter = FunctionRateLimiter(
+            InMemoryRateLimitBackend(), max_failed_tracking_verifications=2
+        )
+
+        def verify(call_id: str, postal_code: str) -> dict:
+            return client.post(
+                "/api/functions/verify_package",
+                json={
+                    "call": {"call_id": call_id},
+                    "name": "verify_package",
+                    "args": {"tracking_number": "001", "postal_code": postal_code},
+                },
+            ).json()
+
+        with patch("api.functions.rate_limiter", limiter):
+            assert verify("guess-1", "00000")["error_type"] == "package_not_found"
+            # Locks the tracking number, but guess-2 itself isn't escalated for one failure
+            assert verify("guess-2", "00001")["error_type"] == "package_not_found"
+            refused = verify("customer-call", "12345")
+
+        assert refused["error_type"] == "verification_locked"
+        assert "this package" in refused["message"]
@@ -0,0 +1,157 @@
+import asyncio
+import json
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from replay.player import MISSING_POSTAL_CODE, PackageMapper, Replayer, compare
+from services.jobs import job_queue
+from services.rate_limit import FunctionRateLimiter, InMemoryRateLimitBackend
+from services.recording import RecordingMiddleware, Redactor, RequestRecorder, read_recording, restore
+from services.sessions import session_store
+from simulator.runner import offline_emails
+
+CALL = {"call_id": "call-1", "agent_id": "agent", "call_status": "ongoing", "from_number": "+4915112345678"}
+
+
+def tool_call(name: str, tracking_number: str = "001", postal_code: str = "12345") -> dict:
+    return {
+        "call": CALL,
+        "name": name,
+        "args": {"tracking_number": tracking_number, "postal_code": postal_code},
+    }
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    unlimited = {scope: (1e9, 1e9) for scope in ("call", "caller", "tracking")}
+    monkeypatch.setattr(
+        "api.functions.rate_limiter", FunctionRateLimiter(InMemoryRateLimitBackend(), limits=unlimited)
+    )
+    monkeypatch.setattr(job_queue, "accepting", True)
+    monkeypatch.setattr("api.webhooks.retell.verify", lambda *args, **kwargs: True)
+    session_store.reset()
+
+
+@pytest.fixture
+def recording(db, tmp_path):
+    """A short call recorded through the middleware"""
+    path = str(tmp_path / "recording.ndjson")
+    recorder = RequestRecorder(path, key=b"test")
+    client = TestClient(RecordingMiddleware(app, recorder))
+    with offline_emails():
+        client.post("/api/webhooks/events", json={"event": "call_started", "call": CALL})
+        client.post("/api/functions/verify_package", json=tool_call("verify_package", postal_code="99999"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package", "003", "54321"))
+        client.post(
+            "/api/webhooks/events",
+            json={"event": "call_ended", "call": {**CALL, "call_status": "ended", "transcript": "Agent: Hi John"}},
+            headers={"X-Retell-Signature": "v=1,d=secret"},
+        )
+    recorder.close()
+    return path
+
+
+class TestRecording:
+    def test_identifiers_are_pseudonymized_and_text_redacted(self, recording):
+        raw = open(recording).read()
+        entries = list(read_recording(recording))
+
+        assert [entry["p"] for entry in entries] == [
+            "/api/webhooks/events",
+            *["/api/functions/verify_package"] * 3,
+            "/api/webhooks/events",
+        ]
+        for secret in ("12345", "+4915112345678", "John", "v=1,d=secret"):
+            assert secret not in raw
+        verify = entries[2]["b"]
+        assert verify["name"] == "verify_package"
+        assert verify["args"]["tracking_number"].startswith("tn_")
+        assert entries[1]["b"]["args"]["tracking_number"] == verify["args"]["tracking_number"]
+        assert entries[4]["b"]["call"]["transcript"] == "<redacted:14>"
+
+    def test_status_timing_and_outcome_are_kept(self, recording):
+        entries = list(read_recording(recording))
+
+        assert [entry["o"] for entry in entries] == [
+            None, "package_not_found", "ok", "package_already_delivered", None,
+        ]
+        assert entries[0]["s"] == 204 and entries[2]["s"] == 200
+        assert all(entry["d"] > 0 for entry in entries)
+        assert entries[0]["t"] <= entries[-1]["t"]
+
+    def test_cut_off_lines_are_skipped(self, recording):
+        with open(recording, "a") as f:
+            f.write('{"t": 1, "m": "PO')
+
+        assert len(list(read_recording(recording))) == 5
+
+    def test_restore_keeps_the_length(self):
+        redacted = Redactor(b"k").redact({"call": {"transcript": "x" * 40, "call_id": "c"}})
+
+        restored = restore(redacted)
+        assert len(restored["call"]["transcript"]) == 40
+        assert restored["call"]["call_id"] == "c"
+
+
+class TestPackageMapper:
+    PACKAGES = [("A", "111", "scheduled"), ("B", "222", "delivered"), ("C", "333", "out_for_delivery")]
+
+    def test_tokens_keep_found_not_found_and_delivered(self):
+        mapper = PackageMapper(self.PACKAGES)
+        mapper.learn([{"o": "package_already_delivered", "b": {"args": {"tracking_number": "tn_2"}}}])
+
+        assert mapper.map_args({"tracking_number": "tn_1", "postal_code": "pc_1"}, "ok") == {
+            "tracking_number": "A",
+            "postal_code": "111",
+        }
+        # Wrong postal code first, the package is still the delivered one
+        assert mapper.map_args({"tracking_number": "tn_2", "postal_code": "pc_x"}, "package_not_found") == {
+            "tracking_number": "B",
+            "postal_code": MISSING_POSTAL_CODE,
+        }
+        assert mapper.map_args({"tracking_number": "tn_2", "postal_code": "pc_2"}, "package_already_delivered")[
+            "postal_code"
+        ] == "222"
+        assert mapper.map_args({"tracking_number": "tn_1", "postal_code": "pc_1"}, "ok")["tracking_number"] == "A"
+        assert mapper.map_args({"tracking_number": "tn_3", "postal_code": "pc_3"}, "ok")["tracking_number"] == "C"
+
+
+class TestReplay:
+    def test_replay_answers_like_the_recording(self, recording, tmp_path, monkeypatch):
+        entries = list(read_recording(recording))
+        # Fresh database, the recorded call logs are gone
+        monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "replay.db"))
+        database.init_database()
+        session_store.reset()
+        conn = database.get_db_connection()
+        packages = [tuple(row) for row in conn.execute("SELECT tracking_number, postal_code, status FROM packages")]
+        conn.close()
+
+        async def run():
+            async with httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://replay") as client:
+                replayer = Replayer(client, "x", PackageMapper(packages), speed=0, concurrency=1)
+                return await replayer.run(entries)
+
+        with offline_emails():
+            result = asyncio.run(run())
+
+        summary = {row["name"]: row["count"] for row in result.to_dict()["latency"]}
+        assert summary == {"call_started": 1, "verify_package": 3, "call_ended": 1}
+        assert result.diverged == {}
+
+    def test_compare_flags_p95_regressions(self):
+        def run(label, p95):
+            row = {"name": "verify_package", "count": 10, "p50": 5.0, "p95": p95, "p99": p95, "max": p95}
+            return {"label": label, "latency": [row, {**row, "name": "reschedule", "p95": 20.0}]}
+
+        rows, regressions = compare(run("a", 10.0), run("b", 15.0), threshold=20)
+
+        assert regressions == ["verify_package"]
+        assert [row["name"] for row in rows] == ["reschedule", "verify_package"]
+        assert rows[1]["change"] == pytest.approx(50.0)
+        assert json.dumps(rows)
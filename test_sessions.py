@@ -0,0 +1,189 @@
+from unittest.mock import patch
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services import database as database_service
+from services.database import fetch_one, update_package_statuses
+from services.rate_limit import FunctionRateLimiter, InMemoryRateLimitBackend
+from services.sessions import SessionStore, session_store
+
+
+def tool_call(name: str, call_id: str = "call-1", **args) -> dict:
+    args = {"tracking_number": "001", "postal_code": "12345", **args}
+    return {"call": {"call_id": call_id}, "name": name, "args": args}
+
+
+def webhook(event: str, call_id: str = "call-1") -> dict:
+    return {"event": event, "call": {"call_id": call_id, "agent_id": "agent", "call_status": "ended"}}
+
+
+@pytest.fixture
+def client(db, monkeypatch):
+    monkeypatch.setattr(
+        "api.functions.rate_limiter", FunctionRateLimiter(InMemoryRateLimitBackend())
+    )
+    session_store.reset()
+    with patch("api.webhooks.retell.verify", return_value=True):
+        yield TestClient(app)
+    session_store.reset()
+
+
+@pytest.fixture
+def lookups(monkeypatch):
+    """Count package lookups that reach the database"""
+    calls = []
+    lookup = database_service.get_package_by_tracking_and_postal
+
+    def counting(*args):
+        calls.append(args)
+        return lookup(*args)
+
+    monkeypatch.setattr("api.functions.get_package_by_tracking_and_postal", counting)
+    return calls
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+class TestSessionStore:
+    def test_open_get_close(self):
+        store = SessionStore()
+        store.open("call-1")
+
+        assert store.get("call-1").tool_calls == 1
+        assert store.get("other") is None
+        assert store.close("call-1").call_id == "call-1"
+        assert store.get("call-1") is None
+        assert len(store) == 0
+
+    def test_reopening_keeps_the_session(self):
+        store = SessionStore()
+        store.open("call-1").failed_verifications = 2
+
+        assert store.open("call-1").failed_verifications == 2
+        assert store.snapshot()["opened"] == 1
+
+    def test_idle_sessions_expire(self):
+        clock = FakeClock()
+        store = SessionStore(ttl=60, clock=clock)
+        store.open("abandoned")
+        clock.now += 30
+        store.open("active")
+        clock.now += 40
+        store.get("active")
+
+        assert store.get("abandoned") is None
+        clock.now += 59
+        assert store.get("active") is not None
+        assert store.snapshot()["evicted"] == 1
+
+    def test_least_recently_used_session_makes_room(self):
+        store = SessionStore(max_sessions=2)
+        store.open("a")
+        store.open("b")
+        store.get("a")
+        store.open("c")
+
+        assert store.get("b") is None
+        assert store.get("a") is not None and store.get("c") is not None
+
+    def test_snapshot_reports_overhead(self):
+        store = SessionStore()
+        store.open("call-1")
+        store.get("call-1")
+        store.record_lookup(True)
+        store.record_lookup(False)
+
+        snapshot = store.snapshot()
+        assert snapshot["operations"] == 2
+        assert snapshot["overhead_us_per_operation"] >= 0
+        assert snapshot["hit_rate"] == 0.5
+
+
+class TestToolCallsUseTheSession:
+    def test_reschedule_reuses_the_verified_package(self, client, lookups):
+        client.post("/api/webhooks/events", json=webhook("call_started"))
+
+        verified = client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+        with patch("api.functions.send_reschedule_confirmation_email", return_value=True):
+            rescheduled = client.post(
+                "/api/functions/reschedule",
+                json=tool_call("reschedule", target_time="2025-08-10T14:00:00"),
+            )
+        again = client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+
+        assert verified.json()["customer_name"] and rescheduled.json()["new_schedule"]
+        assert len(lookups) == 1
+        # The session follows the write, no stale time read back
+        assert again.json()["scheduled_at"] == "2025-08-10T14:00:00"
+        assert session_store.snapshot()["hits"] == 2
+
+    def test_package_delivered_mid_call_is_not_rescheduled(self, client):
+        """A status change after verification isn't hidden by the session's copy"""
+        client.post("/api/webhooks/events", json=webhook("call_started"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+        update_package_statuses(["001"], "delivered")
+
+        with patch("api.functions.send_reschedule_confirmation_email", return_value=True) as email:
+            response = client.post(
+                "/api/functions/reschedule",
+                json=tool_call("reschedule", target_time="2025-08-10T14:00:00"),
+            )
+
+        assert (response.json()["error_type"], response.json()["current_status"]) == (
+            "package_already_delivered",
+            "delivered",
+        )
+        assert fetch_one("SELECT COUNT(*) FROM package_schedule_history")[0] == 0
+        assert not email.called
+        # The session picked up the new status
+        again = client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+        assert again.json()["current_status"] == "delivered"
+
+    def test_other_identifiers_are_looked_up(self, client, lookups):
+        client.post("/api/webhooks/events", json=webhook("call_started"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+
+        response = client.post(
+            "/api/functions/verify_package", json=tool_call("verify_package", postal_code="99999")
+        )
+
+        assert response.json()["error_type"] == "package_not_found"
+        assert len(lookups) == 2
+
+    def test_calls_without_a_session_read_the_database(self, client, lookups):
+        client.post("/api/functions/verify_package", json=tool_call("verify_package", call_id="unknown"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package", call_id="unknown"))
+
+        assert len(lookups) == 2
+        assert len(session_store) == 0
+
+    def test_escalation_names_the_verified_package_once(self, client):
+        client.post("/api/webhooks/events", json=webhook("call_started"))
+        client.post("/api/functions/verify_package", json=tool_call("verify_package"))
+
+        with patch(
+            "api.functions.update_call_log_escalated_by_retell_call_id", return_value=True
+        ) as escalate:
+            first = client.post("/api/functions/escalate", json=tool_call("escalate", tracking_number="typo"))
+            client.post("/api/functions/escalate", json=tool_call("escalate"))
+
+        assert escalate.call_count == 1
+        assert first.json()["tracking_number"] == "001"
+        assert fetch_one("SELECT tracking_number FROM call_logs WHERE retell_call_id = 'call-1'") == ("001",)
+
+    def test_call_ended_closes_the_session(self, client):
+        client.post("/api/webhooks/events", json=webhook("call_started"))
+        assert len(session_store) == 1
+
+        client.post("/api/webhooks/events", json=webhook("call_ended"))
+
+        assert len(session_store) == 0
+        assert client.get("/api/health/sessions").json()["closed"] == 1
@@ -0,0 +1,254 @@
+import asyncio
+import json
+from datetime import datetime, timedelta
+
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from models import CampaignCreate
+from services import sharding
+from services.campaigns import CampaignRunner
+from services.database import (
+    count_campaign_targets,
+    create_campaign,
+    get_campaign,
+    get_package_by_tracking_and_postal,
+    get_package_by_tracking_number,
+    get_schedule_as_of,
+    load_packages,
+    update_campaign_status,
+    update_package_schedule,
+)
+from services.dialer import FakeDialer
+
+client = TestClient(app)
+
+DELIVERY_DAY = datetime(2025, 8, 2)
+
+
+def write_shard_map(tmp_path, routes, shards=("north", "south")):
+    path = tmp_path / "shards.json"
+    path.write_text(
+        json.dumps(
+            {
+                "shards": {name: f"shards/{name}.db" for name in shards},
+                "routes": routes,
+                "default": shards[0],
+            }
+        )
+    )
+    (tmp_path / "shards").mkdir(exist_ok=True)
+    return sharding.ShardMap.load(str(path))
+
+
+def count_packages(path):
+    conn = database.get_db_connection(path=path)
+    try:
+        return conn.execute("SELECT COUNT(*) FROM packages").fetchone()[0]
+    finally:
+        conn.close()
+
+
+def package(tracking_number, postal_code, hours=0):
+    return (
+        tracking_number,
+        f"Customer {tracking_number}",
+        "+491500000000",
+        "customer@example.com",
+        postal_code,
+        "Main St",
+        "1",
+        "scheduled",
+        (DELIVERY_DAY + timedelta(hours=hours)).isoformat(),
+    )
+
+
+@pytest.fixture
+def shards(tmp_path, monkeypatch):
+    """Seeded main database, rebalanced into a north (1..., 2...) and a south (5...) shard"""
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    database.init_database()
+    shard_map = write_shard_map(tmp_path, {"1": "north", "2": "north", "5": "south", "6": "south"})
+    monkeypatch.setattr(sharding, "shard_map", shard_map)
+    sharding.rebalance(shard_map)
+    return shard_map
+
+
+class TestRouting:
+    def test_seed_packages_move_out_of_the_main_database(self, shards):
+        """Rebalancing empties the main package table and gives ids from each shard's range"""
+        north, south = shards.shards
+        assert count_packages(database.DATABASE_PATH) == 0
+        assert count_packages(north.path) == 1  # 001 / 12345
+        assert count_packages(south.path) == 2  # 002 / 67890, 003 / 54321
+
+        package_001 = get_package_by_tracking_and_postal("001", "12345")
+        assert north.id_offset < package_001.id < south.id_offset
+        assert get_package_by_tracking_and_postal("002", "67890").id > south.id_offset
+        assert get_package_by_tracking_and_postal("002", "12345") is None
+        assert get_package_by_tracking_number("003").postal_code == "54321"
+
+    def test_longest_prefix_wins(self, tmp_path):
+        shard_map = write_shard_map(tmp_path, {"1": "north", "12": "south"})
+        assert shard_map.shard_for("12345").name == "south"
+        assert shard_map.shard_for("13345").name == "north"
+        assert shard_map.shard_for("99999").name == "north"  # default
+
+    def test_unknown_shard_is_rejected(self):
+        with pytest.raises(ValueError, match="unknown shards"):
+            sharding.ShardMap({"north": "north.db"}, {"1": "east"}, "north")
+
+    def test_reschedule_writes_history_next_to_the_package(self, shards):
+        response = client.post(
+            "/api/functions/reschedule",
+            json={
+                "call": {"call_id": "call-1"},
+                "name": "reschedule",
+                "args": {
+                    "tracking_number": "002",
+                    "postal_code": "67890",
+                    "target_time": "2025-08-10T14:00:00",
+                },
+            },
+        )
+        assert response.status_code == 200
+
+        conn = database.get_db_connection(path=shards.shards[1].path)
+        changes = conn.execute("SELECT retell_call_id FROM package_schedule_history").fetchall()
+        conn.close()
+        assert [tuple(change) for change in changes] == [("call-1",)]
+        history = client.get("/api/call_logs/call-1/schedule_changes").json()
+        assert [change["tracking_number"] for change in history] == ["002"]
+
+    def test_load_packages_routes_each_row(self, shards):
+        north, south = shards.shards
+        loaded = load_packages([package("N1", "10115"), package("S1", "50667"), package("001", "12345")])
+
+        assert loaded == 2  # 001 already exists
+        assert count_packages(north.path) == 2
+        assert count_packages(south.path) == 3
+
+
+class TestFanOut:
+    def test_dashboard_lists_packages_of_all_shards_in_order(self, shards):
+        load_packages([package(f"P{i}", "10115" if i % 2 else "50667", hours=i) for i in range(6)])
+
+        listed = client.get("/api/packages").json()
+
+        times = [p["scheduled_at"] for p in listed]
+        assert len(listed) == 9
+        assert times == sorted(times, reverse=True)
+
+    def test_export_chains_shards_in_id_order(self, shards):
+        response = client.get("/api/export/packages")
+
+        rows = [json.loads(line) for line in response.text.splitlines()]
+        ids = [row["id"] for row in rows]
+        assert len(ids) == 3
+        assert ids == sorted(ids)
+        assert int(response.headers["X-Export-Watermark"]) == ids[-1]
+
+    def test_reschedule_counts_merge_shards(self, shards):
+        for hour in range(3):
+            update_package_schedule("002", DELIVERY_DAY + timedelta(hours=hour))
+        update_package_schedule("001", DELIVERY_DAY)
+
+        counts = client.get("/api/packages/reschedules").json()
+
+        assert [(c["tracking_number"], c["reschedules"]) for c in counts] == [("002", 3), ("001", 1)]
+
+    def test_campaign_reads_call_logs_from_the_main_database(self, shards):
+        load_packages([package(f"C{i}", "10115" if i % 2 else "50667", hours=i) for i in range(10)])
+        campaign_id = create_campaign(
+            CampaignCreate(
+                name="Shards",
+                delivery_from=DELIVERY_DAY,
+                delivery_to=DELIVERY_DAY + timedelta(days=1),
+                window_start=datetime(2025, 8, 1, 9),
+                window_end=datetime(2025, 8, 1, 17),
+            )
+        )
+        update_campaign_status(campaign_id, "running")
+        campaign = get_campaign(campaign_id)
+        assert count_campaign_targets(campaign) == 10
+        dialer = FakeDialer()
+
+        virtual_time = [0.0]
+
+        async def skip(seconds):
+            virtual_time[0] += seconds
+
+        runner = CampaignRunner(
+            dialer, clock=lambda: virtual_time[0], sleep=skip, now=lambda: datetime(2025, 8, 1, 9)
+        )
+        asyncio.run(runner.run(campaign))
+
+        assert [d["tracking_number"] for d in dialer.dialed] == [f"C{i}" for i in range(10)]
+        assert count_campaign_targets(campaign) == 0
+
+
+class TestRebalance:
+    def test_moves_history_with_the_package(self, shards, tmp_path, monkeypatch):
+        update_package_schedule("002", datetime(2025, 8, 10, 14, 0), "call-1")
+        # 6... moves from south to north
+        moved_map = write_shard_map(tmp_path, {"1": "north", "2": "north", "6": "north", "5": "south"})
+        monkeypatch.setattr(sharding, "shard_map", moved_map)
+
+        moved = sharding.rebalance(moved_map)
+
+        assert moved == {("south", "north"): 1}
+        north, south = moved_map.shards
+        assert count_packages(north.path) == 2
+        assert get_package_by_tracking_and_postal("002", "67890").id < south.id_offset
+        assert get_schedule_as_of("002", datetime(2000, 1, 1)) is not None
+        assert get_schedule_as_of("002", datetime(2100, 1, 1)) == datetime(2025, 8, 10, 14, 0)
+        conn = database.get_db_connection(path=south.path)
+        assert conn.execute("SELECT COUNT(*) FROM package_schedule_history").fetchone()[0] == 0
+        conn.close()
+
+        # A second run has nothing left to do
+        assert sharding.rebalance(moved_map) == {}
+
+    def test_interrupted_move_can_be_repeated(self, shards, tmp_path):
+        """A batch copied to its new shard but not yet deleted from the old one moves once"""
+        update_package_schedule("002", datetime(2025, 8, 10, 14, 0), "call-1")
+        moved_map = write_shard_map(tmp_path, {"6": "north", "5": "south"})
+        north, south = moved_map.shards
+        conn = database.get_db_connection(path=south.path)
+        conn.row_factory = None
+        row = conn.execute(
+            "SELECT id, tracking_number, customer_name, phone, email, postal_code, street, "
+            "street_number, status, scheduled_at, notify_email, notify_sms FROM packages "
+            "WHERE tracking_number = '002'"
+        ).fetchone()
+        conn.close()
+        # Move 002, then put it back into south as if the run died before the delete
+        sharding.move_packages(south.path, north.path, [row])
+        with database.write_connection(south.path) as conn:
+            conn.execute(
+                """
+                INSERT INTO packages
+                (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+                VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?)
+            """,
+                [sharding.to_sql(value) for value in row[1:10]],
+            )
+            conn.execute(
+                """
+                INSERT INTO package_schedule_history
+                (tracking_number, previous_scheduled_at, scheduled_at, changed_at, retell_call_id)
+                VALUES ('002', NULL, '2025-08-10T14:00:00', '2025-08-01T09:00:00', 'call-1')
+            """
+            )
+
+        sharding.rebalance(moved_map)
+
+        conn = database.get_db_connection(path=north.path)
+        history = conn.execute(
+            "SELECT COUNT(*) FROM package_schedule_history WHERE tracking_number = '002'"
+        ).fetchone()[0]
+        conn.close()
+        assert history == 1
+        assert count_packages(south.path) == 1  # only 003 / 54321 is left
@@ -0,0 +1,165 @@
+import asyncio
+import time
+from datetime import datetime, timedelta
+from unittest.mock import patch
+
+import httpx
+from fastapi import FastAPI
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from services import jobs
+from services.database import (
+    claim_job,
+    create_call_log,
+    enqueue_job,
+    fetch_one,
+    update_call_log_escalated_by_retell_call_id,
+)
+from services.jobs import JobQueue
+from services.shutdown import DrainMiddleware, RequestTracker, graceful_shutdown
+
+
+def job_row(job_id):
+    return fetch_one("SELECT status, attempts, run_after, last_error FROM jobs WHERE id = ?", (job_id,))
+
+
+class TestJobQueue:
+    def test_submitted_job_runs_and_is_done(self, db):
+        queue = JobQueue()
+        calls = []
+        queue.register("note", lambda text: calls.append(text) or True)
+
+        async def run():
+            job_id = await queue.submit("note", text="hello")
+            assert await queue.wait(timeout=5)
+            return job_id
+
+        job_id = asyncio.run(run())
+
+        assert calls == ["hello"]
+        assert job_row(job_id)[:2] == ("done", 1)
+
+    def test_failures_are_retried_with_backoff_then_given_up(self, db, monkeypatch):
+        monkeypatch.setattr(jobs, "MAX_JOB_ATTEMPTS", 2)
+        queue = JobQueue()
+        queue.register("flaky", lambda: False)
+
+        async def run():
+            job_id = await queue.submit("flaky")
+            await queue.wait(timeout=5)
+            first = job_row(job_id)
+            # Not due yet, the retry waits RETRY_BACKOFF_SECONDS
+            assert await queue.run_due() == 0
+            conn = database.get_db_connection()
+            conn.execute("UPDATE jobs SET run_after = ?", (datetime.now().isoformat(),))
+            conn.commit()
+            conn.close()
+            assert await queue.run_due() == 1
+            await queue.wait(timeout=5)
+            return first, job_row(job_id)
+
+        first, last = asyncio.run(run())
+
+        assert first[:2] == ("pending", 1)
+        assert first[2] > datetime.now() + timedelta(seconds=jobs.RETRY_BACKOFF_SECONDS - 5)
+        assert last[:2] == ("failed", 2)
+        assert last[3] == "handler returned False"
+
+    def test_jobs_of_a_dead_worker_are_reclaimed(self, db, monkeypatch):
+        queue = JobQueue()
+        queue.register("note", lambda: True)
+        job_id = enqueue_job("note", {})
+        claim_job(job_id)  # by a worker that then died
+
+        assert asyncio.run(queue.run_due()) == 0
+        monkeypatch.setattr(jobs, "STALE_JOB_SECONDS", 0)
+
+        async def run():
+            await queue.run_due()
+            await queue.wait(timeout=5)
+
+        asyncio.run(run())
+        assert job_row(job_id)[:2] == ("done", 2)
+
+    def test_drain_interrupts_and_releases_slow_jobs(self, db):
+        queue = JobQueue()
+        queue.register("slow", lambda: time.sleep(1) or True)
+
+        async def run():
+            job_id = await queue.submit("slow")
+            await asyncio.sleep(0.1)
+            interrupted = await queue.drain(timeout=0.1)
+            # Submitted while draining: persisted, not started
+            later = await queue.submit("slow")
+            return job_id, later, interrupted
+
+        job_id, later, interrupted = asyncio.run(run())
+
+        assert interrupted == 1
+        assert job_row(job_id)[0] == "pending"
+        assert job_row(job_id)[1] == 0  # the interrupted attempt doesn't count
+        assert job_row(later)[:2] == ("pending", 0)
+
+
+class TestStartupAndShutdown:
+    def test_unfinished_jobs_resume_on_startup(self, db):
+        create_call_log("call-1", "001")
+        update_call_log_escalated_by_retell_call_id("call-1")
+        job_id = enqueue_job("escalation_email", {"retell_call_id": "call-1"})
+
+        with patch("api.webhooks.send_escalation_email", return_value=True) as send:
+            with TestClient(app):
+                pass
+
+        assert send.call_args.kwargs["tracking_number"] == "001"
+        assert job_row(job_id)[0] == "done"
+
+    def test_escalation_email_is_persisted_before_the_webhook_answers(self, db):
+        create_call_log("call-1", "001")
+        update_call_log_escalated_by_retell_call_id("call-1")
+        payload = {
+            "event": "call_ended",
+            "call": {"call_id": "call-1", "agent_id": "agent", "call_status": "ended", "transcript": "Agent: hi"},
+        }
+
+        with patch("api.webhooks.retell.verify", return_value=True), patch(
+            "api.webhooks.send_escalation_email", return_value=True
+        ) as send:
+            with TestClient(app) as client:
+                response = client.post("/api/webhooks/events", json=payload)
+                assert response.status_code == 204
+                assert fetch_one("SELECT kind FROM jobs") == ("escalation_email",)
+            # Shutdown waited for the job
+
+        assert send.call_args.kwargs["transcript"] == "Agent: hi"
+        assert fetch_one("SELECT status FROM jobs") == ("done",)
+
+    def test_in_flight_requests_finish_and_new_ones_are_turned_away(self, db):
+        slow_app = FastAPI()
+
+        @slow_app.get("/slow")
+        async def slow():
+            await asyncio.sleep(0.3)
+            return {"done": True}
+
+        tracker = RequestTracker()
+        transport = httpx.ASGITransport(app=DrainMiddleware(slow_app, tracker))
+
+        async def run():
+            async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+                in_flight = asyncio.create_task(client.get("/slow"))
+                await asyncio.sleep(0.05)
+                shutdown = asyncio.create_task(graceful_shutdown(JobQueue(), timeout=5, tracker=tracker))
+                await asyncio.sleep(0.05)
+                turned_away = await client.get("/slow")
+                await shutdown
+                return await in_flight, turned_away
+
+        finished, turned_away = asyncio.run(run())
+
+        assert finished.json() == {"done": True}
+        assert turned_away.status_code == 503
+        assert turned_away.headers["retry-after"] == "1"
+        assert tracker.in_flight == 0
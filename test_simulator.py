@@ -0,0 +1,112 @@
+import asyncio
+from datetime import datetime
+
+import httpx
+import pytest
+
+from main import app
+from services.jobs import job_queue
+from services.database import (
+    get_call_transcript_by_retell_call_id,
+    get_escalation_info_by_retell_call_id,
+    get_package_by_tracking_number,
+)
+from services.rate_limit import FunctionRateLimiter, InMemoryRateLimitBackend
+from simulator.flow import ConversationFlow
+from simulator.runner import Caller, CallSimulator, offline_emails, random_callers
+
+HAPPY_PATH = [
+    "welcome", "confirm-details", "verify-package", "ask-time",
+    "reschedule", "confirm", "success", "end-call",
+]
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    """Fresh seeded database per test, without the limiter getting in the way"""
+    unlimited = {scope: (1e9, 1e9) for scope in ("call", "caller", "tracking")}
+    monkeypatch.setattr(
+        "api.functions.rate_limiter",
+        FunctionRateLimiter(InMemoryRateLimitBackend(), limits=unlimited),
+    )
+    # Earlier tests may have shut the app down, which stops the job queue
+    monkeypatch.setattr(job_queue, "accepting", True)
+
+
+@pytest.fixture(scope="module")
+def flow():
+    return ConversationFlow.load()
+
+
+def simulate(flow, callers, concurrency=10):
+    async def run():
+        async with httpx.AsyncClient(
+            transport=httpx.ASGITransport(app=app), base_url="http://simulator"
+        ) as client:
+            simulator = CallSimulator(flow, client, "x")
+            results = await simulator.run(callers, concurrency)
+            # Escalation emails are sent by jobs
+            await job_queue.wait(timeout=10)
+            return simulator, results
+
+    with offline_emails() as emails:
+        simulator, results = asyncio.run(run())
+    return simulator, results, emails
+
+
+def test_flow_definition(flow):
+    assert flow.start_node_id == "welcome"
+    assert len(flow.nodes) == 10
+    tools = {node.id: node.tool.path for node in flow.nodes.values() if node.tool}
+    assert tools == {
+        "verify-package": "/api/functions/verify_package",
+        "reschedule": "/api/functions/reschedule",
+        "escalate": "/api/functions/escalate",
+    }
+    assert flow.nodes["verify-package"].failure_edge().destination == "pre-escalate"
+    assert flow.nodes["confirm"].failure_edge().destination == "pre-escalate"
+
+
+def test_scripted_reschedule(db, flow):
+    """A scripted call walks the happy path and its effects land in the database"""
+    caller = Caller("002", "67890", datetime(2025, 8, 10, 14, 0), script=HAPPY_PATH)
+
+    _, [result], emails = simulate(flow, [caller])
+
+    assert result.path == HAPPY_PATH
+    assert not result.diverged
+    assert result.errors == []
+    assert emails == ["002"]
+    assert get_package_by_tracking_number("002").scheduled_at == datetime(2025, 8, 10, 14, 0)
+    assert "My tracking number is 002" in get_call_transcript_by_retell_call_id(result.call_id)
+
+
+def test_wrong_details_escalate(db, flow):
+    """A failing verification leaves the script and ends in an escalation email"""
+    caller = Caller("002", "00000", datetime(2025, 8, 10, 14, 0), script=HAPPY_PATH)
+
+    _, [result], emails = simulate(flow, [caller])
+
+    assert result.path == [
+        "welcome", "confirm-details", "verify-package", "pre-escalate", "escalate", "end-call",
+    ]
+    assert result.diverged
+    # Verification failed, so the call log never learned the tracking number
+    assert emails == ["unknown"]
+    assert get_escalation_info_by_retell_call_id(result.call_id) is not None
+
+
+def test_concurrent_random_calls(db, flow):
+    packages = [("001", "12345"), ("002", "67890"), ("003", "54321")]
+    callers = random_callers(packages, 200, invalid_rate=0.2, decline_rate=0.2, seed=1)
+
+    simulator, results, _ = simulate(flow, callers, concurrency=50)
+
+    assert all(r.path[-1] == "end-call" for r in results)
+    assert [error for r in results for error in r.errors] == []
+    # Delivered package 003 and wrong postal codes take the escalation branch
+    assert {len(r.path) for r in results} >= {6, 8}
+    latencies = {row["name"]: row for row in simulator.recorder.summary()}
+    assert latencies["end_to_end"]["count"] == 200
+    assert latencies["call_started"]["count"] == latencies["call_ended"]["count"] == 200
+    assert latencies["verify-package"]["p50"] <= latencies["verify-package"]["max"]
@@ -0,0 +1,216 @@
+import asyncio
+import json
+import os
+from datetime import datetime
+from pathlib import Path
+
+import httpx
+import pytest
+from fastapi.testclient import TestClient
+
+import database
+from main import app
+from services.email import send_escalation_email, send_reschedule_confirmation_email
+from services.notifications import FakeTransport, notification_channels
+from services.tenants import Bulkhead, TenantMiddleware, TenantRegistry, use_tenant
+
+TENANTS = {
+    "acme": {
+        "agent_ids": ["agent_acme"],
+        "database": "acme.db",
+        "source_email": "deliveries@acme.example",
+        "escalation_email": "support@acme.example",
+    },
+    "globex": {
+        "agent_ids": ["agent_globex", "agent_globex_night"],
+        "database": "tenants/globex.db",
+        "rate_limits": {"tracking": [1, 0]},
+        "max_concurrent_requests": 1,
+    },
+}
+
+
+def write_tenants(path, tenants: dict, mtime: float = None):
+    os.makedirs(path.parent / "tenants", exist_ok=True)
+    path.write_text(json.dumps({"tenants": tenants}))
+    if mtime is not None:
+        os.utime(path, (mtime, mtime))
+
+
+@pytest.fixture
+def registry(tmp_path, monkeypatch):
+    monkeypatch.setattr(database, "DATABASE_PATH", str(tmp_path / "test.db"))
+    database.init_database()
+    path = tmp_path / "tenants.json"
+    write_tenants(path, TENANTS, mtime=1000)
+    registry = TenantRegistry(str(path), reload_seconds=0, queue_seconds=0.05)
+    add_package(registry.get("acme").database_path, "ACME1", "10115")
+    return registry
+
+
+def add_package(path: str, tracking_number: str, postal_code: str):
+    conn = database.get_db_connection(path=path)
+    conn.execute(
+        """
+        INSERT INTO packages
+        (tracking_number, customer_name, phone, email, postal_code, street, street_number, status, scheduled_at)
+        VALUES (?, 'Ada', '+4915100000000', 'ada@example.com', ?, 'Main St', '1', 'scheduled', ?)
+    """,
+        (tracking_number, postal_code, datetime(2030, 1, 2, 10).isoformat()),
+    )
+    conn.commit()
+    conn.close()
+
+
+def verify(client: TestClient, agent_id: str, call_id: str, tracking_number: str, postal_code: str) -> dict:
+    response = client.post(
+        "/api/functions/verify_package",
+        json={
+            "call": {"call_id": call_id, "agent_id": agent_id},
+            "name": "verify_package",
+            "args": {"tracking_number": tracking_number, "postal_code": postal_code},
+        },
+    )
+    return response.json()
+
+
+def test_tool_calls_are_served_from_the_agents_tenant_database(registry):
+    client = TestClient(TenantMiddleware(app, registry))
+
+    assert verify(client, "agent_acme", "t-1", "ACME1", "10115")["tracking_number"] == "ACME1"
+    assert verify(client, "agent_acme", "t-2", "001", "12345")["error_type"] == "package_not_found"
+    # Unknown agents are the default tenant's
+    assert verify(client, "agent_other", "t-3", "001", "12345")["tracking_number"] == "001"
+    assert verify(client, "agent_other", "t-4", "ACME1", "10115")["error_type"] == "package_not_found"
+    assert verify(client, "agent_globex", "t-5", "ACME1", "10115")["error_type"] == "package_not_found"
+
+
+def test_header_cant_override_the_agents_tenant(registry):
+    client = TestClient(TenantMiddleware(app, registry))
+    body = {
+        "call": {"call_id": "t-1", "agent_id": "agent_acme"},
+        "name": "verify_package",
+        "args": {"tracking_number": "ACME1", "postal_code": "10115"},
+    }
+
+    response = client.post("/api/functions/verify_package", json=body, headers={"X-Tenant": "globex"})
+    assert response.status_code == 403
+    # The default tenant's agents can't be moved into another tenant either
+    other = {**body, "call": {"call_id": "t-2", "agent_id": "agent_other"}}
+    assert client.post("/api/functions/verify_package", json=other, headers={"X-Tenant": "acme"}).status_code == 403
+
+    matching = client.post("/api/functions/verify_package", json=body, headers={"X-Tenant": "acme"})
+    assert matching.json()["tracking_number"] == "ACME1"
+
+
+def test_dashboard_requests_pick_a_tenant_by_header(registry):
+    client = TestClient(TenantMiddleware(app, registry))
+
+    acme = client.get("/api/packages", headers={"X-Tenant": "acme"}).json()
+    assert [package["tracking_number"] for package in acme] == ["ACME1"]
+    assert client.get("/api/packages", headers={"X-Tenant": "globex"}).json() == []
+    assert len(client.get("/api/packages").json()) == 3
+    assert client.get("/api/packages", headers={"X-Tenant": "initech"}).status_code == 404
+
+
+def test_tenants_file_is_reloaded_when_changed(registry):
+    acme = registry.get("acme")
+    changed = {**TENANTS, "globex": {**TENANTS["globex"], "agent_ids": ["agent_globex_new"]}}
+    assert not registry.reload_if_changed()
+
+    write_tenants(Path(registry.path), changed, mtime=2000)
+    assert registry.reload_if_changed()
+    assert registry.for_agent("agent_globex_new").id == "globex"
+    assert registry.for_agent("agent_globex").id == "default"
+    # Unchanged tenants keep their limiter buckets and request slots
+    assert registry.get("acme") is acme
+
+    with open(registry.path, "w") as f:
+        f.write("{not json")
+    os.utime(registry.path, (3000, 3000))
+    assert not registry.reload_if_changed()
+    assert registry.for_agent("agent_globex_new").id == "globex"
+
+    # Valid JSON, but a tenant without a database
+    write_tenants(Path(registry.path), {"initech": {"agent_ids": ["agent_initech"]}}, mtime=4000)
+    assert not registry.reload_if_changed()
+    assert registry.for_agent("agent_globex_new").id == "globex"
+
+
+def test_tenant_rate_limits_are_separate_and_overridable(registry):
+    acme, globex = registry.get("acme"), registry.get("globex")
+    call = {"call_id": "shared-call-id"}
+
+    assert globex.rate_limiter.check(call, "PKG1") is None
+    assert globex.rate_limiter.check(call, "PKG1") == "tracking"
+    # Same call and tracking number at another tenant, other buckets and default limits
+    assert acme.rate_limiter.check(call, "PKG1") is None
+    assert acme.rate_limiter.check(call, "PKG1") is None
+    assert registry.default.rate_limiter is None
+
+
+def test_busy_tenant_is_rejected_while_others_are_served(registry):
+    release = asyncio.Event()
+
+    async def slow_app(scope, receive, send):
+        await receive()
+        if scope["path"] == "/slow":
+            await release.wait()
+        await send({"type": "http.response.start", "status": 200, "headers": []})
+        await send({"type": "http.response.body", "body": b"ok"})
+
+    def body(agent_id: str) -> dict:
+        return {"call": {"call_id": "c", "agent_id": agent_id}}
+
+    async def run():
+        transport = httpx.ASGITransport(app=TenantMiddleware(slow_app, registry))
+        async with httpx.AsyncClient(transport=transport, base_url="http://test") as client:
+            busy = asyncio.create_task(client.post("/slow", headers={"X-Tenant": "globex"}))
+            await asyncio.sleep(0.01)
+            rejected = await client.post("/api/functions/verify_package", json=body("agent_globex"))
+            other = await client.post("/api/functions/verify_package", json=body("agent_acme"))
+            release.set()
+            return (await busy).status_code, rejected, other.status_code
+
+    busy, rejected, other = asyncio.run(run())
+    assert (busy, rejected.status_code, other) == (200, 503, 200)
+    assert rejected.headers["retry-after"] == "1"
+    assert registry.snapshot()["globex"]["requests"] == {
+        "limit": 1,
+        "in_flight": 0,
+        "waiting": 0,
+        "waited": 1,
+        "rejected": 1,
+    }
+
+
+def test_bulkhead_hands_freed_slots_to_waiters_in_order():
+    bulkhead = Bulkhead(limit=1, timeout=1.0)
+    order = []
+
+    async def request(name: str):
+        assert await bulkhead.acquire()
+        order.append(name)
+        await asyncio.sleep(0.01)
+        bulkhead.release()
+
+    async def run():
+        await asyncio.gather(*(request(name) for name in "abcd"))
+
+    asyncio.run(run())
+    assert order == list("abcd")
+    assert bulkhead.in_flight == 0 and bulkhead.waited == 3
+
+
+def test_emails_use_the_tenants_addresses(registry, monkeypatch):
+    transport = FakeTransport()
+    monkeypatch.setattr(notification_channels["email"], "transport", transport)
+
+    with use_tenant(registry.get("acme")):
+        send_reschedule_confirmation_email("ada@example.com", "Ada", "ACME1", datetime(2030, 1, 2, 10))
+        send_escalation_email("ACME1", "agent_escalation")
+    send_escalation_email("001", "agent_escalation")
+
+    assert transport.sent[0].sender == "deliveries@acme.example"
+    assert (transport.sent[1].to, transport.sent[1].sender) == ("support@acme.example", "deliveries@acme.example")
+    assert (transport.sent[2].to, transport.sent[2].sender) == ("escalation@example.com", None)
@@ -0,0 +1,285 @@
+import re
+from datetime import date, datetime, timedelta, timezone
+
+import pytest
+from fastapi.testclient import TestClient
+
+from main import app
+from services import time_resolution
+from services.database import get_package_by_tracking_number
+from services.rate_limit import FunctionRateLimiter, InMemoryRateLimitBackend
+from services.time_resolution import (
+    UnresolvableTime,
+    parse_time_expression,
+    resolve_date,
+    resolve_delivery_time,
+)
+
+client = TestClient(app)
+
+# Wednesday, 12:15 in Berlin
+NOW = datetime(2025, 8, 6, 10, 15, tzinfo=timezone.utc)
+BERLIN = "Europe/Berlin"
+
+# (expression, start of the resolved slot in Berlin time), said at NOW
+RESOLVED = [
+    ('tomorrow', "Thu 08-07 08:00"),
+    ('tomorrow morning', "Thu 08-07 08:00"),
+    ('tomorrow afternoon', "Thu 08-07 12:00"),
+    ('tomorrow evening', "Thu 08-07 18:00"),
+    ('tomorrow early morning', "Thu 08-07 08:00"),
+    ('tomorrow late morning', "Thu 08-07 10:00"),
+    ('tomorrow early afternoon', "Thu 08-07 12:00"),
+    ('tomorrow late afternoon', "Thu 08-07 16:00"),
+    ('tomorrow at lunchtime', "Thu 08-07 12:00"),
+    ('tomorrow at 9', "Thu 08-07 08:00"),
+    ('tomorrow at 9am', "Thu 08-07 08:00"),
+    ('tomorrow at 9:30', "Thu 08-07 08:00"),
+    ('tomorrow at 9.30', "Thu 08-07 08:00"),
+    ('tomorrow at 3', "Thu 08-07 14:00"),
+    ('tomorrow at 3pm', "Thu 08-07 14:00"),
+    ('tomorrow at 3 pm', "Thu 08-07 14:00"),
+    ('tomorrow at 15:00', "Thu 08-07 14:00"),
+    ('tomorrow at three', "Thu 08-07 14:00"),
+    ("tomorrow at three o'clock", "Thu 08-07 14:00"),
+    ('tomorrow at noon', "Thu 08-07 12:00"),
+    ('tomorrow around 2 p.m.', "Thu 08-07 14:00"),
+    ('Tomorrow, around 2 p.m., please!', "Thu 08-07 14:00"),
+    ('tomorrow at 7am', "Thu 08-07 08:00"),
+    ('tomorrow at 10pm', "Thu 08-07 18:00"),
+    ('tomorrow morning at 10', "Thu 08-07 10:00"),
+    ('tomorrow afternoon at 4', "Thu 08-07 16:00"),
+    ('tomorrow morning after 9', "Thu 08-07 10:00"),
+    ('tomorrow between 2 and 4 pm', "Thu 08-07 14:00"),
+    ('tomorrow between 10 and 2', "Thu 08-07 10:00"),
+    ('tomorrow from 10 to 12', "Thu 08-07 10:00"),
+    ('tomorrow 9-11am', "Thu 08-07 08:00"),
+    ('tomorrow after 3pm', "Thu 08-07 16:00"),
+    ('tomorrow after lunch', "Thu 08-07 14:00"),
+    ('tomorrow before lunch', "Thu 08-07 08:00"),
+    ('tomorrow before noon', "Thu 08-07 08:00"),
+    ('tomorrow by 11am', "Thu 08-07 08:00"),
+    ('tomorrow no later than 10', "Thu 08-07 08:00"),
+    ('tomorrow not before 4pm', "Thu 08-07 16:00"),
+    ('any time tomorrow', "Thu 08-07 08:00"),
+    ('tomorrow whenever', "Thu 08-07 08:00"),
+    ('TOMORROW MORNING', "Thu 08-07 08:00"),
+    ('I would prefer tomorrow afternoon please', "Thu 08-07 12:00"),
+    ('day after tomorrow', "Fri 08-08 08:00"),
+    ('the day after tomorrow in the evening', "Fri 08-08 18:00"),
+    ('today', "Wed 08-06 14:00"),
+    ('this afternoon', "Wed 08-06 14:00"),
+    ('this late afternoon', "Wed 08-06 16:00"),
+    ('this evening', "Wed 08-06 18:00"),
+    ('tonight', "Wed 08-06 18:00"),
+    ('tonight at 7', "Wed 08-06 18:00"),
+    ('tonight at 9', "Wed 08-06 18:00"),
+    ('today at 10am', "Wed 08-06 14:00"),
+    ('in 2 hours', "Wed 08-06 14:00"),
+    ('in an hour', "Wed 08-06 14:00"),
+    ('in half an hour', "Wed 08-06 14:00"),
+    ('in 90 minutes', "Wed 08-06 14:00"),
+    ('in 3 days', "Sat 08-09 08:00"),
+    ('in two days', "Fri 08-08 08:00"),
+    ('in a week', "Wed 08-13 08:00"),
+    ('in 2 weeks', "Wed 08-20 08:00"),
+    ('a week from today', "Wed 08-13 08:00"),
+    ('wednesday', "Wed 08-06 14:00"),
+    ('next wednesday', "Wed 08-13 08:00"),
+    ('thursday', "Thu 08-07 08:00"),
+    ('on friday', "Fri 08-08 08:00"),
+    ('next friday', "Fri 08-08 08:00"),
+    ('this coming friday', "Fri 08-08 08:00"),
+    ('friday after 3', "Fri 08-08 16:00"),
+    ('friday morning', "Fri 08-08 08:00"),
+    ('fri at 10am', "Fri 08-08 10:00"),
+    ('saturday late afternoon', "Sat 08-09 16:00"),
+    ('monday next week', "Mon 08-11 08:00"),
+    ('tuesday next week in the afternoon', "Tue 08-12 12:00"),
+    ('next week', "Mon 08-11 08:00"),
+    ('next week in the morning', "Mon 08-11 08:00"),
+    ('weekend', "Sat 08-09 08:00"),
+    ('this weekend', "Sat 08-09 08:00"),
+    ('August 12th', "Tue 08-12 08:00"),
+    ('12 aug', "Tue 08-12 08:00"),
+    ('the 12th of august', "Tue 08-12 08:00"),
+    ('august the 12th', "Tue 08-12 08:00"),
+    ('aug 12 at 2pm', "Tue 08-12 14:00"),
+    ('the morning of august 12', "Tue 08-12 08:00"),
+    ('12.08.', "Tue 08-12 08:00"),
+    ('12.08. at 9.30', "Tue 08-12 08:00"),
+    ('12.08.2025', "Tue 08-12 08:00"),
+    ('2025-08-20', "Wed 08-20 08:00"),
+    ('2025-08-20 at 9:30', "Wed 08-20 08:00"),
+    ('the 15th', "Fri 08-15 08:00"),
+    ('the 5th', "Fri 09-05 08:00"),
+    ('asap', "Wed 08-06 14:00"),
+    ('as soon as possible', "Wed 08-06 14:00"),
+    ('first available slot', "Wed 08-06 14:00"),
+    ('earliest possible', "Wed 08-06 14:00"),
+    ('whenever', "Wed 08-06 14:00"),
+    ('afternoon', "Wed 08-06 14:00"),
+    ('morning', "Thu 08-07 08:00"),
+    ('after 5pm', "Wed 08-06 18:00"),
+    ('by 5pm', "Wed 08-06 14:00"),
+    ('at 3', "Wed 08-06 14:00"),
+    ('at 3.', "Wed 08-06 14:00"),
+    ('before 10', "Thu 08-07 08:00"),
+]
+
+UNRECOGNIZED = [
+    "",
+    "please",
+    "a good time",
+    "not tomorrow",
+    "tomorrow or friday maybe not",
+    "tomorrow morning at 3pm",
+    "at 25:00",
+    "at 9:75",
+    "at 14pm",
+    "between 4 and 2 pm",
+    "yesterday",
+    "feb 30",
+    "2025-13-01",
+]
+
+NO_SLOT = [
+    "sunday",
+    "next sunday",
+    "this morning",
+    "2025-08-01",
+    "december 25",
+    "in 40 days",
+]
+
+
+@pytest.mark.parametrize("expression,expected", RESOLVED)
+def test_resolves_to_slot(expression, expected):
+    window = resolve_delivery_time(expression, BERLIN, NOW)
+    assert f"{window.start:%a %m-%d %H:%M}" == expected
+    assert window.end - window.start == timedelta(minutes=time_resolution.SLOT_MINUTES)
+
+
+@pytest.mark.parametrize("expression", UNRECOGNIZED)
+def test_unrecognized(expression):
+    with pytest.raises(UnresolvableTime) as error:
+        resolve_delivery_time(expression, BERLIN, NOW)
+    assert error.value.reason == "unrecognized"
+
+
+@pytest.mark.parametrize("expression", NO_SLOT)
+def test_no_delivery_slot(expression):
+    with pytest.raises(UnresolvableTime) as error:
+        resolve_delivery_time(expression, BERLIN, NOW)
+    assert error.value.reason == "no_delivery_slot"
+
+
+@pytest.mark.parametrize(
+    "day,today,expected",
+    [
+        (31, date(2025, 4, 10), date(2025, 5, 31)),
+        (30, date(2025, 1, 31), date(2025, 3, 30)),
+        (29, date(2025, 2, 1), date(2025, 3, 29)),
+        (29, date(2024, 2, 1), date(2024, 2, 29)),
+        (31, date(2025, 12, 31), date(2025, 12, 31)),
+        (5, date(2025, 12, 6), date(2026, 1, 5)),
+    ],
+)
+def test_day_of_month_skips_months_without_it(day, today, expected):
+    assert resolve_date((0, 0, day), today) == expected
+
+
+def test_day_of_month_beyond_the_horizon_has_no_slot():
+    """On April 10 "the 31st" is May 31, not a missing April 31"""
+    with pytest.raises(UnresolvableTime) as error:
+        resolve_delivery_time("the 31st", BERLIN, datetime(2025, 4, 10, 8, 0, tzinfo=timezone.utc))
+    assert error.value.reason == "no_delivery_slot"
+
+
+def test_slots_follow_the_customers_timezone():
+    """At 10:15 UTC it is still morning in New York, but not in Tokyo"""
+    assert f"{resolve_delivery_time('this morning', 'America/New_York', NOW).start:%H:%M}" == "08:00"
+    with pytest.raises(UnresolvableTime):
+        resolve_delivery_time("this morning", "Asia/Tokyo", NOW)
+    tokyo = resolve_delivery_time("tomorrow at 9am", "Asia/Tokyo", NOW)
+    assert tokyo.start.utcoffset().total_seconds() == 9 * 3600
+
+
+def test_unknown_timezone():
+    with pytest.raises(UnresolvableTime) as error:
+        resolve_delivery_time("tomorrow", "Mars/Olympus_Mons", NOW)
+    assert error.value.reason == "unknown_timezone"
+
+
+def test_scheduled_at_is_naive_service_time(monkeypatch):
+    monkeypatch.setattr(time_resolution, "SERVICE_TIMEZONE", "UTC")
+    window = resolve_delivery_time("tomorrow at 9am", BERLIN, NOW)
+    assert window.scheduled_at() == datetime(2025, 8, 7, 6, 0)
+    assert window.describe() == "Thursday, August 7 between 08:00 and 10:00"
+
+
+def test_slot_must_start_after_the_lead_time():
+    """At 13:59 the 14:00 slot is less than an hour away, so today's next slot is 16:00"""
+    almost = datetime(2025, 8, 6, 11, 59, tzinfo=timezone.utc)  # 13:59 in Berlin
+    assert f"{resolve_delivery_time('today', BERLIN, almost).start:%H:%M}" == "16:00"
+
+
+def test_parsing_is_cached():
+    parse_time_expression.cache_clear()
+    resolve_delivery_time("friday after 3", BERLIN, NOW)
+    resolve_delivery_time("friday after 3", BERLIN, datetime(2025, 8, 12, 8, 0, tzinfo=timezone.utc))
+    info = parse_time_expression.cache_info()
+    assert (info.hits, info.misses) == (1, 1)
+
+
+def test_every_pattern_is_precompiled():
+    for pattern, _ in time_resolution.DAY_RULES + time_resolution.CLOCK_RULES:
+        assert isinstance(pattern, re.Pattern)
+
+
+@pytest.fixture
+def db(db, monkeypatch):
+    monkeypatch.setattr(
+        "api.functions.rate_limiter", FunctionRateLimiter(InMemoryRateLimitBackend())
+    )
+    monkeypatch.setattr("api.functions.send_reschedule_confirmation_email", lambda **_: True)
+
+
+def reschedule(**args):
+    return client.post(
+        "/api/functions/reschedule",
+        json={
+            "call": {"call_id": "call-1"},
+            "name": "reschedule",
+            "args": {"tracking_number": "002", "postal_code": "67890", **args},
+        },
+    )
+
+
+class TestRescheduleEndpoint:
+    def test_time_expression_is_resolved_to_a_slot(self, db):
+        response = reschedule(time_expression="monday next week in the afternoon", timezone=BERLIN)
+
+        data = response.json()
+        assert data["message"] == "Package rescheduled successfully"
+        assert data["delivery_window"].startswith("Monday")
+        assert data["delivery_window"].endswith("between 12:00 and 14:00")
+        stored = get_package_by_tracking_number("002").scheduled_at
+        assert stored == datetime.fromisoformat(data["new_schedule"])
+        assert stored.weekday() == 0
+
+    def test_time_expression_wins_over_target_time(self, db):
+        data = reschedule(time_expression="next week", target_time="2025-08-10T14:00:00").json()
+        assert data["new_schedule"] != "2025-08-10T14:00:00"
+        assert data["delivery_window"] is not None
+
+    def test_unresolvable_expression_is_reported_to_the_agent(self, db):
+        before = get_package_by_tracking_number("002").scheduled_at
+
+        data = reschedule(time_expression="not tomorrow").json()
+
+        assert data["error_type"] == "invalid_delivery_time"
+        assert get_package_by_tracking_number("002").scheduled_at == before
+
+    def test_a_time_is_required(self, db):
+        assert reschedule().status_code == 422